@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from .llm_residency import LLM_WARMUP_ON_STARTUP, start_warmup  # noqa: PLC0415
+
+        if LLM_WARMUP_ON_STARTUP:
+            start_warmup()
@@ -0,0 +1,426 @@
+"""
+Admission control in front of the LLM services.
+
+Ollama serves only a few generations per model in parallel; anything above
+that makes every request slower at once. The controller gives each
+(provider, model) pair a fixed number of slots and a bounded wait queue:
+
+* free slot            → the request runs immediately;
+* all slots busy       → it waits in a priority queue (admin, then
+  premium, then user; FIFO within a role) for at most LLM_QUEUE_TIMEOUT;
+* queue full           → LLMOverloadedError with HTTP 429;
+* deadline can't be met (estimated from the average generation time) or
+  the wait timed out   → LLMOverloadedError with HTTP 503.
+
+Both carry a Retry-After estimate. Sync callers wait on a threading.Event,
+async callers on a future of their event loop; both share one queue.
+
+Views don't hold a slot for the whole request. They wrap it in
+``admission.admit(role)``, and the services take a slot (``request_slot``)
+only around the actual model call. Intent and semantic cache hits and
+single-flight followers never queue. Outside ``admit()`` (warmup,
+speculation and hedges, which hold their own tickets) calls are not
+metered.
+
+Usage:
+    from api.llm_admission import admission
+    with admission.admit(profile.role):
+        answer = OllamaService.generate_response(question, model)
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+from decouple import Csv, config
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = config("LLM_MAX_CONCURRENCY", default=2, cast=int)
+LLM_EXTERNAL_MAX_CONCURRENCY = config(
+    "LLM_EXTERNAL_MAX_CONCURRENCY",
+    default=8,
+    cast=int,
+)
+# Переопределения для отдельных моделей: "qwen3:8b=1,alibayram/smollm3=4"
+LLM_MODEL_CONCURRENCY = config("LLM_MODEL_CONCURRENCY", default="", cast=Csv())
+LLM_QUEUE_SIZE = config("LLM_QUEUE_SIZE", default=32, cast=int)
+LLM_QUEUE_TIMEOUT = config("LLM_QUEUE_TIMEOUT", default=30.0, cast=float)
+
+ROLE_PRIORITY = {"admin": 0, "premium": 1, "user": 2}
+DEFAULT_PRIORITY = ROLE_PRIORITY["user"]
+
+_WAIT_SAMPLES = 512
+_EWMA_ALPHA = 0.2
+
+
+class LLMOverloadedError(Exception):
+    """LLM is saturated; the request should be retried later."""
+
+    def __init__(self, message: str, *, status_code: int, retry_after: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_model_limits(items: list[str]) -> dict[str, int]:
+    """Разобрать "model=N" из LLM_MODEL_CONCURRENCY."""
+    limits = {}
+    for item in items:
+        model, sep, value = item.rpartition("=")
+        if not sep or not model:
+            logger.warning("Ignoring malformed LLM_MODEL_CONCURRENCY item %r", item)
+            continue
+        limits[model.strip()] = int(value)
+    return limits
+
+
+class _Admit(NamedTuple):
+    controller: "AdmissionController"
+    role: str | None
+
+
+# Контроллер и роль запроса, в рамках которого идут вызовы LLM
+_current: contextvars.ContextVar[_Admit | None] = contextvars.ContextVar(
+    "llm_admission",
+    default=None,
+)
+
+
+@contextlib.contextmanager
+def unmetered():
+    """Вызовы LLM внутри блока не занимают слот (у вызывающего уже есть свой)."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+async def run_unmetered(coro):
+    """Дождаться корутины вне admission; для задач с собственным слотом."""
+    with unmetered():
+        return await coro
+
+
+@contextlib.contextmanager
+def request_slot(provider: str, model: str):
+    """Слот текущего admit() на время вызова модели; вне admit() — None."""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    with current.controller.slot(provider, model, current.role) as ticket:
+        yield ticket
+
+
+@contextlib.asynccontextmanager
+async def arequest_slot(provider: str, model: str):
+    """Async variant of request_slot()."""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    async with current.controller.aslot(provider, model, current.role) as ticket:
+        yield ticket
+
+
+class _Waiter:
+    __slots__ = ("granted", "priority", "seq", "wake")
+
+    def __init__(self, priority: int, seq: int, wake) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.granted = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _ModelQueue:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.active = 0
+        self.waiters: list[_Waiter] = []
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+        self.timed_out = 0
+        self.waits: deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self.service_time = 0.0  # EWMA, seconds
+
+    def estimate_wait(self, ahead: int) -> float:
+        """Оценка ожидания для запроса, перед которым в очереди *ahead* других."""
+        return self.service_time * (ahead // self.limit + 1)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.estimate_wait(len(self.waiters))))
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_deadline": self.rejected_deadline,
+            "timed_out": self.timed_out,
+            "wait_avg_ms": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+            "wait_p95_ms": (
+                round(1000 * waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0
+            ),
+            "wait_max_ms": round(1000 * waits[-1], 1) if waits else 0.0,
+            "service_avg_ms": round(1000 * self.service_time, 1),
+        }
+
+
+class Ticket:
+    """Занятый слот; release() идемпотентен. waited — секунды в очереди."""
+
+    def __init__(
+        self,
+        controller: "AdmissionController",
+        queue: _ModelQueue,
+        waited: float = 0.0,
+    ) -> None:
+        self._controller = controller
+        self._queue = queue
+        self.waited = waited
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self, *, record: bool = True) -> None:
+        """record=False — не учитывать время в оценке (прерванная генерация)."""
+        if self._released:
+            return
+        self._released = True
+        service_time = time.monotonic() - self._started if record else None
+        self._controller.release(self._queue, service_time)
+
+
+class AdmissionController:
+    """Per-(provider, model) concurrency limits with a bounded priority queue."""
+
+    def __init__(
+        self,
+        *,
+        local_limit: int,
+        external_limit: int,
+        model_limits: dict[str, int] | None = None,
+        max_queue: int,
+        timeout: float,
+    ) -> None:
+        self.local_limit = local_limit
+        self.external_limit = external_limit
+        self.model_limits = model_limits or {}
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._queues: dict[tuple[str, str], _ModelQueue] = {}
+        self._seq = itertools.count()
+
+    def _queue(self, provider: str, model: str) -> _ModelQueue:
+        key = (provider, model)
+        queue = self._queues.get(key)
+        if queue is None:
+            default = (
+                self.external_limit if provider == "external" else self.local_limit
+            )
+            queue = _ModelQueue(max(1, self.model_limits.get(model, default)))
+            self._queues[key] = queue
+        return queue
+
+    def _enqueue(self, queue: _ModelQueue, waiter: _Waiter) -> bool:
+        """Под self._lock: занять слот сразу (True) или встать в очередь (False)."""
+        if queue.active < queue.limit and not queue.waiters:
+            queue.active += 1
+            queue.admitted += 1
+            return True
+        if len(queue.waiters) >= self.max_queue:
+            queue.rejected_full += 1
+            raise LLMOverloadedError(
+                "LLM queue is full",
+                status_code=429,
+                retry_after=queue.retry_after(),
+            )
+        ahead = sum(1 for w in queue.waiters if w.priority <= waiter.priority)
+        if queue.estimate_wait(ahead) > self.timeout:
+            queue.rejected_deadline += 1
+            raise LLMOverloadedError(
+                "LLM is overloaded, expected wait exceeds the deadline",
+                status_code=503,
+                retry_after=queue.retry_after(),
+            )
+        heapq.heappush(queue.waiters, waiter)
+        return False
+
+    def _grant_next(self, queue: _ModelQueue) -> None:
+        """Под self._lock: отдать освободившиеся слоты следующим в очереди."""
+        while queue.waiters and queue.active < queue.limit:
+            waiter = heapq.heappop(queue.waiters)
+            queue.active += 1
+            queue.admitted += 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _abandon(self, queue: _ModelQueue, waiter: _Waiter) -> bool:
+        """Снять ожидающего с очереди; True, если слот уже успели выдать."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            queue.waiters.remove(waiter)
+            heapq.heapify(queue.waiters)
+            queue.timed_out += 1
+            return False
+
+    def release(self, queue: _ModelQueue, service_time: float | None) -> None:
+        with self._lock:
+            queue.active -= 1
+            if service_time is None:
+                pass
+            elif queue.service_time:
+                queue.service_time += _EWMA_ALPHA * (service_time - queue.service_time)
+            else:
+                queue.service_time = service_time
+            self._grant_next(queue)
+
+    def _timed_out(self, queue: _ModelQueue) -> LLMOverloadedError:
+        return LLMOverloadedError(
+            "Timed out waiting for a free LLM slot",
+            status_code=503,
+            retry_after=queue.retry_after(),
+        )
+
+    def _admitted(self, queue: _ModelQueue, started: float) -> Ticket:
+        waited = time.monotonic() - started
+        with self._lock:
+            queue.waits.append(waited)
+        return Ticket(self, queue, waited)
+
+    def acquire(self, provider: str, model: str, role: str | None) -> Ticket:
+        """Занять слот, блокируя поток не дольше self.timeout."""
+        started = time.monotonic()
+        event = threading.Event()
+        with self._lock:
+            queue = self._queue(provider, model)
+            waiter = _Waiter(
+                ROLE_PRIORITY.get(role, DEFAULT_PRIORITY),
+                next(self._seq),
+                event.set,
+            )
+            queued = not self._enqueue(queue, waiter)
+        if queued and not event.wait(self.timeout) and not self._abandon(queue, waiter):
+            raise self._timed_out(queue)
+        return self._admitted(queue, started)
+
+    async def aacquire(self, provider: str, model: str, role: str | None) -> Ticket:
+        """Async variant of acquire(); waits without blocking the event loop."""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(
+                lambda: future.done() or future.set_result(None),
+            )
+
+        with self._lock:
+            queue = self._queue(provider, model)
+            waiter = _Waiter(
+                ROLE_PRIORITY.get(role, DEFAULT_PRIORITY),
+                next(self._seq),
+                wake,
+            )
+            queued = not self._enqueue(queue, waiter)
+        if queued:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except TimeoutError:
+                if not self._abandon(queue, waiter):
+                    raise self._timed_out(queue) from None
+            except asyncio.CancelledError:
+                if self._abandon(queue, waiter):
+                    # Слот выдан в момент отмены — сразу вернуть его
+                    self.release(queue, None)
+                raise
+        return self._admitted(queue, started)
+
+    def try_acquire(self, provider: str, model: str) -> Ticket | None:
+        """Занять слот, только если он свободен сейчас; в очередь не встаёт."""
+        with self._lock:
+            queue = self._queue(provider, model)
+            if queue.active >= queue.limit or queue.waiters:
+                return None
+            queue.active += 1
+            queue.admitted += 1
+        return Ticket(self, queue)
+
+    def load(self, provider: str, model: str) -> float:
+        """Занятые и ожидающие запросы относительно лимита слотов."""
+        with self._lock:
+            queue = self._queue(provider, model)
+            return (queue.active + len(queue.waiters)) / queue.limit
+
+    @contextlib.contextmanager
+    def admit(self, role: str | None):
+        """Вызовы LLM внутри блока проходят через этот контроллер от имени role."""
+        token = _current.set(_Admit(self, role))
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    @contextlib.contextmanager
+    def slot(self, provider: str, model: str, role: str | None):
+        """Context manager around acquire()/release()."""
+        ticket = self.acquire(provider, model, role)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, provider: str, model: str, role: str | None):
+        """Async context manager around aacquire()/release()."""
+        ticket = await self.aacquire(provider, model, role)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_queue": self.max_queue,
+                "timeout": self.timeout,
+                "models": {
+                    f"{provider}:{model}": queue.stats()
+                    for (provider, model), queue in self._queues.items()
+                },
+            }
+
+    def reset(self) -> None:
+        """Забыть очереди и счётчики (для тестов); занятые слоты не трогает."""
+        with self._lock:
+            self._queues = {
+                key: queue for key, queue in self._queues.items() if queue.active
+            }
+
+
+admission = AdmissionController(
+    local_limit=LLM_MAX_CONCURRENCY,
+    external_limit=LLM_EXTERNAL_MAX_CONCURRENCY,
+    model_limits=parse_model_limits(LLM_MODEL_CONCURRENCY),
+    max_queue=LLM_QUEUE_SIZE,
+    timeout=LLM_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,489 @@
+"""
+Async counterparts of OllamaService / ExternalLLMService.
+
+Built on ``ollama.AsyncClient`` and ``AsyncOpenAI`` so that a single ASGI
+worker can wait on many generations at once instead of pinning a thread
+per request. Prompts, parsing and error semantics are shared with the
+sync services in ``api.llm_service``.
+
+Usage:
+    from api.llm_async import AsyncOllamaService
+    answer = await AsyncOllamaService.generate_response("Привет")
+"""
+
+import contextlib
+import logging
+from collections.abc import AsyncIterator, Callable
+
+from .llm_admission import LLMOverloadedError, arequest_slot
+from .llm_breaker import breaker
+from .llm_cache import Uncached, inflight, intent_cache
+from .llm_clients import get_async_ollama_client, get_async_openai_client
+from .llm_service import (
+    CHAT_FALLBACK_CODE,
+    DEFAULT_MODEL,
+    DEFAULT_WEATHER_CITY,
+    LLM_EARLY_EXIT,
+    OLLAMA_BASE_URL,
+    SBER_API_KEY,
+    SBER_API_URL,
+    SBER_DEFAULT_MODEL,
+    ExternalLLMService,
+    ExternalLLMServiceError,
+    OllamaService,
+    ThinkTagFilter,
+    action_code_messages,
+    action_code_ready,
+    action_code_result,
+    action_code_schema,
+    build_completion_kwargs,
+    chat_messages,
+    decoding,
+    filters_messages,
+    intent_key,
+    json_object_ready,
+    keep_alive_for,
+    navigation_failed,
+    navigation_messages,
+    navigation_schema,
+    ollama_text,
+    openai_delta_text,
+    parse_navigation,
+    product_filters_result,
+    product_filters_schema,
+    semantic_cache,
+    weather_city_messages,
+    weather_city_result,
+    weather_city_schema,
+)
+from .llm_telemetry import ollama_usage, openai_usage, telemetry
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.asynccontextmanager
+async def allm_slot(provider: str, model: str):
+    """Async variant of llm_service.llm_slot()."""
+    breaker.check(provider, model)
+    async with arequest_slot(provider, model) as ticket:
+        if ticket is not None:
+            telemetry.record_wait(provider, model, ticket.waited)
+        yield ticket
+
+
+async def aread_until(
+    stream: AsyncIterator,
+    content: Callable[[object], str],
+    until: Callable[[str, str], bool],
+) -> str:
+    """Асинхронная версия llm_service.read_until."""
+    think_filter = ThinkTagFilter()
+    text = ""
+    try:
+        async for chunk in stream:
+            visible = think_filter.feed(content(chunk) or "")
+            if not visible:
+                continue
+            text += visible
+            if until(text, visible):
+                return text
+        return text + think_filter.flush()
+    finally:
+        # Асинхронные генераторы Ollama — aclose(), AsyncStream OpenAI — close()
+        close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+        if close is not None:
+            await close()
+
+
+def _get_async_sber_client():
+    """Вернуть общий AsyncOpenAI-клиент для Cloud.ru Foundation Models."""
+    if not SBER_API_KEY:
+        raise ExternalLLMServiceError(
+            "SBER_API_KEY не задан. Укажите его в .env",
+        )
+    return get_async_openai_client(SBER_API_KEY, SBER_API_URL)
+
+
+class AsyncOllamaService:
+    """Асинхронный сервис для работы с Ollama LLM"""
+
+    clean_response = staticmethod(OllamaService.clean_response)
+
+    @staticmethod
+    def get_client():
+        """Получить общий AsyncClient для текущего event loop"""
+        return get_async_ollama_client(OLLAMA_BASE_URL)
+
+    @staticmethod
+    async def _chat(
+        model: str,
+        messages: list,
+        options: dict | None = None,
+        *,
+        schema: dict | None = None,
+        until: Callable[[str, str], bool] | None = None,
+        mode: str = "chat",
+    ) -> str:
+        client = AsyncOllamaService.get_client()
+        early_exit = until is not None and LLM_EARLY_EXIT
+        async with allm_slot("local", model):
+            with (
+                breaker.guard("local", model),
+                telemetry.call(mode, "local", model) as call,
+            ):
+                response = await client.chat(
+                    model=model,
+                    messages=messages,
+                    stream=early_exit,
+                    format=schema,
+                    options=options,
+                    keep_alive=keep_alive_for(model),
+                )
+                if early_exit:
+                    return await aread_until(
+                        response,
+                        call.reader(ollama_text, ollama_usage),
+                        until,
+                    )
+                call.set_usage(ollama_usage(response))
+        return ollama_text(response)
+
+    @staticmethod
+    async def generate_response(
+        question: str,
+        model: str = DEFAULT_MODEL,
+        *,
+        coalesce: bool = True,
+    ) -> str:
+        """
+        Асинхронная версия OllamaService.generate_response.
+
+        coalesce=False — не объединять с одинаковыми вызовами (спекулятивная
+        генерация может быть отменена и не должна обрывать чужие запросы).
+        """
+        messages = chat_messages(question)
+        lookup = await semantic_cache.alookup("local", model, question)
+        if lookup.answer is not None:
+            return lookup.answer
+
+        def call():
+            return AsyncOllamaService._chat(model, messages, **decoding("chat"))
+
+        try:
+            raw_answer = await (
+                inflight.ado(
+                    intent_key("chat", "local", model, messages, question),
+                    call,
+                )
+                if coalesce
+                else call()
+            )
+            answer = AsyncOllamaService.clean_response(raw_answer)
+            lookup.store(answer)
+            return answer or "Не удалось получить ответ от модели"
+        except LLMOverloadedError:
+            raise
+        except ConnectionError:
+            logger.error("Не удалось подключиться к Ollama на %s", OLLAMA_BASE_URL)
+            return "Ошибка: LLM сервис недоступен"
+        except TimeoutError:
+            logger.error("Таймаут при обращении к Ollama")
+            return "Ошибка: Истекло время ожидания ответа"
+        except Exception as e:
+            logger.error("Ошибка при работе с Ollama: %s", e)
+            return f"Ошибка: {e!s}"
+
+    @staticmethod
+    async def get_action_code(question: str, model: str = DEFAULT_MODEL) -> str:
+        """Асинхронная версия OllamaService.get_action_code."""
+        messages = action_code_messages(question)
+
+        async def compute() -> str | Uncached:
+            raw = await AsyncOllamaService._chat(
+                model,
+                messages,
+                **decoding("action_code", action_code_schema()),
+                until=action_code_ready,
+            )
+            logger.info("LLM action response: %s", raw.strip())
+            return action_code_result(raw.strip())
+
+        try:
+            return await intent_cache.aget_or_compute(
+                intent_key("action_code", "local", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error("Ошибка при получении кода действия: %s", e)
+            return CHAT_FALLBACK_CODE
+
+    @staticmethod
+    async def get_navigation(
+        question: str,
+        model: str = DEFAULT_MODEL,
+        categories: list[str] | None = None,
+    ) -> dict | None:
+        """Асинхронная версия OllamaService.get_navigation."""
+        messages = navigation_messages(question, categories)
+
+        async def compute() -> dict | None:
+            raw = await AsyncOllamaService._chat(
+                model,
+                messages,
+                **decoding("navigation", navigation_schema(categories)),
+                until=json_object_ready,
+            )
+            raw = AsyncOllamaService.clean_response(raw)
+            logger.info("AsyncOllamaService navigation raw: %s", raw)
+            return parse_navigation(raw)
+
+        try:
+            return await intent_cache.aget_or_compute(
+                intent_key("navigation", "local", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error("AsyncOllamaService.get_navigation error: %s", e)
+            return navigation_failed()
+
+    @staticmethod
+    async def get_product_filters(
+        question: str,
+        model: str = DEFAULT_MODEL,
+        categories: list[str] | None = None,
+    ) -> dict:
+        """Асинхронная версия OllamaService.get_product_filters."""
+        messages = filters_messages(question, categories)
+
+        async def compute():
+            raw = await AsyncOllamaService._chat(
+                model,
+                messages,
+                **decoding("filters", product_filters_schema(categories)),
+                until=json_object_ready,
+            )
+            return product_filters_result(AsyncOllamaService.clean_response(raw))
+
+        try:
+            return await intent_cache.aget_or_compute(
+                intent_key("filters", "local", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error("AsyncOllamaService.get_product_filters error: %s", e)
+            return {}
+
+    @staticmethod
+    async def get_weather_city(question: str, model: str = DEFAULT_MODEL) -> str:
+        """Асинхронная версия OllamaService.get_weather_city."""
+        messages = weather_city_messages(question)
+
+        async def compute():
+            raw = await AsyncOllamaService._chat(
+                model,
+                messages,
+                **decoding("weather_city", weather_city_schema()),
+                until=json_object_ready,
+            )
+            return weather_city_result(AsyncOllamaService.clean_response(raw))
+
+        try:
+            return await intent_cache.aget_or_compute(
+                intent_key("weather_city", "local", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error("AsyncOllamaService.get_weather_city error: %s", e)
+            return DEFAULT_WEATHER_CITY
+
+
+class AsyncExternalLLMService:
+    """Асинхронный клиент Сбер GigaChat (AsyncOpenAI, Cloud.ru)."""
+
+    clean_response = staticmethod(ExternalLLMService.clean_response)
+
+    @staticmethod
+    async def _chat(
+        model: str,
+        messages: list,
+        options: dict | None = None,
+        *,
+        schema: dict | None = None,
+        until: Callable[[str, str], bool] | None = None,
+        mode: str = "chat",
+    ) -> str:
+        async with allm_slot("external", model):
+            with (
+                breaker.guard("external", model),
+                telemetry.call(mode, "external", model) as call,
+            ):
+                try:
+                    client = _get_async_sber_client()
+                    kwargs = build_completion_kwargs(model, messages, options, schema)
+                    if until is not None and LLM_EARLY_EXIT:
+                        stream = await client.chat.completions.create(
+                            **kwargs,
+                            stream=True,
+                        )
+                        return await aread_until(
+                            stream,
+                            call.reader(openai_delta_text, openai_usage),
+                            until,
+                        )
+                    resp = await client.chat.completions.create(**kwargs)
+                    call.set_usage(openai_usage(resp))
+                    return resp.choices[0].message.content or ""
+                except ExternalLLMServiceError:
+                    raise
+                except Exception as exc:
+                    raise ExternalLLMServiceError(f"Сбер API error: {exc}") from exc
+
+    @staticmethod
+    async def generate_response(
+        question: str,
+        model: str = SBER_DEFAULT_MODEL,
+        *,
+        coalesce: bool = True,
+    ) -> str:
+        """Асинхронная версия ExternalLLMService.generate_response."""
+        messages = chat_messages(question)
+        lookup = await semantic_cache.alookup("external", model, question)
+        if lookup.answer is not None:
+            return lookup.answer
+
+        def call():
+            return AsyncExternalLLMService._chat(model, messages, **decoding("chat"))
+
+        try:
+            raw = await (
+                inflight.ado(
+                    intent_key("chat", "external", model, messages, question),
+                    call,
+                )
+                if coalesce
+                else call()
+            )
+            answer = AsyncExternalLLMService.clean_response(raw)
+            lookup.store(answer)
+            return answer or "Не удалось получить ответ от модели"
+        except ExternalLLMServiceError as exc:
+            logger.error("AsyncExternalLLMService.generate_response error: %s", exc)
+            return f"Ошибка GigaChat: {exc}"
+
+    @staticmethod
+    async def get_action_code(
+        question: str,
+        model: str = SBER_DEFAULT_MODEL,
+    ) -> str:
+        """Асинхронная версия ExternalLLMService.get_action_code."""
+        messages = action_code_messages(question)
+
+        async def compute():
+            raw = await AsyncExternalLLMService._chat(
+                model,
+                messages,
+                **decoding("action_code", action_code_schema()),
+                until=action_code_ready,
+            )
+            return action_code_result(AsyncExternalLLMService.clean_response(raw))
+
+        try:
+            return await intent_cache.aget_or_compute(
+                intent_key("action_code", "external", model, messages, question),
+                compute,
+            )
+        except ExternalLLMServiceError as exc:
+            logger.error("AsyncExternalLLMService.get_action_code error: %s", exc)
+            return CHAT_FALLBACK_CODE
+
+    @staticmethod
+    async def get_navigation(
+        question: str,
+        model: str = SBER_DEFAULT_MODEL,
+        categories: list[str] | None = None,
+    ) -> dict | None:
+        """Асинхронная версия ExternalLLMService.get_navigation."""
+        messages = navigation_messages(question, categories)
+
+        async def compute():
+            raw = await AsyncExternalLLMService._chat(
+                model,
+                messages,
+                **decoding("navigation", navigation_schema(categories)),
+                until=json_object_ready,
+            )
+            return parse_navigation(AsyncExternalLLMService.clean_response(raw))
+
+        try:
+            return await intent_cache.aget_or_compute(
+                intent_key("navigation", "external", model, messages, question),
+                compute,
+            )
+        except ExternalLLMServiceError as exc:
+            logger.error("AsyncExternalLLMService.get_navigation error: %s", exc)
+            return navigation_failed()
+
+    @staticmethod
+    async def get_product_filters(
+        question: str,
+        model: str = SBER_DEFAULT_MODEL,
+        categories: list[str] | None = None,
+    ) -> dict:
+        """Асинхронная версия ExternalLLMService.get_product_filters."""
+        messages = filters_messages(question, categories)
+
+        async def compute():
+            raw = await AsyncExternalLLMService._chat(
+                model,
+                messages,
+                **decoding("filters", product_filters_schema(categories)),
+                until=json_object_ready,
+            )
+            return product_filters_result(AsyncExternalLLMService.clean_response(raw))
+
+        try:
+            return await intent_cache.aget_or_compute(
+                intent_key("filters", "external", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error("AsyncExternalLLMService.get_product_filters error: %s", e)
+            return {}
+
+    @staticmethod
+    async def get_weather_city(
+        question: str,
+        model: str = SBER_DEFAULT_MODEL,
+    ) -> str:
+        """Асинхронная версия ExternalLLMService.get_weather_city."""
+        messages = weather_city_messages(question)
+
+        async def compute():
+            raw = await AsyncExternalLLMService._chat(
+                model,
+                messages,
+                **decoding("weather_city", weather_city_schema()),
+                until=json_object_ready,
+            )
+            return weather_city_result(AsyncExternalLLMService.clean_response(raw))
+
+        try:
+            return await intent_cache.aget_or_compute(
+                intent_key("weather_city", "external", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error("AsyncExternalLLMService.get_weather_city error: %s", e)
+            return DEFAULT_WEATHER_CITY
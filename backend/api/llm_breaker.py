@@ -0,0 +1,366 @@
+"""
+Circuit breaker for the LLM providers.
+
+When Ollama is down or Cloud.ru is slow, every request used to wait for
+the full client timeout. Calls are now tracked per (provider, model) in a
+sliding window of the last LLM_BREAKER_WINDOW calls:
+
+* closed    → calls pass; once at least LLM_BREAKER_MIN_CALLS are recorded
+  and the failure rate reaches LLM_BREAKER_FAILURE_RATE, or the share of
+  calls slower than LLM_BREAKER_SLOW_CALL seconds reaches
+  LLM_BREAKER_SLOW_RATE, the circuit opens;
+* open      → calls fail immediately with CircuitOpenError (HTTP 503 with
+  Retry-After). A background thread probes the provider every
+  LLM_BREAKER_OPEN_SECONDS with a cheap request (model list) and moves
+  the circuit to half-open once it answers; providers without a probe
+  turn half-open when the open period ends;
+* half-open → one trial call passes; success closes the circuit, failure
+  or a slow answer opens it again.
+
+CircuitOpenError is an LLMOverloadedError, so views answer it the same way
+as a full admission queue. ``observe()`` collects the outcomes of the
+guarded calls made inside it: the services swallow provider errors and
+return fallbacks, so this is how the router learns that a call failed.
+Circuit states are reported by GET /api/llm/models/ (to hide dead
+providers) and GET /api/llm/queue/.
+
+Usage:
+    from api.llm_breaker import breaker
+    breaker.check("local", model)           # fail fast before queueing
+    with breaker.guard("local", model):
+        response = client.chat(...)
+"""
+
+import contextlib
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+
+from decouple import config
+
+from .llm_admission import LLMOverloadedError
+
+logger = logging.getLogger(__name__)
+
+LLM_BREAKER_ENABLED = config("LLM_BREAKER_ENABLED", default=True, cast=bool)
+LLM_BREAKER_WINDOW = config("LLM_BREAKER_WINDOW", default=20, cast=int)
+LLM_BREAKER_MIN_CALLS = config("LLM_BREAKER_MIN_CALLS", default=5, cast=int)
+LLM_BREAKER_FAILURE_RATE = config(
+    "LLM_BREAKER_FAILURE_RATE",
+    default=0.5,
+    cast=float,
+)
+LLM_BREAKER_SLOW_CALL = config("LLM_BREAKER_SLOW_CALL", default=30.0, cast=float)
+LLM_BREAKER_SLOW_RATE = config("LLM_BREAKER_SLOW_RATE", default=0.8, cast=float)
+LLM_BREAKER_OPEN_SECONDS = config(
+    "LLM_BREAKER_OPEN_SECONDS",
+    default=30.0,
+    cast=float,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+# Исходы вызовов под guard() внутри observe(): True — успех
+_outcomes: contextvars.ContextVar[list[bool] | None] = contextvars.ContextVar(
+    "llm_breaker_outcomes",
+    default=None,
+)
+
+
+@contextlib.contextmanager
+def observe():
+    """Собрать исходы вызовов провайдера под guard() внутри блока."""
+    outcomes: list[bool] = []
+    token = _outcomes.set(outcomes)
+    try:
+        yield outcomes
+    finally:
+        _outcomes.reset(token)
+
+
+@contextlib.contextmanager
+def _report_outcome():
+    outcomes = _outcomes.get()
+    try:
+        yield
+    except Exception:
+        if outcomes is not None:
+            outcomes.append(False)
+        raise
+    if outcomes is not None:
+        outcomes.append(True)
+
+
+class CircuitOpenError(LLMOverloadedError):
+    """Provider/model is considered down; the call was not attempted."""
+
+    def __init__(self, provider: str, model: str, retry_after: int) -> None:
+        super().__init__(
+            f"LLM provider {provider} ({model}) is unavailable",
+            status_code=503,
+            retry_after=retry_after,
+        )
+        self.provider = provider
+        self.model = model
+
+
+class _Circuit:
+    def __init__(self, window: int) -> None:
+        self.state = CLOSED
+        self.calls: deque[tuple[bool, bool]] = deque(maxlen=window)  # (failed, slow)
+        self.opened_at = 0.0
+        self.trials = 0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+
+    def stats(self) -> dict:
+        failed = sum(1 for f, _ in self.calls if f)
+        slow = sum(1 for _, s in self.calls if s)
+        return {
+            "state": self.state,
+            "calls": len(self.calls),
+            "failures": failed,
+            "slow": slow,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
+
+
+class CircuitBreaker:
+    """Per-(provider, model) closed / open / half-open circuits."""
+
+    def __init__(
+        self,
+        *,
+        enabled: bool = True,
+        window: int,
+        min_calls: int,
+        failure_rate: float,
+        slow_call: float,
+        slow_rate: float,
+        open_seconds: float,
+    ) -> None:
+        self.enabled = enabled
+        self.window = window
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self._probes: dict[str, Callable[[str], object]] = {}
+        self._circuits: dict[tuple[str, str], _Circuit] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def register_probe(self, provider: str, probe: Callable[[str], object]) -> None:
+        """probe(model) должен бросить исключение, если провайдер недоступен."""
+        self._probes[provider] = probe
+
+    def _circuit(self, provider: str, model: str) -> _Circuit:
+        """Под self._lock: цепь для пары (provider, model)."""
+        if self._pid != os.getpid():
+            # Потоки проб не переживают fork
+            self._circuits = {}
+            self._pid = os.getpid()
+        key = (provider, model)
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit(self.window)
+        if (
+            circuit.state == OPEN
+            and not circuit.probing
+            and time.monotonic() - circuit.opened_at >= self.open_seconds
+        ):
+            circuit.state = HALF_OPEN
+            circuit.trials = 0
+        return circuit
+
+    def _retry_after(self, circuit: _Circuit) -> int:
+        if circuit.state != OPEN:
+            return 1
+        remaining = self.open_seconds - (time.monotonic() - circuit.opened_at)
+        return max(1, math.ceil(remaining))
+
+    def _rejects(self, circuit: _Circuit) -> bool:
+        return circuit.state == OPEN or (
+            circuit.state == HALF_OPEN and circuit.trials > 0
+        )
+
+    def state(self, provider: str, model: str) -> str:
+        if not self.enabled:
+            return CLOSED
+        with self._lock:
+            return self._circuit(provider, model).state
+
+    def states(self, provider: str, models: list[str]) -> dict[str, str]:
+        return {model: self.state(provider, model) for model in models}
+
+    def check(self, provider: str, model: str) -> None:
+        """Бросить CircuitOpenError, если вызов сейчас был бы отклонён."""
+        if not self.enabled:
+            return
+        with self._lock:
+            circuit = self._circuit(provider, model)
+            if self._rejects(circuit):
+                circuit.rejected += 1
+                raise CircuitOpenError(provider, model, self._retry_after(circuit))
+
+    def _admit(self, provider: str, model: str) -> _Circuit:
+        with self._lock:
+            circuit = self._circuit(provider, model)
+            if self._rejects(circuit):
+                circuit.rejected += 1
+                raise CircuitOpenError(provider, model, self._retry_after(circuit))
+            if circuit.state == HALF_OPEN:
+                circuit.trials += 1
+            return circuit
+
+    def _open(self, provider: str, model: str, circuit: _Circuit) -> None:
+        """Под self._lock: открыть цепь и запустить фоновую пробу."""
+        circuit.state = OPEN
+        circuit.opened_at = time.monotonic()
+        circuit.trials = 0
+        circuit.opened += 1
+        logger.warning(
+            "LLM circuit %s:%s opened (%s)",
+            provider,
+            model,
+            circuit.last_error or "slow responses",
+        )
+        probe = self._probes.get(provider)
+        if probe is not None and not circuit.probing:
+            circuit.probing = True
+            threading.Thread(
+                target=self._probe_loop,
+                args=(provider, model, circuit, probe),
+                name="llm-breaker-probe",
+                daemon=True,
+            ).start()
+
+    def _record(
+        self,
+        provider: str,
+        model: str,
+        circuit: _Circuit,
+        *,
+        failed: bool,
+        slow: bool,
+    ) -> None:
+        with self._lock:
+            if circuit.state == HALF_OPEN:
+                circuit.trials = max(0, circuit.trials - 1)
+                if failed or slow:
+                    self._open(provider, model, circuit)
+                else:
+                    circuit.state = CLOSED
+                    circuit.calls.clear()
+                    logger.info("LLM circuit %s:%s closed", provider, model)
+                return
+            if circuit.state == OPEN:
+                # Вызов начался до открытия цепи
+                return
+            circuit.calls.append((failed, slow))
+            total = len(circuit.calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for f, _ in circuit.calls if f)
+            slow_calls = sum(1 for _, s in circuit.calls if s)
+            if (
+                failures / total >= self.failure_rate
+                or slow_calls / total >= self.slow_rate
+            ):
+                self._open(provider, model, circuit)
+
+    def _abort(self, circuit: _Circuit) -> None:
+        """Вызов прерван (отмена, закрытие потока) — ничего не учитываем."""
+        with self._lock:
+            if circuit.state == HALF_OPEN:
+                circuit.trials = max(0, circuit.trials - 1)
+
+    @contextlib.contextmanager
+    def guard(self, provider: str, model: str, *, timed: bool = True):
+        """
+        Выполнить вызов провайдера под защитой цепи.
+
+        timed=False — не учитывать длительность (потоковые ответы, где она
+        зависит от длины ответа, а не от здоровья провайдера).
+        """
+        with _report_outcome():
+            if not self.enabled:
+                yield
+                return
+            circuit = self._admit(provider, model)
+            started = time.monotonic()
+            try:
+                yield
+            except Exception as e:
+                circuit.last_error = str(e) or type(e).__name__
+                self._record(provider, model, circuit, failed=True, slow=False)
+                raise
+            except BaseException:
+                self._abort(circuit)
+                raise
+            slow = timed and time.monotonic() - started >= self.slow_call
+            self._record(provider, model, circuit, failed=False, slow=slow)
+
+    def _probe_loop(self, provider, model, circuit, probe) -> None:
+        try:
+            while True:
+                time.sleep(self.open_seconds)
+                if circuit.state != OPEN:
+                    return
+                try:
+                    probe(model)
+                except Exception as e:
+                    with self._lock:
+                        circuit.last_error = str(e) or type(e).__name__
+                        if circuit.state == OPEN:
+                            circuit.opened_at = time.monotonic()
+                    continue
+                with self._lock:
+                    if circuit.state == OPEN:
+                        circuit.state = HALF_OPEN
+                        circuit.trials = 0
+                        logger.info("LLM circuit %s:%s half-open", provider, model)
+                return
+        finally:
+            circuit.probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            for provider, model in list(self._circuits):
+                self._circuit(provider, model)
+            return {
+                f"{provider}:{model}": circuit.stats()
+                for (provider, model), circuit in self._circuits.items()
+            }
+
+    def reset(self) -> None:
+        """Закрыть все цепи и забыть статистику (для тестов)."""
+        with self._lock:
+            for circuit in self._circuits.values():
+                # Фоновые пробы завершатся при следующей проверке состояния
+                circuit.state = CLOSED
+            self._circuits = {}
+
+
+breaker = CircuitBreaker(
+    enabled=LLM_BREAKER_ENABLED,
+    window=LLM_BREAKER_WINDOW,
+    min_calls=LLM_BREAKER_MIN_CALLS,
+    failure_rate=LLM_BREAKER_FAILURE_RATE,
+    slow_call=LLM_BREAKER_SLOW_CALL,
+    slow_rate=LLM_BREAKER_SLOW_RATE,
+    open_seconds=LLM_BREAKER_OPEN_SECONDS,
+)
@@ -0,0 +1,314 @@
+"""
+In-process result cache for navigation intents.
+
+Navigation phrases repeat a lot ("открой каталог", "тёмная тема"), so the
+parsed results of get_action_code / get_navigation / get_product_filters /
+get_weather_city are cached per
+
+    (kind, provider, model, prompt fingerprint, normalized question)
+
+The prompt fingerprint hashes the system prompt (which already embeds the
+category list and the templates) together with ACTIONS_MAP (passed in by
+api.llm_service), so changing any of them makes old entries unreachable;
+they age out via TTL / LRU.
+
+Only successful LLM round trips are cached — exceptions propagate to the
+caller and leave the cache untouched. A compute function that had to fall
+back to a default (nothing parseable in the answer) returns it wrapped in
+Uncached, and None results are never stored either, so the next request
+asks the model again instead of getting the fallback for the whole TTL.
+Quota accounting happens in the views and is not affected by cache hits.
+
+SingleFlight collapses identical concurrent calls: while one generation
+for a key is in flight, other threads (or tasks of the same event loop)
+asking for the same key wait for it and share its result or exception.
+Cache misses and chat generations go through the process-wide
+``inflight`` instance.
+"""
+
+import asyncio
+import functools
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import NamedTuple
+
+from decouple import config
+
+LLM_INTENT_CACHE_SIZE = config("LLM_INTENT_CACHE_SIZE", default=1024, cast=int)
+LLM_INTENT_CACHE_TTL = config("LLM_INTENT_CACHE_TTL", default=3600, cast=int)
+LLM_SINGLE_FLIGHT = config("LLM_SINGLE_FLIGHT", default=True, cast=bool)
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Case-fold, ё→е, punctuation and whitespace collapsed to single spaces."""
+    text = text.casefold().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def prompt_fingerprint(*parts: str) -> str:
+    """Short content hash of the prompt parts an answer depends on."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class Uncached(NamedTuple):
+    """Result handed to the caller but kept out of the cache (a fallback)."""
+
+    value: object
+
+
+def unwrap(value: object) -> object:
+    """The value itself, or the payload of an Uncached wrapper."""
+    return value.value if isinstance(value, Uncached) else value
+
+
+class _Call:
+    __slots__ = ("done", "error", "result")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+# Result of a flight whose leader was cancelled
+_ABANDONED = object()
+
+
+class SingleFlight:
+    """Share one in-flight execution between concurrent callers of a key."""
+
+    def __init__(self, *, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._futures: dict[tuple, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], object]):
+        """Run *fn* once for all threads calling with the same *key*."""
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[object]]):
+        """
+        Async variant of do(); calls are shared within one event loop.
+
+        If the leader is cancelled, its followers are not: one of them
+        re-runs *fn* as the new leader and the rest wait for it.
+        """
+        if not self.enabled:
+            return await fn()
+        loop = asyncio.get_running_loop()
+        # Futures are bound to their loop, so each loop has its own flights
+        flight_key = (key, loop)
+        while True:
+            with self._lock:
+                future = self._futures.get(flight_key)
+                leader = future is None
+                if leader:
+                    future = self._futures[flight_key] = loop.create_future()
+                    self.leaders += 1
+                else:
+                    self.coalesced += 1
+            if leader:
+                return await self._lead(flight_key, future, fn)
+            # shield: a cancelled follower must not cancel the shared call
+            result = await asyncio.shield(future)
+            if result is not _ABANDONED:
+                return result
+
+    async def _lead(self, flight_key, future, fn):
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Followers retry instead of inheriting the leader's cancellation
+            future.set_result(_ABANDONED)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # retrieved: no "never retrieved" warning
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._futures[flight_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._calls) + len(self._futures),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.leaders = 0
+            self.coalesced = 0
+
+
+inflight = SingleFlight(enabled=LLM_SINGLE_FLIGHT)
+
+
+class TTLLRUCache:
+    """
+    Thread-safe LRU cache with per-entry TTL and hit/miss counters.
+
+    Misses are computed through *flight* (if given), so concurrent misses
+    of one key trigger a single computation.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        flight: SingleFlight | None = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.flight = flight
+        self._data: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> tuple[bool, object]:
+        """Return (found, value); expired entries count as misses."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key: Hashable, value: object) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _store(self, key: Hashable, value: object) -> object:
+        """Cache a computed value unless it is None or Uncached; return it."""
+        if value is not None and not isinstance(value, Uncached):
+            self.set(key, value)
+        return unwrap(value)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        """Return the cached value or compute and store it."""
+        if self.flight is not None:
+            compute = functools.partial(self.flight.do, key, compute)
+        if not self.enabled:
+            return unwrap(compute())
+        found, value = self.get(key)
+        if found:
+            return value
+        return self._store(key, compute())
+
+    async def aget_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[object]],
+    ):
+        """Async variant of get_or_compute."""
+        if self.flight is not None:
+            compute = functools.partial(self.flight.ado, key, compute)
+        if not self.enabled:
+            return unwrap(await compute())
+        found, value = self.get(key)
+        if found:
+            return value
+        return self._store(key, await compute())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+intent_cache = TTLLRUCache(
+    maxsize=LLM_INTENT_CACHE_SIZE,
+    ttl=LLM_INTENT_CACHE_TTL,
+    flight=inflight,
+)
+
+
+def intent_cache_key(
+    kind: str,
+    provider: str,
+    model: str,
+    question: str,
+    *prompt_parts: str,
+) -> tuple:
+    """Cache key for one parsed intent result."""
+    return (
+        kind,
+        provider,
+        model,
+        prompt_fingerprint(*prompt_parts),
+        normalize_question(question),
+    )
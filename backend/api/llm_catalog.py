@@ -0,0 +1,197 @@
+"""
+Shared cache of the Ollama model catalog (``/api/tags``).
+
+The frontend asks for the model list every time the chat opens, and each
+call used to be a blocking round trip to Ollama. The catalog is kept in
+process memory:
+
+* younger than LLM_MODELS_CACHE_TTL  → served as is;
+* younger than LLM_MODELS_STALE_TTL  → served as is while one background
+  thread refreshes it (stale-while-revalidate);
+* older, empty or invalidated        → refreshed synchronously; concurrent
+  callers wait for the same fetch.
+
+If Ollama is unreachable the last known catalog is served. Besides names
+the catalog keeps per-model metadata (size, family, parameter size,
+quantization) for role filtering and routing.
+
+The process-wide instance for Ollama is ``api.llm_service.model_catalog``.
+
+Usage:
+    from api.llm_service import model_catalog
+    names = model_catalog.names()
+    info = model_catalog.info("qwen3:8b")
+"""
+
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+
+logger = logging.getLogger(__name__)
+
+# Пауза между синхронными попытками, пока Ollama недоступна
+RETRY_BACKOFF = 5.0
+
+
+@dataclass(frozen=True)
+class ModelInfo:
+    """Метаданные одной модели из /api/tags."""
+
+    name: str
+    size: int | None = None
+    family: str | None = None
+    parameter_size: str | None = None
+    quantization: str | None = None
+    digest: str | None = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _field(obj, name):
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def parse_model_list(response) -> list[ModelInfo]:
+    """Разобрать ответ client.list() (объекты ollama или словари)."""
+    models = []
+    for item in _field(response, "models") or []:
+        name = _field(item, "model") or _field(item, "name")
+        if not name:
+            continue
+        details = _field(item, "details") or {}
+        size = _field(item, "size")
+        models.append(
+            ModelInfo(
+                name=name,
+                size=int(size) if size is not None else None,
+                family=_field(details, "family"),
+                parameter_size=_field(details, "parameter_size"),
+                quantization=_field(details, "quantization_level"),
+                digest=_field(item, "digest"),
+            ),
+        )
+    return models
+
+
+class ModelCatalog:
+    """TTL cache with stale-while-revalidate refresh of a model list."""
+
+    def __init__(
+        self,
+        fetch: Callable[[], list[ModelInfo]],
+        *,
+        ttl: float,
+        stale_ttl: float,
+    ) -> None:
+        self._fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self._models: dict[str, ModelInfo] = {}
+        self._fetched_at: float | None = None
+        self._attempted_at: float | None = None
+        self._attempts = 0
+        self._refresh_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self._last_error: str | None = None
+        self._pid = os.getpid()
+        self.refreshes = 0
+
+    def _age(self) -> float | None:
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def _load(self) -> None:
+        """Под self._refresh_lock: загрузить каталог, при ошибке оставить прежний."""
+        self._attempts += 1
+        self._attempted_at = time.monotonic()
+        try:
+            models = self._fetch()
+        except Exception as e:
+            self._last_error = str(e)
+            logger.warning("Model catalog refresh failed: %s", e)
+            return
+        self._models = {model.name: model for model in models}
+        self._fetched_at = time.monotonic()
+        self._last_error = None
+        self.refreshes += 1
+        logger.debug("Model catalog refreshed: %d models", len(models))
+
+    def refresh(self) -> None:
+        """Перезагрузить каталог; при ошибке оставить прежние данные."""
+        with self._refresh_lock:
+            self._load()
+
+    def _refresh_once(self, seen_attempts: int) -> None:
+        with self._refresh_lock:
+            # Пока ждали блокировку, каталог мог загрузить другой поток
+            if self._attempts == seen_attempts:
+                self._load()
+
+    def _refresh_in_background(self) -> None:
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run() -> None:
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="model-catalog-refresh", daemon=True).start()
+
+    def _ensure_fresh(self) -> None:
+        if self._pid != os.getpid():
+            # Поток фонового обновления не переживает fork
+            self._refresh_lock = threading.Lock()
+            self._state_lock = threading.Lock()
+            self._refreshing = False
+            self._pid = os.getpid()
+
+        age = self._age()
+        if age is None or age >= self.stale_ttl:
+            recently_failed = (
+                self._last_error is not None
+                and time.monotonic() - self._attempted_at < RETRY_BACKOFF
+            )
+            if not recently_failed:
+                self._refresh_once(self._attempts)
+        elif age >= self.ttl:
+            self._refresh_in_background()
+
+    def models(self) -> list[ModelInfo]:
+        self._ensure_fresh()
+        return list(self._models.values())
+
+    def names(self) -> list[str]:
+        return [model.name for model in self.models()]
+
+    def info(self, name: str) -> ModelInfo | None:
+        self._ensure_fresh()
+        return self._models.get(name)
+
+    def invalidate(self) -> None:
+        """Следующее обращение перезагрузит каталог синхронно."""
+        self._fetched_at = None
+        self._attempted_at = None
+
+    def stats(self) -> dict:
+        age = self._age()
+        return {
+            "models": len(self._models),
+            "age": round(age, 1) if age is not None else None,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "refreshing": self._refreshing,
+            "refreshes": self.refreshes,
+            "last_error": self._last_error,
+        }
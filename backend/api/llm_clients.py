@@ -0,0 +1,244 @@
+"""
+Process-wide registries of reusable LLM clients.
+
+Creating ``ollama.Client`` / ``OpenAI`` objects per call means a fresh
+HTTP connection pool (and a TLS handshake for Cloud.ru) on every request.
+The registries below build one client per (provider, endpoint) and share
+it between threads, so keep-alive connections are reused.
+
+Clients are dropped in forked children (gunicorn workers): sockets
+inherited from the parent must not be shared between processes.
+
+Async clients are additionally keyed by the running event loop, because
+their connection pools are bound to the loop that created them. Loops are
+held weakly, and clients of closed loops are dropped on the next lookup.
+Keep-alive reuse across requests therefore only happens under ASGI, where
+one loop serves the whole process. Under WSGI async_to_sync runs every
+async view in a fresh loop, so the view closes that loop's clients with
+aclose_loop_clients() before the loop ends instead of leaving the sockets
+to the garbage collector.
+
+Usage:
+    from api.llm_clients import get_ollama_client, get_openai_client
+    client = get_ollama_client("http://ollama:11434")
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from collections.abc import Awaitable, Callable, Hashable
+
+import httpx
+import openai
+from decouple import config
+from ollama import AsyncClient, Client
+
+logger = logging.getLogger(__name__)
+
+LLM_POOL_MAX_CONNECTIONS = config("LLM_POOL_MAX_CONNECTIONS", default=20, cast=int)
+LLM_POOL_MAX_KEEPALIVE = config("LLM_POOL_MAX_KEEPALIVE", default=10, cast=int)
+LLM_POOL_KEEPALIVE_EXPIRY = config(
+    "LLM_POOL_KEEPALIVE_EXPIRY",
+    default=30.0,
+    cast=float,
+)
+LLM_CONNECT_TIMEOUT = config("LLM_CONNECT_TIMEOUT", default=5.0, cast=float)
+OLLAMA_TIMEOUT = config("OLLAMA_TIMEOUT", default=120.0, cast=float)
+SBER_TIMEOUT = config("SBER_TIMEOUT", default=60.0, cast=float)
+SBER_MAX_RETRIES = config("SBER_MAX_RETRIES", default=1, cast=int)
+
+
+class ClientRegistry:
+    """Thread-safe, fork-aware cache of clients built by a factory."""
+
+    def __init__(self, factory: Callable[..., object]) -> None:
+        self._factory = factory
+        self._clients: dict[Hashable, object] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get(self, key: Hashable, *args, **kwargs):
+        """Return the client for *key*, building it on first use."""
+        if self._pid != os.getpid():
+            self.reset()
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._factory(*args, **kwargs)
+                self._clients[key] = client
+                logger.debug("Created pooled LLM client for %s", key)
+            return client
+
+    def items(self) -> list[tuple[Hashable, object]]:
+        """(key, client) pairs built so far."""
+        with self._lock:
+            return list(self._clients.items())
+
+    def reset(self) -> None:
+        """
+        Forget all clients (after fork or in tests).
+
+        Clients are not closed: in a forked child their sockets still
+        belong to the parent process.
+        """
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+
+class LoopClientRegistry(ClientRegistry):
+    """ClientRegistry per running event loop; closed loops are evicted."""
+
+    def __init__(
+        self,
+        factory: Callable[..., object],
+        closer: Callable[[object], Awaitable[None]],
+    ) -> None:
+        super().__init__(factory)
+        self._closer = closer
+        self._loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def get(self, key: Hashable, *args, **kwargs):
+        """Return the client for *key* in the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._pid != os.getpid():
+            self.reset()
+        with self._lock:
+            # Клиенты закрытого loop непригодны и держат ссылки на него
+            for closed in [other for other in self._loops if other.is_closed()]:
+                del self._loops[closed]
+            registry = self._loops.get(loop)
+            if registry is None:
+                registry = self._loops[loop] = ClientRegistry(self._factory)
+        return registry.get(key, *args, **kwargs)
+
+    async def aclose_loop(self) -> None:
+        """Close and forget the clients of the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            registry = self._loops.pop(loop, None)
+        if registry is None:
+            return
+        for key, client in registry.items():
+            try:
+                await self._closer(client)
+            except Exception as exc:
+                logger.warning("Failed to close LLM client for %s: %s", key, exc)
+
+    def reset(self) -> None:
+        super().reset()
+        self._loops = weakref.WeakKeyDictionary()
+
+
+def _ollama_client_kwargs() -> dict:
+    return {
+        "timeout": httpx.Timeout(OLLAMA_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def _openai_http_client_kwargs() -> dict:
+    # The SDK ships its own httpx flavour; build Limits/Timeout from its types
+    limits_cls = type(openai.DEFAULT_CONNECTION_LIMITS)
+    return {
+        "timeout": openai.Timeout(SBER_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        "limits": limits_cls(
+            max_connections=LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def _build_ollama_client(host: str) -> Client:
+    return Client(host=host, **_ollama_client_kwargs())
+
+
+def _build_async_ollama_client(host: str) -> AsyncClient:
+    return AsyncClient(host=host, **_ollama_client_kwargs())
+
+
+async def _close_async_ollama_client(client: AsyncClient) -> None:
+    # ollama.AsyncClient has no aclose(); the pool lives in its httpx client
+    await client._client.aclose()  # noqa: SLF001
+
+
+def _build_openai_client(api_key: str, base_url: str) -> openai.OpenAI:
+    http_kwargs = _openai_http_client_kwargs()
+    return openai.OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=http_kwargs["timeout"],
+        max_retries=SBER_MAX_RETRIES,
+        http_client=openai.DefaultHttpxClient(**http_kwargs),
+    )
+
+
+def _build_async_openai_client(api_key: str, base_url: str) -> openai.AsyncOpenAI:
+    http_kwargs = _openai_http_client_kwargs()
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=http_kwargs["timeout"],
+        max_retries=SBER_MAX_RETRIES,
+        http_client=openai.DefaultAsyncHttpxClient(**http_kwargs),
+    )
+
+
+ollama_clients = ClientRegistry(_build_ollama_client)
+openai_clients = ClientRegistry(_build_openai_client)
+async_ollama_clients = LoopClientRegistry(
+    _build_async_ollama_client,
+    _close_async_ollama_client,
+)
+async_openai_clients = LoopClientRegistry(
+    _build_async_openai_client,
+    openai.AsyncOpenAI.close,
+)
+
+
+def get_ollama_client(host: str) -> Client:
+    """Shared ``ollama.Client`` for *host*."""
+    return ollama_clients.get(host, host)
+
+
+def get_openai_client(api_key: str, base_url: str) -> openai.OpenAI:
+    """Shared ``OpenAI`` client for (*api_key*, *base_url*)."""
+    return openai_clients.get((api_key, base_url), api_key, base_url)
+
+
+def get_async_ollama_client(host: str) -> AsyncClient:
+    """Shared ``ollama.AsyncClient`` for *host* in the running event loop."""
+    return async_ollama_clients.get(host, host)
+
+
+def get_async_openai_client(api_key: str, base_url: str) -> openai.AsyncOpenAI:
+    """Shared ``AsyncOpenAI`` client for the running event loop."""
+    return async_openai_clients.get((api_key, base_url), api_key, base_url)
+
+
+async def aclose_loop_clients() -> None:
+    """Close the async clients of the running event loop before it ends."""
+    await async_ollama_clients.aclose_loop()
+    await async_openai_clients.aclose_loop()
+
+
+def reset_clients() -> None:
+    """Drop every pooled client; called automatically in forked children."""
+    ollama_clients.reset()
+    openai_clients.reset()
+    async_ollama_clients.reset()
+    async_openai_clients.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_clients)
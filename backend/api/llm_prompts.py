@@ -0,0 +1,164 @@
+"""
+Cache of the rendered LLM system prompts.
+
+Every navigate request that reached the filters step queried
+``Category.objects.values_list("name")`` and formatted the filters (or
+combined navigation) template again. The category names and the prompts
+built from them are now kept in ``prompt_cache``:
+
+* the category list is loaded once and dropped by the ``post_save`` /
+  ``post_delete`` signals of Category (api.models), right away and again
+  after the transaction commits; LLM_PROMPT_CACHE_TTL bounds how long
+  other worker processes, which do not see the signal, keep a stale list;
+* prompts are memoized per (name, categories) and keep returning the same
+  string object, so the system prompt prefix stays byte-identical between
+  requests and the model server can reuse its prompt (KV) cache;
+* every prompt has a ``version`` — a content hash of its text. The intent
+  cache keys use it instead of hashing the whole prompt on each call, and
+  any change of the text (a new category) yields a new version, so results
+  cached for the old prompt become unreachable.
+
+The module does not import Django: the loader of the category names is
+passed in by the caller.
+
+Usage:
+    from api.llm_prompts import prompt_cache
+    categories = prompt_cache.categories(load_category_names)
+    prompt = prompt_cache.get("filters", build_filters_prompt, categories)
+    prompt.text, prompt.version
+"""
+
+import threading
+import time
+from collections.abc import Callable
+from typing import NamedTuple
+
+from decouple import config
+
+from .llm_cache import prompt_fingerprint
+
+LLM_PROMPT_CACHE_TTL = config("LLM_PROMPT_CACHE_TTL", default=300, cast=int)
+
+# Наборов категорий обычно один; предел защищает от произвольных списков
+_MAX_PROMPTS = 64
+
+
+class Prompt(NamedTuple):
+    name: str
+    text: str
+    version: str
+
+
+class PromptCache:
+    """Список категорий и построенные по нему промпты с версиями."""
+
+    def __init__(self, *, ttl: float = LLM_PROMPT_CACHE_TTL) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._prompts: dict[tuple[str, tuple | None], Prompt] = {}
+        self._versions: dict[str, str] = {}
+        self._categories: list[str] | None = None
+        self._loaded_at = 0.0
+        # Увеличивается при инвалидации: загрузка, начатая до неё, не сохраняется
+        self._generation = 0
+        self.loads = 0
+        self.builds = 0
+        self.invalidations = 0
+
+    def cached_categories(self) -> list[str] | None:
+        """Список категорий, если он загружен и не устарел; иначе None."""
+        with self._lock:
+            if self._categories is None:
+                return None
+            if self.ttl and time.monotonic() - self._loaded_at > self.ttl:
+                self._categories = None
+                return None
+            return self._categories
+
+    def categories(self, load: Callable[[], list[str]]) -> list[str]:
+        """Список категорий из кэша или от load() (запрос к БД)."""
+        categories = self.cached_categories()
+        if categories is not None:
+            return categories
+        with self._lock:
+            generation = self._generation
+        categories = list(load())
+        with self._lock:
+            self.loads += 1
+            if generation == self._generation:
+                self._categories = categories
+                self._loaded_at = time.monotonic()
+        return categories
+
+    def get(
+        self,
+        name: str,
+        build: Callable[[list[str] | None], str],
+        categories: list[str] | None = None,
+    ) -> Prompt:
+        """Промпт name, построенный build(categories) один раз на набор категорий."""
+        key = (name, None if categories is None else tuple(categories))
+        prompt = self._prompts.get(key)
+        if prompt is not None:
+            return prompt
+        text = build(categories)
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is None:
+                if len(self._prompts) >= _MAX_PROMPTS:
+                    self._prompts.clear()
+                prompt = Prompt(name, text, self._version(text))
+                self._prompts[key] = prompt
+                self.builds += 1
+        return prompt
+
+    def _version(self, text: str) -> str:
+        version = self._versions.get(text)
+        if version is None:
+            if len(self._versions) >= _MAX_PROMPTS:
+                self._versions.clear()
+            version = self._versions[text] = prompt_fingerprint(text)
+        return version
+
+    def version(self, text: str) -> str:
+        """Версия (хэш содержимого) текста промпта, в том числе статического."""
+        version = self._versions.get(text)
+        if version is not None:
+            return version
+        with self._lock:
+            return self._version(text)
+
+    def invalidate(self) -> None:
+        """Забыть категории и промпты (сигналы Category, ручной сброс)."""
+        with self._lock:
+            self._generation += 1
+            self._categories = None
+            self._prompts = {}
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            age = None
+            if self._categories is not None:
+                age = round(time.monotonic() - self._loaded_at, 1)
+            return {
+                "ttl": self.ttl,
+                "categories": None
+                if self._categories is None
+                else len(self._categories),
+                "categories_age_seconds": age,
+                "prompts": [
+                    {
+                        "name": prompt.name,
+                        "categories": None if categories is None else len(categories),
+                        "version": prompt.version,
+                    }
+                    for (_, categories), prompt in self._prompts.items()
+                ],
+                "loads": self.loads,
+                "builds": self.builds,
+                "invalidations": self.invalidations,
+            }
+
+
+prompt_cache = PromptCache()
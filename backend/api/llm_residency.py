@@ -0,0 +1,167 @@
+"""
+Keeps local Ollama models resident and their fixed prompts hot.
+
+* Every OllamaService call passes ``keep_alive`` (LLM_KEEP_ALIVE, per-model
+  LLM_MODEL_KEEP_ALIVE), so models are not unloaded after 5 idle minutes.
+* warm_model() loads a model and then sends each fixed system prompt once
+  with ``num_predict=1``. Ollama keeps the KV cache of the last prompt per
+  parallel slot and reuses the longest common prefix, so the next real
+  navigation request only evaluates the user's question. The prompt used
+  by the configured navigation strategy is primed last to stay hot.
+* residency_status() reports load state, RAM/VRAM size and expiry for the
+  configured and currently loaded models (Ollama ``/api/ps``).
+
+Entry points: ``python manage.py warmup_llm`` and, when
+LLM_WARMUP_ON_STARTUP is set, a background warmup from ApiConfig.ready().
+
+Usage:
+    from api.llm_residency import warm_models, residency_status
+    warm_models(["alibayram/smollm3"])
+"""
+
+import logging
+import threading
+import time
+
+from decouple import Csv, config
+
+from .llm_prompts import prompt_cache
+from .llm_service import (
+    DEFAULT_MODEL,
+    NAVIGATION_OPTIONS,
+    NAVIGATION_STRATEGY,
+    NAVIGATION_TWO_STEP,
+    OllamaService,
+    action_code_messages,
+    chat_messages,
+    filters_messages,
+    keep_alive_for,
+    navigation_messages,
+    weather_city_messages,
+)
+from .models import Category
+
+logger = logging.getLogger(__name__)
+
+LLM_WARMUP_MODELS = config("LLM_WARMUP_MODELS", default=DEFAULT_MODEL, cast=Csv())
+LLM_WARMUP_ON_STARTUP = config("LLM_WARMUP_ON_STARTUP", default=False, cast=bool)
+
+# Короткий «вопрос» для прогрева: важен только системный промпт перед ним
+_WARMUP_QUESTION = "."
+
+
+def _category_names() -> list[str] | None:
+    try:
+        return prompt_cache.categories(
+            lambda: Category.objects.values_list("name", flat=True).order_by("name"),
+        )
+    except Exception as e:
+        logger.warning("Warmup: categories unavailable, using generic prompt: %s", e)
+        return None
+
+
+def warmup_prompts(categories: list[str] | None) -> list[tuple[str, list[dict]]]:
+    """Фиксированные промпты в порядке прогрева (последний останется горячим)."""
+    navigation = [
+        ("action_code", action_code_messages(_WARMUP_QUESTION)),
+        ("navigation", navigation_messages(_WARMUP_QUESTION, categories)),
+    ]
+    if NAVIGATION_STRATEGY == NAVIGATION_TWO_STEP:
+        navigation.reverse()
+    return [
+        ("chat", chat_messages(_WARMUP_QUESTION)),
+        ("weather_city", weather_city_messages(_WARMUP_QUESTION)),
+        ("filters", filters_messages(_WARMUP_QUESTION, categories)),
+        *navigation,
+    ]
+
+
+def warm_model(model: str, categories: list[str] | None = None) -> dict:
+    """Загрузить модель и прогреть префиксы системных промптов."""
+    client = OllamaService.get_client()
+    keep_alive = keep_alive_for(model)
+    result = {"model": model, "load_ms": None, "primed": [], "error": None}
+    try:
+        started = time.perf_counter()
+        # Пустой prompt только загружает модель в память
+        client.generate(model=model, prompt="", keep_alive=keep_alive)
+        result["load_ms"] = round(1000 * (time.perf_counter() - started), 1)
+
+        for name, messages in warmup_prompts(categories):
+            client.chat(
+                model=model,
+                messages=messages,
+                stream=False,
+                options={**NAVIGATION_OPTIONS, "num_predict": 1},
+                keep_alive=keep_alive,
+            )
+            result["primed"].append(name)
+    except Exception as e:
+        logger.warning("Warmup of %s failed: %s", model, e)
+        result["error"] = str(e)
+    return result
+
+
+def warm_models(models: list[str] | None = None) -> list[dict]:
+    """Прогреть модели (по умолчанию LLM_WARMUP_MODELS)."""
+    categories = _category_names()
+    results = [warm_model(model, categories) for model in models or LLM_WARMUP_MODELS]
+    for result in results:
+        logger.info(
+            "Warmup %s: load %s ms, primed %s, error %s",
+            result["model"],
+            result["load_ms"],
+            result["primed"],
+            result["error"],
+        )
+    return results
+
+
+def start_warmup(models: list[str] | None = None) -> threading.Thread:
+    """Прогреть модели в фоновом потоке, не задерживая старт процесса."""
+    thread = threading.Thread(
+        target=warm_models,
+        args=(models,),
+        name="llm-warmup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def residency_status(models: list[str] | None = None) -> list[dict]:
+    """Состояние загрузки моделей по данным Ollama /api/ps."""
+    response = OllamaService.get_client().ps()
+    loaded = {}
+    for item in response.get("models", []):
+        name = item.get("model") or item.get("name")
+        expires_at = item.get("expires_at")
+        loaded[name] = {
+            "model": name,
+            "loaded": True,
+            "size": item.get("size"),
+            "size_vram": item.get("size_vram"),
+            "expires_at": (
+                expires_at.isoformat()
+                if hasattr(expires_at, "isoformat")
+                else expires_at
+            ),
+            "keep_alive": keep_alive_for(name),
+        }
+
+    status = [
+        loaded.pop(
+            model,
+            {
+                "model": model,
+                "loaded": False,
+                "size": None,
+                "size_vram": None,
+                "expires_at": None,
+                "keep_alive": keep_alive_for(model),
+            },
+        )
+        for model in models or LLM_WARMUP_MODELS
+    ]
+    # Загруженные, но не сконфигурированные модели тоже показываем
+    return status + list(loaded.values())
@@ -0,0 +1,600 @@
+"""
+Latency-aware routing between the local (Ollama) and external (Cloud.ru)
+providers, with hedged navigation calls.
+
+``provider=auto`` lets the router pick the provider per request. Every
+routed call is timed per (provider, kind), where kind is ``chat`` or
+``navigation``, and each candidate gets a score in seconds:
+
+    (p50 · (1 + admission load) + LLM_ROUTER_TAIL_WEIGHT · (p95 − p50))
+    / (1 − error rate) + LLM_ROUTER_COST_<PROVIDER>
+
+A call counts as an error when any of its guarded model requests failed,
+even if the service answered with a fallback. The lowest score wins.
+Providers with an open circuit are skipped, and external only takes part
+when SBER_API_KEY is set. Providers without samples are scored with
+LLM_ROUTER_PRIOR_LATENCY, so both get tried.
+
+Navigation calls (intent, filters, city) have tiny outputs, so they are
+hedged. If the primary hasn't answered within its
+LLM_HEDGE_PERCENTILE latency, the same call goes to the secondary and the
+first answer wins. A failed call (an exception or a fallback after a
+provider error) is not an answer: a primary that fails early is hedged at
+once, and the fallback is returned only when both calls fail. Only the
+slow tail is duplicated, so the load grows by roughly (100 − percentile)%. A hedge needs at least LLM_HEDGE_MIN_SAMPLES
+observations, a closed circuit and a free admission slot on the
+secondary; it never queues. The async loser is cancelled. A sync loser
+finishes in the background and its answer is dropped. Chat answers are
+long and are never hedged.
+
+Usage:
+    from api.llm_router import router
+    svc = router.service("navigation", "alibayram/smollm3")
+    code = svc.get_action_code("где мои заказы")
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+from decouple import config
+
+from .llm_admission import (
+    AdmissionController,
+    admission,
+    run_unmetered,
+    unmetered,
+)
+from .llm_async import AsyncExternalLLMService, AsyncOllamaService
+from .llm_breaker import CLOSED, OPEN, CircuitBreaker, breaker, observe
+from .llm_service import (
+    SBER_API_KEY,
+    SBER_DEFAULT_MODEL,
+    ExternalLLMService,
+    OllamaService,
+)
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_AUTO = "auto"
+KIND_CHAT = "chat"
+KIND_NAVIGATION = "navigation"
+
+LLM_AUTO_EXTERNAL_MODEL = config(
+    "LLM_AUTO_EXTERNAL_MODEL",
+    default=SBER_DEFAULT_MODEL,
+)
+LLM_ROUTER_WINDOW = config("LLM_ROUTER_WINDOW", default=200, cast=int)
+LLM_ROUTER_PRIOR_LATENCY = config(
+    "LLM_ROUTER_PRIOR_LATENCY",
+    default=2.0,
+    cast=float,
+)
+LLM_ROUTER_TAIL_WEIGHT = config("LLM_ROUTER_TAIL_WEIGHT", default=0.5, cast=float)
+# Стоимость запроса в «секундах»: чем больше, тем реже выбирается провайдер
+LLM_ROUTER_COST_LOCAL = config("LLM_ROUTER_COST_LOCAL", default=0.0, cast=float)
+LLM_ROUTER_COST_EXTERNAL = config(
+    "LLM_ROUTER_COST_EXTERNAL",
+    default=0.0,
+    cast=float,
+)
+LLM_HEDGE_ENABLED = config("LLM_HEDGE_ENABLED", default=True, cast=bool)
+LLM_HEDGE_PERCENTILE = config("LLM_HEDGE_PERCENTILE", default=95.0, cast=float)
+LLM_HEDGE_MIN_SAMPLES = config("LLM_HEDGE_MIN_SAMPLES", default=20, cast=int)
+LLM_HEDGE_MIN_DELAY = config("LLM_HEDGE_MIN_DELAY", default=0.1, cast=float)
+LLM_ROUTER_WORKERS = config("LLM_ROUTER_WORKERS", default=8, cast=int)
+
+# Нижняя граница (1 − доля ошибок), чтобы оценка оставалась конечной
+_MIN_SUCCESS_RATE = 0.1
+
+
+class Route(NamedTuple):
+    provider: str
+    model: str
+    svc: object
+
+
+class _Answer(NamedTuple):
+    ok: bool
+    result: object
+
+
+def _answered(future) -> bool:
+    """Вызов вернул ответ модели, а не исключение или запасной ответ."""
+    return future.exception() is None and future.result().ok
+
+
+class _Window:
+    """Последние наблюдения одного (provider, kind)."""
+
+    def __init__(self, size: int) -> None:
+        self.latencies: deque[float] = deque(maxlen=size)
+        self.errors: deque[bool] = deque(maxlen=size)
+
+    def percentile(self, p: float) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[round(p / 100 * (len(ordered) - 1))]
+
+    def error_rate(self) -> float:
+        if not self.errors:
+            return 0.0
+        return sum(self.errors) / len(self.errors)
+
+
+class LLMRouter:
+    """Scores providers by observed latency, errors, load and cost."""
+
+    def __init__(
+        self,
+        *,
+        window: int,
+        prior_latency: float,
+        tail_weight: float,
+        costs: dict[str, float],
+        hedging: bool,
+        hedge_percentile: float,
+        hedge_min_samples: int,
+        hedge_min_delay: float,
+        controller: AdmissionController,
+        circuit_breaker: CircuitBreaker,
+        workers: int,
+    ) -> None:
+        self.window = window
+        self.prior_latency = prior_latency
+        self.tail_weight = tail_weight
+        self.costs = costs
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.controller = controller
+        self.breaker = circuit_breaker
+        self.workers = workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.reset()
+
+    # ── наблюдения ───────────────────────────────────────────────────────
+
+    def _window(self, provider: str, kind: str) -> _Window:
+        """Под self._lock."""
+        key = (provider, kind)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _Window(self.window)
+        return window
+
+    def record(self, provider: str, kind: str, seconds: float, *, ok: bool) -> None:
+        with self._lock:
+            window = self._window(provider, kind)
+            window.errors.append(not ok)
+            if ok:
+                window.latencies.append(seconds)
+
+    def score(self, provider: str, model: str, kind: str) -> float | None:
+        """Ожидаемая «стоимость» запроса в секундах; None — провайдер недоступен."""
+        if self.breaker.state(provider, model) == OPEN:
+            return None
+        with self._lock:
+            window = self._window(provider, kind)
+            p50 = window.percentile(50)
+            p95 = window.percentile(95)
+            error_rate = window.error_rate()
+        if p50 is None:
+            p50 = p95 = self.prior_latency
+        expected = p50 * (1 + self.controller.load(provider, model))
+        expected += self.tail_weight * (p95 - p50)
+        expected /= max(1 - error_rate, _MIN_SUCCESS_RATE)
+        return expected + self.costs.get(provider, 0.0)
+
+    def rank(self, kind: str, routes: list[Route]) -> list[Route]:
+        """Маршруты по возрастанию оценки; недоступные отбрасываются."""
+        scored = [
+            (score, index, route)
+            for index, route in enumerate(routes)
+            if (score := self.score(route.provider, route.model, kind)) is not None
+        ]
+        if not scored:
+            # Все цепи открыты — пусть view ответит 503 как обычно
+            return routes
+        return [route for _, _, route in sorted(scored)]
+
+    def hedge_delay(self, provider: str, kind: str) -> float | None:
+        """Сколько ждать основной провайдер до хеджирования; None — не хеджировать."""
+        if not self.hedging:
+            return None
+        with self._lock:
+            window = self._window(provider, kind)
+            if len(window.latencies) < self.hedge_min_samples:
+                return None
+            budget = window.percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, budget)
+
+    def try_hedge(self, route: Route):
+        """Слот для хеджа или None: хедж не ждёт в очереди и не идёт в открытую цепь."""
+        if self.breaker.state(route.provider, route.model) != CLOSED:
+            return None
+        ticket = self.controller.try_acquire(route.provider, route.model)
+        if ticket is not None:
+            with self._lock:
+                self.hedges += 1
+        return ticket
+
+    def hedge_won(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    # ── маршруты ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _candidates(local_model: str, *, async_: bool) -> list[Route]:
+        routes = [
+            Route(
+                "local",
+                local_model,
+                AsyncOllamaService if async_ else OllamaService,
+            ),
+        ]
+        if SBER_API_KEY:
+            routes.append(
+                Route(
+                    "external",
+                    LLM_AUTO_EXTERNAL_MODEL,
+                    AsyncExternalLLMService if async_ else ExternalLLMService,
+                ),
+            )
+        return routes
+
+    def _routes(self, kind: str, local_model: str, *, async_: bool) -> list[Route]:
+        routes = self.rank(kind, self._candidates(local_model, async_=async_))
+        with self._lock:
+            self.routed[routes[0].provider] = self.routed.get(routes[0].provider, 0) + 1
+        return routes
+
+    def service(self, kind: str, local_model: str) -> "RoutedService":
+        """Сервис с интерфейсом OllamaService, выбирающий провайдера сам."""
+        return RoutedService(self, self._routes(kind, local_model, async_=False))
+
+    def aservice(self, kind: str, local_model: str) -> "AsyncRoutedService":
+        """Async variant of service()."""
+        return AsyncRoutedService(self, self._routes(kind, local_model, async_=True))
+
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="llm-hedge",
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def stats(self) -> dict:
+        with self._lock:
+            windows = {}
+            for (provider, kind), window in self._windows.items():
+                p50 = window.percentile(50)
+                p95 = window.percentile(95)
+                windows[f"{provider}:{kind}"] = {
+                    "samples": len(window.latencies),
+                    "p50_ms": round(1000 * p50, 1) if p50 is not None else None,
+                    "p95_ms": round(1000 * p95, 1) if p95 is not None else None,
+                    "error_rate": round(window.error_rate(), 3),
+                }
+            return {
+                "routed": dict(self.routed),
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "latency": windows,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._windows: dict[tuple[str, str], _Window] = {}
+            self.routed: dict[str, int] = {}
+            self.hedges = 0
+            self.hedge_wins = 0
+
+
+class _RoutedBase:
+    def __init__(self, router: LLMRouter, routes: list[Route]) -> None:
+        self.router = router
+        self.routes = routes
+        self.primary = routes[0]
+        self.secondary = routes[1] if len(routes) > 1 else None
+        self.provider = self.primary.provider
+        self.model = self.primary.model
+        self.hedged = False
+        self.answered_by = self.provider
+
+    def routing(self) -> dict:
+        """Сведения о маршрутизации для ответа API."""
+        return {
+            "requested": PROVIDER_AUTO,
+            "hedged": self.hedged,
+            "answered_by": self.answered_by,
+        }
+
+    def _hedge_delay(self) -> float | None:
+        if self.secondary is None:
+            return None
+        return self.router.hedge_delay(self.primary.provider, KIND_NAVIGATION)
+
+    def _record(self, route: Route, kind: str, started: float, outcomes) -> bool:
+        """
+        Учесть вызов по исходам обращений к модели.
+
+        Сервисы перехватывают ошибки провайдера и возвращают запасной ответ
+        ("000", "Ошибка: …", None), поэтому успехом считается только вызов,
+        все обращения которого к модели прошли без ошибок.
+        """
+        ok = all(outcomes)
+        elapsed = time.monotonic() - started if ok else 0.0
+        self.router.record(route.provider, kind, elapsed, ok=ok)
+        return ok
+
+    def _settle(self, first, second, winner):
+        """
+        Результат гонки основного и хеджирующего вызовов.
+
+        winner=None — оба провалились: отдаём запасной ответ, основного
+        провайдера по возможности; исключение — только если упали оба.
+        """
+        if winner is None:
+            failed_first = first.exception() is not None
+            winner = second if failed_first and second.exception() is None else first
+        elif winner is second:
+            self.router.hedge_won()
+        if winner is second:
+            self.answered_by = self.secondary.provider
+        return winner.result().result
+
+
+class RoutedService(_RoutedBase):
+    """Sync service facade: the same methods as OllamaService, routed."""
+
+    def _attempt(
+        self,
+        route: Route,
+        kind: str,
+        method: str,
+        question: str,
+        *extra,
+    ) -> _Answer:
+        started = time.monotonic()
+        with observe() as outcomes:
+            try:
+                result = getattr(route.svc, method)(question, route.model, *extra)
+            except Exception:
+                self.router.record(route.provider, kind, 0.0, ok=False)
+                raise
+        return _Answer(self._record(route, kind, started, outcomes), result)
+
+    def _call(self, route: Route, kind: str, method: str, question: str, *extra):
+        return self._attempt(route, kind, method, question, *extra).result
+
+    def _hedged(self, method: str, question: str, *extra):
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._call(self.primary, KIND_NAVIGATION, method, question, *extra)
+
+        executor = self.router.executor()
+        # Копия контекста: вызовы попадают в телеметрию запроса
+        first = executor.submit(
+            contextvars.copy_context().run,
+            self._attempt,
+            self.primary,
+            KIND_NAVIGATION,
+            method,
+            question,
+            *extra,
+        )
+        done, _ = wait([first], timeout=delay)
+        if done and _answered(first):
+            return first.result().result
+        # Медленный или уже провалившийся основной вызов — хеджируем
+        ticket = self.router.try_hedge(self.secondary)
+        if ticket is None:
+            return first.result().result
+
+        def run_secondary():
+            # Слот хеджа уже занят — вызов не встаёт в очередь запроса
+            try:
+                with unmetered():
+                    return self._attempt(
+                        self.secondary,
+                        KIND_NAVIGATION,
+                        method,
+                        question,
+                        *extra,
+                    )
+            finally:
+                ticket.release()
+
+        self.hedged = True
+        second = executor.submit(contextvars.copy_context().run, run_secondary)
+        pending = {first, second}
+        winner = None
+        while pending and winner is None:
+            # Провал не считается ответом — ждём второй вызов
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next(
+                (f for f in (first, second) if f in done and _answered(f)),
+                None,
+            )
+        return self._settle(first, second, winner)
+
+    def generate_response(self, question: str, model: str | None = None) -> str:
+        return self._call(self.primary, KIND_CHAT, "generate_response", question)
+
+    def stream_response(self, question: str, model: str | None = None):
+        # Ошибки потока не перехватываются сервисом — учитываем их здесь
+        started = time.monotonic()
+        try:
+            yield from self.primary.svc.stream_response(question, self.primary.model)
+        except Exception:
+            self.router.record(self.primary.provider, KIND_CHAT, 0.0, ok=False)
+            raise
+        self.router.record(
+            self.primary.provider,
+            KIND_CHAT,
+            time.monotonic() - started,
+            ok=True,
+        )
+
+    def get_action_code(self, question: str, model: str | None = None) -> str:
+        return self._hedged("get_action_code", question)
+
+    def get_navigation(
+        self,
+        question: str,
+        model: str | None = None,
+        categories: list[str] | None = None,
+    ) -> dict | None:
+        return self._hedged("get_navigation", question, categories)
+
+    def get_product_filters(
+        self,
+        question: str,
+        model: str | None = None,
+        categories: list[str] | None = None,
+    ) -> dict:
+        return self._hedged("get_product_filters", question, categories)
+
+    def get_weather_city(self, question: str, model: str | None = None) -> str:
+        return self._hedged("get_weather_city", question)
+
+
+class AsyncRoutedService(_RoutedBase):
+    """Async service facade: the same methods as AsyncOllamaService, routed."""
+
+    async def _attempt(self, route, kind, method, question, *extra, **kwargs):
+        started = time.monotonic()
+        with observe() as outcomes:
+            try:
+                result = await getattr(route.svc, method)(
+                    question,
+                    route.model,
+                    *extra,
+                    **kwargs,
+                )
+            except Exception:
+                self.router.record(route.provider, kind, 0.0, ok=False)
+                raise
+        return _Answer(self._record(route, kind, started, outcomes), result)
+
+    async def _call(self, route, kind, method, question, *extra, **kwargs):
+        answer = await self._attempt(route, kind, method, question, *extra, **kwargs)
+        return answer.result
+
+    async def _hedged(self, method: str, question: str, *extra):
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._call(
+                self.primary,
+                KIND_NAVIGATION,
+                method,
+                question,
+                *extra,
+            )
+        first = asyncio.ensure_future(
+            self._attempt(self.primary, KIND_NAVIGATION, method, question, *extra),
+        )
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done and _answered(first):
+            return first.result().result
+        # Медленный или уже провалившийся основной вызов — хеджируем
+        ticket = self.router.try_hedge(self.secondary)
+        if ticket is None:
+            return (await first).result
+
+        self.hedged = True
+        second = asyncio.ensure_future(
+            run_unmetered(
+                self._attempt(
+                    self.secondary,
+                    KIND_NAVIGATION,
+                    method,
+                    question,
+                    *extra,
+                ),
+            ),
+        )
+        second.add_done_callback(lambda _task: ticket.release())
+        pending = {first, second}
+        winner = None
+        try:
+            while pending and winner is None:
+                # Провал не считается ответом — ждём второй вызов
+                done, pending = await asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                winner = next(
+                    (t for t in (first, second) if t in done and _answered(t)),
+                    None,
+                )
+            return self._settle(first, second, winner)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate_response(
+        self,
+        question: str,
+        model: str | None = None,
+        *,
+        coalesce: bool = True,
+    ) -> str:
+        return await self._call(
+            self.primary,
+            KIND_CHAT,
+            "generate_response",
+            question,
+            coalesce=coalesce,
+        )
+
+    async def get_action_code(self, question: str, model: str | None = None) -> str:
+        return await self._hedged("get_action_code", question)
+
+    async def get_navigation(
+        self,
+        question: str,
+        model: str | None = None,
+        categories: list[str] | None = None,
+    ) -> dict | None:
+        return await self._hedged("get_navigation", question, categories)
+
+    async def get_product_filters(
+        self,
+        question: str,
+        model: str | None = None,
+        categories: list[str] | None = None,
+    ) -> dict:
+        return await self._hedged("get_product_filters", question, categories)
+
+    async def get_weather_city(self, question: str, model: str | None = None) -> str:
+        return await self._hedged("get_weather_city", question)
+
+
+router = LLMRouter(
+    window=LLM_ROUTER_WINDOW,
+    prior_latency=LLM_ROUTER_PRIOR_LATENCY,
+    tail_weight=LLM_ROUTER_TAIL_WEIGHT,
+    costs={"local": LLM_ROUTER_COST_LOCAL, "external": LLM_ROUTER_COST_EXTERNAL},
+    hedging=LLM_HEDGE_ENABLED,
+    hedge_percentile=LLM_HEDGE_PERCENTILE,
+    hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+    hedge_min_delay=LLM_HEDGE_MIN_DELAY,
+    controller=admission,
+    circuit_breaker=breaker,
+    workers=LLM_ROUTER_WORKERS,
+)
@@ -0,0 +1,171 @@
+"""
+Deterministic pre-classifier for obvious navigation intents.
+
+Short commands such as "светлая тема", "очистить чат" or "погода в Казани"
+do not need a round trip to the LLM. Every ACTIONS_MAP code has a small
+trigger lexicon of word stems; a token matches a stem when it starts with
+it, which tolerates Russian inflection ("тёмную тему", "тёмный режим").
+All stems are compiled into one regular expression, so a question is
+classified in a single pass over its tokens.
+
+A rule is a tuple of stem groups that must all be present, e.g.
+``("светл", "тем|режим")``. The match is trusted only when
+
+* exactly one code wins (the rule with the most groups breaks ties),
+* every other token is a known filler word ("открой", "пожалуйста", …)
+  rather than a trigger of some other rule ("удали товар" is not 004);
+  for the weather code up to MAX_CITY_WORDS unknown tokens are taken as
+  the city name.
+
+Anything else returns None and the caller falls back to the LLM.
+
+Usage:
+    from api.llm_rules import match_intent
+    match = match_intent("включи тёмную тему")  # RuleMatch(code="100")
+"""
+
+import re
+from dataclasses import dataclass
+
+from decouple import config
+
+from .llm_cache import normalize_question
+from .llm_service import ACTIONS_MAP
+
+LLM_RULES_ENABLED = config("LLM_RULES_ENABLED", default=True, cast=bool)
+
+# Значение поля "navigation" в ответе, когда код определён без LLM
+NAVIGATION_RULES = "rules"
+
+WEATHER_CODE = "007"
+MAX_QUESTION_WORDS = 8
+MAX_CITY_WORDS = 2
+
+# Стемы пишутся без «ё»; суффикс "$" — слово целиком, а не префикс
+TRIGGER_RULES: dict[str, list[tuple[str, ...]]] = {
+    "001": [("главн",), ("домашн",), ("домой$",)],
+    "002": [("кабинет",), ("дашборд",), ("профил",), ("аккаунт",)],
+    "003": [("о$", "нас$|сайт|проект|компани")],
+    "004": [("каталог",), ("товар",), ("продукт",), ("объявлен",)],
+    "005": [
+        ("созда|добав|размест|выстав|прода", "товар|объявлен|продукт"),
+        ("прода",),
+    ],
+    "006": [("админ",)],
+    "007": [("погод",), ("прогноз",)],
+    "100": [("темн|ночн|черн", "тем|режим|оформлен")],
+    "101": [("светл|дневн|бел", "тем|режим|оформлен")],
+    "200": [("закр|сверн|скр|убер|убр|спрят", "чат|ассистент|помощник|окн")],
+    "201": [("очист|сброс|удал|стер|стир", "чат|истори|сообщен|переписк")],
+}
+
+FILLER_STEMS = (
+    "открой|откр|перейд|перейт|переход|зайд|зайт|покаж|показ|включ|вкл|"
+    "постав|установ|смен|помен|измен|сдела|хочу|нужн|можно|давай|мне$|"
+    "мой$|мою$|мои$|моя$|мое$|пожалуйст|пжл$|на$|в$|во$|к$|ко$|для$|"
+    "личн|страниц|раздел|сайт|как$|какая$|какой$|сегодня|сейчас|завтра|пож$"
+)
+
+
+@dataclass(frozen=True)
+class RuleMatch:
+    """Результат детерминированной классификации."""
+
+    code: str
+    city_words: tuple[str, ...] = ()
+
+    @property
+    def needs_city(self) -> bool:
+        return bool(self.city_words)
+
+
+def _stem_pattern(stem: str) -> str:
+    if stem.endswith("$"):
+        return re.escape(stem[:-1])
+    return re.escape(stem) + r"\w*"
+
+
+def _compile(rules: dict[str, list[tuple[str, ...]]], fillers: str):
+    """
+    Собрать единый matcher и нормализованные правила.
+
+    Возвращает (regex, stem_by_group, rules) — rules хранит для каждого
+    кода список кортежей множеств стемов.
+    """
+    stems: set[str] = set(fillers.split("|"))
+    compiled: dict[str, list[tuple[frozenset[str], ...]]] = {}
+    for code, code_rules in rules.items():
+        if code not in ACTIONS_MAP:
+            raise ValueError(f"Unknown action code in TRIGGER_RULES: {code}")
+        compiled[code] = []
+        for rule in code_rules:
+            groups = tuple(frozenset(group.split("|")) for group in rule)
+            compiled[code].append(groups)
+            for group in groups:
+                stems.update(group)
+
+    # Длинные стемы первыми: «темн» должен сработать раньше «тем»
+    ordered = sorted(stems, key=lambda s: (-len(s.rstrip("$")), s))
+    stem_by_group = {f"s{i}": stem for i, stem in enumerate(ordered)}
+    pattern = "|".join(
+        f"(?P<{name}>{_stem_pattern(stem)})" for name, stem in stem_by_group.items()
+    )
+    return re.compile(pattern), stem_by_group, compiled
+
+
+_MATCHER, _STEM_BY_GROUP, _RULES = _compile(TRIGGER_RULES, FILLER_STEMS)
+_FILLERS = frozenset(FILLER_STEMS.split("|"))
+
+
+def _scan(tokens: list[str]) -> tuple[set[str], list[str]]:
+    """Разбить токены на найденные стемы и незнакомые слова."""
+    found: set[str] = set()
+    unknown: list[str] = []
+    for token in tokens:
+        m = _MATCHER.fullmatch(token)
+        if m is None:
+            unknown.append(token)
+        else:
+            found.add(_STEM_BY_GROUP[m.lastgroup])
+    return found, unknown
+
+
+def _best_rule(found: set[str]) -> tuple[str, tuple[frozenset[str], ...]] | None:
+    """Самое специфичное сработавшее правило; None при ничьей между кодами."""
+    best: dict[str, tuple[frozenset[str], ...]] = {}
+    for code, rules in _RULES.items():
+        for groups in rules:
+            matched = all(group & found for group in groups)
+            if matched and len(groups) > len(best.get(code, ())):
+                best[code] = groups
+    if not best:
+        return None
+    top = max(len(groups) for groups in best.values())
+    winners = [code for code, groups in best.items() if len(groups) == top]
+    if len(winners) != 1:
+        return None
+    return winners[0], best[winners[0]]
+
+
+def match_intent(question: str) -> RuleMatch | None:
+    """Определить код действия без LLM или вернуть None, если не уверены."""
+    if not LLM_RULES_ENABLED:
+        return None
+    tokens = normalize_question(question).split()
+    if not tokens or len(tokens) > MAX_QUESTION_WORDS:
+        return None
+
+    found, unknown = _scan(tokens)
+    winner = _best_rule(found)
+    if winner is None:
+        return None
+    code, groups = winner
+
+    used = frozenset().union(*(group & found for group in groups))
+    if found - used - _FILLERS:
+        return None
+    if code == WEATHER_CODE and len(unknown) <= MAX_CITY_WORDS:
+        return RuleMatch(code=code, city_words=tuple(unknown))
+    if unknown:
+        return None
+    return RuleMatch(code=code)
@@ -0,0 +1,484 @@
+"""
+Semantic answer cache for free chat.
+
+Users ask the same FAQ-style questions in many wordings ("как добавить
+товар", "как мне создать объявление?"). Exact-match caching misses those,
+so chat answers are cached by meaning instead:
+
+* the question is embedded (Ollama /api/embed, or the offline
+  HashingEmbedder) and L2-normalized;
+* each namespace — (provider, model, prompt fingerprint) — keeps its
+  vectors in one preallocated float32 matrix, so a lookup is a single
+  matrix-vector product (cosine similarity) plus a top-k partition;
+* the best live entry with similarity >= LLM_SEMANTIC_CACHE_THRESHOLD is
+  returned instead of generating a new answer.
+
+Entries expire after LLM_SEMANTIC_CACHE_TTL seconds; a full namespace
+evicts expired entries first, then the least recently used one.
+
+With LLM_SEMANTIC_CACHE_DIR set, every namespace is persisted as
+``<hash>.npy`` (the vector matrix, opened with memory mapping) plus an
+append-only ``<hash>.jsonl`` log of slot records that is replayed on
+start and compacted when it grows. The directory must have a single
+writer: give every worker process its own directory or leave it empty.
+
+Only complete, successful answers are stored; embedding failures are
+logged and treated as misses, so chat keeps working without the cache.
+
+Usage:
+    from api.llm_service import semantic_cache
+    lookup = semantic_cache.lookup("local", model, question)
+    if lookup.answer is None:
+        answer = generate(...)
+        lookup.store(answer)
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from pathlib import Path
+
+import numpy as np
+from decouple import config
+
+from .llm_cache import normalize_question, prompt_fingerprint
+
+logger = logging.getLogger(__name__)
+
+LLM_SEMANTIC_CACHE_ENABLED = config(
+    "LLM_SEMANTIC_CACHE_ENABLED",
+    default=False,
+    cast=bool,
+)
+LLM_SEMANTIC_CACHE_THRESHOLD = config(
+    "LLM_SEMANTIC_CACHE_THRESHOLD",
+    default=0.92,
+    cast=float,
+)
+LLM_SEMANTIC_CACHE_SIZE = config("LLM_SEMANTIC_CACHE_SIZE", default=2048, cast=int)
+LLM_SEMANTIC_CACHE_TTL = config("LLM_SEMANTIC_CACHE_TTL", default=86400, cast=int)
+LLM_SEMANTIC_CACHE_TOP_K = config("LLM_SEMANTIC_CACHE_TOP_K", default=4, cast=int)
+LLM_SEMANTIC_CACHE_DIR = config("LLM_SEMANTIC_CACHE_DIR", default="")
+LLM_EMBEDDING_BACKEND = config("LLM_EMBEDDING_BACKEND", default="ollama")
+LLM_EMBEDDING_MODEL = config("LLM_EMBEDDING_MODEL", default="nomic-embed-text")
+
+# Совпадение с уже сохранённым вопросом — перезаписываем слот, а не дублируем
+_DUPLICATE_SIMILARITY = 0.999
+# Журнал слотов сжимается, когда записей в нём больше capacity * фактор
+_LOG_COMPACT_FACTOR = 4
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class OllamaEmbedder:
+    """Эмбеддинги через Ollama /api/embed (sync и async клиенты)."""
+
+    def __init__(
+        self,
+        model: str,
+        client: Callable[[], object],
+        async_client: Callable[[], object],
+    ) -> None:
+        self.model = model
+        self.name = f"ollama:{model}"
+        self._client = client
+        self._async_client = async_client
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        response = self._client().embed(model=self.model, input=list(texts))
+        return np.asarray(response["embeddings"], dtype=np.float32)
+
+    async def aembed(self, texts: Sequence[str]) -> np.ndarray:
+        response = await self._async_client().embed(
+            model=self.model,
+            input=list(texts),
+        )
+        return np.asarray(response["embeddings"], dtype=np.float32)
+
+
+class HashingEmbedder:
+    """
+    Офлайн-эмбеддинги: хэшированные символьные триграммы нормализованного
+    вопроса. Ловят перестановки и мелкие правки, но не синонимы — для
+    тестов, бенчмарков и разработки без модели эмбеддингов.
+    """
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            padded = f"  {normalize_question(text)}  "
+            for index in range(len(padded) - 2):
+                digest = hashlib.blake2b(
+                    padded[index : index + 3].encode(), digest_size=4
+                )
+                vectors[row, int.from_bytes(digest.digest(), "little") % self.dim] += 1
+        return vectors
+
+    async def aembed(self, texts: Sequence[str]) -> np.ndarray:
+        return self.embed(texts)
+
+
+class VectorIndex:
+    """
+    Векторы одного пространства имён: нормализованная матрица
+    capacity × dim, ответы, сроки жизни и время последнего обращения.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        dim: int,
+        capacity: int,
+        path: Path | None = None,
+    ) -> None:
+        self.namespace = namespace
+        self.dim = dim
+        self.capacity = capacity
+        self.path = path
+        self.questions: list[str | None] = [None] * capacity
+        self.answers: list[str | None] = [None] * capacity
+        self.expires = np.zeros(capacity, dtype=np.float64)
+        self.used = np.zeros(capacity, dtype=np.float64)
+        self.hits = 0
+        self.misses = 0
+        self._log_records = 0
+        self.vectors = self._open_vectors()
+
+    # ── persistence ───────────────────────────────────────────────────────
+    def _files(self) -> tuple[Path, Path]:
+        return self.path.with_suffix(".npy"), self.path.with_suffix(".jsonl")
+
+    def _header(self) -> dict:
+        return {"namespace": self.namespace, "dim": self.dim, "capacity": self.capacity}
+
+    def _open_vectors(self) -> np.ndarray:
+        if self.path is None:
+            return np.zeros((self.capacity, self.dim), dtype=np.float32)
+        matrix_file, log_file = self._files()
+        if matrix_file.exists() and log_file.exists():
+            try:
+                vectors = np.load(matrix_file, mmap_mode="r+")
+                with log_file.open(encoding="utf-8") as log:
+                    header = json.loads(log.readline())
+                    if header == self._header() and vectors.shape == (
+                        self.capacity,
+                        self.dim,
+                    ):
+                        self._replay(log)
+                        return vectors
+            except (OSError, ValueError) as e:
+                logger.warning("Semantic cache %s is unreadable: %s", matrix_file, e)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        vectors = np.lib.format.open_memmap(
+            matrix_file,
+            mode="w+",
+            dtype=np.float32,
+            shape=(self.capacity, self.dim),
+        )
+        log_file.write_text(json.dumps(self._header()) + "\n", encoding="utf-8")
+        return vectors
+
+    def _replay(self, log) -> None:
+        now = time.time()
+        for line in log:
+            try:
+                record = json.loads(line)
+                slot = record["slot"]
+            except (ValueError, KeyError):
+                # Оборванная последняя строка после сбоя
+                continue
+            self._log_records += 1
+            if record.get("answer") is None or record["expires"] <= now:
+                self.questions[slot] = self.answers[slot] = None
+                self.expires[slot] = 0.0
+                continue
+            self.questions[slot] = record["question"]
+            self.answers[slot] = record["answer"]
+            self.expires[slot] = record["expires"]
+            self.used[slot] = now
+
+    def _log(self, record: dict) -> None:
+        if self.path is None:
+            return
+        _, log_file = self._files()
+        with log_file.open("a", encoding="utf-8") as log:
+            log.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._log_records += 1
+        if self._log_records > self.capacity * _LOG_COMPACT_FACTOR:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Переписать журнал: только живые слоты."""
+        _, log_file = self._files()
+        tmp = log_file.with_suffix(".jsonl.tmp")
+        with tmp.open("w", encoding="utf-8") as log:
+            log.write(json.dumps(self._header()) + "\n")
+            for slot in np.flatnonzero(self.expires > time.time()):
+                log.write(
+                    json.dumps(self._record(int(slot)), ensure_ascii=False) + "\n"
+                )
+        self.vectors.flush()
+        tmp.replace(log_file)
+        self._log_records = int(np.count_nonzero(self.expires > time.time()))
+
+    def _record(self, slot: int) -> dict:
+        return {
+            "slot": slot,
+            "question": self.questions[slot],
+            "answer": self.answers[slot],
+            "expires": float(self.expires[slot]),
+        }
+
+    # ── search ────────────────────────────────────────────────────────────
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.expires > time.time()))
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Косинусный top-k для пачки нормализованных запросов (m × dim).
+
+        Возвращает (slots, scores) формы m × k, по убыванию сходства;
+        пустые и просроченные слоты имеют score = -inf.
+        """
+        scores = queries @ self.vectors.T
+        scores[:, self.expires <= time.time()] = -np.inf
+        k = min(k, self.capacity)
+        slots = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(scores, slots, axis=1)
+        order = np.argsort(-top, axis=1)
+        return (
+            np.take_along_axis(slots, order, axis=1),
+            np.take_along_axis(top, order, axis=1),
+        )
+
+    def get(self, vector: np.ndarray, threshold: float, k: int) -> str | None:
+        slots, scores = self.search(vector[None, :], k)
+        for slot, score in zip(slots[0], scores[0], strict=True):
+            if score < threshold:
+                break
+            answer = self.answers[slot]
+            if answer is not None:
+                self.used[slot] = time.time()
+                self.hits += 1
+                return answer
+        self.misses += 1
+        return None
+
+    def put(self, vector: np.ndarray, question: str, answer: str, ttl: float) -> None:
+        now = time.time()
+        slots, scores = self.search(vector[None, :], 1)
+        if scores[0, 0] >= _DUPLICATE_SIMILARITY:
+            slot = int(slots[0, 0])
+        else:
+            free = np.flatnonzero(self.expires <= now)
+            # Свободный или просроченный слот, иначе — давно не использованный
+            slot = int(free[0]) if free.size else int(np.argmin(self.used))
+        self.vectors[slot] = vector
+        self.questions[slot] = question
+        self.answers[slot] = answer
+        self.expires[slot] = now + ttl
+        self.used[slot] = now
+        self._log(self._record(slot))
+
+    def purge(self) -> None:
+        self.expires[:] = 0.0
+        self.questions = [None] * self.capacity
+        self.answers = [None] * self.capacity
+        if self.path is not None:
+            del self.vectors
+            for file in self._files():
+                file.unlink(missing_ok=True)
+        self.vectors = np.zeros((self.capacity, self.dim), dtype=np.float32)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _model_of(namespace: str) -> str:
+    """Модель из имени «provider:model:fingerprint» (в имени модели бывает «:»)."""
+    return namespace.rsplit(":", 1)[0].partition(":")[2]
+
+
+class SemanticLookup:
+    """Результат поиска: answer (None — промах) и store() для нового ответа."""
+
+    def __init__(
+        self,
+        cache: "SemanticCache | None" = None,
+        namespace: str = "",
+        question: str = "",
+        vector: np.ndarray | None = None,
+        answer: str | None = None,
+    ) -> None:
+        self.cache = cache
+        self.namespace = namespace
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+
+    def store(self, answer: str) -> None:
+        if self.cache is not None and self.vector is not None and answer:
+            self.cache.store(self.namespace, self.question, self.vector, answer)
+
+    def record(self, pieces: Iterator[str]) -> Iterator[str]:
+        """Пропустить поток ответа и сохранить его, если он дошёл до конца."""
+        parts = []
+        for piece in pieces:
+            parts.append(piece)
+            yield piece
+        self.store("".join(parts).strip())
+
+
+# Кэш выключен или эмбеддинг не получен: промах, store() ничего не делает
+NO_LOOKUP = SemanticLookup()
+
+
+class SemanticCache:
+    """Пространства имён VectorIndex и доступ к ним по (provider, model)."""
+
+    def __init__(
+        self,
+        *,
+        embedder,
+        enabled: bool = True,
+        threshold: float,
+        capacity: int,
+        ttl: float,
+        top_k: int = LLM_SEMANTIC_CACHE_TOP_K,
+        directory: str | Path | None = None,
+        prompt: str = "",
+    ) -> None:
+        self.embedder = embedder
+        self.enabled = enabled and capacity > 0 and ttl > 0
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self.top_k = max(1, top_k)
+        self.directory = Path(directory) if directory else None
+        # Ответ зависит от системного промпта, вектор — от модели эмбеддингов
+        self.fingerprint = prompt_fingerprint(prompt, embedder.name)
+        self.errors = 0
+        self._indexes: dict[str, VectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def namespace(self, provider: str, model: str) -> str:
+        return f"{provider}:{model}:{self.fingerprint}"
+
+    def _index(self, namespace: str, dim: int) -> VectorIndex:
+        """Под self._lock: индекс пространства имён (загружается с диска)."""
+        index = self._indexes.get(namespace)
+        if index is None or index.dim != dim:
+            path = None
+            if self.directory is not None:
+                name = hashlib.sha256(namespace.encode()).hexdigest()[:16]
+                path = self.directory / name
+            index = VectorIndex(namespace, dim, self.capacity, path)
+            self._indexes[namespace] = index
+        return index
+
+    def _search(self, namespace: str, question: str, vector) -> SemanticLookup:
+        vector = _normalize(vector[0])
+        with self._lock:
+            answer = self._index(namespace, vector.shape[0]).get(
+                vector,
+                self.threshold,
+                self.top_k,
+            )
+        return SemanticLookup(self, namespace, question, vector, answer)
+
+    def lookup(self, provider: str, model: str, question: str) -> SemanticLookup:
+        """Найти ответ на похожий вопрос; ошибки эмбеддинга — промах."""
+        if not self.enabled:
+            return NO_LOOKUP
+        try:
+            vector = self.embedder.embed([question])
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Semantic cache: embedding failed: %s", e)
+            return NO_LOOKUP
+        return self._search(self.namespace(provider, model), question, vector)
+
+    async def alookup(
+        self,
+        provider: str,
+        model: str,
+        question: str,
+    ) -> SemanticLookup:
+        """Async variant of lookup()."""
+        if not self.enabled:
+            return NO_LOOKUP
+        try:
+            vector = await self.embedder.aembed([question])
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Semantic cache: embedding failed: %s", e)
+            return NO_LOOKUP
+        return self._search(self.namespace(provider, model), question, vector)
+
+    def store(
+        self,
+        namespace: str,
+        question: str,
+        vector: np.ndarray,
+        answer: str,
+    ) -> None:
+        with self._lock:
+            index = self._index(namespace, vector.shape[0])
+            index.put(vector, question, answer, self.ttl)
+
+    def purge(self, model: str | None = None) -> int:
+        """
+        Очистить все пространства имён (или только модели model), включая
+        сохранённые на диске, но ещё не загруженные. Возвращает их число.
+        """
+        with self._lock:
+            purged = set()
+            for namespace, index in list(self._indexes.items()):
+                if model is None or _model_of(namespace) == model:
+                    index.purge()
+                    del self._indexes[namespace]
+                    purged.add(namespace)
+            if self.directory is not None and self.directory.is_dir():
+                for log_file in self.directory.glob("*.jsonl"):
+                    try:
+                        with log_file.open(encoding="utf-8") as log:
+                            namespace = json.loads(log.readline())["namespace"]
+                    except (OSError, ValueError, KeyError):
+                        continue
+                    if model is None or _model_of(namespace) == model:
+                        log_file.unlink(missing_ok=True)
+                        log_file.with_suffix(".npy").unlink(missing_ok=True)
+                        purged.add(namespace)
+            return len(purged)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "embedder": self.embedder.name,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "errors": self.errors,
+                "namespaces": {
+                    namespace.rsplit(":", 1)[0]: index.stats()
+                    for namespace, index in self._indexes.items()
+                },
+            }
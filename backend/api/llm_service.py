@@ -1,16 +1,68 @@
+import contextlib
 import json
 import logging
 import re
+from collections.abc import Callable, Iterator
 
-from decouple import config
+from decouple import Csv, config
 from ollama import Client
 from openai import OpenAI as _OpenAI
 
+from .llm_admission import LLMOverloadedError, request_slot
+from .llm_breaker import breaker
+from .llm_cache import (
+    Uncached,
+    inflight,
+    intent_cache,
+    intent_cache_key,
+    prompt_fingerprint,
+    unwrap,
+)
+from .llm_catalog import ModelCatalog, ModelInfo, parse_model_list
+from .llm_clients import (
+    get_async_ollama_client,
+    get_ollama_client,
+    get_openai_client,
+)
+from .llm_prompts import prompt_cache
+from .llm_semantic_cache import (
+    LLM_EMBEDDING_BACKEND,
+    LLM_EMBEDDING_MODEL,
+    LLM_SEMANTIC_CACHE_DIR,
+    LLM_SEMANTIC_CACHE_ENABLED,
+    LLM_SEMANTIC_CACHE_SIZE,
+    LLM_SEMANTIC_CACHE_THRESHOLD,
+    LLM_SEMANTIC_CACHE_TTL,
+    HashingEmbedder,
+    OllamaEmbedder,
+    SemanticCache,
+)
+from .llm_telemetry import ollama_usage, openai_usage, telemetry
+
 logger = logging.getLogger(__name__)
 
 OLLAMA_BASE_URL = config("OLLAMA_BASE_URL", default="http://localhost:11434")
 DEFAULT_MODEL = config("LLM_MODEL", default="alibayram/smollm3")
 
+# Сколько Ollama держит модель в памяти после запроса ("30m", "1h", -1 — всегда).
+# Переопределения: LLM_MODEL_KEEP_ALIVE=qwen3:8b=5m,alibayram/smollm3=-1
+LLM_KEEP_ALIVE = config("LLM_KEEP_ALIVE", default="30m")
+LLM_MODEL_KEEP_ALIVE = dict(
+    item.strip().rsplit("=", 1)
+    for item in config("LLM_MODEL_KEEP_ALIVE", default="", cast=Csv())
+    if "=" in item
+)
+
+
+def keep_alive_for(model: str) -> str | int:
+    """Значение keep_alive для модели; числа передаются в Ollama как int."""
+    value = LLM_MODEL_KEEP_ALIVE.get(model, LLM_KEEP_ALIVE)
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
 # Системный промпт для ассистента (только на backend)
 SYSTEM_PROMPT = """Вы - полезный и дружелюбный ассистент.
 Отвечайте на русском языке.
@@ -42,13 +94,29 @@ ACTIONS_MAP = {
 # Код, который LLM возвращает для свободного чата
 CHAT_FALLBACK_CODE = "000"
 
+# Стратегии режима navigate:
+#   combined — код, фильтры и город одним вызовом LLM (get_navigation)
+#   two_step — get_action_code, затем get_product_filters / get_weather_city
+NAVIGATION_COMBINED = "combined"
+NAVIGATION_TWO_STEP = "two_step"
+NAVIGATION_STRATEGY = config("LLM_NAVIGATION_STRATEGY", default=NAVIGATION_TWO_STEP)
 
-def build_system_prompt() -> str:
-    """Построить системный промпт на основе актуального ACTIONS_MAP"""
-    nav_actions = "\n".join(
+# Пакетная классификация: максимум вопросов в запросе и параллельных вызовов
+LLM_BATCH_MAX_ITEMS = config("LLM_BATCH_MAX_ITEMS", default=50, cast=int)
+LLM_BATCH_CONCURRENCY = config("LLM_BATCH_CONCURRENCY", default=4, cast=int)
+
+
+def _format_nav_actions() -> str:
+    """Список навигационных действий ACTIONS_MAP для вставки в промпт."""
+    return "\n".join(
         [f"  {code} — {desc}" for code, desc in ACTIONS_MAP.items() if code != "000"],
     )
 
+
+def build_system_prompt() -> str:
+    """Построить системный промпт на основе актуального ACTIONS_MAP"""
+    nav_actions = _format_nav_actions()
+
     return f"""Ты — навигационный ассистент веб-приложения. По запросу пользователя определи ОДНО наиболее подходящее действие и вернуть ТОЛЬКО его трёхзначный код.
 
 Доступные действия:
@@ -73,17 +141,34 @@ def build_system_prompt() -> str:
 
 NAVIGATION_SYSTEM_PROMPT = build_system_prompt()
 
+# Параметры фильтрации каталога, которые LLM возвращает фронтенду
+FILTER_PARAMS_DESCRIPTION = (
+    "- search: строка поиска по названию/описанию товара\n"
+    "- min_price: минимальная цена (число)\n"
+    "- max_price: максимальная цена (число)\n"
+    "- in_stock: true если пользователь хочет только товары в наличии, false если только отсутствующие\n"
+    "- category_name: ТОЧНОЕ название категории из списка ниже (или отсутствует, если не указана)\n"
+    '- status: статус товара — одно из: "published", "draft", "archived"'
+)
+
+# Допустимые типы значений фильтров — для валидации ответа LLM
+FILTER_FIELD_TYPES: dict[str, tuple[type, ...]] = {
+    "search": (str,),
+    "min_price": (int, float),
+    "max_price": (int, float),
+    "in_stock": (bool,),
+    "category_name": (str,),
+    "status": (str,),
+}
+FILTER_STATUSES = ("published", "draft", "archived")
+DEFAULT_WEATHER_CITY = "Москва"
+
 # Базовый промпт для извлечения фильтров — категории подставляются динамически в get_product_filters()
 FILTERS_SYSTEM_PROMPT_TEMPLATE = """Ты — ассистент для фильтрации каталога товаров.
 Извлеки из запроса пользователя параметры фильтрации и верни их ТОЛЬКО в виде JSON.
 
 Доступные параметры:
-- search: строка поиска по названию/описанию товара
-- min_price: минимальная цена (число)
-- max_price: максимальная цена (число)
-- in_stock: true если пользователь хочет только товары в наличии, false если только отсутствующие
-- category_name: ТОЧНОЕ название категории из списка ниже (или отсутствует, если не указана)
-- status: статус товара — одно из: "published", "draft", "archived"
+{filter_params}
 
 {categories_block}
 
@@ -112,14 +197,574 @@ WEATHER_CITY_PROMPT = """Ты — ассистент для извлечения
 """
 
 
+# Единый промпт навигации: код действия, фильтры и город за один вызов LLM
+COMBINED_NAVIGATION_PROMPT_TEMPLATE = """Ты — навигационный ассистент веб-приложения. По запросу пользователя определи ОДНО наиболее подходящее действие и верни ТОЛЬКО JSON-объект.
+
+Доступные действия:
+{nav_actions}
+
+Формат ответа:
+{{"code": "<трёхзначный код>", "filters": {{}}, "city": null}}
+
+Параметры filters (заполняются ТОЛЬКО для кода 004):
+{filter_params}
+
+{categories_block}
+
+ПРАВИЛА (строго соблюдай):
+1. Верни ТОЛЬКО валидный JSON без пояснений.
+2. code — строго один из кодов выше. Если запрос НЕ является навигационным (вопрос, просьба, разговор) — "000".
+3. Для кода 004 включай в filters только параметры, явно указанные в запросе; цены — числами. Для остальных кодов filters = {{}}.
+4. Для кода 007 в city укажи город из запроса с заглавной буквы (если не указан — "Москва"). Для остальных кодов city = null.
+5. Если пользователь хочет посмотреть товары, каталог, продукты, объявления — код 004.
+6. Если пользователь спрашивает о погоде в каком-либо городе — код 007.
+"""
+
+
+def _build_categories_block(categories: list[str] | None) -> str:
+    if categories:
+        cats = "\n".join(f"  - {c}" for c in categories)
+        return f"Доступные категории (используй ТОЛЬКО эти названия):\n{cats}"
+    return "Категории: не заданы (используй category_name как строку поиска)."
+
+
 def build_filters_prompt(categories: list[str] | None = None) -> str:
     """Построить промпт фильтрации, подставив список реальных категорий."""
+    return FILTERS_SYSTEM_PROMPT_TEMPLATE.format(
+        filter_params=FILTER_PARAMS_DESCRIPTION,
+        categories_block=_build_categories_block(categories),
+    )
+
+
+def build_combined_navigation_prompt(categories: list[str] | None = None) -> str:
+    """Построить единый промпт навигации из ACTIONS_MAP, схемы фильтров и категорий."""
+    return COMBINED_NAVIGATION_PROMPT_TEMPLATE.format(
+        nav_actions=_format_nav_actions(),
+        filter_params=FILTER_PARAMS_DESCRIPTION,
+        categories_block=_build_categories_block(categories),
+    )
+
+
+_ACTION_CODE_RE = re.compile(r"(?<!\d)\d{3}(?!\d)")
+
+
+def extract_json_object(text: str) -> dict | None:
+    """
+    Найти в тексте первый корректный JSON-объект (в том числе вложенный).
+
+    В отличие от регулярного выражения в get_product_filters() поддерживает объекты
+    внутри объекта, например {"code": "004", "filters": {...}}.
+    """
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            data, _ = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            start = text.find("{", start + 1)
+            continue
+        if isinstance(data, dict):
+            return data
+        start = text.find("{", start + 1)
+    return None
+
+
+def sanitize_filters(data: dict) -> dict:
+    """Оставить только известные фильтры с корректными типами значений."""
+    clean = {}
+    for key, value in data.items():
+        types = FILTER_FIELD_TYPES.get(key)
+        if types is None or not isinstance(value, types):
+            continue
+        # bool — подкласс int, цены-булевы отбрасываем
+        if bool not in types and isinstance(value, bool):
+            continue
+        if key == "status" and value not in FILTER_STATUSES:
+            continue
+        clean[key] = value
+    return clean
+
+
+def validate_navigation_result(data: object) -> dict | None:
+    """
+    Проверить ответ единого промпта навигации.
+
+    Возвращает {"code", "filters", "city"} или None, если ответ не
+    соответствует схеме (тогда вызывающий код переходит на двухшаговый путь).
+    """
+    if not isinstance(data, dict):
+        return None
+    code = data.get("code")
+    if isinstance(code, int) and not isinstance(code, bool):
+        code = f"{code:03d}"
+    if not isinstance(code, str) or code.strip() not in ACTIONS_MAP:
+        return None
+    code = code.strip()
+
+    filters = data.get("filters") or {}
+    if not isinstance(filters, dict):
+        return None
+    city = data.get("city")
+    if city is not None and not isinstance(city, str):
+        return None
+
+    return {
+        "code": code,
+        "filters": sanitize_filters(filters) if code == "004" else {},
+        "city": ((city or "").strip() or DEFAULT_WEATHER_CITY)
+        if code == "007"
+        else None,
+    }
+
+
+def navigation_failed() -> dict:
+    """
+    Результат get_navigation при ошибке вызова LLM: свободный чат.
+
+    В отличие от невалидного ответа (None), повторять запрос двухшаговым
+    путём бессмысленно — он упрётся в ту же ошибку или тот же таймаут.
+    """
+    return {"code": CHAT_FALLBACK_CODE, "filters": {}, "city": None}
+
+
+# Параметры генерации для коротких служебных ответов (код действия, JSON)
+NAVIGATION_OPTIONS = {"temperature": 0.1, "top_p": 0.9}
+
+# Структурированный вывод: JSON Schema передаётся в Ollama (format) и
+# OpenAI-совместимый API (response_format), декодирование ограничено
+# грамматикой — модель не может ни «порассуждать», ни сломать JSON.
+LLM_STRUCTURED_OUTPUT = config("LLM_STRUCTURED_OUTPUT", default=True, cast=bool)
+
+# Лимит длины ответа по режимам (Ollama num_predict / OpenAI max_tokens).
+# Служебные лимиты применяются только со структурированным выводом:
+# без грамматики модель может начать с блока <think>.
+LLM_MAX_TOKENS = {
+    "chat": config("LLM_CHAT_MAX_TOKENS", default=2500, cast=int),
+    "action_code": config("LLM_ACTION_CODE_MAX_TOKENS", default=16, cast=int),
+    "navigation": config("LLM_NAVIGATION_MAX_TOKENS", default=160, cast=int),
+    "filters": config("LLM_FILTERS_MAX_TOKENS", default=128, cast=int),
+    "weather_city": config("LLM_WEATHER_CITY_MAX_TOKENS", default=32, cast=int),
+}
+
+# Типы JSON Schema для полей ProductFilter
+_FILTER_JSON_TYPES = {"NumberFilter": "number", "BooleanFilter": "boolean"}
+
+
+def action_code_schema() -> dict:
+    """JSON Schema ответа с кодом действия: только коды из ACTIONS_MAP."""
+    return {
+        "type": "object",
+        "properties": {"code": {"type": "string", "enum": list(ACTIONS_MAP)}},
+        "required": ["code"],
+        "additionalProperties": False,
+    }
+
+
+def product_filters_schema(categories: list[str] | None = None) -> dict:
+    """
+    JSON Schema фильтров каталога, построенная по полям ProductFilter.
+
+    Вместо id категории модель выбирает category_name из списка реальных
+    категорий; search ищет по названию и описанию.
+    """
+    # Модели Django нужны только здесь — сервис импортируется и без настроек
+    # (бенчмарки, фоновые скрипты)
+    import django_filters  # noqa: PLC0415
+
+    from .filters import ProductFilter  # noqa: PLC0415
+
+    category_name: dict = {"type": "string"}
     if categories:
-        cats = "\n".join(f"  - {c}" for c in categories)
-        block = f"Доступные категории (используй ТОЛЬКО эти названия):\n{cats}"
-    else:
-        block = "Категории: не заданы (используй category_name как строку поиска)."
-    return FILTERS_SYSTEM_PROMPT_TEMPLATE.format(categories_block=block)
+        category_name["enum"] = list(categories)
+    properties: dict = {"search": {"type": "string"}}
+    for name, field in ProductFilter.base_filters.items():
+        if name == "category":
+            properties["category_name"] = category_name
+        elif isinstance(field, django_filters.ChoiceFilter):
+            properties[name] = {
+                "type": "string",
+                "enum": [value for value, _ in field.extra["choices"]],
+            }
+        else:
+            properties[name] = {"type": _FILTER_JSON_TYPES[type(field).__name__]}
+    return {
+        "type": "object",
+        "properties": properties,
+        "additionalProperties": False,
+    }
+
+
+def navigation_schema(categories: list[str] | None = None) -> dict:
+    """JSON Schema ответа единого промпта навигации."""
+    return {
+        "type": "object",
+        "properties": {
+            "code": action_code_schema()["properties"]["code"],
+            "filters": product_filters_schema(categories),
+            "city": {"type": ["string", "null"]},
+        },
+        "required": ["code", "filters", "city"],
+        "additionalProperties": False,
+    }
+
+
+def weather_city_schema() -> dict:
+    """JSON Schema ответа с городом для прогноза погоды."""
+    return {
+        "type": "object",
+        "properties": {"city": {"type": "string"}},
+        "required": ["city"],
+        "additionalProperties": False,
+    }
+
+
+def decoding(mode: str, schema: dict | None = None) -> dict:
+    """
+    Аргументы _chat для режима mode: опции генерации, схема ответа и сам
+    режим (для телеметрии).
+
+    mode — ключ LLM_MAX_TOKENS; schema учитывается, только если включён
+    LLM_STRUCTURED_OUTPUT.
+    """
+    if mode == "chat":
+        return {
+            "options": {"num_predict": LLM_MAX_TOKENS["chat"]},
+            "schema": None,
+            "mode": mode,
+        }
+    if not LLM_STRUCTURED_OUTPUT:
+        return {"options": NAVIGATION_OPTIONS, "schema": None, "mode": mode}
+    return {
+        "options": {**NAVIGATION_OPTIONS, "num_predict": LLM_MAX_TOKENS[mode]},
+        "schema": schema,
+        "mode": mode,
+    }
+
+
+def chat_messages(question: str) -> list[dict]:
+    """Сообщения для свободного чата."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": question},
+    ]
+
+
+def action_code_messages(question: str) -> list[dict]:
+    """Сообщения для определения кода действия."""
+    return [
+        {"role": "system", "content": NAVIGATION_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{question}\n\nОтвет (только код):"},
+    ]
+
+
+def navigation_messages(question: str, categories: list[str] | None) -> list[dict]:
+    """Сообщения для единого промпта навигации."""
+    return [
+        {
+            "role": "system",
+            "content": prompt_cache.get(
+                "navigation",
+                build_combined_navigation_prompt,
+                categories,
+            ).text,
+        },
+        {"role": "user", "content": question},
+    ]
+
+
+def filters_messages(question: str, categories: list[str] | None) -> list[dict]:
+    """Сообщения для извлечения фильтров каталога."""
+    return [
+        {
+            "role": "system",
+            "content": prompt_cache.get(
+                "filters",
+                build_filters_prompt,
+                categories,
+            ).text,
+        },
+        {"role": "user", "content": question},
+    ]
+
+
+def weather_city_messages(question: str) -> list[dict]:
+    """Сообщения для извлечения города из запроса о погоде."""
+    return [
+        {"role": "system", "content": WEATHER_CITY_PROMPT},
+        {"role": "user", "content": question},
+    ]
+
+
+# ACTIONS_MAP задаётся в коде и меняется только с перезапуском
+ACTIONS_VERSION = prompt_fingerprint(
+    json.dumps(ACTIONS_MAP, sort_keys=True, ensure_ascii=False),
+)
+
+
+def intent_key(
+    kind: str,
+    provider: str,
+    model: str,
+    messages: list[dict],
+    question: str,
+) -> tuple:
+    """Ключ кэша интентов: версии системного промпта и ACTIONS_MAP, нормализованный вопрос."""
+    return intent_cache_key(
+        kind,
+        provider,
+        model,
+        question,
+        prompt_cache.version(messages[0]["content"]),
+        ACTIONS_VERSION,
+    )
+
+
+def _action_codes(text: str) -> Iterator[re.Match]:
+    """Трёхзначные числа из ACTIONS_MAP (не части более длинных чисел)."""
+    return (m for m in _ACTION_CODE_RE.finditer(text) if m.group(0) in ACTIONS_MAP)
+
+
+def action_code_result(text: str) -> str | Uncached:
+    """Код из JSON {"code": ...} или первый код ACTIONS_MAP в тексте.
+
+    Если кода нет — Uncached(CHAT_FALLBACK_CODE): запасной код не кэшируется.
+    """
+    data = extract_json_object(text)
+    if data is not None and isinstance(data.get("code"), str):
+        text = data["code"]
+    match = next(_action_codes(text), None)
+    if match is None:
+        logger.warning(
+            "No ACTIONS_MAP code in %r, fallback to %s",
+            text,
+            CHAT_FALLBACK_CODE,
+        )
+        return Uncached(CHAT_FALLBACK_CODE)
+    return match.group(0)
+
+
+def parse_action_code(text: str) -> str:
+    """Извлечь код из JSON {"code": ...} или первый код ACTIONS_MAP в тексте."""
+    return unwrap(action_code_result(text))
+
+
+def product_filters_result(text: str) -> dict | Uncached:
+    """Валидные поля фильтров; Uncached({}), если JSON не найден."""
+    data = extract_json_object(text)
+    if data is None:
+        logger.warning("Product filters: no JSON object in %r", text)
+        return Uncached({})
+    return sanitize_filters(data)
+
+
+def parse_product_filters(text: str) -> dict:
+    """Извлечь JSON с фильтрами и оставить валидные поля; {} если JSON не найден."""
+    return unwrap(product_filters_result(text))
+
+
+def weather_city_result(text: str) -> str | Uncached:
+    """Город из JSON-ответа; Uncached(DEFAULT_WEATHER_CITY), если его нет."""
+    data = extract_json_object(text) or {}
+    city = data.get("city")
+    if not isinstance(city, str) or not city.strip():
+        return Uncached(DEFAULT_WEATHER_CITY)
+    return city.strip()
+
+
+def parse_weather_city(text: str) -> str:
+    """Извлечь город из JSON-ответа; по умолчанию — Москва."""
+    return unwrap(weather_city_result(text))
+
+
+def parse_navigation(text: str) -> dict | None:
+    """Разобрать и провалидировать ответ единого промпта навигации."""
+    return validate_navigation_result(extract_json_object(text))
+
+
+class ThinkTagFilter:
+    """
+    Инкрементально вырезает блоки <think>…</think> из потока токенов.
+
+    Теги могут приходить разрезанными между чанками, поэтому хвост, похожий
+    на начало тега, придерживается в буфере до следующего feed().
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._inside = False
+        self._started = False
+
+    @staticmethod
+    def _partial_tag_len(text: str, tag: str) -> int:
+        """Длина самого длинного суффикса text, являющегося префиксом tag."""
+        for size in range(min(len(text), len(tag) - 1), 0, -1):
+            if tag.startswith(text[-size:]):
+                return size
+        return 0
+
+    def _emit(self, text: str) -> str:
+        # Как и clean_response(), не отдаём ведущие пробелы ответа
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def feed(self, chunk: str) -> str:
+        """Принять очередной чанк, вернуть видимую пользователю часть."""
+        self._buffer += chunk
+        out = []
+        while self._buffer:
+            if self._inside:
+                idx = self._buffer.find(self.CLOSE_TAG)
+                if idx == -1:
+                    keep = self._partial_tag_len(self._buffer, self.CLOSE_TAG)
+                    self._buffer = self._buffer[len(self._buffer) - keep :]
+                    break
+                self._buffer = self._buffer[idx + len(self.CLOSE_TAG) :]
+                self._inside = False
+            else:
+                idx = self._buffer.find(self.OPEN_TAG)
+                if idx == -1:
+                    keep = self._partial_tag_len(self._buffer, self.OPEN_TAG)
+                    out.append(self._buffer[: len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep :]
+                    break
+                out.append(self._buffer[:idx])
+                self._buffer = self._buffer[idx + len(self.OPEN_TAG) :]
+                self._inside = True
+        return self._emit("".join(out))
+
+    def flush(self) -> str:
+        """Отдать остаток буфера в конце потока (незакрытый <think> отбрасывается)."""
+        rest = "" if self._inside else self._buffer
+        self._buffer = ""
+        return self._emit(rest)
+
+
+def filter_think_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """Пропустить поток текстовых чанков через ThinkTagFilter."""
+    think_filter = ThinkTagFilter()
+    for chunk in chunks:
+        visible = think_filter.feed(chunk)
+        if visible:
+            yield visible
+    tail = think_filter.flush()
+    if tail:
+        yield tail
+
+
+# Ранний выход: служебные ответы читаются потоком, и поток закрывается,
+# как только ответ можно разобрать — модель перестаёт генерировать
+# преамбулы и пояснения после кода.
+LLM_EARLY_EXIT = config("LLM_EARLY_EXIT", default=True, cast=bool)
+
+
+def action_code_ready(text: str, chunk: str) -> bool:
+    """Код ACTIONS_MAP уже получен целиком (за ним пришёл ещё символ)."""
+    return any(m.end() < len(text) for m in _action_codes(text))
+
+
+def _balanced_object_end(text: str, start: int) -> int | None:
+    """Конец объекта, открытого на text[start]; None — ещё не закрыт."""
+    depth = 0
+    in_string = escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return None
+
+
+def json_object_ready(text: str, chunk: str) -> bool:
+    """
+    Первый JSON-объект ответа закрыт и разобран.
+
+    Вложенный объект ({"filters": {...}}) готовым не считается, пока не
+    закрыт внешний: перебираем «{» по порядку, как extract_json_object().
+    """
+    if "}" not in chunk:
+        return False
+    start = text.find("{")
+    while start != -1:
+        end = _balanced_object_end(text, start)
+        if end is None:
+            return False
+        try:
+            if isinstance(json.loads(text[start:end]), dict):
+                return True
+        except ValueError:
+            pass
+        start = text.find("{", start + 1)
+    return False
+
+
+def read_until(
+    stream: Iterator,
+    content: Callable[[object], str],
+    until: Callable[[str, str], bool],
+) -> str:
+    """
+    Читать поток чанков, пока until(text, chunk) не вернёт True.
+
+    content(chunk) — текст чанка; блоки <think> в text не попадают. Поток
+    закрывается в любом случае: провайдер видит разрыв соединения и
+    прекращает генерацию.
+    """
+    think_filter = ThinkTagFilter()
+    text = ""
+    try:
+        for chunk in stream:
+            visible = think_filter.feed(content(chunk) or "")
+            if not visible:
+                continue
+            text += visible
+            if until(text, visible):
+                return text
+        return text + think_filter.flush()
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+@contextlib.contextmanager
+def llm_slot(provider: str, model: str):
+    """
+    Слот admission control на время вызова модели (см. admission.admit).
+
+    Открытая цепь отклоняет вызов сразу, не занимая места в очереди.
+    """
+    breaker.check(provider, model)
+    with request_slot(provider, model) as ticket:
+        if ticket is not None:
+            telemetry.record_wait(provider, model, ticket.waited)
+        yield ticket
+
+
+def ollama_text(chunk) -> str:
+    """Текст ответа (или чанка потока) Ollama chat."""
+    return chunk.get("message", {}).get("content", "")
+
+
+def openai_delta_text(chunk) -> str:
+    """Текст чанка потока chat.completions."""
+    return chunk.choices[0].delta.content if chunk.choices else ""
 
 
 class OllamaService:
@@ -133,8 +778,49 @@ class OllamaService:
 
     @staticmethod
     def get_client() -> Client:
-        """Получить Ollama клиент"""
-        return Client(host=OLLAMA_BASE_URL)
+        """Получить общий (пул соединений) Ollama клиент"""
+        return get_ollama_client(OLLAMA_BASE_URL)
+
+    @staticmethod
+    def _chat(
+        model: str,
+        messages: list,
+        options: dict | None = None,
+        *,
+        schema: dict | None = None,
+        until: Callable[[str, str], bool] | None = None,
+        mode: str = "chat",
+    ) -> str:
+        """
+        Отправить messages в Ollama, вернуть текст ответа.
+
+        schema — JSON Schema ответа (format); until — читать ответ потоком
+        и оборвать генерацию, как только until(text, chunk) истинно;
+        mode — режим запроса для телеметрии.
+        """
+        client = OllamaService.get_client()
+        early_exit = until is not None and LLM_EARLY_EXIT
+        with (
+            llm_slot("local", model),
+            breaker.guard("local", model),
+            telemetry.call(mode, "local", model) as call,
+        ):
+            response = client.chat(
+                model=model,
+                messages=messages,
+                stream=early_exit,
+                format=schema,
+                options=options,
+                keep_alive=keep_alive_for(model),
+            )
+            if early_exit:
+                return read_until(
+                    response,
+                    call.reader(ollama_text, ollama_usage),
+                    until,
+                )
+            call.set_usage(ollama_usage(response))
+        return ollama_text(response)
 
     @staticmethod
     def generate_response(question: str, model: str = DEFAULT_MODEL) -> str:
@@ -148,32 +834,26 @@ class OllamaService:
         Returns:
             str: ответ от модели
         """
+        messages = chat_messages(question)
+        # Ответ на похожий (по смыслу) вопрос — без генерации
+        lookup = semantic_cache.lookup("local", model, question)
+        if lookup.answer is not None:
+            return lookup.answer
         try:
-            client = OllamaService.get_client()
-
-            response = client.chat(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": SYSTEM_PROMPT,
-                    },
-                    {
-                        "role": "user",
-                        "content": question,
-                    },
-                ],
-                stream=False,
-            )
-
-            raw_answer = response.get("message", {}).get(
-                "content",
-                "Не удалось получить ответ от модели",
+            # Одинаковые одновременные вопросы разделяют одну генерацию
+            raw_answer = inflight.do(
+                intent_key("chat", "local", model, messages, question),
+                lambda: OllamaService._chat(model, messages, **decoding("chat")),
             )
 
             # Очистить ответ от тегов <think>
-            return OllamaService.clean_response(raw_answer)
+            answer = OllamaService.clean_response(raw_answer)
+            lookup.store(answer)
+            return answer or "Не удалось получить ответ от модели"
 
+        except LLMOverloadedError:
+            # Очередь переполнена или цепь открыта — view ответит 429/503
+            raise
         except ConnectionError:
             logger.error(f"Не удалось подключиться к Ollama на {OLLAMA_BASE_URL}")  # noqa: G004
             return "Ошибка: LLM сервис недоступен"
@@ -184,6 +864,36 @@ class OllamaService:
             logger.error(f"Ошибка при работе с Ollama: {e!s}")  # noqa: G004
             return f"Ошибка: {e!s}"
 
+    @staticmethod
+    def stream_response(question: str, model: str = DEFAULT_MODEL) -> Iterator[str]:
+        """
+        Потоковая версия generate_response: отдаёт очищенные от <think>
+        фрагменты ответа по мере их генерации.
+
+        Ошибки Ollama не перехватываются — их обрабатывает вызывающий код,
+        так как часть ответа к этому моменту уже может быть отправлена.
+        """
+        lookup = semantic_cache.lookup("local", model, question)
+        if lookup.answer is not None:
+            yield lookup.answer
+            return
+        client = OllamaService.get_client()
+        # Длительность потока зависит от длины ответа — учитываем только ошибки
+        with (
+            breaker.guard("local", model, timed=False),
+            telemetry.call("chat", "local", model) as call,
+        ):
+            stream = client.chat(
+                model=model,
+                messages=chat_messages(question),
+                stream=True,
+                options=decoding("chat")["options"],
+                keep_alive=keep_alive_for(model),
+            )
+            read = call.reader(ollama_text, ollama_usage)
+            chunks = (read(chunk) or "" for chunk in stream)
+            yield from lookup.record(filter_think_stream(chunks))
+
     @staticmethod
     def get_action_code(question: str, model: str = DEFAULT_MODEL) -> str:
         """
@@ -195,47 +905,32 @@ class OllamaService:
             model: имя модели (по умолчанию alibayram/smollm3)
 
         Returns:
-            str: код действия из ACTIONS_MAP или 001 если ошибка
+            str: код действия из ACTIONS_MAP или 000 если ошибка
         """
-        try:
-            client = OllamaService.get_client()
-
-            response = client.chat(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": NAVIGATION_SYSTEM_PROMPT,
-                    },
-                    {
-                        "role": "user",
-                        "content": f"{question}\n\nОтвет (только код):",
-                    },
-                ],
-                stream=False,
-                options={
-                    "temperature": 0.1,  # Низкая температура для консистентности
-                    "top_p": 0.9,
-                },
-            )
+        messages = action_code_messages(question)
 
-            llm_response = response.get("message", {}).get("content", "").strip()
+        def compute() -> str | Uncached:
+            # Низкая температура и схема ответа — несколько токенов на код
+            llm_response = OllamaService._chat(
+                model,
+                messages,
+                **decoding("action_code", action_code_schema()),
+                until=action_code_ready,
+            ).strip()
             logger.info(f"LLM action response: {llm_response}")  # noqa: G004
+            return action_code_result(llm_response)
 
-            # Извлечь первый трёхзначный код из ответа
-            match = re.search(r"\d{3}", llm_response)
-            action_code = match.group(0) if match else CHAT_FALLBACK_CODE
-
-            # Неизвестный код → свободный чат
-            if action_code not in ACTIONS_MAP:
-                logger.warning(
-                    f"Action code {action_code} not in ACTIONS_MAP, fallback to {CHAT_FALLBACK_CODE}",  # noqa: G004
-                )
-                action_code = CHAT_FALLBACK_CODE
-
+        try:
+            action_code = intent_cache.get_or_compute(
+                intent_key("action_code", "local", model, messages, question),
+                compute,
+            )
             logger.info(f"Extracted action code: {action_code}")  # noqa: G004
             return action_code
 
+        except LLMOverloadedError:
+            # Как и в generate_response: view ответит 429/503
+            raise
         except ConnectionError:
             logger.error(f"Не удалось подключиться к Ollama на {OLLAMA_BASE_URL}")  # noqa: G004
             return CHAT_FALLBACK_CODE
@@ -247,43 +942,55 @@ class OllamaService:
             return CHAT_FALLBACK_CODE
 
     @staticmethod
-    def list_available_models() -> list:
-        """Получить список доступных моделей в Ollama"""
-        try:
-            client = OllamaService.get_client()
-            logger.info("Получение списка моделей...")
-
-            response = client.list()
-            logger.info(f"Ответ от Ollama: {response}")  # noqa: G004
-
-            models = response.get("models", [])
-            logger.info(f"Найдено моделей: {len(models)}")  # noqa: G004
+    def get_navigation(
+        question: str,
+        model: str = DEFAULT_MODEL,
+        categories: list[str] | None = None,
+    ) -> dict | None:
+        """
+        Определить код действия, фильтры и город одним вызовом LLM.
 
-            # Возвращаем список названий моделей
-            model_names = []
-            for model in models:
-                # Пробуем как атрибут объекта
-                model_name = getattr(model, "model", None)
+        Returns:
+            dict | None: {"code", "filters", "city"} или None, если ответ
+            не прошёл валидацию — тогда используется двухшаговый путь.
+            При ошибке вызова — navigation_failed() (свободный чат).
+        """
+        messages = navigation_messages(question, categories)
 
-                # Если атрибута нет, пробуем как словарь
-                if model_name is None and isinstance(model, dict):
-                    model_name = model.get("name") or model.get("model")
+        def compute() -> dict | None:
+            raw = OllamaService._chat(
+                model,
+                messages,
+                **decoding("navigation", navigation_schema(categories)),
+                until=json_object_ready,
+            )
+            raw = OllamaService.clean_response(raw)
+            logger.info("OllamaService navigation raw: %s", raw)
+            result = parse_navigation(raw)
+            if result is None:
+                logger.warning("OllamaService navigation: invalid response %r", raw)
+            return result
 
-                if model_name:
-                    model_names.append(model_name)
+        try:
+            return intent_cache.get_or_compute(
+                intent_key("navigation", "local", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error("OllamaService.get_navigation error: %s", e)
+            return navigation_failed()
 
-            logger.info(f"Итоговый список моделей: {model_names}")  # noqa: G004
-            return model_names
+    @staticmethod
+    def list_available_models() -> list:
+        """Получить список доступных моделей в Ollama (из кэша каталога)"""
+        return model_catalog.names()
 
-        except ConnectionError as e:
-            logger.error(f"Не удалось подключиться к Ollama: {e!s}")  # noqa: G004
-            return []
-        except Exception as e:
-            logger.error(  # noqa: G201
-                f"Ошибка при получении списка моделей: {e!s}",  # noqa: G004
-                exc_info=True,
-            )
-            return []
+    @staticmethod
+    def fetch_models() -> list[ModelInfo]:
+        """Запросить /api/tags у Ollama с метаданными моделей."""
+        return parse_model_list(OllamaService.get_client().list())
 
     @staticmethod
     def get_product_filters(
@@ -292,25 +999,26 @@ class OllamaService:
         categories: list[str] | None = None,
     ) -> dict:
         """Extract product catalogue filters from a free-text query via LLM."""
-        try:
-            client = OllamaService.get_client()
-            prompt = build_filters_prompt(categories)
-            response = client.chat(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": question},
-                ],
-                stream=False,
-                options={"temperature": 0.1, "top_p": 0.9},
+        messages = filters_messages(question, categories)
+
+        def compute() -> dict | Uncached:
+            raw = OllamaService._chat(
+                model,
+                messages,
+                **decoding("filters", product_filters_schema(categories)),
+                until=json_object_ready,
             )
-            raw = response.get("message", {}).get("content", "").strip()
             raw = OllamaService.clean_response(raw)
             logger.info("OllamaService filters raw: %s", raw)
-            match = re.search(r"\{[^{}]*\}", raw, re.DOTALL)
-            if not match:
-                return {}
-            return json.loads(match.group(0))
+            return product_filters_result(raw)
+
+        try:
+            return intent_cache.get_or_compute(
+                intent_key("filters", "local", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error("OllamaService.get_product_filters error: %s", e)
             return {}
@@ -318,28 +1026,73 @@ class OllamaService:
     @staticmethod
     def get_weather_city(question: str, model: str = DEFAULT_MODEL) -> str:
         """Extract city name (in English) from a weather query via LLM."""
-        try:
-            client = OllamaService.get_client()
-            response = client.chat(
-                model=model,
-                messages=[
-                    {"role": "system", "content": WEATHER_CITY_PROMPT},
-                    {"role": "user", "content": question},
-                ],
-                stream=False,
-                options={"temperature": 0.1, "top_p": 0.9},
+        messages = weather_city_messages(question)
+
+        def compute() -> str | Uncached:
+            raw = OllamaService._chat(
+                model,
+                messages,
+                **decoding("weather_city", weather_city_schema()),
+                until=json_object_ready,
             )
-            raw = response.get("message", {}).get("content", "").strip()
             raw = OllamaService.clean_response(raw)
             logger.info("OllamaService weather_city raw: %s", raw)
-            match = re.search(r"\{[^{}]*\}", raw, re.DOTALL)
-            if not match:
-                return "Москва"
-            data = json.loads(match.group(0))
-            return data.get("city", "Москва") or "Москва"
+            return weather_city_result(raw)
+
+        try:
+            return intent_cache.get_or_compute(
+                intent_key("weather_city", "local", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error("OllamaService.get_weather_city error: %s", e)
-            return "Москва"
+            return DEFAULT_WEATHER_CITY
+
+
+# Каталог моделей Ollama: TTL + фоновое обновление (stale-while-revalidate)
+LLM_MODELS_CACHE_TTL = config("LLM_MODELS_CACHE_TTL", default=60.0, cast=float)
+LLM_MODELS_STALE_TTL = config("LLM_MODELS_STALE_TTL", default=600.0, cast=float)
+
+
+def _fetch_ollama_models() -> list[ModelInfo]:
+    # Через атрибут класса: подмена OllamaService.fetch_models видна каталогу
+    return OllamaService.fetch_models()
+
+
+model_catalog = ModelCatalog(
+    _fetch_ollama_models,
+    ttl=LLM_MODELS_CACHE_TTL,
+    stale_ttl=LLM_MODELS_STALE_TTL,
+)
+
+
+def _ollama_client() -> Client:
+    # Через атрибут класса: подмена OllamaService.get_client видна кэшу
+    return OllamaService.get_client()
+
+
+def _async_ollama_client():
+    return get_async_ollama_client(OLLAMA_BASE_URL)
+
+
+def _build_embedder() -> OllamaEmbedder | HashingEmbedder:
+    if LLM_EMBEDDING_BACKEND == "hashing":
+        return HashingEmbedder()
+    return OllamaEmbedder(LLM_EMBEDDING_MODEL, _ollama_client, _async_ollama_client)
+
+
+# Семантический кэш ответов свободного чата (см. api.llm_semantic_cache)
+semantic_cache = SemanticCache(
+    embedder=_build_embedder(),
+    enabled=LLM_SEMANTIC_CACHE_ENABLED,
+    threshold=LLM_SEMANTIC_CACHE_THRESHOLD,
+    capacity=LLM_SEMANTIC_CACHE_SIZE,
+    ttl=LLM_SEMANTIC_CACHE_TTL,
+    directory=LLM_SEMANTIC_CACHE_DIR,
+    prompt=SYSTEM_PROMPT,
+)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -347,7 +1100,6 @@ class OllamaService:
 # OpenAI-совместимый эндпоинт: https://foundation-models.api.cloud.ru/v1
 # Документация: https://developers.sber.ru/portal/products/gigachat
 # ─────────────────────────────────────────────────────────────────────────────
-
 SBER_API_KEY = config("SBER_API_KEY", default="")
 SBER_API_URL = config(
     "SBER_API_URL",
@@ -366,12 +1118,43 @@ EXTERNAL_LLM_MODELS: list[str] = [
 
 
 def _get_sber_client() -> _OpenAI:
-    """Вернуть OpenAI-клиент, настроенный на Cloud.ru Foundation Models."""
+    """Вернуть общий OpenAI-клиент, настроенный на Cloud.ru Foundation Models."""
     if not SBER_API_KEY:
         raise ExternalLLMServiceError(
             "SBER_API_KEY не задан. Укажите его в .env",
         )
-    return _OpenAI(api_key=SBER_API_KEY, base_url=SBER_API_URL)
+    return get_openai_client(SBER_API_KEY, SBER_API_URL)
+
+
+def build_completion_kwargs(
+    model: str,
+    messages: list,
+    options: dict | None,
+    schema: dict | None = None,
+) -> dict:
+    """Собрать параметры chat.completions.create с учётом options и схемы."""
+    kwargs: dict = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": LLM_MAX_TOKENS["chat"],
+        "temperature": 0.5,
+        "top_p": 0.95,
+        "presence_penalty": 0,
+    }
+    # Перекрыть параметры из options (например temperature=0.1 для navigate)
+    if options:
+        for key in ("temperature", "top_p", "max_tokens", "presence_penalty"):
+            if key in options:
+                kwargs[key] = options[key]
+        # Опции в формате Ollama: num_predict — тот же лимит длины ответа
+        if "num_predict" in options:
+            kwargs["max_tokens"] = options["num_predict"]
+    if schema is not None:
+        kwargs["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "response", "schema": schema},
+        }
+    return kwargs
 
 
 class ExternalLLMServiceError(Exception):
@@ -391,30 +1174,38 @@ class ExternalLLMService:
         model: str,
         messages: list,
         options: dict | None = None,
+        *,
+        schema: dict | None = None,
+        until: Callable[[str, str], bool] | None = None,
+        mode: str = "chat",
     ) -> str:
-        """Отправить messages в Сбер API, вернуть текст ответа."""
-        try:
-            client = _get_sber_client()
-            kwargs: dict = {
-                "model": model,
-                "messages": messages,
-                "max_tokens": 2500,
-                "temperature": 0.5,
-                "top_p": 0.95,
-                "presence_penalty": 0,
-            }
-            # Перекрыть параметры из options (например temperature=0.1 для navigate)
-            if options:
-                for key in ("temperature", "top_p", "max_tokens", "presence_penalty"):
-                    if key in options:
-                        kwargs[key] = options[key]
-
-            resp = client.chat.completions.create(**kwargs)
-            return resp.choices[0].message.content or ""
-        except ExternalLLMServiceError:
-            raise
-        except Exception as exc:
-            raise ExternalLLMServiceError(f"Сбер API error: {exc}") from exc
+        """
+        Отправить messages в Сбер API, вернуть текст ответа.
+
+        schema, until и mode — как в OllamaService._chat.
+        """
+        with (
+            llm_slot("external", model),
+            breaker.guard("external", model),
+            telemetry.call(mode, "external", model) as call,
+        ):
+            try:
+                client = _get_sber_client()
+                kwargs = build_completion_kwargs(model, messages, options, schema)
+                if until is not None and LLM_EARLY_EXIT:
+                    stream = client.chat.completions.create(**kwargs, stream=True)
+                    return read_until(
+                        stream,
+                        call.reader(openai_delta_text, openai_usage),
+                        until,
+                    )
+                resp = client.chat.completions.create(**kwargs)
+                call.set_usage(openai_usage(resp))
+                return resp.choices[0].message.content or ""
+            except ExternalLLMServiceError:
+                raise
+            except Exception as exc:
+                raise ExternalLLMServiceError(f"Сбер API error: {exc}") from exc
 
     @staticmethod
     def clean_response(text: str) -> str:
@@ -424,54 +1215,127 @@ class ExternalLLMService:
     @staticmethod
     def generate_response(question: str, model: str = SBER_DEFAULT_MODEL) -> str:
         """Отправить вопрос в GigaChat, вернуть очищенный ответ."""
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": question},
-        ]
+        messages = chat_messages(question)
+        lookup = semantic_cache.lookup("external", model, question)
+        if lookup.answer is not None:
+            return lookup.answer
         try:
-            raw = ExternalLLMService._chat(model, messages)
-            return (
-                ExternalLLMService.clean_response(raw)
-                or "Не удалось получить ответ от модели"
+            raw = inflight.do(
+                intent_key("chat", "external", model, messages, question),
+                lambda: ExternalLLMService._chat(model, messages, **decoding("chat")),
             )
+            answer = ExternalLLMService.clean_response(raw)
+            lookup.store(answer)
+            return answer or "Не удалось получить ответ от модели"
         except ExternalLLMServiceError as exc:
             logger.error("ExternalLLMService.generate_response error: %s", exc)
             return f"Ошибка GigaChat: {exc}"
 
+    @staticmethod
+    def _chat_stream(
+        model: str,
+        messages: list,
+        options: dict | None = None,
+    ) -> Iterator[str]:
+        """Потоково отправить messages в Сбер API, отдавая текстовые дельты."""
+        with (
+            breaker.guard("external", model, timed=False),
+            telemetry.call("chat", "external", model) as call,
+        ):
+            try:
+                client = _get_sber_client()
+                kwargs = build_completion_kwargs(model, messages, options)
+                for chunk in client.chat.completions.create(**kwargs, stream=True):
+                    delta = call.chunk(openai_delta_text(chunk), openai_usage(chunk))
+                    if delta:
+                        yield delta
+            except ExternalLLMServiceError:
+                raise
+            except Exception as exc:
+                raise ExternalLLMServiceError(f"Сбер API error: {exc}") from exc
+
+    @staticmethod
+    def stream_response(
+        question: str,
+        model: str = SBER_DEFAULT_MODEL,
+    ) -> Iterator[str]:
+        """Потоковая версия generate_response; ошибки — ExternalLLMServiceError."""
+        lookup = semantic_cache.lookup("external", model, question)
+        if lookup.answer is not None:
+            yield lookup.answer
+            return
+        yield from lookup.record(
+            filter_think_stream(
+                ExternalLLMService._chat_stream(
+                    model,
+                    chat_messages(question),
+                    decoding("chat")["options"],
+                ),
+            ),
+        )
+
     @staticmethod
     def get_action_code(question: str, model: str = SBER_DEFAULT_MODEL) -> str:
         """Получить трёхзначный код навигационного действия от GigaChat."""
-        messages = [
-            {"role": "system", "content": NAVIGATION_SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": f"{question}\n\nОтвет (только код):",
-            },
-        ]
-        try:
+        messages = action_code_messages(question)
+
+        def compute() -> str | Uncached:
             raw = ExternalLLMService._chat(
                 model,
                 messages,
-                options={"temperature": 0.1, "top_p": 0.9},
+                **decoding("action_code", action_code_schema()),
+                until=action_code_ready,
             )
             llm_response = ExternalLLMService.clean_response(raw)
             logger.info("External LLM action response: %s", llm_response)
+            return action_code_result(llm_response)
 
-            match = re.search(r"\d{3}", llm_response)
-            action_code = match.group(0) if match else CHAT_FALLBACK_CODE
-            if action_code not in ACTIONS_MAP:
-                logger.warning(
-                    "External action code %s not in ACTIONS_MAP, fallback to %s",
-                    action_code,
-                    CHAT_FALLBACK_CODE,
-                )
-                action_code = CHAT_FALLBACK_CODE
+        try:
+            action_code = intent_cache.get_or_compute(
+                intent_key("action_code", "external", model, messages, question),
+                compute,
+            )
             logger.info("External extracted action code: %s", action_code)
             return action_code
         except ExternalLLMServiceError as exc:
             logger.error("ExternalLLMService.get_action_code error: %s", exc)
             return CHAT_FALLBACK_CODE
 
+    @staticmethod
+    def get_navigation(
+        question: str,
+        model: str = SBER_DEFAULT_MODEL,
+        categories: list[str] | None = None,
+    ) -> dict | None:
+        """Определить код действия, фильтры и город одним вызовом GigaChat."""
+        messages = navigation_messages(question, categories)
+
+        def compute() -> dict | None:
+            raw = ExternalLLMService._chat(
+                model,
+                messages,
+                **decoding("navigation", navigation_schema(categories)),
+                until=json_object_ready,
+            )
+            raw = ExternalLLMService.clean_response(raw)
+            logger.info("ExternalLLMService navigation raw: %s", raw)
+            result = parse_navigation(raw)
+            if result is None:
+                logger.warning(
+                    "ExternalLLMService navigation: invalid response %r",
+                    raw,
+                )
+            return result
+
+        try:
+            return intent_cache.get_or_compute(
+                intent_key("navigation", "external", model, messages, question),
+                compute,
+            )
+        except ExternalLLMServiceError as exc:
+            logger.error("ExternalLLMService.get_navigation error: %s", exc)
+            return navigation_failed()
+
     @staticmethod
     def get_product_filters(
         question: str,
@@ -479,23 +1343,26 @@ class ExternalLLMService:
         categories: list[str] | None = None,
     ) -> dict:
         """Extract product catalogue filters from a free-text query via GigaChat."""
-        prompt = build_filters_prompt(categories)
-        messages = [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": question},
-        ]
-        try:
+        messages = filters_messages(question, categories)
+
+        def compute() -> dict | Uncached:
             raw = ExternalLLMService._chat(
                 model,
                 messages,
-                options={"temperature": 0.1, "top_p": 0.9},
+                **decoding("filters", product_filters_schema(categories)),
+                until=json_object_ready,
             )
             raw = ExternalLLMService.clean_response(raw)
             logger.info("ExternalLLMService filters raw: %s", raw)
-            match = re.search(r"\{[^{}]*\}", raw, re.DOTALL)
-            if not match:
-                return {}
-            return json.loads(match.group(0))
+            return product_filters_result(raw)
+
+        try:
+            return intent_cache.get_or_compute(
+                intent_key("filters", "external", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error("ExternalLLMService.get_product_filters error: %s", e)
             return {}
@@ -503,26 +1370,29 @@ class ExternalLLMService:
     @staticmethod
     def get_weather_city(question: str, model: str = SBER_DEFAULT_MODEL) -> str:
         """Extract city name (in English) from a weather query via GigaChat."""
-        messages = [
-            {"role": "system", "content": WEATHER_CITY_PROMPT},
-            {"role": "user", "content": question},
-        ]
-        try:
+        messages = weather_city_messages(question)
+
+        def compute() -> str | Uncached:
             raw = ExternalLLMService._chat(
                 model,
                 messages,
-                options={"temperature": 0.1, "top_p": 0.9},
+                **decoding("weather_city", weather_city_schema()),
+                until=json_object_ready,
             )
             raw = ExternalLLMService.clean_response(raw)
             logger.info("ExternalLLMService weather_city raw: %s", raw)
-            match = re.search(r"\{[^{}]*\}", raw, re.DOTALL)
-            if not match:
-                return "Москва"
-            data = json.loads(match.group(0))
-            return data.get("city", "Москва") or "Москва"
+            return weather_city_result(raw)
+
+        try:
+            return intent_cache.get_or_compute(
+                intent_key("weather_city", "external", model, messages, question),
+                compute,
+            )
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error("ExternalLLMService.get_weather_city error: %s", e)
-            return "Москва"
+            return DEFAULT_WEATHER_CITY
 
     @staticmethod
     def list_available_models() -> list:
@@ -531,3 +1401,19 @@ class ExternalLLMService:
         Не обращаемся к API — платформа отдаёт все модели без фильтрации.
         """
         return EXTERNAL_LLM_MODELS
+
+
+def _probe_ollama(model: str) -> None:
+    """Дешёвая проверка для circuit breaker: Ollama отвечает и модель есть."""
+    names = {info.name for info in OllamaService.fetch_models()}
+    if model not in names:
+        raise LookupError(f"Model {model} is not available in Ollama")
+
+
+def _probe_external(model: str) -> None:
+    """Дешёвая проверка для circuit breaker: Cloud.ru API отвечает."""
+    _get_sber_client().models.list()
+
+
+breaker.register_probe("local", _probe_ollama)
+breaker.register_probe("external", _probe_external)
@@ -0,0 +1,347 @@
+"""
+Speculative chat generation for navigate mode.
+
+When intent detection returns "000" the navigate pipeline only then starts
+the chat answer, so free-chat questions pay two LLM latencies in a row.
+With speculation enabled the chat answer is started in parallel with
+intent detection:
+
+* the intent is a navigation action → the speculative generation is
+  cancelled (the Ollama stream is closed, the async task cancelled);
+* the intent is "000"               → the answer is already in flight and
+  is awaited instead of starting a new generation.
+
+Policies (LLM_SPECULATIVE_POLICY):
+
+* ``off``      — never speculate (default);
+* ``always``   — every navigate request that reaches the LLM;
+* ``long``     — questions of at least LLM_SPECULATIVE_MIN_WORDS words
+  (short ones are usually commands);
+* ``low_load`` — only while the model's admission load (active + queued
+  per slot) is at most LLM_SPECULATIVE_MAX_LOAD.
+
+A speculative generation never waits in the admission queue: it runs only
+if a slot is free right now, and it bypasses single-flight so cancelling
+it can't fail a coalesced caller. ``speculator.stats()`` counts used and
+cancelled generations with the latency saved and the generation time
+wasted on them.
+
+Usage:
+    from api.llm_speculative import speculator
+    with speculator.start(svc, question, model, provider) as speculation:
+        code = svc.get_action_code(question, model)
+        if code == "000":
+            answer = speculation.result() or svc.generate_response(question, model)
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+
+from .llm_admission import AdmissionController, admission, run_unmetered
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_OFF = "off"
+SPECULATION_ALWAYS = "always"
+SPECULATION_LONG = "long"
+SPECULATION_LOW_LOAD = "low_load"
+SPECULATION_POLICIES = (
+    SPECULATION_OFF,
+    SPECULATION_ALWAYS,
+    SPECULATION_LONG,
+    SPECULATION_LOW_LOAD,
+)
+
+LLM_SPECULATIVE_POLICY = config("LLM_SPECULATIVE_POLICY", default=SPECULATION_OFF)
+LLM_SPECULATIVE_MIN_WORDS = config("LLM_SPECULATIVE_MIN_WORDS", default=6, cast=int)
+LLM_SPECULATIVE_MAX_LOAD = config(
+    "LLM_SPECULATIVE_MAX_LOAD",
+    default=0.5,
+    cast=float,
+)
+LLM_SPECULATIVE_WORKERS = config("LLM_SPECULATIVE_WORKERS", default=8, cast=int)
+
+
+class _NoSpeculation:
+    """Заглушка, когда спекуляция не запущена."""
+
+    started = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+    def result(self) -> None:
+        return None
+
+    async def aresult(self) -> None:
+        return None
+
+    def cancel(self) -> None:
+        return None
+
+
+NO_SPECULATION = _NoSpeculation()
+
+
+class _Speculation:
+    """Запущенная генерация; выход из with без result() её отменяет."""
+
+    started = True
+
+    def __init__(self, speculator: "Speculator", ticket) -> None:
+        self._speculator = speculator
+        self._ticket = ticket
+        self._started = time.monotonic()
+        self._finished: float | None = None
+        self._decided = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cancel()
+
+    def _finish(self, *, record: bool) -> None:
+        self._finished = time.monotonic()
+        self._ticket.release(record=record)
+
+    def _elapsed(self, decided_at: float) -> float:
+        """Время генерации до решения (или до её окончания, если раньше)."""
+        end = decided_at if self._finished is None else min(decided_at, self._finished)
+        return end - self._started
+
+    def _decide(self) -> float | None:
+        if self._decided:
+            return None
+        self._decided = True
+        return time.monotonic()
+
+
+class Speculation(_Speculation):
+    """Генерация в пуле потоков поверх svc.stream_response()."""
+
+    def __init__(self, speculator, ticket, executor, open_stream) -> None:
+        super().__init__(speculator, ticket)
+        self._cancelled = threading.Event()
+        self._future = executor.submit(
+            contextvars.copy_context().run,
+            self._run,
+            open_stream,
+        )
+
+    def _run(self, open_stream) -> str | None:
+        parts = []
+        stream = None
+        try:
+            stream = open_stream()
+            for chunk in stream:
+                if self._cancelled.is_set():
+                    break
+                parts.append(chunk)
+        finally:
+            # Закрытие потока обрывает HTTP-запрос, и Ollama прекращает генерацию
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            self._finish(record=not self._cancelled.is_set())
+        return "".join(parts).strip() or None
+
+    def result(self) -> str | None:
+        """Дождаться ответа; None, если генерация не удалась."""
+        decided_at = self._decide()
+        if decided_at is None:
+            return None
+        try:
+            answer = self._future.result()
+        except Exception as e:
+            logger.warning("Speculative generation failed: %s", e)
+            answer = None
+        self._speculator.record_result(
+            self._elapsed(decided_at),
+            ok=answer is not None,
+        )
+        return answer
+
+    def cancel(self) -> None:
+        decided_at = self._decide()
+        if decided_at is None:
+            return
+        self._cancelled.set()
+        self._speculator.record_cancel(self._elapsed(decided_at))
+
+
+class AsyncSpeculation(_Speculation):
+    """Генерация в отдельной asyncio-задаче текущего event loop."""
+
+    def __init__(self, speculator, ticket, generation) -> None:
+        super().__init__(speculator, ticket)
+        self._task = asyncio.ensure_future(generation)
+        # Колбэк, а не finally: задача может быть отменена до первого шага
+        self._task.add_done_callback(
+            lambda task: self._finish(record=not task.cancelled()),
+        )
+
+    async def aresult(self) -> str | None:
+        """Дождаться ответа; None, если генерация не удалась."""
+        decided_at = self._decide()
+        if decided_at is None:
+            return None
+        try:
+            answer = await self._task
+        except Exception as e:
+            logger.warning("Speculative generation failed: %s", e)
+            answer = None
+        self._speculator.record_result(
+            self._elapsed(decided_at),
+            ok=answer is not None,
+        )
+        return answer
+
+    def cancel(self) -> None:
+        decided_at = self._decide()
+        if decided_at is None:
+            return
+        self._task.cancel()
+        self._speculator.record_cancel(self._elapsed(decided_at))
+
+
+class Speculator:
+    """Decides when to speculate and keeps used/wasted compute counters."""
+
+    def __init__(
+        self,
+        *,
+        policy: str,
+        min_words: int,
+        max_load: float,
+        controller: AdmissionController,
+        workers: int,
+    ) -> None:
+        if policy not in SPECULATION_POLICIES:
+            logger.warning("Unknown LLM_SPECULATIVE_POLICY %r, using off", policy)
+            policy = SPECULATION_OFF
+        self.policy = policy
+        self.min_words = min_words
+        self.max_load = max_load
+        self.controller = controller
+        self.workers = workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def _wanted(self, question: str, provider: str, model: str) -> bool:
+        if self.policy == SPECULATION_LONG:
+            return len(question.split()) >= self.min_words
+        if self.policy == SPECULATION_LOW_LOAD:
+            return self.controller.load(provider, model) <= self.max_load
+        return self.policy == SPECULATION_ALWAYS
+
+    def _ticket(self, question: str, provider: str, model: str):
+        """Слот для спекуляции или None, если политика/нагрузка не позволяют."""
+        if self.policy == SPECULATION_OFF:
+            return None
+        if not self._wanted(question, provider, model):
+            with self._lock:
+                self.declined += 1
+            return None
+        ticket = self.controller.try_acquire(provider, model)
+        with self._lock:
+            if ticket is None:
+                self.no_slot += 1
+            else:
+                self.started += 1
+        return ticket
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="llm-speculative",
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def start(self, svc, question: str, model: str, provider: str):
+        """Запустить генерацию ответа чата параллельно с определением интента."""
+        ticket = self._ticket(question, provider, model)
+        if ticket is None:
+            return NO_SPECULATION
+        try:
+            return Speculation(
+                self,
+                ticket,
+                self._get_executor(),
+                lambda: svc.stream_response(question, model),
+            )
+        except Exception:
+            ticket.release(record=False)
+            raise
+
+    def astart(self, svc, question: str, model: str, provider: str):
+        """Async variant of start(); must be called inside the event loop."""
+        ticket = self._ticket(question, provider, model)
+        if ticket is None:
+            return NO_SPECULATION
+        return AsyncSpeculation(
+            self,
+            ticket,
+            run_unmetered(svc.generate_response(question, model, coalesce=False)),
+        )
+
+    def record_result(self, overlap: float, *, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.used += 1
+                self.saved_seconds += overlap
+            else:
+                self.failed += 1
+
+    def record_cancel(self, elapsed: float) -> None:
+        with self._lock:
+            self.cancelled += 1
+            self.wasted_seconds += elapsed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "started": self.started,
+                "used": self.used,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "declined": self.declined,
+                "no_slot": self.no_slot,
+                "saved_ms": round(1000 * self.saved_seconds, 1),
+                "wasted_ms": round(1000 * self.wasted_seconds, 1),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = 0
+            self.used = 0
+            self.cancelled = 0
+            self.failed = 0
+            self.declined = 0
+            self.no_slot = 0
+            self.saved_seconds = 0.0
+            self.wasted_seconds = 0.0
+
+
+speculator = Speculator(
+    policy=LLM_SPECULATIVE_POLICY,
+    min_words=LLM_SPECULATIVE_MIN_WORDS,
+    max_load=LLM_SPECULATIVE_MAX_LOAD,
+    controller=admission,
+    workers=LLM_SPECULATIVE_WORKERS,
+)
@@ -0,0 +1,364 @@
+"""
+Per-call LLM telemetry.
+
+A slow answer can come from the admission queue, loading the model, prompt
+evaluation or generation; the services used to log only the raw response.
+Every OllamaService / ExternalLLMService call (sync and async) now records:
+
+* wall time and, for streamed calls, time to the first text chunk;
+* Ollama's own breakdown — load_duration, prompt_eval_count/duration,
+  eval_count/duration — or the OpenAI ``usage`` token counts;
+* generation speed in tokens per second (eval_count / eval_duration, or
+  completion tokens over wall time; streamed chunks stand in for tokens
+  when the provider reports no counts, e.g. after an early exit).
+
+Calls are aggregated per (mode, provider, model) into fixed-bucket
+histograms; admission queue waits per (provider, model). Both are served
+by GET /api/llm/metrics/ (admin). With LLM_TELEMETRY_DEBUG=True the calls
+made while handling an /api/llm/ask/ request are also attached to its
+response as ``telemetry``.
+
+Usage:
+    from api.llm_telemetry import telemetry, ollama_usage
+    with telemetry.call("chat", "local", model) as call:
+        response = client.chat(...)
+        call.set_usage(ollama_usage(response))
+"""
+
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from collections.abc import Callable
+
+from decouple import config
+
+LLM_TELEMETRY_ENABLED = config("LLM_TELEMETRY_ENABLED", default=True, cast=bool)
+LLM_TELEMETRY_DEBUG = config("LLM_TELEMETRY_DEBUG", default=False, cast=bool)
+
+# Верхние границы корзин (как le в Prometheus); последняя корзина — +Inf
+SECONDS_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+TOKENS_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_NS = 1e-9
+
+# Вызовы текущего запроса (список) или None — не собираются
+_collected: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "llm_telemetry_calls",
+    default=None,
+)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, суммой и оценкой квантилей."""
+
+    def __init__(self, buckets: tuple) -> None:
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Линейная интерполяция внутри корзины, в которую попал квантиль."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.bounds):
+                    return self.max
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = min(self.bounds[index], self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def stats(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.bounds, self.counts, strict=False):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "avg": round(self.sum / self.count, 4) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "p99": round(self.quantile(0.99), 4),
+            "max": round(self.max, 4),
+            "buckets": buckets,
+        }
+
+
+# Поля вызова: (имя гистограммы, поле записи, корзины)
+_CALL_HISTOGRAMS = (
+    ("wall_seconds", "wall", SECONDS_BUCKETS),
+    ("first_chunk_seconds", "first_chunk", SECONDS_BUCKETS),
+    ("load_seconds", "load", SECONDS_BUCKETS),
+    ("prompt_eval_seconds", "prompt_eval", SECONDS_BUCKETS),
+    ("eval_seconds", "eval", SECONDS_BUCKETS),
+    ("prompt_tokens", "prompt_tokens", TOKENS_BUCKETS),
+    ("completion_tokens", "completion_tokens", TOKENS_BUCKETS),
+    ("tokens_per_second", "tokens_per_second", RATE_BUCKETS),
+)
+
+
+class _CallMetrics:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.histograms = {
+            name: Histogram(buckets) for name, _, buckets in _CALL_HISTOGRAMS
+        }
+
+    def observe(self, record: dict) -> None:
+        self.calls += 1
+        if not record["ok"]:
+            self.errors += 1
+            return
+        for name, field, _ in _CALL_HISTOGRAMS:
+            value = record.get(field)
+            if value is not None:
+                self.histograms[name].observe(value)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            **{name: hist.stats() for name, hist in self.histograms.items()},
+        }
+
+
+def ollama_usage(response) -> dict:
+    """Разбивка времени и токены из ответа (или последнего чанка) Ollama."""
+    usage = {}
+    for field, key, scale in (
+        ("load_duration", "load", _NS),
+        ("prompt_eval_count", "prompt_tokens", 1),
+        ("prompt_eval_duration", "prompt_eval", _NS),
+        ("eval_count", "completion_tokens", 1),
+        ("eval_duration", "eval", _NS),
+    ):
+        value = response.get(field)
+        if value is not None:
+            usage[key] = value * scale
+    return usage
+
+
+def openai_usage(response) -> dict:
+    """Токены из usage ответа (или чанка потока) chat.completions."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    return {
+        key: value
+        for key in ("prompt_tokens", "completion_tokens")
+        if (value := getattr(usage, key, None)) is not None
+    }
+
+
+class LLMCall:
+    """Один вызов провайдера: время, чанки потока и usage."""
+
+    def __init__(self, mode: str, provider: str, model: str) -> None:
+        self.mode = mode
+        self.provider = provider
+        self.model = model
+        self.started = time.monotonic()
+        self.first_chunk: float | None = None
+        self.streamed = False
+        self.chunks = 0
+        self.usage: dict = {}
+
+    def set_usage(self, usage: dict) -> None:
+        self.usage.update(usage)
+
+    def chunk(self, text: str, usage: dict | None = None) -> str:
+        """Учесть чанк потока; возвращает его текст без изменений."""
+        self.streamed = True
+        if text:
+            if self.first_chunk is None:
+                self.first_chunk = time.monotonic() - self.started
+            self.chunks += 1
+        if usage:
+            self.usage.update(usage)
+        return text
+
+    def reader(
+        self,
+        content: Callable[[object], str],
+        usage: Callable[[object], dict],
+    ) -> Callable[[object], str]:
+        """content() для read_until, который попутно учитывает чанки."""
+
+        def read(chunk) -> str:
+            return self.chunk(content(chunk), usage(chunk))
+
+        return read
+
+    def record(self, *, ok: bool) -> dict:
+        wall = time.monotonic() - self.started
+        completion = self.usage.get("completion_tokens")
+        if completion is None and self.chunks:
+            completion = self.chunks
+        rate = None
+        if completion and self.usage.get("eval"):
+            rate = completion / self.usage["eval"]
+        elif completion and wall > 0:
+            rate = completion / wall
+        return {
+            "mode": self.mode,
+            "provider": self.provider,
+            "model": self.model,
+            "ok": ok,
+            "streamed": self.streamed,
+            "wall": wall,
+            "first_chunk": self.first_chunk,
+            "load": self.usage.get("load"),
+            "prompt_tokens": self.usage.get("prompt_tokens"),
+            "prompt_eval": self.usage.get("prompt_eval"),
+            "completion_tokens": completion,
+            "eval": self.usage.get("eval"),
+            "tokens_per_second": rate,
+        }
+
+
+def _public(record: dict) -> dict:
+    """Запись для ответа API: секунды → миллисекунды, округление."""
+    result = {}
+    for key, value in record.items():
+        if key in {"wall", "first_chunk", "load", "prompt_eval", "eval"}:
+            result[f"{key}_ms"] = None if value is None else round(1000 * value, 1)
+        elif key == "tokens_per_second" and value is not None:
+            result[key] = round(value, 1)
+        else:
+            result[key] = value
+    return result
+
+
+class Telemetry:
+    """Гистограммы вызовов по (mode, provider, model) и ожиданий в очереди."""
+
+    def __init__(self, *, enabled: bool = True, debug: bool = False) -> None:
+        self.enabled = enabled
+        self.debug = debug
+        self._calls: dict[tuple[str, str, str], _CallMetrics] = {}
+        self._waits: dict[tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def call(self, mode: str, provider: str, model: str):
+        """
+        Измерить вызов провайдера. Прерванные вызовы (отмена, закрытый
+        поток) не учитываются; исключения считаются ошибками.
+        """
+        call = LLMCall(mode, provider, model)
+        if not self.enabled:
+            yield call
+            return
+        try:
+            yield call
+        except Exception:
+            self._observe(call.record(ok=False))
+            raise
+        self._observe(call.record(ok=True))
+
+    def _observe(self, record: dict) -> None:
+        key = (record["mode"], record["provider"], record["model"])
+        with self._lock:
+            metrics = self._calls.get(key)
+            if metrics is None:
+                metrics = self._calls[key] = _CallMetrics()
+            metrics.observe(record)
+        collected = _collected.get()
+        if collected is not None:
+            collected.append(_public(record))
+
+    def record_wait(self, provider: str, model: str, seconds: float) -> None:
+        """Время ожидания слота admission control."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._waits.get((provider, model))
+            if histogram is None:
+                histogram = self._waits[(provider, model)] = Histogram(
+                    SECONDS_BUCKETS,
+                )
+            histogram.observe(seconds)
+        collected = _collected.get()
+        if collected is not None:
+            collected.append(
+                {
+                    "mode": "queue",
+                    "provider": provider,
+                    "model": model,
+                    "wait_ms": round(1000 * seconds, 1),
+                },
+            )
+
+    @contextlib.contextmanager
+    def collect(self):
+        """
+        Собрать записи вызовов текущего запроса (только в режиме debug).
+
+        Возвращает список (или None); потоки и задачи, запущенные с копией
+        контекста, пишут в тот же список.
+        """
+        if not (self.enabled and self.debug):
+            yield None
+            return
+        calls = []
+        token = _collected.set(calls)
+        try:
+            yield calls
+        finally:
+            _collected.reset(token)
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls: dict[str, dict] = {}
+            for (mode, provider, model), metrics in self._calls.items():
+                calls.setdefault(mode, {})[f"{provider}:{model}"] = metrics.stats()
+            return {
+                "enabled": self.enabled,
+                "calls": calls,
+                "queue_wait_seconds": {
+                    f"{provider}:{model}": histogram.stats()
+                    for (provider, model), histogram in self._waits.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls = {}
+            self._waits = {}
+
+
+telemetry = Telemetry(enabled=LLM_TELEMETRY_ENABLED, debug=LLM_TELEMETRY_DEBUG)
@@ -0,0 +1,70 @@
+"""
+Management command: warmup_llm
+Loads local Ollama models and primes the fixed system prompts so the first
+navigation request does not pay for model loading and prompt evaluation.
+
+Usage:
+    python manage.py warmup_llm                      # LLM_WARMUP_MODELS
+    python manage.py warmup_llm --model qwen3:8b     # specific model(s)
+    python manage.py warmup_llm --status             # only show load state
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.llm_residency import residency_status, warm_models
+
+_MB = 1024 * 1024
+
+
+def _mb(value):
+    return f"{value / _MB:.0f} MB" if value else "-"
+
+
+class Command(BaseCommand):
+    help = "Preload local LLM models and show their residency state"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            action="append",
+            dest="models",
+            help="Model to warm up (repeatable; default: LLM_WARMUP_MODELS)",
+        )
+        parser.add_argument(
+            "--status",
+            action="store_true",
+            help="Only print which models are loaded",
+        )
+
+    def handle(self, *args, **options):
+        models = options["models"]
+
+        if not options["status"]:
+            failed = False
+            for result in warm_models(models):
+                if result["error"]:
+                    failed = True
+                    self.stdout.write(
+                        self.style.ERROR(f"{result['model']}: {result['error']}"),
+                    )
+                else:
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"{result['model']}: loaded in {result['load_ms']} ms, "
+                            f"primed {', '.join(result['primed'])}",
+                        ),
+                    )
+            if failed:
+                raise CommandError("Some models could not be warmed up")
+
+        try:
+            status = residency_status(models)
+        except Exception as e:
+            raise CommandError(f"Ollama is unavailable: {e}") from e
+        for item in status:
+            state = "loaded" if item["loaded"] else "not loaded"
+            self.stdout.write(
+                f"{item['model']}: {state}, RAM {_mb(item['size'])}, "
+                f"VRAM {_mb(item['size_vram'])}, expires {item['expires_at'] or '-'}, "
+                f"keep_alive {item['keep_alive']}",
+            )
@@ -1,5 +1,9 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .llm_prompts import prompt_cache
 
 
 class Category(models.Model):
@@ -16,6 +20,15 @@ class Category(models.Model):
         return self.name
 
 
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_llm_prompts(sender, **kwargs):
+    """Rebuild the LLM prompts that list categories"""
+    prompt_cache.invalidate()
+    # Reload that raced the open transaction must not keep the old list
+    transaction.on_commit(prompt_cache.invalidate)
+
+
 class Product(models.Model):
     STATUS_CHOICES = (
         ("draft", "Draft"),
@@ -0,0 +1,118 @@
+"""
+Pre-signed S3 GET URLs (Signature Version 4) without boto3.
+
+boto3's generate_presigned_url runs event hooks, endpoint resolution and
+parameter validation for every URL, which is most of its cost. Presigner
+produces the same URLs for ``get_object`` with path-style addressing (what
+boto3 uses with a custom endpoint such as MinIO): the signing key is derived
+once per day and a batch of keys is signed in one loop with a shared
+timestamp. tests/unit/test_s3_presign.py checks the output against boto3
+byte for byte.
+"""
+
+import hashlib
+import hmac
+import threading
+from datetime import UTC, datetime
+from urllib.parse import quote, urlsplit
+
+_ALGORITHM = "AWS4-HMAC-SHA256"
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# Регион по умолчанию boto3, если он не задан
+_DEFAULT_REGION = "us-east-1"
+
+
+def _host(endpoint) -> str:
+    """Заголовок host, как его подписывает botocore: без порта по умолчанию."""
+    host = endpoint.hostname or ""
+    if ":" in host:
+        host = f"[{host}]"
+    if endpoint.port is not None and endpoint.port != _DEFAULT_PORTS.get(
+        endpoint.scheme,
+    ):
+        host = f"{host}:{endpoint.port}"
+    return host
+
+
+class Presigner:
+    """Подпись GET-ссылок на объекты одного бакета."""
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str | None = None,
+    ) -> None:
+        endpoint = urlsplit(endpoint_url)
+        self.access_key = access_key
+        self.region = region or _DEFAULT_REGION
+        self._secret = f"AWS4{secret_key}".encode()
+        self._origin = f"{endpoint.scheme}://{endpoint.netloc}"
+        self._signed_host = _host(endpoint)
+        base_path = endpoint.path.rstrip("/")
+        self._bucket_path = f"{base_path}/{quote(bucket, safe='/~')}/"
+        self._lock = threading.Lock()
+        # (дата YYYYMMDD, HMAC с ключом подписи этого дня)
+        self._day_key: tuple[str, hmac.HMAC] | None = None
+
+    def unsigned_url(self, key: str) -> str:
+        """Прямая ссылка на объект (для бакета с публичным чтением)."""
+        return f"{self._origin}{self._bucket_path}{quote(key, safe='/~')}"
+
+    def _signing_hmac(self, date: str) -> hmac.HMAC:
+        """HMAC с ключом подписи на дату; ключ считается раз в сутки."""
+        day_key = self._day_key
+        if day_key is not None and day_key[0] == date:
+            return day_key[1]
+        key = self._secret
+        for part in (date, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signing = hmac.new(key, digestmod=hashlib.sha256)
+        with self._lock:
+            self._day_key = (date, signing)
+        return signing
+
+    def presign_get_many(
+        self,
+        keys: list[str],
+        expires_in: int = 3600,
+        now: datetime | None = None,
+    ) -> list[str]:
+        """Ссылки на объекты keys (в том же порядке) с общей меткой времени."""
+        now = now or datetime.now(tz=UTC)
+        timestamp = now.strftime("%Y%m%dT%H%M%SZ")
+        date = timestamp[:8]
+        scope = f"{date}/{self.region}/s3/aws4_request"
+        credential = quote(f"{self.access_key}/{scope}", safe="-_.~")
+        query = (
+            f"X-Amz-Algorithm={_ALGORITHM}"
+            f"&X-Amz-Credential={credential}"
+            f"&X-Amz-Date={timestamp}"
+            f"&X-Amz-Expires={int(expires_in)}"
+            "&X-Amz-SignedHeaders=host"
+        )
+        # Каноничный запрос без пути: параметры уже отсортированы по имени
+        request_tail = f"\n{query}\nhost:{self._signed_host}\n\nhost\nUNSIGNED-PAYLOAD"
+        string_prefix = f"{_ALGORITHM}\n{timestamp}\n{scope}\n".encode()
+        signing = self._signing_hmac(date)
+
+        urls = []
+        for key in keys:
+            path = self._bucket_path + quote(key, safe="/~")
+            canonical = f"GET\n{path}{request_tail}".encode()
+            mac = signing.copy()
+            mac.update(string_prefix + hashlib.sha256(canonical).hexdigest().encode())
+            urls.append(
+                f"{self._origin}{path}?{query}&X-Amz-Signature={mac.hexdigest()}",
+            )
+        return urls
+
+    def presign_get(
+        self,
+        key: str,
+        expires_in: int = 3600,
+        now: datetime | None = None,
+    ) -> str:
+        return self.presign_get_many([key], expires_in, now)[0]
@@ -1,54 +1,508 @@
+import contextlib
+import functools
+import hashlib
 import logging
+import os
+import threading
+import time
 import uuid
+from datetime import UTC, datetime
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from botocore.exceptions import BotoCoreError, ClientError
 from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+
+from .s3_presign import Presigner
 
 logger = logging.getLogger(__name__)
 
+# Классы объектов и стратегии их URL (settings.AWS_S3_URL_STRATEGY):
+#   presigned — подписанные ссылки на час (бакет закрыт);
+#   public    — прямые ссылки, бакет открыт на чтение, подпись не нужна;
+#   immutable — ключи по хэшу содержимого и долгоживущие ссылки, одинаковые
+#               в течение AWS_S3_IMMUTABLE_URL_PERIOD (кэшируются браузером/CDN)
+PRODUCT_IMAGE = "product_image"
+AVATAR = "avatar"
+URL_PRESIGNED = "presigned"
+URL_PUBLIC = "public"
+URL_IMMUTABLE = "immutable"
+URL_STRATEGIES = (URL_PRESIGNED, URL_PUBLIC, URL_IMMUTABLE)
+
+PRESIGNED_URL_EXPIRES = 3600
+# Предел SigV4 для X-Amz-Expires
+MAX_PRESIGNED_URL_EXPIRES = 7 * 24 * 3600
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_KEY_PREFIXES = {AVATAR: "avatars"}
+
+_UPLOAD_TOKEN_SALT = "api.s3_service.direct_upload"
+# Подтверждение принимается ещё столько секунд после истечения политики POST
+_UPLOAD_CONFIRM_GRACE = 300
+
+
+class UploadVerificationError(Exception):
+    """A direct upload is missing, expired or does not match its policy."""
+
+
+class S3ClientRegistry:
+    """
+    boto3 S3 clients shared by the process, one per endpoint and credentials.
+
+    Creating a client loads the service model and opens a new connection
+    pool, so a client per call paid for that and for a new TCP/TLS
+    handshake on every upload and delete. Clients are created under a lock
+    from the registry's own session (boto3 sessions are not thread-safe,
+    clients are) and dropped in a forked child, which must not share the
+    parent's sockets.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._clients: dict[tuple, object] = {}
+        self._session: boto3.session.Session | None = None
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _config() -> Config:
+        return Config(
+            signature_version="s3v4",
+            max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.AWS_S3_CONNECT_TIMEOUT,
+            read_timeout=settings.AWS_S3_READ_TIMEOUT,
+            retries={"max_attempts": settings.AWS_S3_MAX_ATTEMPTS, "mode": "standard"},
+        )
+
+    def get(
+        self,
+        endpoint_url: str,
+        access_key: str,
+        secret_key: str,
+        region: str | None,
+    ):
+        key = (endpoint_url, access_key, secret_key, region)
+        if self._pid == os.getpid():
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            client = self._clients.get(key)
+            if client is None:
+                if self._session is None:
+                    self._session = boto3.session.Session()
+                client = self._session.client(
+                    "s3",
+                    endpoint_url=endpoint_url,
+                    aws_access_key_id=access_key,
+                    aws_secret_access_key=secret_key,
+                    region_name=region,
+                    config=self._config(),
+                )
+                self._clients[key] = client
+        return client
+
+    def _reset(self) -> None:
+        self._clients = {}
+        self._session = None
+        self._pid = os.getpid()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+
+clients = S3ClientRegistry()
+# Дочерний процесс (gunicorn --preload, multiprocessing) создаёт свои клиенты
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=clients.clear)
+
+# Бакеты, существование которых уже проверено: (endpoint, bucket)
+_known_buckets: set[tuple[str, str]] = set()
+
 
 def _get_client():
-    """Return a boto3 S3 client pointed at MinIO."""
-    return boto3.client(
-        "s3",
-        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME or None,
-        config=Config(signature_version="s3v4"),
+    """Return the shared boto3 S3 client pointed at MinIO."""
+    return clients.get(
+        settings.AWS_S3_ENDPOINT_URL,
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+        settings.AWS_S3_REGION_NAME or None,
+    )
+
+
+def _get_public_client():
+    """Client for the public endpoint: signs what the browser will send."""
+    return clients.get(
+        getattr(settings, "AWS_S3_PUBLIC_URL", settings.AWS_S3_ENDPOINT_URL),
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+        settings.AWS_S3_REGION_NAME or None,
     )
 
 
+def _error_code(exc: ClientError) -> str:
+    return exc.response.get("Error", {}).get("Code", "")
+
+
+def _transfer_config() -> TransferConfig:
+    """
+    Uploads up to MAX_UPLOAD_SIZE go in one PutObject: no multipart
+    create/complete round trips and no transfer thread pool per file.
+    """
+    return TransferConfig(
+        multipart_threshold=max(settings.MAX_UPLOAD_SIZE + 1, 8 * 1024 * 1024),
+        use_threads=False,
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _presigner(
+    endpoint_url: str,
+    bucket: str,
+    access_key: str,
+    secret_key: str,
+    region: str | None,
+) -> Presigner:
+    """One SigV4 presigner per endpoint, bucket and credentials."""
+    return Presigner(endpoint_url, bucket, access_key, secret_key, region)
+
+
+class PresignedURLCache:
+    """
+    Signed URLs memoized per (endpoint, bucket, key, expiry) in time windows.
+
+    All URLs are dropped when a new window of ``window`` seconds starts, so a
+    reused URL always has at least ``expires_in - window`` seconds left.
+    Within a window a key keeps the same URL, which also lets browsers
+    cache the image instead of downloading it again for every listing.
+    """
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._urls: dict[tuple, str] = {}
+        self._window: int | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def window_for(expires_in: int) -> int:
+        """Length of the window: the setting, but well under the expiry."""
+        window = getattr(settings, "AWS_S3_PRESIGNED_URL_CACHE_SECONDS", 300)
+        return min(window, expires_in // 2)
+
+    def get_or_sign_many(self, keys: list[tuple], window: int, sign) -> list[str]:
+        """
+        URLs for the cache keys in the current window of ``window`` seconds;
+        the missing ones are signed together by sign(indexes) -> URLs.
+        """
+        if window <= 0:
+            return sign(list(range(len(keys))))
+        current = int(time.time() // window)
+        with self._lock:
+            if current != self._window or len(self._urls) + len(keys) > self.maxsize:
+                self._urls = {}
+                self._window = current
+            urls = [self._urls.get(key) for key in keys]
+        missing = [index for index, url in enumerate(urls) if url is None]
+        signed = sign(missing) if missing else []
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            for index, url in zip(missing, signed, strict=True):
+                urls[index] = url
+                if current == self._window:
+                    self._urls[keys[index]] = url
+        return urls
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._urls), "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._urls = {}
+            self._window = None
+            self.hits = 0
+            self.misses = 0
+
+
+presigned_urls = PresignedURLCache()
+immutable_urls = PresignedURLCache()
+
+
+def clear_caches() -> None:
+    """Forget clients, known buckets, presigners and URLs (settings, tests)."""
+    clients.clear()
+    _known_buckets.clear()
+    _presigner.cache_clear()
+    presigned_urls.clear()
+    immutable_urls.clear()
+
+
+def url_strategy(kind: str) -> str:
+    """URL strategy configured for a class of objects (PRODUCT_IMAGE, AVATAR)."""
+    strategy = getattr(settings, "AWS_S3_URL_STRATEGY", {}).get(kind, URL_PRESIGNED)
+    if strategy not in URL_STRATEGIES:
+        msg = f"Unknown S3 URL strategy {strategy!r} for {kind}"
+        raise ImproperlyConfigured(msg)
+    return strategy
+
+
+def _public_presigner() -> Presigner:
+    return _presigner(
+        getattr(settings, "AWS_S3_PUBLIC_URL", settings.AWS_S3_ENDPOINT_URL),
+        settings.AWS_STORAGE_BUCKET_NAME,
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+        settings.AWS_S3_REGION_NAME or None,
+    )
+
+
+def _cache_keys(keys: list[str], expires_in: int) -> list[tuple]:
+    public_url = getattr(settings, "AWS_S3_PUBLIC_URL", settings.AWS_S3_ENDPOINT_URL)
+    return [
+        (
+            public_url,
+            settings.AWS_ACCESS_KEY_ID,
+            settings.AWS_STORAGE_BUCKET_NAME,
+            key,
+            expires_in,
+        )
+        for key in keys
+    ]
+
+
 def ensure_bucket_exists(bucket: str | None = None) -> None:
-    """Create the bucket if it doesn't exist yet."""
+    """
+    Create the bucket if it doesn't exist yet.
+
+    A bucket found or created once is remembered for the process lifetime,
+    so uploads skip the head_bucket round trip; forget_bucket() (called on
+    NoSuchBucket) makes the next call check again.
+    """
     bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+    known = (settings.AWS_S3_ENDPOINT_URL, bucket)
+    if known in _known_buckets:
+        return
     client = _get_client()
     try:
         client.head_bucket(Bucket=bucket)
     except ClientError:
-        client.create_bucket(Bucket=bucket)
-        logger.info("Created S3 bucket: %s", bucket)
+        try:
+            client.create_bucket(Bucket=bucket)
+            logger.info("Created S3 bucket: %s", bucket)
+        except ClientError as exc:
+            # Другой процесс успел создать бакет
+            if _error_code(exc) not in {
+                "BucketAlreadyOwnedByYou",
+                "BucketAlreadyExists",
+            }:
+                raise
+    _known_buckets.add(known)
+
+
+def forget_bucket(bucket: str | None = None) -> None:
+    """The bucket is gone (NoSuchBucket): check it again before the next upload."""
+    bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+    _known_buckets.discard((settings.AWS_S3_ENDPOINT_URL, bucket))
+
+
+def _content_hash(file_obj) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(1024 * 1024), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
 
 
-def upload_file(file_obj, content_type: str, original_filename: str) -> str:
+def _new_key(kind: str | None, filename: str, name: str | None = None) -> str:
+    ext = filename.rsplit(".", 1)[-1] if "." in filename else "bin"
+    return f"{_KEY_PREFIXES.get(kind, 'products')}/{name or uuid.uuid4()}.{ext}"
+
+
+def upload_file(
+    file_obj,
+    content_type: str,
+    original_filename: str,
+    kind: str | None = None,
+) -> str:
     """
     Upload a file-like object to S3/MinIO.
     Returns the S3 object key.
+
+    With the immutable URL strategy for ``kind`` the key is the SHA-256 of
+    the content (the same file always gets the same key, so its URL can be
+    cached forever); objects served without signing query strings are
+    stored with an immutable Cache-Control.
     """
     ensure_bucket_exists()
-    ext = original_filename.rsplit(".", 1)[-1] if "." in original_filename else "bin"
-    key = f"products/{uuid.uuid4()}.{ext}"
+    strategy = url_strategy(kind) if kind else URL_PRESIGNED
+    extra_args = {"ContentType": content_type}
+    if strategy == URL_IMMUTABLE:
+        key = _new_key(kind, original_filename, _content_hash(file_obj))
+    else:
+        key = _new_key(kind, original_filename)
+    if strategy != URL_PRESIGNED:
+        extra_args["CacheControl"] = IMMUTABLE_CACHE_CONTROL
     client = _get_client()
-    client.upload_fileobj(
-        file_obj,
+    try:
+        client.upload_fileobj(
+            file_obj,
+            settings.AWS_STORAGE_BUCKET_NAME,
+            key,
+            ExtraArgs=extra_args,
+            Config=_transfer_config(),
+        )
+    except ClientError as exc:
+        if _error_code(exc) != "NoSuchBucket":
+            raise
+        # Бакет удалили после проверки: создать заново и повторить один раз
+        logger.warning("S3 bucket disappeared, recreating: %s", exc)
+        forget_bucket()
+        ensure_bucket_exists()
+        file_obj.seek(0)
+        client.upload_fileobj(
+            file_obj,
+            settings.AWS_STORAGE_BUCKET_NAME,
+            key,
+            ExtraArgs=extra_args,
+            Config=_transfer_config(),
+        )
+    logger.info("Uploaded file to S3: %s", key)
+    return key
+
+
+def create_direct_upload(
+    kind: str,
+    filename: str,
+    content_type: str,
+    size: int,
+    scope: str,
+) -> dict:
+    """
+    Presigned POST policy for uploading a file straight from the browser.
+
+    The policy pins the key, the Content-Type and a content-length range
+    capped at the declared ``size``, so storage itself rejects anything
+    else. ``upload_token`` carries the key and the declared file (name,
+    type, size) signed with SECRET_KEY and bound to
+    ``scope`` (who uploads what); confirm_direct_upload() checks it.
+    Direct uploads always get random keys: the content is not known in
+    advance, so "immutable" classes get unique rather than hashed keys.
+    """
+    ensure_bucket_exists()
+    key = _new_key(kind, filename)
+    fields = {"Content-Type": content_type}
+    if url_strategy(kind) != URL_PRESIGNED:
+        fields["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    conditions = [{name: value} for name, value in fields.items()]
+    conditions.append(["content-length-range", 1, size])
+    expires_in = settings.AWS_S3_DIRECT_UPLOAD_EXPIRES
+    post = _get_public_client().generate_presigned_post(
         settings.AWS_STORAGE_BUCKET_NAME,
         key,
-        ExtraArgs={"ContentType": content_type},
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=expires_in,
     )
-    logger.info("Uploaded file to S3: %s", key)
-    return key
+    token = signing.dumps(
+        {
+            "key": key,
+            "scope": scope,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+        },
+        salt=_UPLOAD_TOKEN_SALT,
+    )
+    return {
+        "url": post["url"],
+        "fields": post["fields"],
+        "key": key,
+        "upload_token": token,
+        "expires_in": expires_in,
+    }
+
+
+def confirm_direct_upload(token: str, scope: str) -> dict:
+    """
+    Check an object uploaded with create_direct_upload() (one HEAD request).
+
+    Returns {"key", "filename", "content_type", "size"}; raises
+    UploadVerificationError if the token is invalid, expired or issued for
+    another scope, the object is missing, or its type or size differs from
+    the declared ones (such an object is deleted).
+    """
+    try:
+        upload = signing.loads(
+            token,
+            salt=_UPLOAD_TOKEN_SALT,
+            max_age=settings.AWS_S3_DIRECT_UPLOAD_EXPIRES + _UPLOAD_CONFIRM_GRACE,
+        )
+    except signing.BadSignature as exc:
+        msg = "Ссылка на загрузку недействительна или истекла."
+        raise UploadVerificationError(msg) from exc
+    if upload.get("scope") != scope:
+        msg = "Ссылка на загрузку выдана для другого объекта."
+        raise UploadVerificationError(msg)
+
+    key = upload["key"]
+    try:
+        head = _get_client().head_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=key,
+        )
+    except ClientError as exc:
+        if _error_code(exc) not in {"404", "NoSuchKey", "NotFound"}:
+            raise
+        msg = "Файл не загружен в хранилище."
+        raise UploadVerificationError(msg) from exc
+
+    size = head.get("ContentLength", 0)
+    content_type = head.get("ContentType", "")
+    if content_type != upload["content_type"] or size != upload["size"]:
+        logger.warning(
+            "Direct upload %s does not match its policy: %s, %s bytes",
+            key,
+            content_type,
+            size,
+        )
+        with contextlib.suppress(BotoCoreError, ClientError):
+            delete_file(key)
+        msg = "Загруженный файл не соответствует заявленному типу или размеру."
+        raise UploadVerificationError(msg)
+    return {
+        "key": key,
+        "filename": upload["filename"],
+        "content_type": content_type,
+        "size": size,
+    }
+
+
+def generate_presigned_urls(keys: list[str], expires_in: int = 3600) -> dict[str, str]:
+    """
+    Pre-signed GET URLs for many objects: {key: url}.
+
+    URLs are signed with the public endpoint (accessible from browser) by
+    the pure-Python presigner in one batch; the ones already signed in the
+    current cache window (AWS_S3_PRESIGNED_URL_CACHE_SECONDS) are reused.
+    """
+    keys = list(dict.fromkeys(keys))
+    presigner = _public_presigner()
+    urls = presigned_urls.get_or_sign_many(
+        _cache_keys(keys, expires_in),
+        PresignedURLCache.window_for(expires_in),
+        lambda missing: presigner.presign_get_many(
+            [keys[index] for index in missing],
+            expires_in,
+        ),
+    )
+    return dict(zip(keys, urls, strict=True))
 
 
 def generate_presigned_url(key: str, expires_in: int = 3600) -> str:
@@ -57,21 +511,67 @@ def generate_presigned_url(key: str, expires_in: int = 3600) -> str:
     Uses the public URL (accessible from browser) if configured differently
     from the internal Docker endpoint.
     """
-    # Build a client that signs URLs using the public-facing endpoint
-    public_url = getattr(settings, "AWS_S3_PUBLIC_URL", settings.AWS_S3_ENDPOINT_URL)
-    client = boto3.client(
-        "s3",
-        endpoint_url=public_url,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME or None,
-        config=Config(signature_version="s3v4"),
-    )
-    return client.generate_presigned_url(
-        "get_object",
-        Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": key},
-        ExpiresIn=expires_in,
-    )
+    return generate_presigned_urls([key], expires_in)[key]
+
+
+def generate_immutable_urls(keys: list[str]) -> dict[str, str]:
+    """
+    Long-lived signed URLs that stay the same for a whole period.
+
+    Every URL is signed as of the start of the current
+    AWS_S3_IMMUTABLE_URL_PERIOD and is valid for AWS_S3_IMMUTABLE_URL_EXPIRES
+    (SigV4 allows up to 7 days), so a URL handed out at the end of a period
+    still has ``expires - period`` seconds left.
+    """
+    keys = list(dict.fromkeys(keys))
+    period = settings.AWS_S3_IMMUTABLE_URL_PERIOD
+    expires_in = settings.AWS_S3_IMMUTABLE_URL_EXPIRES
+    if not 0 < period < expires_in <= MAX_PRESIGNED_URL_EXPIRES:
+        msg = (
+            "AWS_S3_IMMUTABLE_URL_PERIOD must be positive and shorter than "
+            "AWS_S3_IMMUTABLE_URL_EXPIRES, which is at most 7 days"
+        )
+        raise ImproperlyConfigured(msg)
+    presigner = _public_presigner()
+
+    def sign(missing: list[int]) -> list[str]:
+        start = int(time.time() // period) * period
+        return presigner.presign_get_many(
+            [keys[index] for index in missing],
+            expires_in,
+            now=datetime.fromtimestamp(start, tz=UTC),
+        )
+
+    urls = immutable_urls.get_or_sign_many(_cache_keys(keys, expires_in), period, sign)
+    return dict(zip(keys, urls, strict=True))
+
+
+def object_urls(keys: list[str], kind: str) -> dict[str, str]:
+    """{key: URL} for objects of one class, using its URL strategy."""
+    strategy = url_strategy(kind)
+    if strategy == URL_PUBLIC:
+        presigner = _public_presigner()
+        return {key: presigner.unsigned_url(key) for key in keys}
+    if strategy == URL_IMMUTABLE:
+        return generate_immutable_urls(keys)
+    return generate_presigned_urls(keys, expires_in=PRESIGNED_URL_EXPIRES)
+
+
+def object_url(key: str, kind: str) -> str:
+    return object_urls([key], kind)[key]
+
+
+def url_lifetime(kind: str) -> int | None:
+    """Seconds a URL handed out now stays valid at least; None — forever."""
+    strategy = url_strategy(kind)
+    if strategy == URL_PUBLIC:
+        return None
+    if strategy == URL_IMMUTABLE:
+        return (
+            settings.AWS_S3_IMMUTABLE_URL_EXPIRES - settings.AWS_S3_IMMUTABLE_URL_PERIOD
+        )
+    # Закэшированная ссылка могла быть подписана в начале окна кэша
+    return PRESIGNED_URL_EXPIRES - PresignedURLCache.window_for(PRESIGNED_URL_EXPIRES)
 
 
 def delete_file(key: str) -> None:
@@ -81,5 +581,7 @@ def delete_file(key: str) -> None:
         client.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
         logger.info("Deleted S3 object: %s", key)
     except (BotoCoreError, ClientError) as exc:
+        if isinstance(exc, ClientError) and _error_code(exc) == "NoSuchBucket":
+            forget_bucket()
         logger.exception("Failed to delete S3 object %s: %s", key, exc)
         raise
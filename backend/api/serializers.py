@@ -1,10 +1,26 @@
 # filepath: c:\projects\fullstack\work\backend\api\serializers.py
+import contextlib
+
 from django.contrib.auth.models import User
+from django.db import models
 from django.utils.text import slugify
 from rest_framework import serializers
 
 from .models import Category, Order, OrderItem, Product, ProductImage
-from .s3_service import generate_presigned_url
+from .s3_service import AVATAR, PRODUCT_IMAGE, object_url, object_urls
+
+
+def _avatar_key(user) -> str | None:
+    profile = getattr(user, "profile", None)
+    return getattr(profile, "avatar_s3_key", None) or None
+
+
+def _object_url(context, key: str, kind: str) -> str:
+    """URL built in a batch by ProductListSerializer, or build it alone."""
+    urls = context.get("object_urls", {}).get(kind)
+    if urls is not None and key in urls:
+        return urls[key]
+    return object_url(key, kind)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -28,9 +44,9 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_avatar_url(self, obj):
         try:
-            profile = obj.profile
-            if profile.avatar_s3_key:
-                return generate_presigned_url(profile.avatar_s3_key, expires_in=3600)
+            key = _avatar_key(obj)
+            if key:
+                return _object_url(self.context, key, AVATAR)
         except Exception:
             pass
         return None
@@ -76,13 +92,58 @@ class ProductImageSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_url(self, obj):
-        """Return a pre-signed URL valid for 1 hour."""
+        """Return the image URL (per AWS_S3_URL_STRATEGY["product_image"])."""
         try:
-            return generate_presigned_url(obj.s3_key, expires_in=3600)
+            return _object_url(self.context, obj.s3_key, PRODUCT_IMAGE)
         except Exception:
             return None
 
 
+class DirectUploadSerializer(serializers.Serializer):
+    """
+    The file the browser is going to upload straight to storage.
+    Context: ``allowed_types`` and ``max_size`` (bytes).
+    """
+
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100)
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_content_type(self, value):
+        allowed = self.context["allowed_types"]
+        if value not in allowed:
+            msg = f"Недопустимый тип файла. Разрешены: {', '.join(sorted(allowed))}"
+            raise serializers.ValidationError(msg)
+        return value
+
+    def validate_size(self, value):
+        max_size = self.context["max_size"]
+        if value > max_size:
+            msg = f"Файл слишком большой. Максимум: {max_size // 1024 // 1024} MB"
+            raise serializers.ValidationError(msg)
+        return value
+
+
+class ProductListSerializer(serializers.ListSerializer):
+    """Builds the image and author avatar URLs of a whole page in one batch."""
+
+    def to_representation(self, data):
+        products = list(data.all() if isinstance(data, models.Manager) else data)
+        keys = {PRODUCT_IMAGE: [], AVATAR: []}
+        for product in products:
+            keys[PRODUCT_IMAGE].extend(image.s3_key for image in product.images.all())
+            avatar = _avatar_key(product.author)
+            if avatar:
+                keys[AVATAR].append(avatar)
+        # On failure the nested serializers build (or skip) each URL themselves
+        urls = self.context.setdefault("object_urls", {})
+        for kind, kind_keys in keys.items():
+            if kind_keys:
+                with contextlib.suppress(Exception):
+                    urls[kind] = object_urls(kind_keys, kind)
+        return super().to_representation(products)
+
+
 class ProductSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     category_name = serializers.CharField(source="category.name", read_only=True)
@@ -91,6 +152,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
+        list_serializer_class = ProductListSerializer
         fields = (
             "id",
             "title",
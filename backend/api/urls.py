@@ -2,12 +2,22 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
+    AskLLMBatchView,
+    AskLLMStreamView,
     AskLLMView,
+    AsyncAskLLMView,
     CategoryViewSet,
     GetActionsMapView,
     GetAvailableModelsView,
+    LLMCacheView,
+    LLMMetricsView,
+    LLMQueueStatsView,
+    LLMResidencyView,
+    LLMSemanticCacheView,
     OrderViewSet,
     ProductImageDetailView,
+    ProductImageDirectUploadConfirmView,
+    ProductImageDirectUploadView,
     ProductImageUploadView,
     ProductViewSet,
     WeatherView,
@@ -28,14 +38,36 @@ urlpatterns = [
         ProductImageUploadView.as_view(),
         name="product_images",
     ),
+    path(
+        "products/<str:slug>/images/direct/",
+        ProductImageDirectUploadView.as_view(),
+        name="product_image_direct_upload",
+    ),
+    path(
+        "products/<str:slug>/images/direct/confirm/",
+        ProductImageDirectUploadConfirmView.as_view(),
+        name="product_image_direct_upload_confirm",
+    ),
     path(
         "products/<str:slug>/images/<int:image_id>/",
         ProductImageDetailView.as_view(),
         name="product_image_detail",
     ),  # LLM
     path("llm/ask/", AskLLMView.as_view(), name="ask_llm"),
+    path("llm/ask/async/", AsyncAskLLMView.as_view(), name="ask_llm_async"),
+    path("llm/ask/batch/", AskLLMBatchView.as_view(), name="ask_llm_batch"),
+    path("llm/ask/stream/", AskLLMStreamView.as_view(), name="ask_llm_stream"),
     path("llm/models/", GetAvailableModelsView.as_view(), name="available_models"),
     path("llm/actions/", GetActionsMapView.as_view(), name="actions_map"),
+    path("llm/cache/", LLMCacheView.as_view(), name="llm_cache"),
+    path("llm/metrics/", LLMMetricsView.as_view(), name="llm_metrics"),
+    path(
+        "llm/cache/semantic/",
+        LLMSemanticCacheView.as_view(),
+        name="llm_semantic_cache",
+    ),
+    path("llm/queue/", LLMQueueStatsView.as_view(), name="llm_queue"),
+    path("llm/residency/", LLMResidencyView.as_view(), name="llm_residency"),
     # Weather (third-party API)
     path("weather/", WeatherView.as_view(), name="weather"),
 ]
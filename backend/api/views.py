@@ -1,33 +1,69 @@
+import asyncio
 import contextlib
+import json
 import logging
+import time
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import (
     AllowAny,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from users.permissions import CanMakeRequest
+from users.permissions import CanMakeRequest, IsAdminUser
 
 from .filters import ProductFilter
+from .llm_admission import LLMOverloadedError, admission
+from .llm_async import AsyncExternalLLMService, AsyncOllamaService
+from .llm_breaker import OPEN, breaker
+from .llm_cache import inflight, intent_cache
+from .llm_clients import aclose_loop_clients
+from .llm_prompts import prompt_cache
+from .llm_residency import residency_status, start_warmup
+from .llm_router import KIND_CHAT, KIND_NAVIGATION, PROVIDER_AUTO, router
+from .llm_rules import NAVIGATION_RULES, match_intent
 from .llm_service import (
     ACTIONS_MAP,
     CHAT_FALLBACK_CODE,
+    DEFAULT_WEATHER_CITY,
+    LLM_BATCH_CONCURRENCY,
+    LLM_BATCH_MAX_ITEMS,
+    NAVIGATION_COMBINED,
+    NAVIGATION_STRATEGY,
+    NAVIGATION_TWO_STEP,
     ExternalLLMService,
     ExternalLLMServiceError,
     OllamaService,
+    model_catalog,
+    semantic_cache,
 )
+from .llm_speculative import NO_SPECULATION, speculator
+from .llm_telemetry import telemetry
 from .models import Category, Order, Product, ProductImage
-from .s3_service import delete_file, generate_presigned_url, upload_file
+from .s3_service import (
+    PRODUCT_IMAGE,
+    UploadVerificationError,
+    confirm_direct_upload,
+    create_direct_upload,
+    delete_file,
+    object_url,
+    upload_file,
+    url_lifetime,
+)
 from .serializers import (
     CategorySerializer,
+    DirectUploadSerializer,
     OrderSerializer,
     ProductImageSerializer,
     ProductSerializer,
@@ -37,6 +73,20 @@ from .weather_service import WeatherService, WeatherServiceError
 logger = logging.getLogger(__name__)
 
 
+def _image_key_shared(s3_key, deleted_pks) -> bool:
+    """
+    Объект S3 нужен другим изображениям: при ключах по хэшу содержимого
+    (AWS_S3_URL_STRATEGY "immutable") один файл может принадлежать многим.
+    """
+    return (
+        ProductImage.objects.filter(s3_key=s3_key).exclude(pk__in=deleted_pks).exists()
+    )
+
+
+# Провайдеры, для которых модель проверяется по роли пользователя
+LOCAL_PROVIDERS = ("local", PROVIDER_AUTO)
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -48,7 +98,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = (
-        Product.objects.select_related("category", "author")
+        Product.objects.select_related("category", "author__profile")
         .prefetch_related("images")
         .all()
     )
@@ -112,7 +162,11 @@ class ProductViewSet(viewsets.ModelViewSet):
                 {"detail": "Вы не можете удалить чужой товар."},
                 status=status.HTTP_403_FORBIDDEN,
             )
-        for img in instance.images.all():
+        images = list(instance.images.all())
+        deleted = [img.pk for img in images]
+        for img in images:
+            if _image_key_shared(img.s3_key, deleted):
+                continue
             with contextlib.suppress(Exception):
                 delete_file(img.s3_key)
         return super().destroy(request, *args, **kwargs)
@@ -208,7 +262,7 @@ class ProductImageUploadView(APIView):
             )
 
         try:
-            s3_key = upload_file(file, content_type, file.name)
+            s3_key = upload_file(file, content_type, file.name, kind=PRODUCT_IMAGE)
         except Exception as exc:
             logger.exception("S3 upload failed: %s", exc)
             return Response(
@@ -240,6 +294,116 @@ class ProductImageUploadView(APIView):
         return Response(ProductImageSerializer(images, many=True).data)
 
 
+class ProductImageDirectUploadView(ProductImageUploadView):
+    """
+    POST /api/products/<slug>/images/direct/  — presigned POST policy
+
+    Первая фаза прямой загрузки: браузер получает политику и отправляет
+    файл multipart/form-data (поля ``fields`` и затем ``file``) прямо
+    в хранилище по ``url``, минуя бэкенд; затем вызывает confirm с
+    ``upload_token``.
+    """
+
+    http_method_names = ("post", "options")
+    parser_classes = (JSONParser,)
+
+    @staticmethod
+    def _scope(request, product):
+        return f"product_image:{product.pk}:{request.user.pk}"
+
+    def _get_owned_product(self, request, slug):
+        """(товар, None) или (None, ответ с ошибкой)."""
+        product = self._get_product(slug)
+        if not product:
+            return None, Response(
+                {"detail": "Товар не найден."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if not self._check_owner(request, product):
+            return None, Response(
+                {"detail": "Нет прав для загрузки."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        return product, None
+
+    def post(self, request, slug):
+        product, error = self._get_owned_product(request, slug)
+        if error:
+            return error
+        serializer = DirectUploadSerializer(
+            data=request.data,
+            context={
+                "allowed_types": settings.ALLOWED_IMAGE_TYPES,
+                "max_size": settings.MAX_UPLOAD_SIZE,
+            },
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            upload = create_direct_upload(
+                PRODUCT_IMAGE,
+                serializer.validated_data["filename"],
+                serializer.validated_data["content_type"],
+                serializer.validated_data["size"],
+                self._scope(request, product),
+            )
+        except Exception as exc:
+            logger.exception("Failed to create direct upload: %s", exc)
+            return Response(
+                {"detail": "Ошибка хранилища."},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+        return Response(upload, status=status.HTTP_200_OK)
+
+
+class ProductImageDirectUploadConfirmView(ProductImageDirectUploadView):
+    """
+    POST /api/products/<slug>/images/direct/confirm/  — {"upload_token": ...}
+
+    Вторая фаза: проверка объекта в хранилище (HEAD: наличие, тип, размер)
+    и создание ProductImage. Повторное подтверждение возвращает то же
+    изображение.
+    """
+
+    def post(self, request, slug):
+        product, error = self._get_owned_product(request, slug)
+        if error:
+            return error
+        token = request.data.get("upload_token")
+        if not token:
+            return Response(
+                {"detail": "Не передан upload_token."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            upload = confirm_direct_upload(token, self._scope(request, product))
+        except UploadVerificationError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as exc:
+            logger.exception("Failed to confirm direct upload: %s", exc)
+            return Response(
+                {"detail": "Ошибка хранилища."},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+
+        image, created = ProductImage.objects.get_or_create(
+            product=product,
+            s3_key=upload["key"],
+            defaults={
+                "uploaded_by": request.user,
+                "original_filename": upload["filename"],
+                "content_type": upload["content_type"],
+                "file_size": upload["size"],
+            },
+        )
+        return Response(
+            ProductImageSerializer(image).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
 class ProductImageDetailView(APIView):
     """
     GET    /api/products/<slug>/images/<image_id>/  — pre-signed URL
@@ -268,14 +432,14 @@ class ProductImageDetailView(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
         try:
-            url = generate_presigned_url(image.s3_key, expires_in=3600)
+            url = object_url(image.s3_key, PRODUCT_IMAGE)
         except Exception as exc:
             logger.exception("Failed to generate presigned URL: %s", exc)
             return Response(
                 {"detail": "Не удалось получить ссылку."},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
-        return Response({"url": url, "expires_in": 3600})
+        return Response({"url": url, "expires_in": url_lifetime(PRODUCT_IMAGE)})
 
     def delete(self, request, slug, image_id):
         image = self._get_image(slug, image_id)
@@ -300,7 +464,8 @@ class ProductImageDetailView(APIView):
             )
 
         try:
-            delete_file(image.s3_key)
+            if not _image_key_shared(image.s3_key, [image.pk]):
+                delete_file(image.s3_key)
         except Exception as exc:
             logger.exception("S3 delete failed: %s", exc)
             return Response(
@@ -340,48 +505,113 @@ class OrderViewSet(viewsets.ModelViewSet):
 class AskLLMView(APIView):
     permission_classes = (IsAuthenticated, CanMakeRequest)
 
-    def post(self, request):
-        question = request.data.get("question", "").strip()
-        model = request.data.get("model", "alibayram/smollm3")
-        mode = request.data.get("mode", "chat")
-        provider = request.data.get("provider", "local")
-
-        if not question:
-            return self._error_response(
+    def dispatch(self, request, *args, **kwargs):
+        with telemetry.collect() as calls:
+            response = super().dispatch(request, *args, **kwargs)
+        return self._with_telemetry(response, calls)
+
+    def _parse_request(self, request):
+        """
+        Validate common LLM request fields.
+
+        Returns (params, None) on success or (None, error Response).
+        """
+        params = {
+            "question": request.data.get("question", "").strip(),
+            "model": request.data.get("model", "alibayram/smollm3"),
+            "mode": request.data.get("mode", "chat"),
+            "provider": request.data.get("provider", "local"),
+            "navigation": request.data.get("navigation", NAVIGATION_STRATEGY),
+        }
+        if not params["question"]:
+            return None, self._error_response(
                 "Question field is required",
                 status.HTTP_400_BAD_REQUEST,
             )
 
         profile = request.user.profile
-        if provider == "local" and not self._has_model_access(
+        if params["provider"] in LOCAL_PROVIDERS and not self._has_model_access(
             profile,
-            model,
+            params["model"],
         ):
-            return self._error_response(
+            return None, self._error_response(
                 "You don't have access to this model",
                 status.HTTP_403_FORBIDDEN,
             )
+        return params, None
+
+    @staticmethod
+    def _get_service(provider):
+        return ExternalLLMService if provider == "external" else OllamaService
+
+    @staticmethod
+    def _route(kind, model):
+        return router.service(kind, model)
+
+    def _resolve_service(self, params):
+        """
+        Сервис провайдера запроса.
+
+        Для provider=auto маршрутизатор выбирает провайдера и модель по
+        задержкам, ошибкам и нагрузке; params получает выбранные значения.
+        """
+        if params["provider"] != PROVIDER_AUTO:
+            return self._get_service(params["provider"]), params
+        kind = KIND_NAVIGATION if params["mode"] == "navigate" else KIND_CHAT
+        svc = self._route(kind, params["model"])
+        return svc, {**params, "provider": svc.provider, "model": svc.model}
+
+    @staticmethod
+    def _with_telemetry(response, calls):
+        # LLM_TELEMETRY_DEBUG: вызовы LLM и ожидание в очереди этого запроса
+        if calls is not None and isinstance(getattr(response, "data", None), dict):
+            response.data["telemetry"] = calls
+        return response
+
+    @staticmethod
+    def _with_routing(response, svc):
+        # provider=auto: куда ушёл запрос и понадобился ли хедж
+        routing = getattr(svc, "routing", None)
+        if routing is not None and response.status_code == status.HTTP_200_OK:
+            response.data["routing"] = routing()
+        return response
 
-        svc = ExternalLLMService if provider == "external" else OllamaService
+    def post(self, request):
+        params, error = self._parse_request(request)
+        if error:
+            return error
+        svc, params = self._resolve_service(params)
+        question = params["question"]
+        model = params["model"]
+        mode = params["mode"]
+        provider = params["provider"]
+
+        profile = request.user.profile
         try:
             requests_remaining = self._get_requests_remaining(profile)
-            if mode == "navigate":
-                return self._handle_navigation_mode(
-                    svc,
-                    question,
-                    model,
-                    profile,
-                    requests_remaining,
-                    provider,
-                )
-            return self._handle_chat_mode(
-                svc,
-                question,
-                model,
-                profile,
-                requests_remaining,
-                provider,
-            )
+            # Слот admission control берётся только на время вызова модели
+            with admission.admit(profile.role):
+                if mode == "navigate":
+                    response = self._handle_navigation_mode(
+                        svc,
+                        question,
+                        model,
+                        profile,
+                        requests_remaining,
+                        provider,
+                        strategy=params["navigation"],
+                    )
+                else:
+                    response = self._handle_chat_mode(
+                        svc,
+                        question,
+                        model,
+                        profile,
+                        requests_remaining,
+                        provider,
+                    )
+        except LLMOverloadedError as e:
+            return self._overloaded_response(e)
         except ExternalLLMServiceError as e:
             logger.warning("External LLM error: %s", e)
             return self._error_response(
@@ -394,10 +624,19 @@ class AskLLMView(APIView):
                 f"LLM processing error: {e!s}",
                 status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+        return self._with_routing(response, svc)
 
     def _error_response(self, message, status_code):
         return Response({"error": message}, status=status_code)
 
+    def _overloaded_response(self, exc):
+        logger.warning("LLM admission rejected request: %s", exc)
+        return Response(
+            {"error": str(exc), "retry_after": exc.retry_after},
+            status=exc.status_code,
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
     def _has_model_access(self, profile, model):
         available_models = profile.get_available_models()
         return available_models == "all" or model in available_models
@@ -416,8 +655,65 @@ class AskLLMView(APIView):
         profile,
         requests_remaining,
         provider,
+        *,
+        strategy=NAVIGATION_TWO_STEP,
+    ):
+        # Очевидные команды распознаются правилами, без вызова LLM
+        match = match_intent(question)
+        if match is not None:
+            weather_city = None
+            if match.code == "007":
+                weather_city = DEFAULT_WEATHER_CITY
+            if match.needs_city:
+                weather_city = self._get_weather_city(svc, question, model)
+            profile.increment_requests()
+            return self._ok_response(
+                self._navigation_payload(
+                    question,
+                    match.code,
+                    {},
+                    weather_city,
+                    NAVIGATION_RULES,
+                ),
+                model,
+                provider,
+                requests_remaining,
+            )
+
+        return self._navigate_with_llm(
+            svc,
+            question,
+            model,
+            profile,
+            requests_remaining,
+            provider=provider,
+            strategy=strategy,
+        )
+
+    def _navigate_with_llm(
+        self,
+        svc,
+        question,
+        model,
+        profile,
+        requests_remaining,
+        *,
+        provider,
+        strategy,
     ):
-        action_code = svc.get_action_code(question, model)
+        # Ответ чата может генерироваться параллельно с определением интента;
+        # при навигационном коде спекулятивная генерация отменяется
+        with speculator.start(svc, question, model, provider) as speculation:
+            strategy, action_code, result = self._detect_intent(
+                svc,
+                question,
+                model,
+                strategy,
+            )
+            answer = None
+            if action_code == CHAT_FALLBACK_CODE:
+                answer = speculation.result()
+
         if action_code == CHAT_FALLBACK_CODE:
             return self._generate_fallback_response(
                 svc,
@@ -426,34 +722,47 @@ class AskLLMView(APIView):
                 profile,
                 requests_remaining,
                 provider,
+                answer=answer,
             )
-        filters, weather_city = self._extract_navigation_data(
-            svc,
-            question,
-            model,
-            action_code,
-        )
-        action_description = ACTIONS_MAP.get(
-            action_code,
-            "Неизвестное действие",
-        )
+        if result is None:
+            filters, weather_city = self._extract_navigation_data(
+                svc,
+                question,
+                model,
+                action_code,
+            )
+        else:
+            filters, weather_city = result["filters"], result["city"]
         profile.increment_requests()
-        return Response(
-            {
-                "question": question,
-                "action_code": action_code,
-                "action_description": action_description,
-                "is_fallback": False,
-                "filters": filters,
-                "weather_city": weather_city,
-                "mode": "navigate",
-                "model": model,
-                "provider": provider,
-                "requests_remaining": requests_remaining,
-            },
-            status=status.HTTP_200_OK,
+        return self._ok_response(
+            self._navigation_payload(
+                question,
+                action_code,
+                filters,
+                weather_city,
+                strategy,
+            ),
+            model,
+            provider,
+            requests_remaining,
         )
 
+    def _detect_intent(self, svc, question, model, strategy):
+        """
+        Определить код действия.
+
+        Единый вызов LLM; при невалидном ответе — прежний двухшаговый путь.
+        Если единый вызов завершился ошибкой или таймаутом, get_navigation
+        возвращает код свободного чата и второй вызов не делается.
+        Возвращает (strategy, action_code, result комбинированного вызова).
+        """
+        result = None
+        if strategy == NAVIGATION_COMBINED:
+            result = svc.get_navigation(question, model, self._get_category_names())
+        if result is None:
+            return NAVIGATION_TWO_STEP, svc.get_action_code(question, model), None
+        return strategy, result["code"], result
+
     def _generate_fallback_response(
         self,
         svc,
@@ -462,25 +771,16 @@ class AskLLMView(APIView):
         profile,
         requests_remaining,
         provider,
+        *,
+        answer=None,
     ):
-        fallback_answer = svc.generate_response(question, model)
+        fallback_answer = answer or svc.generate_response(question, model)
         profile.increment_requests()
-        return Response(
-            {
-                "question": question,
-                "action_code": CHAT_FALLBACK_CODE,
-                "action_description": ACTIONS_MAP.get(
-                    CHAT_FALLBACK_CODE,
-                    "Свободный чат",
-                ),
-                "is_fallback": True,
-                "answer": fallback_answer,
-                "mode": "navigate",
-                "model": model,
-                "provider": provider,
-                "requests_remaining": requests_remaining,
-            },
-            status=status.HTTP_200_OK,
+        return self._ok_response(
+            self._fallback_payload(question, fallback_answer),
+            model,
+            provider,
+            requests_remaining,
         )
 
     def _extract_navigation_data(self, svc, question, model, action_code):
@@ -491,19 +791,29 @@ class AskLLMView(APIView):
             weather_city = self._get_weather_city(svc, question, model)
         return filters, weather_city
 
+    def _get_category_names(self):
+        # Список кэшируется до изменения Category (сигналы) или LLM_PROMPT_CACHE_TTL
+        return prompt_cache.categories(
+            lambda: Category.objects.values_list("name", flat=True).order_by("name"),
+        )
+
+    async def _aget_category_names(self):
+        """Категории из кэша без перехода в поток; при промахе — запрос к БД."""
+        categories = prompt_cache.cached_categories()
+        if categories is None:
+            categories = await sync_to_async(self._get_category_names)()
+        return categories
+
     def _get_product_filters(self, svc, question, model):
         try:
-            category_names = list(
-                Category.objects.values_list(
-                    "name",
-                    flat=True,
-                ).order_by("name"),
-            )
+            category_names = self._get_category_names()
             return svc.get_product_filters(
                 question,
                 model,
                 category_names,
             )
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.warning("Failed to extract filters: %s", e)
             return {}
@@ -511,6 +821,8 @@ class AskLLMView(APIView):
     def _get_weather_city(self, svc, question, model):
         try:
             return svc.get_weather_city(question, model)
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.warning("Failed to extract weather city: %s", e)
             return "Moscow"
@@ -526,11 +838,52 @@ class AskLLMView(APIView):
     ):
         answer = svc.generate_response(question, model)
         profile.increment_requests()
+        return self._ok_response(
+            self._chat_payload(question, answer),
+            model,
+            provider,
+            requests_remaining,
+        )
+
+    @staticmethod
+    def _chat_payload(question, answer):
+        return {"question": question, "answer": answer, "mode": "chat"}
+
+    @staticmethod
+    def _fallback_payload(question, answer):
+        return {
+            "question": question,
+            "action_code": CHAT_FALLBACK_CODE,
+            "action_description": ACTIONS_MAP.get(
+                CHAT_FALLBACK_CODE,
+                "Свободный чат",
+            ),
+            "is_fallback": True,
+            "answer": answer,
+            "mode": "navigate",
+        }
+
+    @staticmethod
+    def _navigation_payload(question, action_code, filters, weather_city, strategy):
+        return {
+            "question": question,
+            "action_code": action_code,
+            "action_description": ACTIONS_MAP.get(
+                action_code,
+                "Неизвестное действие",
+            ),
+            "is_fallback": False,
+            "filters": filters,
+            "weather_city": weather_city,
+            "mode": "navigate",
+            "navigation": strategy,
+        }
+
+    @staticmethod
+    def _ok_response(payload, model, provider, requests_remaining):
         return Response(
             {
-                "question": question,
-                "answer": answer,
-                "mode": "chat",
+                **payload,
                 "model": model,
                 "provider": provider,
                 "requests_remaining": requests_remaining,
@@ -539,16 +892,464 @@ class AskLLMView(APIView):
         )
 
 
+class AsyncAskLLMView(AskLLMView):
+    """
+    POST /api/llm/ask/async/ — same contract as /api/llm/ask/, but the LLM
+    calls are awaited (AsyncClient / AsyncOpenAI) instead of blocking a
+    worker thread. Served natively when running under ASGI.
+
+    Authentication, permissions and ORM access (profile, categories, quota)
+    stay synchronous and run through sync_to_async.
+    """
+
+    @staticmethod
+    def _get_service(provider):
+        return AsyncExternalLLMService if provider == "external" else AsyncOllamaService
+
+    @staticmethod
+    def _route(kind, model):
+        return router.aservice(kind, model)
+
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        Async variant of APIView.dispatch (DRF only ships a sync one).
+
+        Outside ASGI the view runs in a loop of its own (async_to_sync), so
+        the async LLM clients of that loop are closed before it ends.
+        """
+        own_loop = not isinstance(request, ASGIRequest)
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            with telemetry.collect() as calls:
+                try:
+                    await sync_to_async(self.initial)(request, *args, **kwargs)
+                    handler = getattr(
+                        self,
+                        request.method.lower(),
+                        self.http_method_not_allowed,
+                    )
+                    response = handler(request, *args, **kwargs)
+                    if asyncio.iscoroutine(response):
+                        response = await response
+                except Exception as exc:
+                    response = self.handle_exception(exc)
+        finally:
+            if own_loop:
+                await aclose_loop_clients()
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self._with_telemetry(self.response, calls)
+
+    def _prepare(self, request):
+        params, error = self._parse_request(request)
+        if error:
+            return None, None, None, error
+        profile = request.user.profile
+        return params, profile, self._get_requests_remaining(profile), None
+
+    async def post(self, request):
+        params, profile, requests_remaining, error = await sync_to_async(
+            self._prepare,
+        )(request)
+        if error:
+            return error
+
+        svc, params = self._resolve_service(params)
+        try:
+            if params["mode"] == "navigate":
+                payload = await self._navigate(svc, params, profile.role)
+            else:
+                with admission.admit(profile.role):
+                    answer = await svc.generate_response(
+                        params["question"],
+                        params["model"],
+                    )
+                payload = self._chat_payload(params["question"], answer)
+            await sync_to_async(profile.increment_requests)()
+        except LLMOverloadedError as e:
+            return self._overloaded_response(e)
+        except ExternalLLMServiceError as e:
+            logger.warning("External LLM error: %s", e)
+            return self._error_response(
+                f"Внешний LLM недоступен: {e!s}",
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        except Exception as e:
+            logger.exception("Ошибка в обработке LLM: %s", e)
+            return self._error_response(
+                f"LLM processing error: {e!s}",
+                status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return self._with_routing(
+            self._ok_response(
+                payload,
+                params["model"],
+                params["provider"],
+                requests_remaining,
+            ),
+            svc,
+        )
+
+    async def _navigate(self, svc, params, role, *, chat_fallback=True):
+        question, model = params["question"], params["model"]
+        match = match_intent(question)
+        if match is not None:
+            weather_city = None
+            if match.code == "007":
+                weather_city = DEFAULT_WEATHER_CITY
+            if match.needs_city:
+                with admission.admit(role):
+                    weather_city = await svc.get_weather_city(question, model)
+            return self._navigation_payload(
+                question,
+                match.code,
+                {},
+                weather_city,
+                NAVIGATION_RULES,
+            )
+
+        with admission.admit(role):
+            return await self._navigate_with_llm(
+                svc,
+                params,
+                chat_fallback=chat_fallback,
+            )
+
+    async def _adetect_intent(self, svc, question, model, strategy):
+        """Async variant of _detect_intent(); also returns the categories used."""
+        categories = None
+        result = None
+        if strategy == NAVIGATION_COMBINED:
+            categories = await self._aget_category_names()
+            result = await svc.get_navigation(question, model, categories)
+        if result is None:
+            action_code = await svc.get_action_code(question, model)
+            return NAVIGATION_TWO_STEP, action_code, None, categories
+        return strategy, result["code"], result, categories
+
+    async def _navigate_with_llm(self, svc, params, *, chat_fallback=True):
+        question, model = params["question"], params["model"]
+        speculation = NO_SPECULATION
+        if chat_fallback:
+            speculation = speculator.astart(svc, question, model, params["provider"])
+        with speculation:
+            strategy, action_code, result, categories = await self._adetect_intent(
+                svc,
+                question,
+                model,
+                params["navigation"],
+            )
+            answer = None
+            if action_code == CHAT_FALLBACK_CODE:
+                answer = await speculation.aresult()
+
+        if action_code == CHAT_FALLBACK_CODE:
+            if chat_fallback and answer is None:
+                answer = await svc.generate_response(question, model)
+            return self._fallback_payload(question, answer)
+
+        if result is not None:
+            filters, weather_city = result["filters"], result["city"]
+        elif action_code == "004":
+            if categories is None:
+                categories = await self._aget_category_names()
+            filters, weather_city = (
+                await svc.get_product_filters(question, model, categories),
+                None,
+            )
+        elif action_code == "007":
+            filters, weather_city = {}, await svc.get_weather_city(question, model)
+        else:
+            filters, weather_city = {}, None
+        return self._navigation_payload(
+            question,
+            action_code,
+            filters,
+            weather_city,
+            strategy,
+        )
+
+
+class AskLLMBatchView(AsyncAskLLMView):
+    """
+    POST /api/llm/ask/batch/ — classify many navigation questions at once.
+
+    Body: {"questions": [...], "model", "provider", "navigation"}
+
+    Every question goes through the navigate pipeline (rules, then
+    get_navigation / get_action_code with filter and city extraction) but
+    never generates a chat answer: non-navigational questions come back
+    with action_code "000". At most LLM_BATCH_CONCURRENCY questions are
+    classified in parallel, each still passing admission control.
+
+    Each item is charged as one request. Items past the remaining daily
+    quota are not classified and come back with an error.
+    """
+
+    max_items = LLM_BATCH_MAX_ITEMS
+    concurrency = LLM_BATCH_CONCURRENCY
+
+    def _parse_request(self, request):
+        questions = request.data.get("questions")
+        if not isinstance(questions, list) or not questions:
+            return None, self._error_response(
+                "questions must be a non-empty list",
+                status.HTTP_400_BAD_REQUEST,
+            )
+        if len(questions) > self.max_items:
+            return None, self._error_response(
+                f"At most {self.max_items} questions per batch",
+                status.HTTP_400_BAD_REQUEST,
+            )
+        if not all(isinstance(q, str) and q.strip() for q in questions):
+            return None, self._error_response(
+                "Every question must be a non-empty string",
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        params = {
+            "questions": [q.strip() for q in questions],
+            "mode": "navigate",
+            "model": request.data.get("model", "alibayram/smollm3"),
+            "provider": request.data.get("provider", "local"),
+            "navigation": request.data.get("navigation", NAVIGATION_STRATEGY),
+        }
+        if params["provider"] in LOCAL_PROVIDERS and not self._has_model_access(
+            request.user.profile,
+            params["model"],
+        ):
+            return None, self._error_response(
+                "You don't have access to this model",
+                status.HTTP_403_FORBIDDEN,
+            )
+        return params, None
+
+    def _get_category_names(self):
+        # Один запрос к БД на весь пакет
+        if getattr(self, "_category_names", None) is None:
+            self._category_names = super()._get_category_names()
+        return self._category_names
+
+    async def post(self, request):
+        params, profile, requests_remaining, error = await sync_to_async(
+            self._prepare,
+        )(request)
+        if error:
+            return error
+
+        started = time.perf_counter()
+        svc, params = self._resolve_service(params)
+        questions = params["questions"]
+        allowed = len(questions)
+        if requests_remaining != "unlimited":
+            allowed = min(allowed, requests_remaining)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(index, question):
+            if index >= allowed:
+                return {
+                    "index": index,
+                    "question": question,
+                    "error": "Daily request limit exceeded",
+                }
+            async with semaphore:
+                return await self._classify_item(svc, params, profile, index, question)
+
+        results = await asyncio.gather(
+            *(run(index, question) for index, question in enumerate(questions)),
+        )
+
+        charged = sum(1 for item in results if "error" not in item)
+        if charged:
+            await sync_to_async(profile.increment_requests)(charged)
+        if requests_remaining != "unlimited":
+            requests_remaining -= charged
+        response = Response(
+            {
+                "results": results,
+                "charged": charged,
+                "model": params["model"],
+                "provider": params["provider"],
+                "requests_remaining": requests_remaining,
+                "elapsed_ms": round(1000 * (time.perf_counter() - started), 1),
+            },
+            status=status.HTTP_200_OK,
+        )
+        return self._with_routing(response, svc)
+
+    async def _classify_item(self, svc, params, profile, index, question):
+        started = time.perf_counter()
+        try:
+            payload = await self._navigate(
+                svc,
+                {**params, "question": question},
+                profile.role,
+                chat_fallback=False,
+            )
+            item = {"index": index, **payload}
+            item.pop("answer", None)
+        except LLMOverloadedError as e:
+            item = {
+                "index": index,
+                "question": question,
+                "error": str(e),
+                "retry_after": e.retry_after,
+            }
+        except Exception as e:
+            logger.warning("Batch item %s failed: %s", index, e)
+            item = {"index": index, "question": question, "error": str(e)}
+        item["elapsed_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        return item
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message with a JSON payload."""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class ReleasingStream:
+    """
+    Iterator wrapper that runs *release* when the response is closed.
+
+    Django closes streaming content even if the client disconnected before
+    the first chunk, when a plain generator's ``finally`` would never run.
+    """
+
+    def __init__(self, iterator, release):
+        self._iterator = iterator
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Render plain (error) responses as a single SSE ``error`` event."""
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event("error", data).encode(self.charset)
+
+
+class AskLLMStreamView(AskLLMView):
+    """
+    POST /api/llm/ask/stream/ — chat mode answer streamed as Server-Sent Events.
+
+    Events:
+        token — {"content": "..."} fragment of the answer (<think> stripped)
+        done  — {"answer", "model", "provider", "requests_remaining"}
+        error — {"error": "..."}; the request is not charged
+
+    The daily quota is charged once, after the generation has completed.
+    An admission slot is held until the stream is closed.
+    """
+
+    renderer_classes = (JSONRenderer, EventStreamRenderer)
+
+    def post(self, request):
+        params, error = self._parse_request(request)
+        if error:
+            return error
+
+        profile = request.user.profile
+        svc, params = self._resolve_service(params)
+        try:
+            breaker.check(params["provider"], params["model"])
+            ticket = admission.acquire(
+                params["provider"], params["model"], profile.role
+            )
+        except LLMOverloadedError as e:
+            return self._overloaded_response(e)
+        telemetry.record_wait(params["provider"], params["model"], ticket.waited)
+        response = StreamingHttpResponse(
+            ReleasingStream(self._event_stream(svc, params, profile), ticket.release),
+            content_type="text/event-stream; charset=utf-8",
+        )
+        response["Cache-Control"] = "no-cache"
+        # Disable proxy buffering (nginx) so tokens reach the browser immediately
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _event_stream(self, svc, params, profile):
+        requests_remaining = self._get_requests_remaining(profile)
+        parts = []
+        try:
+            for token in svc.stream_response(params["question"], params["model"]):
+                parts.append(token)
+                yield sse_event("token", {"content": token})
+        except ExternalLLMServiceError as e:
+            logger.warning("External LLM stream error: %s", e)
+            yield sse_event("error", {"error": f"Внешний LLM недоступен: {e!s}"})
+            return
+        except Exception as e:
+            logger.exception("Ошибка в потоковой обработке LLM: %s", e)
+            yield sse_event("error", {"error": f"LLM processing error: {e!s}"})
+            return
+
+        profile.increment_requests()
+        yield sse_event(
+            "done",
+            {
+                "question": params["question"],
+                "answer": "".join(parts).strip()
+                or "Не удалось получить ответ от модели",
+                "mode": "chat",
+                "model": params["model"],
+                "provider": params["provider"],
+                "requests_remaining": requests_remaining,
+            },
+        )
+
+
 class GetAvailableModelsView(APIView):
+    """
+    GET /api/llm/models/?provider=local|external[&details=1]
+
+    Local models come from the cached Ollama catalog (see api.llm_catalog);
+    details=1 adds size / family / quantization per model.
+
+    "circuits" maps every model to its circuit breaker state (closed, open,
+    half_open) and "available" is false when all of them are open, so the
+    UI can hide a dead provider without waiting for a request to time out.
+    """
+
     permission_classes = (IsAuthenticated,)
 
+    @staticmethod
+    def _with_circuits(data):
+        circuits = breaker.states(data["provider"], data["models"])
+        data["circuits"] = circuits
+        data["available"] = any(state != OPEN for state in circuits.values())
+        return data
+
     def get(self, request):
         provider = request.query_params.get("provider", "local")
         try:
             if provider == "external":
                 models = ExternalLLMService.list_available_models()
                 return Response(
-                    {"models": models, "provider": "external"},
+                    self._with_circuits({"models": models, "provider": "external"}),
                     status=status.HTTP_200_OK,
                 )
 
@@ -559,10 +1360,14 @@ class GetAvailableModelsView(APIView):
                 models = all_models if available_models == "all" else available_models
             else:
                 models = ["alibayram/smollm3"]
-            return Response(
-                {"models": models, "provider": "local"},
-                status=status.HTTP_200_OK,
-            )
+            data = {"models": models, "provider": "local"}
+            if request.query_params.get("details"):
+                # Метаданные берутся из кэша каталога, без запроса к Ollama
+                data["details"] = {
+                    name: info.as_dict() if (info := model_catalog.info(name)) else None
+                    for name in models
+                }
+            return Response(self._with_circuits(data), status=status.HTTP_200_OK)
         except Exception as e:
             logger.exception("Ошибка при получении моделей: %s", e)
             return Response(
@@ -571,6 +1376,128 @@ class GetAvailableModelsView(APIView):
             )
 
 
+class LLMCacheView(APIView):
+    """
+    GET    /api/llm/cache/ — статистика кэша интентов, объединения запросов,
+                             каталога моделей, семантического кэша чата
+                             и кэша промптов (версии, категории)
+    DELETE /api/llm/cache/ — очистить кэши и сбросить каталог моделей
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(
+            {
+                "intent": intent_cache.stats(),
+                "single_flight": inflight.stats(),
+                "models": model_catalog.stats(),
+                "semantic": semantic_cache.stats(),
+                "prompts": prompt_cache.stats(),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def delete(self, request):
+        intent_cache.clear()
+        inflight.reset_stats()
+        model_catalog.invalidate()
+        semantic_cache.purge()
+        prompt_cache.invalidate()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class LLMSemanticCacheView(APIView):
+    """
+    GET    /api/llm/cache/semantic/          — пространства имён семантического
+                                               кэша ответов чата
+    DELETE /api/llm/cache/semantic/?model=…  — удалить ответы модели (без model —
+                                               все), в том числе сохранённые на диске
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(semantic_cache.stats(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        purged = semantic_cache.purge(request.query_params.get("model") or None)
+        return Response({"purged": purged}, status=status.HTTP_200_OK)
+
+
+class LLMQueueStatsView(APIView):
+    """
+    GET /api/llm/queue/ — слоты, глубина очереди и время ожидания по моделям,
+    счётчики спекулятивных генераций (использованные / отменённые,
+    сэкономленное и потраченное впустую время), состояние circuit breaker
+    и задержки провайдеров, по которым маршрутизируется provider=auto
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(
+            {
+                **admission.stats(),
+                "speculation": speculator.stats(),
+                "circuits": breaker.stats(),
+                "routing": router.stats(),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class LLMMetricsView(APIView):
+    """
+    GET    /api/llm/metrics/ — гистограммы вызовов LLM по режиму, провайдеру
+                               и модели (время, загрузка модели, обработка
+                               промпта, генерация, токены, токены/с) и
+                               ожидания в очереди admission control
+    DELETE /api/llm/metrics/ — сбросить накопленные метрики
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(telemetry.stats(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        telemetry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class LLMResidencyView(APIView):
+    """
+    GET  /api/llm/residency/ — какие локальные модели загружены (RAM/VRAM, keep_alive)
+    POST /api/llm/residency/ — прогреть модели в фоне; body: {"models": [...]}
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        try:
+            return Response(
+                {"models": residency_status()},
+                status=status.HTTP_200_OK,
+            )
+        except Exception as e:
+            logger.warning("Ollama residency status failed: %s", e)
+            return Response(
+                {"error": f"LLM сервис недоступен: {e!s}"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+    def post(self, request):
+        models = request.data.get("models") or None
+        if models is not None and not isinstance(models, list):
+            return Response(
+                {"error": "models must be a list"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        start_warmup(models)
+        return Response({"status": "warming"}, status=status.HTTP_202_ACCEPTED)
+
+
 class GetActionsMapView(APIView):
     permission_classes = (AllowAny,)
 
@@ -169,6 +169,49 @@ AWS_S3_REGION_NAME = config("AWS_S3_REGION_NAME", default="")
 AWS_S3_FILE_OVERWRITE = False
 AWS_DEFAULT_ACL = None
 AWS_S3_VERIFY = False
+# Shared boto3 clients (api.s3_service.S3ClientRegistry): connection pool
+# size per process, timeouts in seconds and attempts with standard retries
+AWS_S3_MAX_POOL_CONNECTIONS = config(
+    "AWS_S3_MAX_POOL_CONNECTIONS",
+    default=20,
+    cast=int,
+)
+AWS_S3_CONNECT_TIMEOUT = config("AWS_S3_CONNECT_TIMEOUT", default=5, cast=float)
+AWS_S3_READ_TIMEOUT = config("AWS_S3_READ_TIMEOUT", default=30, cast=float)
+AWS_S3_MAX_ATTEMPTS = config("AWS_S3_MAX_ATTEMPTS", default=3, cast=int)
+# Pre-signed GET URLs are reused within windows of this many seconds
+# (capped at half the expiry); 0 signs a new URL every time
+AWS_S3_PRESIGNED_URL_CACHE_SECONDS = config(
+    "AWS_S3_PRESIGNED_URL_CACHE_SECONDS",
+    default=300,
+    cast=int,
+)
+# How URLs of each class of objects are built (api.s3_service):
+# "presigned" - one-hour signed URLs (private bucket),
+# "public" - direct URLs, the bucket must allow anonymous reads,
+# "immutable" - content-addressed keys and long-lived signed URLs that stay
+# the same for AWS_S3_IMMUTABLE_URL_PERIOD seconds
+AWS_S3_URL_STRATEGY = {
+    "product_image": config("AWS_S3_PRODUCT_IMAGE_URLS", default="presigned"),
+    "avatar": config("AWS_S3_AVATAR_URLS", default="presigned"),
+}
+# Lifetime of "immutable" URLs (SigV4 allows at most 7 days)
+AWS_S3_IMMUTABLE_URL_EXPIRES = config(
+    "AWS_S3_IMMUTABLE_URL_EXPIRES",
+    default=7 * 24 * 3600,
+    cast=int,
+)
+AWS_S3_IMMUTABLE_URL_PERIOD = config(
+    "AWS_S3_IMMUTABLE_URL_PERIOD",
+    default=24 * 3600,
+    cast=int,
+)
+# Lifetime of a direct-upload policy (presigned POST), in seconds
+AWS_S3_DIRECT_UPLOAD_EXPIRES = config(
+    "AWS_S3_DIRECT_UPLOAD_EXPIRES",
+    default=600,
+    cast=int,
+)
 # File size limit: 10 MB
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024
 ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/png", "image/gif", "image/webp"]
@@ -0,0 +1,416 @@
+"""
+Stand-in for Ollama and an OpenAI-compatible API, for offline benchmarks.
+
+Implements the subsets the backend uses:
+
+* Ollama  — ``POST /api/chat`` (JSON or NDJSON stream), ``GET /api/tags``;
+* OpenAI  — ``POST /v1/chat/completions`` (JSON or SSE stream, ``usage``
+  and ``stream_options.include_usage``), ``GET /v1/models``.
+
+Every generation first waits for a latency drawn from ``latency`` (time to
+the first token: queueing, prompt evaluation), then emits one token per
+character of the answer at ``token_rate`` tokens per second; streams are
+sent chunk by chunk as the tokens are "generated". The first request for
+a model also pays ``cold_start`` seconds (reported as Ollama
+load_duration). A share ``error_rate`` of generations fails with HTTP
+``error_status``.
+
+The answer follows the requested JSON Schema (Ollama ``format`` /
+OpenAI ``response_format``): action code, navigation object, city or
+filters; free chat gets ``answer``.
+
+Latency specs: ``0.2`` (fixed), ``uniform:0.1:0.3``, ``exp:0.2`` (mean),
+``lognormal:0.2:0.5`` (median, sigma).
+
+Usage:
+    with FakeLLMServer(latency=0.2) as server:
+        print(server.url)
+
+    # Standalone, for a backend started with OLLAMA_BASE_URL /
+    # SBER_API_URL pointing at it (from backend/):
+    python -m benchmarks.fake_llm_server --port 11435 \
+        --latency lognormal:0.3:0.4 --token-rate 40 --error-rate 0.01
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MODELS = ("alibayram/smollm3", "fake/model")
+DEFAULT_CHAT_ANSWER = "004"
+
+_NS = 1_000_000_000
+
+
+class LatencyModel:
+    """Распределение задержки до первого токена, задаётся строкой."""
+
+    def __init__(self, spec: str | float, seed: int | None = None) -> None:
+        self.spec = str(spec)
+        kind, _, params = self.spec.partition(":")
+        try:
+            values = [float(value) for value in params.split(":") if value]
+            if not params:
+                kind, values = "fixed", [float(kind)]
+        except ValueError as e:
+            raise ValueError(f"Invalid latency spec: {self.spec}") from e
+        expected = {"fixed": 1, "uniform": 2, "exp": 1, "lognormal": 2}
+        if expected.get(kind) != len(values):
+            raise ValueError(f"Invalid latency spec: {self.spec}")
+        self.kind = kind
+        self.values = values
+        self._random = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.kind == "uniform":
+            return self._random.uniform(*self.values)
+        if self.kind == "exp":
+            return self._random.expovariate(1 / self.values[0])
+        if self.kind == "lognormal":
+            median, sigma = self.values
+            return self._random.lognormvariate(math.log(median), sigma)
+        return self.values[0]
+
+
+def _answer_for(schema: dict | None, chat_answer: str, code: str) -> str:
+    """Ответ, подходящий под запрошенную схему (или текст свободного чата)."""
+    if not isinstance(schema, dict):
+        return chat_answer
+    properties = schema.get("properties", {})
+    if "filters" in properties:
+        return json.dumps({"code": code, "filters": {}, "city": None})
+    if "code" in properties:
+        return json.dumps({"code": code})
+    if "city" in properties:
+        return json.dumps({"city": "Moscow"})
+    return "{}"
+
+
+def _prompt_tokens(messages: list) -> int:
+    # Грубая оценка: ~4 символа на токен
+    return max(1, sum(len(m.get("content") or "") for m in messages) // 4)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        models = self.server.models
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": m, "model": m} for m in models]})
+        elif self.path == "/v1/models":
+            self._send_json(
+                {
+                    "object": "list",
+                    "data": [
+                        {"id": m, "object": "model", "created": 0, "owned_by": "fake"}
+                        for m in models
+                    ],
+                },
+            )
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        handlers = {
+            "/api/chat": self._ollama_chat,
+            "/v1/chat/completions": self._openai_chat,
+        }
+        handler = handlers.get(self.path)
+        if handler is None:
+            self._send_json({"error": "not found"}, status=404)
+            return
+        generation = self.server.generation(request)
+        if generation is None:
+            self._send_json(
+                {"error": "injected failure"},
+                status=self.server.error_status,
+            )
+            return
+        try:
+            generation.start()
+            handler(request, generation)
+        except ConnectionError:
+            # Клиент закрыл поток раньше (ранний выход) — генерация прервана
+            pass
+
+    def _ollama_chat(self, request: dict, generation: "_Generation") -> None:
+        model = request.get("model", DEFAULT_MODELS[0])
+        if not request.get("stream"):
+            generation.finish()
+            self._send_json(
+                {
+                    "model": model,
+                    "message": {"role": "assistant", "content": generation.answer},
+                    "done": True,
+                    **generation.ollama_stats(),
+                },
+            )
+            return
+        self._start_chunked("application/x-ndjson")
+        for token in generation.tokens():
+            line = {
+                "model": model,
+                "message": {"role": "assistant", "content": token},
+                "done": False,
+            }
+            self._write_chunk(json.dumps(line).encode() + b"\n")
+        last = {
+            "model": model,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            **generation.ollama_stats(),
+        }
+        self._write_chunk(json.dumps(last).encode() + b"\n")
+        self._end_chunked()
+
+    def _openai_chat(self, request: dict, generation: "_Generation") -> None:
+        model = request.get("model", DEFAULT_MODELS[0])
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": model}
+        if not request.get("stream"):
+            generation.finish()
+            self._send_json(
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": generation.answer,
+                            },
+                            "finish_reason": "stop",
+                        },
+                    ],
+                    "usage": generation.openai_usage(),
+                },
+            )
+            return
+
+        def event(choices: list, **extra) -> bytes:
+            chunk = {**base, "object": "chat.completion.chunk", "choices": choices}
+            return f"data: {json.dumps({**chunk, **extra})}\n\n".encode()
+
+        self._start_chunked("text/event-stream")
+        for token in generation.tokens():
+            self._write_chunk(
+                event(
+                    [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                ),
+            )
+        self._write_chunk(event([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._write_chunk(event([], usage=generation.openai_usage()))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_chunked()
+
+
+class _Generation:
+    """Одна имитируемая генерация: задержка, токены и статистика."""
+
+    def __init__(
+        self,
+        answer: str,
+        prompt_tokens: int,
+        latency: float,
+        load: float,
+        token_rate: float,
+    ) -> None:
+        self.answer = answer
+        self.prompt_tokens = prompt_tokens
+        self.latency = latency
+        self.load = load
+        self.token_rate = token_rate
+
+    def start(self) -> None:
+        """Загрузка модели и обработка промпта — до первого токена."""
+        time.sleep(self.load + self.latency)
+
+    def _token_delay(self) -> float:
+        return 1 / self.token_rate if self.token_rate > 0 else 0.0
+
+    def tokens(self):
+        for token in self.answer:
+            time.sleep(self._token_delay())
+            yield token
+
+    def finish(self) -> None:
+        """Непотоковый ответ: дождаться генерации всех токенов."""
+        time.sleep(self._token_delay() * len(self.answer))
+
+    def ollama_stats(self) -> dict:
+        eval_seconds = self._token_delay() * len(self.answer)
+        return {
+            "total_duration": int((self.load + self.latency + eval_seconds) * _NS),
+            "load_duration": int(self.load * _NS),
+            "prompt_eval_count": self.prompt_tokens,
+            "prompt_eval_duration": int(self.latency * _NS),
+            "eval_count": len(self.answer),
+            "eval_duration": int(eval_seconds * _NS),
+        }
+
+    def openai_usage(self) -> dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": len(self.answer),
+            "total_tokens": self.prompt_tokens + len(self.answer),
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Default backlog (5) drops connections under hundreds of concurrent clients
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address) -> None:
+        # Клиенты закрывают соединения посреди потока — это не ошибка сервера
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def generation(self, request: dict) -> _Generation | None:
+        """Начать генерацию; None — внедрённая ошибка."""
+        if self.error_rate and self.random.random() < self.error_rate:
+            return None
+        model = request.get("model", DEFAULT_MODELS[0])
+        with self.lock:
+            load = 0.0 if model in self.loaded else self.cold_start
+            self.loaded.add(model)
+        schema = request.get("format")
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"].get("schema")
+        return _Generation(
+            _answer_for(schema, self.answer, self.code),
+            _prompt_tokens(request.get("messages", [])),
+            self.latency.sample(),
+            load,
+            self.token_rate,
+        )
+
+
+class FakeLLMServer:
+    """Threaded fake Ollama / OpenAI-compatible server in a background thread."""
+
+    def __init__(
+        self,
+        latency: str | float = 0.2,
+        answer: str = DEFAULT_CHAT_ANSWER,
+        *,
+        code: str = "004",
+        token_rate: float = 0.0,
+        cold_start: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        models: tuple[str, ...] = DEFAULT_MODELS,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int | None = None,
+    ) -> None:
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.latency = LatencyModel(latency, seed)
+        self._httpd.answer = answer
+        self._httpd.code = code
+        self._httpd.token_rate = token_rate
+        self._httpd.cold_start = cold_start
+        self._httpd.error_rate = error_rate
+        self._httpd.error_status = error_status
+        self._httpd.models = models
+        self._httpd.loaded = set()
+        self._httpd.lock = threading.Lock()
+        self._httpd.random = random.Random(seed)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def config(self) -> dict:
+        """Параметры сервера — сохраняются вместе с результатами бенчмарка."""
+        return {
+            "latency": self._httpd.latency.spec,
+            "token_rate": self._httpd.token_rate,
+            "cold_start": self._httpd.cold_start,
+            "error_rate": self._httpd.error_rate,
+            "error_status": self._httpd.error_status,
+            "answer_tokens": len(self._httpd.answer),
+        }
+
+    def __enter__(self) -> "FakeLLMServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", default="0.2", help="e.g. lognormal:0.3:0.4")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="tokens/s")
+    parser.add_argument("--cold-start", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--answer", default="Это ответ тестового сервера. " * 4)
+    parser.add_argument("--code", default="004", help="navigation action code")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        args.latency,
+        args.answer.strip(),
+        code=args.code,
+        token_rate=args.token_rate,
+        cold_start=args.cold_start,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        host=args.host,
+        port=args.port,
+        seed=args.seed,
+    )
+    with server:
+        print(f"Ollama:  OLLAMA_BASE_URL={server.url}")
+        print(f"OpenAI:  SBER_API_URL={server.url}/v1")
+        with contextlib.suppress(KeyboardInterrupt):
+            threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
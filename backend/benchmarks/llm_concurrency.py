@@ -0,0 +1,106 @@
+"""
+Sync vs async throughput of the LLM services against a fake Ollama server.
+
+The sync path runs OllamaService.get_action_code in a thread pool sized
+like a WSGI deployment (``--workers``); the async path awaits
+AsyncOllamaService.get_action_code from a single event loop with up to
+``--concurrency`` requests in flight.
+
+Usage (from backend/):
+    python -m benchmarks.llm_concurrency --requests 400 --workers 8 \
+        --concurrency 200 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_llm_server import FakeLLMServer
+
+
+def _questions(total: int, run: str) -> list[str]:
+    # Разные вопросы: кэш интентов и single-flight не схлопывают вызовы
+    return [f"каталог {run} {index}" for index in range(total)]
+
+
+def _run_sync(total: int, workers: int) -> float:
+    from api.llm_service import OllamaService  # noqa: PLC0415
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        codes = list(pool.map(OllamaService.get_action_code, _questions(total, "sync")))
+    elapsed = time.perf_counter() - started
+    assert codes.count("004") == total, "fake server answers must parse"
+    return elapsed
+
+
+def _run_async(total: int, concurrency: int) -> float:
+    from api.llm_async import AsyncOllamaService  # noqa: PLC0415
+
+    async def main() -> float:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(question: str) -> str:
+            async with semaphore:
+                return await AsyncOllamaService.get_action_code(question)
+
+        started = time.perf_counter()
+        codes = await asyncio.gather(*(one(q) for q in _questions(total, "async")))
+        elapsed = time.perf_counter() - started
+        assert codes.count("004") == total, "fake server answers must parse"
+        return elapsed
+
+    return asyncio.run(main())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=8, help="sync threads")
+    parser.add_argument("--concurrency", type=int, default=200, help="async tasks")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds")
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    args = parser.parse_args()
+
+    with FakeLLMServer(latency=args.latency) as server:
+        # Must be set before api.* modules read their configuration
+        os.environ["OLLAMA_BASE_URL"] = server.url
+        os.environ.setdefault(
+            "LLM_POOL_MAX_CONNECTIONS",
+            str(max(args.workers, args.concurrency)),
+        )
+        sync_elapsed = _run_sync(args.requests, args.workers)
+        async_elapsed = _run_async(args.requests, args.concurrency)
+
+    result = {
+        "requests": args.requests,
+        "latency_s": args.latency,
+        "sync": {
+            "workers": args.workers,
+            "elapsed_s": round(sync_elapsed, 3),
+            "rps": round(args.requests / sync_elapsed, 1),
+        },
+        "async": {
+            "concurrency": args.concurrency,
+            "elapsed_s": round(async_elapsed, 3),
+            "rps": round(args.requests / async_elapsed, 1),
+        },
+    }
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(
+        f"sync  ({args.workers} threads): {result['sync']['rps']:>8} req/s "
+        f"in {result['sync']['elapsed_s']} s",
+    )
+    print(
+        f"async ({args.concurrency} tasks): {result['async']['rps']:>8} req/s "
+        f"in {result['async']['elapsed_s']} s",
+    )
+
+
+if __name__ == "__main__":
+    main()
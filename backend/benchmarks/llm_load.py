@@ -0,0 +1,326 @@
+"""
+Load test of the LLM endpoints of a running backend, without real models.
+
+Sends ``--requests`` requests per mode — chat and navigate to
+/api/llm/ask/ (or /api/llm/ask/async/ with ``--async-endpoint``), batch to
+/api/llm/ask/batch/ — keeping ``--concurrency`` of them in flight, and
+reports throughput, latency p50/p95/p99 and error rates per mode. Every
+request uses a distinct question, so the intent and semantic caches do
+not hide the LLM calls.
+
+The LLM side is benchmarks.fake_llm_server: start it separately or pass
+``--serve-fake`` to run it inside the driver on ``--fake-port``. The
+backend must point at it (and use a premium or admin account, so the
+daily quota does not end the run):
+
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 \
+    SBER_API_URL=http://127.0.0.1:11435/v1 SBER_API_KEY=fake \
+    python manage.py runserver --noreload
+
+Results are written as JSON (``--output``) together with the run
+configuration, the fake server settings, the git commit and — for admin
+accounts — a snapshot of GET /api/llm/metrics/; ``--compare`` prints the
+change against an earlier result file.
+
+Usage (from backend/):
+    python -m benchmarks.llm_load --username admin --password admin \
+        --serve-fake --fake-latency lognormal:0.3:0.4 --fake-token-rate 40 \
+        --modes chat,navigate,batch --requests 200 --concurrency 16 \
+        --output benchmarks/results/baseline.json
+"""
+
+import argparse
+import json
+import math
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from pathlib import Path
+
+import requests
+
+from benchmarks.fake_llm_server import FakeLLMServer
+
+MODES = ("chat", "navigate", "batch")
+RESULT_VERSION = 1
+
+_QUESTIONS = {
+    "chat": "Расскажи, как работает доставка, вопрос {index}",
+    "navigate": "Покажи каталог товаров до {index} рублей",
+    "batch": "Открой личный кабинет, запрос {index}",
+}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу; values отсортированы."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class LoadDriver:
+    """Замкнутый цикл: concurrency потоков, у каждого своя HTTP-сессия."""
+
+    def __init__(self, base_url: str, token: str, timeout: float) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers["Authorization"] = f"Bearer {self.token}"
+        return session
+
+    def request(self, method: str, path: str, payload: dict | None = None):
+        return self._session().request(
+            method,
+            f"{self.base_url}{path}",
+            json=payload,
+            timeout=self.timeout,
+        )
+
+    def _one(self, path: str, payload: dict) -> tuple[float, str]:
+        """(секунды, исход): HTTP-код или имя исключения."""
+        started = time.perf_counter()
+        try:
+            response = self.request("POST", path, payload)
+            outcome = str(response.status_code)
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        return time.perf_counter() - started, outcome
+
+    def run(
+        self,
+        path: str,
+        payloads: list[dict],
+        concurrency: int,
+        items_per_request: int = 1,
+    ) -> dict:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda p: self._one(path, p), payloads))
+        elapsed = time.perf_counter() - started
+
+        outcomes: dict[str, int] = {}
+        for _, outcome in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        ok = sum(count for outcome, count in outcomes.items() if outcome == "200")
+        latencies = sorted(seconds for seconds, _ in results)
+        return {
+            "requests": len(results),
+            "ok": ok,
+            "errors": len(results) - ok,
+            "error_rate": round((len(results) - ok) / len(results), 4),
+            "outcomes": dict(sorted(outcomes.items())),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(ok / elapsed, 2),
+            "items_per_s": round(ok * items_per_request / elapsed, 2),
+            "latency_ms": {
+                "mean": round(1000 * sum(latencies) / len(latencies), 1),
+                "p50": round(1000 * _percentile(latencies, 0.5), 1),
+                "p95": round(1000 * _percentile(latencies, 0.95), 1),
+                "p99": round(1000 * _percentile(latencies, 0.99), 1),
+                "max": round(1000 * latencies[-1], 1),
+            },
+        }
+
+
+def _payloads(mode: str, args: argparse.Namespace) -> tuple[str, list[dict], int]:
+    """(путь, тела запросов, вопросов в запросе) для режима."""
+    common = {"model": args.model, "provider": args.provider}
+    template = f"{args.label} {_QUESTIONS[mode]}" if args.label else _QUESTIONS[mode]
+    if mode == "batch":
+        payloads = [
+            {
+                **common,
+                "questions": [
+                    template.format(index=request * args.batch_size + item)
+                    for item in range(args.batch_size)
+                ],
+            }
+            for request in range(args.requests)
+        ]
+        return "/api/llm/ask/batch/", payloads, args.batch_size
+    path = "/api/llm/ask/async/" if args.async_endpoint else "/api/llm/ask/"
+    payloads = [
+        {**common, "mode": mode, "question": template.format(index=index)}
+        for index in range(args.requests)
+    ]
+    return path, payloads, 1
+
+
+def _obtain_token(base_url: str, username: str, password: str) -> str:
+    response = requests.post(
+        f"{base_url.rstrip('/')}/api/token/",
+        json={"username": username, "password": password},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()["access"]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _server_metrics(driver: LoadDriver) -> dict | None:
+    """Снимок /api/llm/metrics/ (только для admin)."""
+    try:
+        response = driver.request("GET", "/api/llm/metrics/")
+    except requests.RequestException:
+        return None
+    return response.json() if response.status_code == 200 else None  # noqa: PLR2004
+
+
+def _llm_calls(metrics: dict | None) -> tuple[int, int] | None:
+    """(вызовов, ошибок) провайдеров по телеметрии сервера."""
+    if not metrics:
+        return None
+    entries = [
+        entry for per_model in metrics["calls"].values() for entry in per_model.values()
+    ]
+    return sum(e["calls"] for e in entries), sum(e["errors"] for e in entries)
+
+
+def compare(result: dict, baseline: dict) -> list[str]:
+    """Строки сравнения пропускной способности и p95 с прошлым прогоном."""
+
+    def change(now: float, before: float) -> str:
+        if not before:
+            return "n/a"
+        return f"{100 * (now - before) / before:+.1f}%"
+
+    lines = [f"vs {baseline.get('label') or baseline.get('git_commit') or 'baseline'}"]
+    for mode, now in result["modes"].items():
+        before = baseline.get("modes", {}).get(mode)
+        if before is None:
+            continue
+        lines.append(
+            f"  {mode:<9} rps {before['throughput_rps']} → {now['throughput_rps']} "
+            f"({change(now['throughput_rps'], before['throughput_rps'])}), "
+            f"p95 {before['latency_ms']['p95']} → {now['latency_ms']['p95']} ms "
+            f"({change(now['latency_ms']['p95'], before['latency_ms']['p95'])}), "
+            f"errors {before['error_rate']:.2%} → {now['error_rate']:.2%}",
+        )
+    return lines
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--token", help="JWT access token instead of a password")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--requests", type=int, default=100, help="per mode")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--model", default="alibayram/smollm3")
+    parser.add_argument("--provider", default="local")
+    parser.add_argument("--async-endpoint", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--label", default="", help="name of this run")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="earlier results JSON")
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    parser.add_argument("--serve-fake", action="store_true")
+    parser.add_argument("--fake-port", type=int, default=11435)
+    parser.add_argument("--fake-latency", default="0.2")
+    parser.add_argument("--fake-token-rate", type=float, default=0.0)
+    parser.add_argument("--fake-cold-start", type=float, default=0.0)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--fake-seed", type=int)
+    args = parser.parse_args()
+    unknown = set(args.modes.split(",")) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+    if not args.token and not (args.username and args.password):
+        parser.error("pass --token or --username and --password")
+    return args
+
+
+def _run(args: argparse.Namespace, fake: FakeLLMServer | None) -> dict:
+    token = args.token or _obtain_token(args.base_url, args.username, args.password)
+    driver = LoadDriver(args.base_url, token, args.timeout)
+    result = {
+        "version": RESULT_VERSION,
+        "label": args.label,
+        "started_at": datetime.now(tz=UTC).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "config": {
+            "base_url": args.base_url,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "batch_size": args.batch_size,
+            "model": args.model,
+            "provider": args.provider,
+            "async_endpoint": args.async_endpoint,
+        },
+        "fake_server": fake.config() if fake is not None else None,
+        "modes": {},
+    }
+    for mode in args.modes.split(","):
+        path, payloads, items = _payloads(mode, args)
+        result["modes"][mode] = driver.run(path, payloads, args.concurrency, items)
+    result["server_metrics"] = _server_metrics(driver)
+    return result
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.serve_fake:
+        fake = FakeLLMServer(
+            args.fake_latency,
+            "Это ответ тестового сервера. " * 4,
+            token_rate=args.fake_token_rate,
+            cold_start=args.fake_cold_start,
+            error_rate=args.fake_error_rate,
+            port=args.fake_port,
+            seed=args.fake_seed,
+        )
+        with fake:
+            result = _run(args, fake)
+    else:
+        result = _run(args, None)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(
+            json.dumps(result, ensure_ascii=False, indent=2) + "\n",
+            encoding="utf-8",
+        )
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    for mode, stats in result["modes"].items():
+        latency = stats["latency_ms"]
+        print(
+            f"{mode:<9} {stats['throughput_rps']:>8} req/s  "
+            f"p50 {latency['p50']} ms  p95 {latency['p95']} ms  "
+            f"p99 {latency['p99']} ms  errors {stats['error_rate']:.2%} "
+            f"{stats['outcomes']}",
+        )
+    calls = _llm_calls(result["server_metrics"])
+    if calls is not None:
+        # Ошибки LLM бэкенд часто маскирует фолбэком с кодом 200
+        print(f"LLM calls {calls[0]}, failed {calls[1]} (server telemetry)")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        print("\n".join(compare(result, baseline)))
+
+
+if __name__ == "__main__":
+    main()
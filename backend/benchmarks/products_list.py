@@ -0,0 +1,196 @@
+"""
+Latency of GET /api/products/ as the number of images per product grows.
+
+Runs in-process against the test settings (in-memory SQLite, no MinIO —
+pre-signing is local): seeds ``--products`` products whose authors have
+avatars, adds images step by step (``--images``) and times the list
+endpoint for
+
+* ``legacy`` — a new boto3 client for every URL, as before;
+* ``boto3``  — one shared boto3 client, every URL signed again;
+* ``cached`` — batch signing (api.s3_presign), first request of a window;
+* ``warm``   — repeated listing within the same window (URLs memoized);
+* ``public`` — AWS_S3_URL_STRATEGY "public" for images and avatars (no
+  signing at all, stable URLs).
+
+Usage (from backend/):
+    python -m benchmarks.products_list --products 10 --images 0,1,2,4,8 \
+        --repeat 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+
+def _setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings_test")
+    import django  # noqa: PLC0415
+
+    django.setup()
+    from django.core.management import call_command  # noqa: PLC0415
+    from django.test.utils import setup_test_environment  # noqa: PLC0415
+
+    # ALLOWED_HOSTS += testserver, как в тестах
+    setup_test_environment()
+    call_command("migrate", verbosity=0)
+
+
+def _seed(products: int):
+    from api.models import Category, Product  # noqa: PLC0415
+    from django.contrib.auth.models import User  # noqa: PLC0415
+
+    category = Category.objects.create(name="Bench")
+    items = []
+    for index in range(products):
+        author = User.objects.create_user(f"author{index}", password="x")
+        author.profile.avatar_s3_key = f"avatars/{index}.png"
+        author.profile.save()
+        items.append(
+            Product.objects.create(
+                title=f"Товар {index}",
+                slug=f"bench-{index}",
+                description="",
+                price=100,
+                stock=1,
+                category=category,
+                author=author,
+                status="published",
+            ),
+        )
+    return items
+
+
+def _add_images(products, count: int) -> None:
+    from api.models import ProductImage  # noqa: PLC0415
+
+    for product in products:
+        existing = product.images.count()
+        ProductImage.objects.bulk_create(
+            ProductImage(
+                product=product,
+                s3_key=f"products/{product.pk}-{index}.png",
+                original_filename=f"{index}.png",
+                content_type="image/png",
+                file_size=1,
+            )
+            for index in range(existing, count)
+        )
+
+
+def _boto3_client():
+    import boto3  # noqa: PLC0415
+    from botocore.client import Config  # noqa: PLC0415
+    from django.conf import settings  # noqa: PLC0415
+
+    return boto3.client(
+        "s3",
+        endpoint_url=settings.AWS_S3_PUBLIC_URL,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME or None,
+        config=Config(signature_version="s3v4"),
+    )
+
+
+def _boto3_presigner(client_for):
+    """Подпись списка ключей через boto3; client_for() — клиент."""
+    from django.conf import settings  # noqa: PLC0415
+
+    def presign_many(keys, expires_in: int = 3600) -> dict[str, str]:
+        return {
+            key: client_for().generate_presigned_url(
+                "get_object",
+                Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": key},
+                ExpiresIn=expires_in,
+            )
+            for key in keys
+        }
+
+    return presign_many
+
+
+def _time_list(client, repeat: int, before=None) -> float:
+    """Медиана времени ответа в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        response = client.get("/api/products/")
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code  # noqa: PLR2004
+    return 1000 * statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--images", default="0,1,2,4,8")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    _setup_django()
+    from api import s3_service  # noqa: PLC0415
+    from django.test.utils import override_settings  # noqa: PLC0415
+    from rest_framework.test import APIClient  # noqa: PLC0415
+
+    products = _seed(args.products)
+    client = APIClient()
+    cached = s3_service.generate_presigned_urls
+    shared = _boto3_client()
+    legacy = _boto3_presigner(_boto3_client)
+    boto3_shared = _boto3_presigner(lambda: shared)
+    public = override_settings(
+        AWS_S3_URL_STRATEGY={"product_image": "public", "avatar": "public"},
+    )
+
+    def use(presign_many) -> None:
+        # object_urls() вызывает generate_presigned_urls модуля s3_service
+        s3_service.generate_presigned_urls = presign_many
+
+    rows = []
+    for images in (int(value) for value in args.images.split(",")):
+        _add_images(products, images)
+        use(legacy)
+        legacy_ms = _time_list(client, args.repeat)
+        use(boto3_shared)
+        boto3_ms = _time_list(client, args.repeat)
+        use(cached)
+        # Каждый раз новое окно: подпись всех URL страницы одним пакетом
+        cold = _time_list(client, args.repeat, before=s3_service.presigned_urls.clear)
+        warm = _time_list(client, args.repeat)
+        with public:
+            public_ms = _time_list(client, args.repeat)
+        rows.append(
+            {
+                "products": args.products,
+                "images_per_product": images,
+                "legacy_ms": round(legacy_ms, 2),
+                "boto3_ms": round(boto3_ms, 2),
+                "cached_ms": round(cold, 2),
+                "warm_ms": round(warm, 2),
+                "public_ms": round(public_ms, 2),
+            },
+        )
+
+    if args.json:
+        print(json.dumps(rows))
+        return
+    print(
+        f"{'images':>6} {'legacy ms':>10} {'boto3 ms':>9} "
+        f"{'cached ms':>10} {'warm ms':>8} {'public ms':>10}",
+    )
+    for row in rows:
+        print(
+            f"{row['images_per_product']:>6} {row['legacy_ms']:>10} "
+            f"{row['boto3_ms']:>9} {row['cached_ms']:>10} {row['warm_ms']:>8} "
+            f"{row['public_ms']:>10}",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,13 @@ Provides:
 from decimal import Decimal
 
 import pytest
+from api import s3_service
+from api.llm_breaker import breaker
+from api.llm_cache import intent_cache
+from api.llm_prompts import prompt_cache
+from api.llm_router import router
+from api.llm_service import model_catalog
+from api.llm_telemetry import telemetry
 from api.models import Category, Order, OrderItem, Product
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
@@ -302,6 +309,32 @@ def reset_factories(db):
     OrderFactory.reset()
 
 
+@pytest.fixture(autouse=True)
+def clear_llm_caches():
+    """Keep LLM caches, prompts, circuit states, routing stats and metrics from leaking between tests."""
+    intent_cache.clear()
+    model_catalog.invalidate()
+    breaker.reset()
+    router.reset()
+    telemetry.reset()
+    prompt_cache.invalidate()
+    yield
+    intent_cache.clear()
+    model_catalog.invalidate()
+    breaker.reset()
+    router.reset()
+    telemetry.reset()
+    prompt_cache.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def clear_s3_caches():
+    """Signing clients and pre-signed URLs are cached per process."""
+    s3_service.clear_caches()
+    yield
+    s3_service.clear_caches()
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Configuration
 # ─────────────────────────────────────────────────────────────────────────────
@@ -0,0 +1,1154 @@
+"""Integration tests for LLM API endpoints.
+
+Tests:
+- Streaming chat answers (SSE)
+- Navigate mode (combined single-call and two-step fallback)
+- Async endpoint (AsyncOllamaService)
+- Intent cache admin endpoint
+- Admission control (429/503 + Retry-After, queue stats)
+- Batch classification endpoint
+- Cached model catalog
+- Model residency (status / warmup)
+- Speculative chat generation in navigate mode
+- Circuit breaker (fast 503, provider state in the model list)
+- provider=auto routing
+- Semantic answer cache (hits, admin stats and purge)
+- Per-call telemetry (metrics endpoint, debug attachment)
+- Category-based prompts cached until a Category changes
+"""
+
+import asyncio
+import json
+
+import pytest
+from api import llm_async, llm_router, llm_service, views
+from api.llm_admission import AdmissionController
+from api.llm_async import AsyncOllamaService
+from api.llm_breaker import CircuitBreaker
+from api.llm_cache import intent_cache
+from api.llm_catalog import ModelInfo
+from api.llm_clients import get_async_ollama_client
+from api.llm_prompts import prompt_cache
+from api.llm_semantic_cache import HashingEmbedder, SemanticCache
+from api.llm_service import NAVIGATION_COMBINED, OllamaService
+from api.llm_speculative import Speculator
+from api.llm_telemetry import telemetry
+from api.models import Category
+from rest_framework import status
+
+pytestmark = pytest.mark.integration
+
+
+def _parse_sse(response):
+    """Return a list of (event, data) tuples from a streaming response."""
+    body = b"".join(response.streaming_content).decode()
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestAskLLMStreamAPI:
+    """Tests for POST /api/llm/ask/stream/ endpoint."""
+
+    url = "/api/llm/ask/stream/"
+
+    def test_stream_forwards_tokens_and_charges_once(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, user = authenticated_client
+        monkeypatch.setattr(
+            OllamaService,
+            "stream_response",
+            staticmethod(lambda *_a, **_k: iter(["Привет", ", ", "мир"])),
+        )
+
+        response = client.post(self.url, {"question": "hi"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"].startswith("text/event-stream")
+
+        events = _parse_sse(response)
+        assert [e for e, _ in events] == ["token", "token", "token", "done"]
+        assert events[-1][1]["answer"] == "Привет, мир"
+
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == 1
+
+    def test_stream_error_is_not_charged(self, authenticated_client, monkeypatch):
+        client, user = authenticated_client
+
+        def _broken(*_a, **_k):
+            yield "partial"
+            raise ConnectionError("ollama down")
+
+        monkeypatch.setattr(OllamaService, "stream_response", staticmethod(_broken))
+
+        events = _parse_sse(client.post(self.url, {"question": "hi"}))
+        assert events[-1][0] == "error"
+
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == 0
+
+    def test_stream_requires_question(self, authenticated_client):
+        client, _ = authenticated_client
+        response = client.post(self.url, {"question": "  "})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestAskLLMNavigateAPI:
+    """Tests for POST /api/llm/ask/ in navigate mode."""
+
+    url = "/api/llm/ask/"
+
+    def test_combined_navigation_makes_single_call(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        monkeypatch.setattr(
+            OllamaService,
+            "get_navigation",
+            staticmethod(
+                lambda *_a, **_k: {
+                    "code": "004",
+                    "filters": {"max_price": 1000},
+                    "city": None,
+                },
+            ),
+        )
+
+        def _unexpected(*_a, **_k):
+            raise AssertionError("two-step path must not be used")
+
+        monkeypatch.setattr(OllamaService, "get_action_code", staticmethod(_unexpected))
+        monkeypatch.setattr(
+            OllamaService,
+            "get_product_filters",
+            staticmethod(_unexpected),
+        )
+
+        response = client.post(
+            self.url,
+            {
+                "question": "товары до 1000",
+                "mode": "navigate",
+                "navigation": "combined",
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["action_code"] == "004"
+        assert response.data["filters"] == {"max_price": 1000}
+        assert response.data["navigation"] == "combined"
+
+    def test_invalid_combined_result_falls_back_to_two_step(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        monkeypatch.setattr(
+            OllamaService,
+            "get_navigation",
+            staticmethod(lambda *_a, **_k: None),
+        )
+        monkeypatch.setattr(
+            OllamaService,
+            "get_action_code",
+            staticmethod(lambda *_a, **_k: "007"),
+        )
+        monkeypatch.setattr(
+            OllamaService,
+            "get_weather_city",
+            staticmethod(lambda *_a, **_k: "Казань"),
+        )
+
+        response = client.post(
+            self.url,
+            {
+                "question": "какая погода будет у бабушки в казани",
+                "mode": "navigate",
+                "navigation": "combined",
+            },
+        )
+        assert response.data["weather_city"] == "Казань"
+        assert response.data["navigation"] == "two_step"
+
+    def test_failed_combined_call_is_not_retried_two_step(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        calls = []
+
+        def fake_chat(model, messages, options=None, *, mode="chat", **_k):
+            calls.append(mode)
+            raise TimeoutError("timed out")
+
+        monkeypatch.setattr(OllamaService, "_chat", staticmethod(fake_chat))
+
+        response = client.post(
+            self.url,
+            {
+                "question": "что нового на сайте",
+                "mode": "navigate",
+                "navigation": "combined",
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["is_fallback"] is True
+        assert "action_code" not in calls
+
+    def test_obvious_command_skips_llm(self, authenticated_client, monkeypatch):
+        client, user = authenticated_client
+
+        def _unexpected(*_a, **_k):
+            raise AssertionError("LLM must not be called")
+
+        monkeypatch.setattr(OllamaService, "_chat", staticmethod(_unexpected))
+
+        response = client.post(
+            self.url,
+            {"question": "Включи светлую тему", "mode": "navigate"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["action_code"] == "101"
+        assert response.data["navigation"] == "rules"
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == 1
+
+    def test_rules_weather_asks_llm_only_for_city(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        monkeypatch.setattr(
+            OllamaService,
+            "get_weather_city",
+            staticmethod(lambda *_a, **_k: "Казань"),
+        )
+
+        def _unexpected(*_a, **_k):
+            raise AssertionError("classification must come from rules")
+
+        monkeypatch.setattr(OllamaService, "get_navigation", staticmethod(_unexpected))
+        monkeypatch.setattr(OllamaService, "get_action_code", staticmethod(_unexpected))
+
+        response = client.post(
+            self.url,
+            {"question": "погода в Казани", "mode": "navigate"},
+        )
+        assert response.data["action_code"] == "007"
+        assert response.data["weather_city"] == "Казань"
+        assert response.data["navigation"] == "rules"
+
+    def test_cached_navigation_still_charges_quota(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, user = authenticated_client
+        calls = []
+
+        def fake_chat(*_a, **_k):
+            calls.append(1)
+            return '{"code": "003"}'
+
+        monkeypatch.setattr(OllamaService, "_chat", staticmethod(fake_chat))
+
+        questions = ("Мои заказы", "мои заказы?")
+        for question in questions:
+            response = client.post(self.url, {"question": question, "mode": "navigate"})
+            assert response.data["action_code"] == "003"
+
+        assert len(calls) == 1
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == len(questions)
+
+
+class TestAsyncAskLLMAPI:
+    """Tests for POST /api/llm/ask/async/ endpoint."""
+
+    url = "/api/llm/ask/async/"
+
+    def test_async_chat_answers_and_charges_quota(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, user = authenticated_client
+
+        async def _answer(question, model):
+            return f"echo: {question}"
+
+        monkeypatch.setattr(
+            AsyncOllamaService,
+            "generate_response",
+            staticmethod(_answer),
+        )
+
+        response = client.post(self.url, {"question": "hi"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["answer"] == "echo: hi"
+        assert response.data["mode"] == "chat"
+
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == 1
+
+    def test_async_closes_clients_of_its_own_loop(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        used = []
+
+        async def _answer(question, model):
+            used.append(get_async_ollama_client("http://ollama.test:11434"))
+            return "ok"
+
+        monkeypatch.setattr(
+            AsyncOllamaService,
+            "generate_response",
+            staticmethod(_answer),
+        )
+
+        response = client.post(self.url, {"question": "hi"})
+
+        # Тестовый клиент — WSGI: loop запроса закрывается вместе с пулами
+        assert response.status_code == status.HTTP_200_OK
+        assert used[0]._client.is_closed  # noqa: SLF001
+
+    def test_async_navigate_combined(self, authenticated_client, monkeypatch):
+        client, _ = authenticated_client
+
+        async def _navigation(question, model, categories):
+            return {"code": "100", "filters": {}, "city": None}
+
+        monkeypatch.setattr(
+            AsyncOllamaService,
+            "get_navigation",
+            staticmethod(_navigation),
+        )
+
+        response = client.post(
+            self.url,
+            {
+                "question": "сделай интерфейс потемнее",
+                "mode": "navigate",
+                "navigation": "combined",
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["action_code"] == "100"
+        assert response.data["navigation"] == "combined"
+
+    def test_async_requires_authentication(self, api_client):
+        response = api_client.post(self.url, {"question": "hi"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+class TestLLMCacheAPI:
+    """Tests for GET/DELETE /api/llm/cache/ endpoint."""
+
+    url = "/api/llm/cache/"
+
+    def test_admin_sees_stats_and_clears(self, admin_client):
+        client, _ = admin_client
+        intent_cache.set(("k",), "v")
+
+        response = client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["intent"]["size"] == 1
+        assert response.data["single_flight"]["in_flight"] == 0
+
+        response = client.delete(self.url)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert intent_cache.stats()["size"] == 0
+
+    def test_regular_user_is_forbidden(self, authenticated_client):
+        client, _ = authenticated_client
+        response = client.get(self.url)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+class TestLLMAdmissionAPI:
+    """Overload handling of the LLM endpoints and GET /api/llm/queue/."""
+
+    model = "alibayram/smollm3"
+
+    @pytest.fixture
+    def saturated(self, monkeypatch):
+        controller = AdmissionController(
+            local_limit=1,
+            external_limit=1,
+            max_queue=0,
+            timeout=1.0,
+        )
+        monkeypatch.setattr(views, "admission", controller)
+        ticket = controller.acquire("local", self.model, "admin")
+        yield controller
+        ticket.release()
+
+    @pytest.mark.parametrize(
+        "url",
+        ["/api/llm/ask/", "/api/llm/ask/async/", "/api/llm/ask/stream/"],
+    )
+    def test_full_queue_returns_429_and_is_not_charged(
+        self,
+        authenticated_client,
+        saturated,
+        url,
+    ):
+        client, user = authenticated_client
+
+        response = client.post(url, {"question": "hi"}, HTTP_ACCEPT="application/json")
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(response["Retry-After"]) >= 1
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == 0
+
+    def test_cached_intent_bypasses_queue(
+        self,
+        authenticated_client,
+        saturated,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        answer = {"message": {"content": '{"code": "003"}'}}
+
+        class _Client:
+            def chat(self, **kwargs):
+                return iter([answer]) if kwargs["stream"] else answer
+
+        monkeypatch.setattr(OllamaService, "get_client", staticmethod(_Client))
+        question = "расскажи про ваш магазин подробнее"
+        # Вне admit() вызов модели не проходит admission control
+        assert OllamaService.get_action_code(question, self.model) == "003"
+
+        def ask(text):
+            return client.post("/api/llm/ask/", {"question": text, "mode": "navigate"})
+
+        response = ask(question)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["action_code"] == "003"
+        assert ask("а что ещё у вас есть").status_code == (
+            status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+    def test_rule_based_navigation_bypasses_queue(
+        self, authenticated_client, saturated
+    ):
+        client, _ = authenticated_client
+
+        response = client.post(
+            "/api/llm/ask/",
+            {"question": "очистить чат", "mode": "navigate"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["action_code"] == "201"
+
+    def test_admin_sees_queue_stats(self, admin_client, saturated):
+        client, _ = admin_client
+
+        response = client.get("/api/llm/queue/")
+
+        assert response.status_code == status.HTTP_200_OK
+        stats = response.data["models"][f"local:{self.model}"]
+        assert stats["active"] == 1
+        assert stats["queued"] == 0
+
+
+class TestAskLLMBatchAPI:
+    """Tests for POST /api/llm/ask/batch/ endpoint."""
+
+    url = "/api/llm/ask/batch/"
+
+    @pytest.fixture
+    def llm(self, monkeypatch):
+        """Async LLM stub: "каталог" → 004, anything else → 000."""
+        state = {"running": 0, "peak": 0, "calls": 0}
+
+        async def _navigation(question, model, categories):
+            state["calls"] += 1
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(0.01)
+            state["running"] -= 1
+            code = "004" if "каталог" in question else "000"
+            return {"code": code, "filters": {"max_price": 10}, "city": None}
+
+        async def _no_chat(*_a, **_k):
+            raise AssertionError("batch must not generate chat answers")
+
+        monkeypatch.setattr(
+            AsyncOllamaService,
+            "get_navigation",
+            staticmethod(_navigation),
+        )
+        monkeypatch.setattr(
+            AsyncOllamaService,
+            "generate_response",
+            staticmethod(_no_chat),
+        )
+        monkeypatch.setattr(views, "NAVIGATION_STRATEGY", NAVIGATION_COMBINED)
+        return state
+
+    def test_batch_classifies_and_charges_per_item(self, authenticated_client, llm):
+        client, user = authenticated_client
+        questions = ["тёмная тема", "каталог дешёвых товаров", "как дела?"]
+
+        response = client.post(self.url, {"questions": questions}, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data["results"]
+        assert [r["action_code"] for r in results] == ["100", "004", "000"]
+        assert results[0]["navigation"] == "rules"
+        assert results[1]["filters"] == {"max_price": 10}
+        assert results[2]["is_fallback"]
+        assert all(r["elapsed_ms"] >= 0 for r in results)
+        assert response.data["charged"] == len(questions)
+
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == len(questions)
+        assert response.data["requests_remaining"] == (
+            user.profile.daily_requests_limit - len(questions)
+        )
+
+    def test_batch_parallelism_is_bounded(self, authenticated_client, llm, monkeypatch):
+        client, _ = authenticated_client
+        monkeypatch.setattr(views.AskLLMBatchView, "concurrency", 2)
+        monkeypatch.setattr(
+            views,
+            "admission",
+            AdmissionController(
+                local_limit=8,
+                external_limit=8,
+                max_queue=8,
+                timeout=5.0,
+            ),
+        )
+
+        questions = [f"каталог {i}" for i in range(6)]
+        response = client.post(self.url, {"questions": questions}, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert llm["calls"] == len(questions)
+        assert llm["peak"] == 2  # noqa: PLR2004
+
+    def test_items_over_quota_are_not_classified(self, authenticated_client, llm):
+        client, user = authenticated_client
+        user.profile.daily_requests_used = user.profile.daily_requests_limit - 1
+        user.profile.save()
+
+        response = client.post(
+            self.url,
+            {"questions": ["каталог велосипедов", "каталог самокатов"]},
+            format="json",
+        )
+
+        results = response.data["results"]
+        assert results[0]["action_code"] == "004"
+        assert results[1]["error"] == "Daily request limit exceeded"
+        assert response.data["charged"] == 1
+        assert llm["calls"] == 1
+
+    @pytest.mark.parametrize("questions", [[], "каталог", ["ok", ""], ["q"] * 51])
+    def test_invalid_batches_are_rejected(self, authenticated_client, questions):
+        client, user = authenticated_client
+
+        response = client.post(self.url, {"questions": questions}, format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == 0
+
+
+class TestAvailableModelsAPI:
+    """Tests for GET /api/llm/models/ endpoint."""
+
+    url = "/api/llm/models/"
+
+    @pytest.fixture
+    def catalog(self, monkeypatch):
+        calls = []
+
+        def _fetch():
+            calls.append(1)
+            return [
+                ModelInfo(name="alibayram/smollm3", size=1_000, family="llama"),
+                ModelInfo(name="qwen3:8b", size=5_000, quantization="Q4_K_M"),
+            ]
+
+        monkeypatch.setattr(OllamaService, "fetch_models", staticmethod(_fetch))
+        return calls
+
+    def test_catalog_is_fetched_once_for_many_requests(
+        self,
+        authenticated_client,
+        catalog,
+    ):
+        client, _ = authenticated_client
+
+        for _ in range(3):
+            response = client.get(self.url)
+            assert response.data["models"] == ["alibayram/smollm3"]
+
+        assert catalog == [1]
+
+    def test_details_come_from_catalog(self, admin_client, catalog):
+        client, _ = admin_client
+
+        response = client.get(self.url, {"details": "1"})
+
+        assert response.data["models"] == ["alibayram/smollm3", "qwen3:8b"]
+        assert response.data["details"]["qwen3:8b"]["quantization"] == "Q4_K_M"
+        assert catalog == [1]
+
+    def test_cache_reset_invalidates_catalog(self, admin_client, catalog):
+        client, _ = admin_client
+        client.get(self.url)
+
+        client.delete("/api/llm/cache/")
+        client.get(self.url)
+
+        assert catalog == [1, 1]
+
+
+class TestLLMResidencyAPI:
+    """Tests for GET/POST /api/llm/residency/ endpoint."""
+
+    url = "/api/llm/residency/"
+
+    def test_admin_sees_loaded_models(self, admin_client, monkeypatch):
+        client, _ = admin_client
+
+        class _Client:
+            def ps(self):
+                return {"models": [{"model": "alibayram/smollm3", "size": 1}]}
+
+        monkeypatch.setattr(OllamaService, "get_client", staticmethod(_Client))
+
+        response = client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["models"][0]["loaded"]
+
+    def test_post_starts_background_warmup(self, admin_client, monkeypatch):
+        client, _ = admin_client
+        started = []
+        monkeypatch.setattr(views, "start_warmup", started.append)
+
+        response = client.post(self.url, {"models": ["qwen3:8b"]}, format="json")
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert started == [["qwen3:8b"]]
+
+    def test_regular_user_is_forbidden(self, authenticated_client):
+        client, _ = authenticated_client
+        assert client.get(self.url).status_code == status.HTTP_403_FORBIDDEN
+
+
+class TestSpeculativeNavigationAPI:
+    """Navigate mode with LLM_SPECULATIVE_POLICY=always."""
+
+    @pytest.fixture
+    def speculator(self, monkeypatch):
+        speculator = Speculator(
+            policy="always",
+            min_words=1,
+            max_load=1.0,
+            controller=AdmissionController(
+                local_limit=2,
+                external_limit=2,
+                max_queue=4,
+                timeout=5.0,
+            ),
+            workers=2,
+        )
+        monkeypatch.setattr(views, "speculator", speculator)
+        monkeypatch.setattr(views, "NAVIGATION_STRATEGY", NAVIGATION_COMBINED)
+        return speculator
+
+    @staticmethod
+    def _navigation(code):
+        return staticmethod(
+            lambda *_a, **_k: {"code": code, "filters": {}, "city": None}
+        )
+
+    def test_chat_fallback_uses_speculative_answer(
+        self,
+        authenticated_client,
+        speculator,
+        monkeypatch,
+    ):
+        client, user = authenticated_client
+        monkeypatch.setattr(OllamaService, "get_navigation", self._navigation("000"))
+        monkeypatch.setattr(
+            OllamaService,
+            "stream_response",
+            staticmethod(lambda *_a, **_k: iter(["Сорок ", "два"])),
+        )
+
+        def _unexpected(*_a, **_k):
+            raise AssertionError("answer must come from the speculative generation")
+
+        monkeypatch.setattr(
+            OllamaService, "generate_response", staticmethod(_unexpected)
+        )
+
+        response = client.post(
+            "/api/llm/ask/",
+            {"question": "в чём смысл жизни", "mode": "navigate"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["is_fallback"]
+        assert response.data["answer"] == "Сорок два"
+        assert speculator.stats()["used"] == 1
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == 1
+
+    def test_navigation_code_cancels_speculation(
+        self,
+        authenticated_client,
+        speculator,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        monkeypatch.setattr(OllamaService, "get_navigation", self._navigation("002"))
+        monkeypatch.setattr(
+            OllamaService,
+            "stream_response",
+            staticmethod(lambda *_a, **_k: iter(["лишний ответ"])),
+        )
+
+        response = client.post(
+            "/api/llm/ask/",
+            {"question": "где мои настройки профиля", "mode": "navigate"},
+        )
+
+        assert response.data["action_code"] == "002"
+        stats = speculator.stats()
+        assert stats["cancelled"] == 1
+        assert stats["used"] == 0
+
+    def test_async_chat_fallback_uses_speculative_answer(
+        self,
+        authenticated_client,
+        speculator,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        calls = []
+
+        async def _navigation(question, model, categories):
+            return {"code": "000", "filters": {}, "city": None}
+
+        async def _answer(question, model, *, coalesce=True):
+            calls.append(coalesce)
+            return "ответ"
+
+        monkeypatch.setattr(
+            AsyncOllamaService,
+            "get_navigation",
+            staticmethod(_navigation),
+        )
+        monkeypatch.setattr(
+            AsyncOllamaService, "generate_response", staticmethod(_answer)
+        )
+
+        response = client.post(
+            "/api/llm/ask/async/",
+            {"question": "расскажи анекдот", "mode": "navigate"},
+        )
+
+        assert response.data["answer"] == "ответ"
+        assert calls == [False]
+        assert speculator.stats()["used"] == 1
+
+    def test_batch_never_speculates(
+        self, authenticated_client, speculator, monkeypatch
+    ):
+        client, _ = authenticated_client
+
+        async def _navigation(question, model, categories):
+            return {"code": "000", "filters": {}, "city": None}
+
+        monkeypatch.setattr(
+            AsyncOllamaService,
+            "get_navigation",
+            staticmethod(_navigation),
+        )
+
+        response = client.post(
+            "/api/llm/ask/batch/",
+            {"questions": ["расскажи анекдот"]},
+            format="json",
+        )
+
+        assert response.data["results"][0]["action_code"] == "000"
+        assert speculator.stats()["started"] == 0
+
+    def test_admin_sees_speculation_stats(self, admin_client, speculator):
+        client, _ = admin_client
+
+        response = client.get("/api/llm/queue/")
+
+        assert response.data["speculation"]["policy"] == "always"
+
+
+class TestCircuitBreakerAPI:
+    """LLM endpoints while the circuit of the local model is open."""
+
+    model = "alibayram/smollm3"
+
+    @pytest.fixture
+    def tripped(self, monkeypatch):
+        breaker = CircuitBreaker(
+            window=4,
+            min_calls=1,
+            failure_rate=0.5,
+            slow_call=60.0,
+            slow_rate=1.0,
+            open_seconds=60.0,
+        )
+        with pytest.raises(ConnectionError), breaker.guard("local", self.model):
+            raise ConnectionError("Ollama is down")
+        for module in (views, llm_service, llm_async):
+            monkeypatch.setattr(module, "breaker", breaker)
+        return breaker
+
+    @pytest.mark.parametrize(
+        "url",
+        ["/api/llm/ask/", "/api/llm/ask/async/", "/api/llm/ask/stream/"],
+    )
+    def test_open_circuit_fails_fast_and_is_not_charged(
+        self,
+        authenticated_client,
+        tripped,
+        url,
+    ):
+        client, user = authenticated_client
+
+        response = client.post(url, {"question": "hi"}, HTTP_ACCEPT="application/json")
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert int(response["Retry-After"]) >= 1
+        user.profile.refresh_from_db()
+        assert user.profile.daily_requests_used == 0
+
+    def test_rule_based_navigation_still_works(self, authenticated_client, tripped):
+        client, _ = authenticated_client
+
+        response = client.post(
+            "/api/llm/ask/",
+            {"question": "светлая тема", "mode": "navigate"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["action_code"] == "101"
+
+    def test_model_list_reports_dead_provider(
+        self,
+        authenticated_client,
+        tripped,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        monkeypatch.setattr(
+            OllamaService,
+            "fetch_models",
+            staticmethod(lambda: [ModelInfo(name=self.model)]),
+        )
+
+        response = client.get("/api/llm/models/")
+
+        assert response.data["circuits"] == {self.model: "open"}
+        assert response.data["available"] is False
+
+        external = client.get("/api/llm/models/?provider=external")
+        assert external.data["available"] is True
+
+
+class TestAutoRoutingAPI:
+    """provider=auto picks a provider and reports the routing decision."""
+
+    def test_auto_routes_to_local_without_api_key(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        monkeypatch.setattr(llm_router, "SBER_API_KEY", "")
+        monkeypatch.setattr(
+            OllamaService,
+            "generate_response",
+            staticmethod(lambda question, model: f"local {model}"),
+        )
+
+        response = client.post(
+            "/api/llm/ask/",
+            {"question": "hi", "provider": "auto", "model": "alibayram/smollm3"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["answer"] == "local alibayram/smollm3"
+        assert response.data["provider"] == "local"
+        assert response.data["routing"] == {
+            "requested": "auto",
+            "hedged": False,
+            "answered_by": "local",
+        }
+
+    def test_auto_prefers_faster_provider(self, authenticated_client, monkeypatch):
+        client, _ = authenticated_client
+        monkeypatch.setattr(llm_router, "SBER_API_KEY", "key")
+        for _ in range(5):
+            llm_router.router.record("local", llm_router.KIND_CHAT, 5.0, ok=True)
+            llm_router.router.record("external", llm_router.KIND_CHAT, 0.5, ok=True)
+        monkeypatch.setattr(
+            views.ExternalLLMService,
+            "generate_response",
+            staticmethod(lambda question, model: "external"),
+        )
+
+        response = client.post("/api/llm/ask/", {"question": "hi", "provider": "auto"})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["answer"] == "external"
+        assert response.data["provider"] == "external"
+        assert response.data["routing"]["answered_by"] == "external"
+
+    def test_admin_sees_routing_stats(self, admin_client):
+        client, _ = admin_client
+
+        response = client.get("/api/llm/queue/")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["routing"]["hedges"] == 0
+
+
+class TestSemanticCacheAPI:
+    """Chat answers reused for reworded questions; GET/DELETE cache/semantic/."""
+
+    url = "/api/llm/cache/semantic/"
+
+    @pytest.fixture
+    def cache(self, monkeypatch):
+        cache = SemanticCache(
+            embedder=HashingEmbedder(),
+            threshold=0.9,
+            capacity=16,
+            ttl=60,
+        )
+        monkeypatch.setattr(llm_service, "semantic_cache", cache)
+        monkeypatch.setattr(views, "semantic_cache", cache)
+        return cache
+
+    def test_reworded_question_is_answered_from_cache(
+        self,
+        authenticated_client,
+        cache,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        calls = []
+
+        def fake_chat(model, messages, options=None, **_kwargs):
+            calls.append(model)
+            return "Через личный кабинет"
+
+        monkeypatch.setattr(OllamaService, "_chat", staticmethod(fake_chat))
+
+        for question in ["Как добавить товар?", "как  добавить товар"]:
+            response = client.post(
+                "/api/llm/ask/",
+                {"question": question, "model": "alibayram/smollm3"},
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert response.data["answer"] == "Через личный кабинет"
+
+        assert calls == ["alibayram/smollm3"]
+
+    def test_admin_sees_stats_and_purges_model(self, admin_client, cache):
+        client, _ = admin_client
+        cache.lookup("local", "m", "как добавить товар").store("answer")
+        cache.lookup("local", "other", "как добавить товар").store("answer")
+
+        response = client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["namespaces"]["local:m"]["size"] == 1
+
+        response = client.delete(f"{self.url}?model=m")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {"purged": 1}
+        assert set(cache.stats()["namespaces"]) == {"local:other"}
+
+        response = client.delete("/api/llm/cache/")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert cache.stats()["namespaces"] == {}
+
+    def test_regular_user_is_forbidden(self, authenticated_client):
+        client, _ = authenticated_client
+        response = client.delete(self.url)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+class TestLLMMetricsAPI:
+    """GET/DELETE /api/llm/metrics/ and the LLM_TELEMETRY_DEBUG attachment."""
+
+    url = "/api/llm/metrics/"
+
+    @pytest.fixture
+    def ollama(self, monkeypatch):
+        class _Client:
+            def chat(self, **kwargs):
+                return {
+                    "message": {"content": "Привет"},
+                    "load_duration": 1_000_000,
+                    "prompt_eval_count": 20,
+                    "prompt_eval_duration": 2_000_000,
+                    "eval_count": 3,
+                    "eval_duration": 3_000_000,
+                }
+
+        monkeypatch.setattr(OllamaService, "get_client", staticmethod(_Client))
+
+    def test_admin_sees_call_histograms(self, admin_client, ollama):
+        client, _ = admin_client
+        client.post(
+            "/api/llm/ask/",
+            {"question": "hi", "model": "alibayram/smollm3"},
+        )
+
+        response = client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        chat = response.data["calls"]["chat"]["local:alibayram/smollm3"]
+        assert chat["calls"] == 1
+        assert chat["eval_seconds"]["count"] == 1
+        assert chat["tokens_per_second"]["sum"] == pytest.approx(1000.0)
+        assert (
+            response.data["queue_wait_seconds"]["local:alibayram/smollm3"]["count"] == 1
+        )
+
+        response = client.delete(self.url)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert telemetry.stats()["calls"] == {}
+
+    def test_debug_flag_attaches_request_telemetry(
+        self,
+        authenticated_client,
+        ollama,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+
+        response = client.post("/api/llm/ask/", {"question": "hi"})
+        assert "telemetry" not in response.data
+
+        monkeypatch.setattr(telemetry, "debug", True)
+        response = client.post("/api/llm/ask/", {"question": "hi"})
+
+        assert response.status_code == status.HTTP_200_OK
+        modes = [entry["mode"] for entry in response.data["telemetry"]]
+        assert modes == ["queue", "chat"]
+        assert response.data["telemetry"][1]["prompt_tokens"] == 20  # noqa: PLR2004
+
+    def test_debug_flag_covers_async_endpoint(
+        self,
+        authenticated_client,
+        monkeypatch,
+    ):
+        client, _ = authenticated_client
+        monkeypatch.setattr(telemetry, "debug", True)
+
+        class _Client:
+            async def chat(self, **kwargs):
+                return {"message": {"content": "Привет"}, "eval_count": 2}
+
+        monkeypatch.setattr(
+            AsyncOllamaService,
+            "get_client",
+            staticmethod(_Client),
+        )
+
+        response = client.post("/api/llm/ask/async/", {"question": "hi"})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["telemetry"][-1]["completion_tokens"] == 2  # noqa: PLR2004
+
+    def test_regular_user_is_forbidden(self, authenticated_client):
+        client, _ = authenticated_client
+        response = client.get(self.url)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+class TestPromptCacheAPI:
+    """Category list cached for navigate requests, dropped by Category signals."""
+
+    url = "/api/llm/ask/"
+
+    @pytest.fixture
+    def navigation(self, monkeypatch):
+        seen = []
+
+        def _navigation(question, model, categories=None):
+            seen.append(categories)
+            return {"code": "004", "filters": {}, "city": None}
+
+        monkeypatch.setattr(OllamaService, "get_navigation", staticmethod(_navigation))
+        monkeypatch.setattr(views, "NAVIGATION_STRATEGY", NAVIGATION_COMBINED)
+        return seen
+
+    def _navigate(self, client, question):
+        response = client.post(self.url, {"question": question, "mode": "navigate"})
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_categories_are_queried_once(
+        self,
+        authenticated_client,
+        category,
+        navigation,
+    ):
+        client, _ = authenticated_client
+        loads = prompt_cache.stats()["loads"]
+
+        self._navigate(client, "товары до 1000")
+        self._navigate(client, "товары до 2000")
+
+        assert navigation == [["Electronics"], ["Electronics"]]
+        assert prompt_cache.stats()["loads"] == loads + 1
+
+    def test_category_change_rebuilds_prompt(
+        self,
+        authenticated_client,
+        category,
+        navigation,
+    ):
+        client, _ = authenticated_client
+        self._navigate(client, "товары до 1000")
+
+        Category.objects.create(name="Books")
+        self._navigate(client, "товары до 2000")
+        category.delete()
+        self._navigate(client, "товары до 3000")
+
+        assert navigation == [["Electronics"], ["Books", "Electronics"], ["Books"]]
+
+    def test_admin_sees_prompt_versions(self, admin_client):
+        client, _ = admin_client
+        llm_service.filters_messages("книги", ["Books"])
+
+        response = client.get("/api/llm/cache/")
+
+        prompts = response.data["prompts"]["prompts"]
+        assert [(p["name"], p["categories"]) for p in prompts] == [("filters", 1)]
+        assert len(prompts[0]["version"]) == 16  # noqa: PLR2004
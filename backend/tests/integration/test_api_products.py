@@ -5,12 +5,16 @@ Tests:
 - Permissions and authorization
 - Filtering, searching, sorting
 - Pagination
+- Pre-signed image URLs signed in one batch per page
+- URL strategy per object class (AWS_S3_URL_STRATEGY)
+- Direct-to-storage image uploads (presigned POST + confirm)
 """
 
 from decimal import Decimal
 
 import pytest
-from api.models import Product
+from api import s3_service
+from api.models import Product, ProductImage
 from rest_framework import status
 from tests.conftest import (
     CategoryFactory,
@@ -231,6 +235,202 @@ class TestProductListAPI:
         assert response.status_code == status.HTTP_200_OK
         assert len(response.data["results"]) == 5  # noqa: PLR2004
 
+    def test_list_products_signs_image_urls_in_one_batch(
+        self,
+        api_client,
+        monkeypatch,
+    ):
+        """Image and avatar URLs of the page are signed in one call per class."""
+        user = UserFactory.create()
+        user.profile.avatar_s3_key = "avatars/a.png"
+        user.profile.save()
+        for i in range(2):
+            product = ProductFactory.create(
+                slug=f"img-{i}",
+                author=user,
+                status="published",
+            )
+            for j in range(2):
+                ProductImage.objects.create(
+                    product=product,
+                    s3_key=f"products/{i}-{j}.png",
+                    original_filename="x.png",
+                    content_type="image/png",
+                    file_size=1,
+                )
+        batches = []
+
+        def fake_presign(keys, expires_in=3600):
+            batches.append(sorted(set(keys)))
+            return {key: f"https://signed/{key}" for key in keys}
+
+        monkeypatch.setattr(s3_service, "generate_presigned_urls", fake_presign)
+
+        response = api_client.get("/api/products/")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert batches == [
+            [
+                "products/0-0.png",
+                "products/0-1.png",
+                "products/1-0.png",
+                "products/1-1.png",
+            ],
+            ["avatars/a.png"],
+        ]
+        product = response.data["results"][0]
+        assert product["images"][0]["url"].startswith("https://signed/products/")
+        assert product["author"]["avatar_url"] == "https://signed/avatars/a.png"
+
+    def test_list_products_uses_url_strategy_per_class(
+        self,
+        api_client,
+        settings,
+    ):
+        """Public product images get stable direct URLs; avatars stay signed."""
+        settings.AWS_S3_PUBLIC_URL = "https://cdn.example.com"
+        settings.AWS_S3_URL_STRATEGY = {
+            "product_image": "public",
+            "avatar": "presigned",
+        }
+        user = UserFactory.create()
+        user.profile.avatar_s3_key = "avatars/a.png"
+        user.profile.save()
+        product = ProductFactory.create(author=user, status="published")
+        ProductImage.objects.create(
+            product=product,
+            s3_key="products/0.png",
+            original_filename="x.png",
+            content_type="image/png",
+            file_size=1,
+        )
+
+        first = api_client.get("/api/products/").data["results"][0]
+        second = api_client.get("/api/products/").data["results"][0]
+
+        bucket = settings.AWS_STORAGE_BUCKET_NAME
+        url = f"https://cdn.example.com/{bucket}/products/0.png"
+        assert first["images"][0]["url"] == url
+        assert second["images"][0]["url"] == url
+        assert "X-Amz-Signature=" in first["author"]["avatar_url"]
+
+
+class TestProductImageDirectUploadAPI:
+    """Tests for POST /api/products/{slug}/images/direct/[confirm/]."""
+
+    @pytest.fixture
+    def storage(self, monkeypatch):
+        """Хранилище без MinIO: HEAD отвечает тем, что «загрузил» браузер."""
+        objects = {}
+
+        class _Client:
+            def head_object(self, Bucket, Key):  # noqa: N803
+                if Key not in objects:
+                    raise s3_service.ClientError(
+                        {"Error": {"Code": "404"}},
+                        "HeadObject",
+                    )
+                return objects[Key]
+
+            def delete_object(self, Bucket, Key):  # noqa: N803
+                objects.pop(Key, None)
+
+        monkeypatch.setattr(s3_service, "ensure_bucket_exists", lambda *a, **k: None)
+        monkeypatch.setattr(s3_service, "_get_client", _Client)
+        return objects
+
+    def test_direct_upload_creates_image_after_confirm(
+        self,
+        authenticated_client,
+        storage,
+    ):
+        client, user = authenticated_client
+        product = ProductFactory.create(author=user)
+        base = f"/api/products/{product.slug}/images/direct/"
+
+        response = client.post(
+            base,
+            {"filename": "photo.png", "content_type": "image/png", "size": 2048},
+            format="json",
+        )
+        assert response.status_code == status.HTTP_200_OK
+        upload = response.data
+        assert upload["fields"]["key"] == upload["key"]
+
+        token = {"upload_token": upload["upload_token"]}
+        response = client.post(f"{base}confirm/", token, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not ProductImage.objects.exists()
+
+        # Браузер отправил файл в хранилище по политике
+        storage[upload["key"]] = {"ContentLength": 2048, "ContentType": "image/png"}
+        response = client.post(f"{base}confirm/", token, format="json")
+        again = client.post(f"{base}confirm/", token, format="json")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert again.status_code == status.HTTP_200_OK
+        image = ProductImage.objects.get()
+        assert image.s3_key == upload["key"]
+        assert image.file_size == 2048  # noqa: PLR2004
+        assert image.original_filename == "photo.png"
+
+    def test_direct_upload_rejects_size_other_than_declared(
+        self,
+        authenticated_client,
+        storage,
+    ):
+        client, user = authenticated_client
+        base = f"/api/products/{ProductFactory.create(author=user).slug}/images/direct/"
+        upload = client.post(
+            base,
+            {"filename": "photo.png", "content_type": "image/png", "size": 2048},
+            format="json",
+        ).data
+        storage[upload["key"]] = {"ContentLength": 1024, "ContentType": "image/png"}
+
+        response = client.post(
+            f"{base}confirm/",
+            {"upload_token": upload["upload_token"]},
+            format="json",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not ProductImage.objects.exists()
+        assert upload["key"] not in storage
+
+    def test_direct_upload_rejects_bad_files_and_strangers(
+        self,
+        authenticated_client,
+        storage,
+    ):
+        client, user = authenticated_client
+        base = f"/api/products/{ProductFactory.create(author=user).slug}/images/direct/"
+        foreign = ProductFactory.create()
+
+        wrong_type = client.post(
+            base,
+            {
+                "filename": "a.exe",
+                "content_type": "application/x-msdownload",
+                "size": 1,
+            },
+            format="json",
+        )
+        too_big = client.post(
+            base,
+            {"filename": "a.png", "content_type": "image/png", "size": 10**9},
+            format="json",
+        )
+        stranger = client.post(
+            f"/api/products/{foreign.slug}/images/direct/",
+            {"filename": "a.png", "content_type": "image/png", "size": 1},
+            format="json",
+        )
+
+        assert wrong_type.status_code == status.HTTP_400_BAD_REQUEST
+        assert too_big.status_code == status.HTTP_400_BAD_REQUEST
+        assert stranger.status_code == status.HTTP_403_FORBIDDEN
+
 
 class TestProductDetailAPI:
     """Tests for GET /api/products/{slug}/ endpoint."""
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+
+import pytest
+from api.llm_admission import (
+    AdmissionController,
+    LLMOverloadedError,
+    parse_model_limits,
+    request_slot,
+    unmetered,
+)
+
+pytestmark = pytest.mark.unit
+
+
+def _controller(**kwargs):
+    options = {
+        "local_limit": 1,
+        "external_limit": 4,
+        "max_queue": 4,
+        "timeout": 5.0,
+    }
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def _wait_queued(controller, count, key="local:m"):
+    while controller.stats()["models"][key]["queued"] < count:
+        threading.Event().wait(0.001)
+
+
+def test_parse_model_limits_skips_malformed_items():
+    assert parse_model_limits(["qwen3:8b=1", "broken", " a/b = 3"]) == {
+        "qwen3:8b": 1,
+        "a/b": 3,
+    }
+
+
+def test_limits_are_per_model_and_provider():
+    controller = _controller(model_limits={"big": 2})
+
+    with controller.slot("local", "m", "user"), controller.slot("local", "big", "user"):
+        stats = controller.stats()["models"]
+    assert stats["local:m"]["limit"] == 1
+    assert stats["local:big"]["limit"] == 2  # noqa: PLR2004
+    assert stats["local:m"]["active"] == 1
+    assert controller.stats()["models"]["local:m"]["active"] == 0
+
+    with controller.slot("external", "m", "user"):
+        assert controller.stats()["models"]["external:m"]["limit"] == 4  # noqa: PLR2004
+
+
+def test_request_slot_is_taken_only_inside_admit():
+    controller = _controller()
+
+    with request_slot("local", "m") as ticket:
+        assert ticket is None
+    with controller.admit("user"):
+        with request_slot("local", "m") as ticket:
+            assert controller.stats()["models"]["local:m"]["active"] == 1
+        with unmetered(), request_slot("local", "m") as ticket:
+            assert ticket is None
+    assert controller.stats()["models"]["local:m"]["active"] == 0
+
+
+def test_full_queue_is_rejected_with_429():
+    controller = _controller(max_queue=0)
+
+    with (
+        controller.slot("local", "m", "user"),
+        pytest.raises(LLMOverloadedError) as exc,
+    ):
+        controller.acquire("local", "m", "user")
+
+    assert exc.value.status_code == 429  # noqa: PLR2004
+    assert exc.value.retry_after >= 1
+    assert controller.stats()["models"]["local:m"]["rejected_full"] == 1
+
+
+def test_wait_timeout_is_rejected_with_503():
+    controller = _controller(timeout=0.01)
+
+    with (
+        controller.slot("local", "m", "user"),
+        pytest.raises(LLMOverloadedError) as exc,
+    ):
+        controller.acquire("local", "m", "user")
+
+    assert exc.value.status_code == 503  # noqa: PLR2004
+    stats = controller.stats()["models"]["local:m"]
+    assert stats["timed_out"] == 1
+    assert stats["queued"] == 0
+
+
+def test_unmeetable_deadline_is_rejected_without_waiting():
+    controller = _controller(timeout=1.0)
+    controller.acquire("local", "m", "user").release()
+    queue = controller._queue("local", "m")  # noqa: SLF001
+    queue.service_time = 10.0
+
+    with (
+        controller.slot("local", "m", "user"),
+        pytest.raises(LLMOverloadedError) as exc,
+    ):
+        controller.acquire("local", "m", "user")
+
+    assert exc.value.status_code == 503  # noqa: PLR2004
+    assert exc.value.retry_after >= 10  # noqa: PLR2004
+    assert queue.rejected_deadline == 1
+
+
+def test_premium_and_admin_are_served_first():
+    controller = _controller()
+    order = []
+
+    def worker(role):
+        with controller.slot("local", "m", role):
+            order.append(role)
+
+    holder = controller.acquire("local", "m", "user")
+    threads = []
+    for queued, role in enumerate(["user", "premium", "admin"], start=1):
+        thread = threading.Thread(target=worker, args=(role,))
+        thread.start()
+        threads.append(thread)
+        _wait_queued(controller, queued)
+    holder.release()
+    for thread in threads:
+        thread.join()
+
+    assert order == ["admin", "premium", "user"]
+    stats = controller.stats()["models"]["local:m"]
+    assert stats["admitted"] == 4  # noqa: PLR2004
+    assert stats["wait_max_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_async_callers_share_the_queue():
+    controller = _controller()
+    running = []
+    peak = []
+
+    async def worker():
+        async with controller.aslot("local", "m", "user"):
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.005)
+            running.pop()
+
+    await asyncio.gather(*(worker() for _ in range(4)))
+
+    assert max(peak) == 1
+    assert controller.stats()["models"]["local:m"]["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_async_wait_timeout_frees_queue_position():
+    controller = _controller(timeout=0.01)
+    ticket = await controller.aacquire("local", "m", "user")
+
+    with pytest.raises(LLMOverloadedError):
+        await controller.aacquire("local", "m", "user")
+    ticket.release()
+
+    stats = controller.stats()["models"]["local:m"]
+    assert stats["queued"] == 0
+    assert stats["active"] == 0
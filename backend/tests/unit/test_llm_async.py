@@ -0,0 +1,89 @@
+import pytest
+from api import llm_async
+from api.llm_async import AsyncExternalLLMService, AsyncOllamaService
+from api.llm_breaker import CircuitOpenError
+from api.llm_service import ExternalLLMServiceError
+
+pytestmark = pytest.mark.unit
+
+
+class _DummyAsyncClient:
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+
+    async def chat(self, **kwargs):
+        self.calls.append(kwargs)
+        response = {"message": {"content": self.content}}
+        return _stream([response]) if kwargs.get("stream") else response
+
+
+async def _stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_async_get_action_code_parses_code(monkeypatch):
+    client = _DummyAsyncClient("Код: 101")
+    monkeypatch.setattr(AsyncOllamaService, "get_client", staticmethod(lambda: client))
+
+    assert await AsyncOllamaService.get_action_code("светлая тема") == "101"
+    assert client.calls[0]["options"]["temperature"] == 0.1  # noqa: PLR2004
+    assert client.calls[0]["format"]["required"] == ["code"]
+
+
+@pytest.mark.asyncio
+async def test_async_generate_response_strips_think(monkeypatch):
+    client = _DummyAsyncClient("<think>hmm</think> Ответ")
+    monkeypatch.setattr(AsyncOllamaService, "get_client", staticmethod(lambda: client))
+
+    assert await AsyncOllamaService.generate_response("q") == "Ответ"
+
+
+@pytest.mark.asyncio
+async def test_async_external_reports_missing_key(monkeypatch):
+    monkeypatch.setattr("api.llm_async.SBER_API_KEY", "")
+
+    with pytest.raises(ExternalLLMServiceError):
+        await AsyncExternalLLMService._chat("m", [])  # noqa: SLF001
+    assert await AsyncExternalLLMService.get_action_code("q") == "000"
+
+
+@pytest.mark.asyncio
+async def test_async_action_code_closes_stream_early(monkeypatch):
+    sent = []
+    closed = []
+
+    async def generation():
+        try:
+            for chunk in ("Код", " 004", "\n", "Пояснение", " ещё"):
+                sent.append(chunk)
+                yield {"message": {"content": chunk}}
+        finally:
+            closed.append(True)
+
+    class Client:
+        async def chat(self, **kwargs):
+            assert kwargs["stream"] is True
+            return generation()
+
+    monkeypatch.setattr(AsyncOllamaService, "get_client", staticmethod(Client))
+
+    assert await AsyncOllamaService.get_action_code("каталог") == "004"
+    assert sent == ["Код", " 004", "\n"]
+    assert closed == [True]
+
+
+@pytest.mark.asyncio
+async def test_async_action_code_propagates_open_circuit(monkeypatch):
+    class _OpenBreaker:
+        def check(self, provider, model):
+            raise CircuitOpenError(provider, model, 60.0)
+
+        guard = check
+
+    monkeypatch.setattr(llm_async, "breaker", _OpenBreaker())
+
+    with pytest.raises(CircuitOpenError):
+        await AsyncOllamaService.get_action_code("светлая тема")
@@ -0,0 +1,193 @@
+import threading
+
+import pytest
+from api import llm_service
+from api.llm_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from api.llm_service import OllamaService
+
+pytestmark = pytest.mark.unit
+
+
+def _breaker(**kwargs):
+    options = {
+        "window": 10,
+        "min_calls": 3,
+        "failure_rate": 0.5,
+        "slow_call": 10.0,
+        "slow_rate": 1.0,
+        "open_seconds": 60.0,
+    }
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+
+def _fail(breaker, times=1, provider="local", model="m"):
+    for _ in range(times):
+        with pytest.raises(ConnectionError), breaker.guard(provider, model):
+            raise ConnectionError("refused")
+
+
+def _succeed(breaker, provider="local", model="m"):
+    with breaker.guard(provider, model):
+        pass
+
+
+def test_stays_closed_below_min_calls():
+    breaker = _breaker()
+    _fail(breaker, 2)
+
+    assert breaker.state("local", "m") == CLOSED
+    breaker.check("local", "m")
+
+
+def test_failure_rate_opens_circuit_and_fails_fast():
+    breaker = _breaker()
+    _succeed(breaker)
+    _fail(breaker, 2)
+
+    assert breaker.state("local", "m") == OPEN
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.check("local", "m")
+    assert exc.value.status_code == 503  # noqa: PLR2004
+    assert exc.value.retry_after >= 1
+    # Другие модели и провайдеры не затронуты
+    assert breaker.state("local", "other") == CLOSED
+    assert breaker.state("external", "m") == CLOSED
+
+    calls = []
+    with pytest.raises(CircuitOpenError), breaker.guard("local", "m"):
+        calls.append(1)
+    assert calls == []
+    assert breaker.stats()["local:m"]["rejected"] == 2  # noqa: PLR2004
+
+
+def test_slow_calls_open_circuit():
+    breaker = _breaker(slow_call=0.0)
+    for _ in range(3):
+        _succeed(breaker)
+
+    assert breaker.state("local", "m") == OPEN
+
+
+def test_untimed_calls_are_never_slow():
+    breaker = _breaker(slow_call=0.0)
+    for _ in range(3):
+        with breaker.guard("local", "m", timed=False):
+            pass
+
+    assert breaker.state("local", "m") == CLOSED
+
+
+def test_half_open_allows_one_trial_and_closes_on_success():
+    breaker = _breaker(open_seconds=0.0)
+    _fail(breaker, 3)
+
+    assert breaker.state("local", "m") == HALF_OPEN
+    with breaker.guard("local", "m"), pytest.raises(CircuitOpenError):
+        # Пока идёт пробный вызов, остальные отклоняются
+        breaker.check("local", "m")
+
+    assert breaker.state("local", "m") == CLOSED
+    assert breaker.stats()["local:m"]["calls"] == 0
+
+
+def test_failed_trial_reopens_circuit():
+    breaker = _breaker(open_seconds=0.05)
+    _fail(breaker, 3)
+    threading.Event().wait(0.06)
+
+    _fail(breaker)
+
+    assert breaker.state("local", "m") == OPEN
+    assert breaker.stats()["local:m"]["opened"] == 2  # noqa: PLR2004
+
+
+def test_interrupted_trial_is_not_recorded():
+    breaker = _breaker(open_seconds=0.0)
+    _fail(breaker, 3)
+
+    with pytest.raises(GeneratorExit), breaker.guard("local", "m"):
+        raise GeneratorExit
+
+    assert breaker.state("local", "m") == HALF_OPEN
+    breaker.check("local", "m")
+
+
+def test_background_probe_moves_circuit_to_half_open():
+    breaker = _breaker(open_seconds=0.01)
+    healthy = threading.Event()
+    probed = []
+
+    def probe(model):
+        probed.append(model)
+        if not healthy.is_set():
+            raise ConnectionError("still down")
+
+    breaker.register_probe("local", probe)
+    _fail(breaker, 3)
+    while len(probed) < 2:  # noqa: PLR2004
+        threading.Event().wait(0.005)
+    # Пока проба неуспешна, цепь остаётся открытой
+    assert breaker.state("local", "m") == OPEN
+
+    healthy.set()
+    while breaker.state("local", "m") == OPEN:
+        threading.Event().wait(0.005)
+    assert breaker.state("local", "m") == HALF_OPEN
+    assert set(probed) == {"m"}
+
+
+def test_disabled_breaker_never_opens():
+    breaker = _breaker(enabled=False)
+    _fail(breaker, 5)
+
+    assert breaker.state("local", "m") == CLOSED
+    breaker.check("local", "m")
+
+
+def test_reset_closes_circuits():
+    breaker = _breaker()
+    _fail(breaker, 3)
+
+    breaker.reset()
+
+    assert breaker.state("local", "m") == CLOSED
+
+
+def test_open_circuit_skips_ollama_calls(monkeypatch):
+    breaker = _breaker()
+    monkeypatch.setattr(llm_service, "breaker", breaker)
+    calls = []
+
+    class _DownClient:
+        def chat(self, **kwargs):
+            calls.append(kwargs["model"])
+            raise ConnectionError("Ollama is down")
+
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(_DownClient))
+
+    for _ in range(3):
+        assert OllamaService.get_action_code("привет", "m") == "000"
+    with pytest.raises(CircuitOpenError):
+        OllamaService.generate_response("привет", "m")
+
+    assert calls == ["m"] * 3
+
+
+@pytest.mark.parametrize(
+    "method",
+    ["get_action_code", "get_navigation", "get_product_filters", "get_weather_city"],
+)
+def test_open_circuit_is_not_swallowed_by_navigation_helpers(monkeypatch, method):
+    breaker = _breaker()
+    monkeypatch.setattr(llm_service, "breaker", breaker)
+    _fail(breaker, 3, model="m")
+
+    with pytest.raises(CircuitOpenError):
+        getattr(OllamaService, method)("погода в Казани", "m")
@@ -0,0 +1,284 @@
+import asyncio
+import threading
+
+import pytest
+from api import llm_cache
+from api.llm_admission import AdmissionController
+from api.llm_cache import (
+    SingleFlight,
+    TTLLRUCache,
+    Uncached,
+    intent_cache_key,
+    normalize_question,
+)
+from api.llm_service import OllamaService
+
+pytestmark = pytest.mark.unit
+
+
+def test_normalize_question_folds_case_punctuation_and_yo():
+    assert normalize_question("  Открой, КАТАЛОГ!! ") == "открой каталог"
+    assert normalize_question("Тёмная   тема?") == "темная тема"
+
+
+def test_key_depends_on_prompt_and_model():
+    base = intent_cache_key("navigation", "local", "m", "Каталог", "prompt")
+    assert intent_cache_key("navigation", "local", "m", "каталог!", "prompt") == base
+    assert intent_cache_key("navigation", "local", "m", "каталог", "other") != base
+    assert intent_cache_key("navigation", "local", "m2", "каталог", "prompt") != base
+
+
+def test_cache_expires_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_cache.time, "monotonic", lambda: now[0])
+    cache = TTLLRUCache(maxsize=10, ttl=5)
+
+    cache.set("k", "v")
+    assert cache.get("k") == (True, "v")
+    now[0] += 6
+    assert cache.get("k") == (False, None)
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLLRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+
+
+def test_exceptions_are_not_cached():
+    cache = TTLLRUCache(maxsize=10, ttl=60)
+
+    def broken():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", broken)
+    assert cache.get_or_compute("k", lambda: "ok") == "ok"
+
+
+def test_none_and_fallbacks_are_not_cached():
+    cache = TTLLRUCache(maxsize=10, ttl=60)
+
+    assert cache.get_or_compute("none", lambda: None) is None
+    assert cache.get_or_compute("fallback", lambda: Uncached("000")) == "000"
+
+    assert cache.get_or_compute("none", lambda: "001") == "001"
+    assert cache.get_or_compute("fallback", lambda: "002") == "002"
+    assert cache.stats()["size"] == 2  # noqa: PLR2004
+
+
+def test_disabled_cache_always_computes():
+    cache = TTLLRUCache(maxsize=0, ttl=60)
+    calls = []
+    for _ in range(2):
+        cache.get_or_compute("k", lambda: calls.append(1))
+    assert calls == [1, 1]
+
+
+def test_action_code_is_cached_per_normalized_question(monkeypatch):
+    calls = []
+
+    def fake_chat(model, messages, options=None, **_kwargs):
+        calls.append(model)
+        return "001"
+
+    monkeypatch.setattr(OllamaService, "_chat", staticmethod(fake_chat))
+
+    assert OllamaService.get_action_code("Открой каталог") == "001"
+    assert OllamaService.get_action_code("открой  каталог!") == "001"
+    assert len(calls) == 1
+
+    OllamaService.get_action_code("Открой каталог", model="other")
+    assert calls[1:] == ["other"]
+
+
+def test_unparseable_action_code_is_not_cached(monkeypatch):
+    responses = iter(["не знаю", "004"])
+    monkeypatch.setattr(
+        OllamaService,
+        "_chat",
+        staticmethod(lambda *_a, **_k: next(responses)),
+    )
+
+    assert OllamaService.get_action_code("покажи товары") == "000"
+    assert OllamaService.get_action_code("покажи товары") == "004"
+
+
+def test_failed_navigation_call_is_retried(monkeypatch):
+    responses = iter([ConnectionError("down"), '{"code": "002"}'])
+
+    def fake_chat(*_a, **_k):
+        item = next(responses)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    monkeypatch.setattr(OllamaService, "_chat", staticmethod(fake_chat))
+
+    assert OllamaService.get_navigation("корзина")["code"] == "000"
+    assert OllamaService.get_navigation("корзина")["code"] == "002"
+
+
+def _run_in_threads(target, count):
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(target())) for _ in range(count)
+    ]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def _wait_for_followers(flight, count):
+    while flight.stats()["coalesced"] < count:
+        threading.Event().wait(0.001)
+
+
+def test_single_flight_shares_one_call_between_threads():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait()
+        return "answer"
+
+    callers = 8
+    threads, results = _run_in_threads(lambda: flight.do("k", slow), callers)
+    _wait_for_followers(flight, callers - 1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert results == ["answer"] * callers
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_single_flight_shares_exceptions_and_forgets_them():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def broken():
+        release.wait()
+        raise ConnectionError("down")
+
+    def call():
+        try:
+            flight.do("k", broken)
+        except ConnectionError as exc:
+            errors.append(exc)
+
+    threads, _ = _run_in_threads(call, 3)
+    _wait_for_followers(flight, 2)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(errors) == len(threads)
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_tasks():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    results = await asyncio.gather(*(flight.ado("k", slow) for _ in range(5)))
+
+    assert calls == [1]
+    assert results == ["answer"] * len(results)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_hands_the_call_to_a_follower():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    leader = asyncio.ensure_future(flight.ado("k", slow))
+    await asyncio.sleep(0)
+    followers = [asyncio.ensure_future(flight.ado("k", slow)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    results = await asyncio.gather(*followers)
+
+    assert leader.cancelled()
+    assert results == ["answer"] * len(followers)
+    assert calls == [1, 1]
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_concurrent_chat_questions_share_generation(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def fake_chat(model, messages, options=None, **_kwargs):
+        calls.append(model)
+        release.wait()
+        return "Ответ"
+
+    monkeypatch.setattr(OllamaService, "_chat", staticmethod(fake_chat))
+    llm_cache.inflight.reset_stats()
+
+    threads, results = _run_in_threads(
+        lambda: OllamaService.generate_response("Привет!"),
+        4,
+    )
+    _wait_for_followers(llm_cache.inflight, 3)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["Ответ"] * len(threads)
+
+
+def test_single_flight_followers_do_not_take_admission_slots(monkeypatch):
+    release = threading.Event()
+
+    class _Client:
+        def chat(self, **_kwargs):
+            release.wait()
+            return {"message": {"content": "Ответ"}}
+
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(_Client))
+    controller = AdmissionController(
+        local_limit=1,
+        external_limit=1,
+        max_queue=0,
+        timeout=1.0,
+    )
+    llm_cache.inflight.reset_stats()
+
+    def ask():
+        with controller.admit("user"):
+            return OllamaService.generate_response("Привет!", "m")
+
+    threads, results = _run_in_threads(ask, 3)
+    _wait_for_followers(llm_cache.inflight, 2)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == ["Ответ"] * len(threads)
+    assert controller.stats()["models"]["local:m"]["admitted"] == 1
@@ -0,0 +1,155 @@
+import threading
+
+import pytest
+from api import llm_catalog
+from api.llm_catalog import ModelCatalog, ModelInfo, parse_model_list
+from ollama import ListResponse
+
+pytestmark = pytest.mark.unit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(llm_catalog.time, "monotonic", fake)
+    return fake
+
+
+def _catalog(fetch, **kwargs):
+    return ModelCatalog(
+        fetch, ttl=kwargs.get("ttl", 10), stale_ttl=kwargs.get("stale", 100)
+    )
+
+
+def _counting_fetch(names=("a",)):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [ModelInfo(name=name) for name in names]
+
+    return fetch, calls
+
+
+def test_parse_model_list_reads_ollama_objects_and_dicts():
+    response = ListResponse(
+        models=[
+            {
+                "model": "qwen3:8b",
+                "size": 5_000,
+                "digest": "abc",
+                "details": {
+                    "family": "qwen3",
+                    "parameter_size": "8.2B",
+                    "quantization_level": "Q4_K_M",
+                },
+            },
+        ],
+    )
+    assert parse_model_list(response) == [
+        ModelInfo(
+            name="qwen3:8b",
+            size=5_000,
+            family="qwen3",
+            parameter_size="8.2B",
+            quantization="Q4_K_M",
+            digest="abc",
+        ),
+    ]
+    assert parse_model_list({"models": [{"name": "tiny"}, {}]}) == [ModelInfo("tiny")]
+
+
+def test_fresh_catalog_is_served_from_memory(clock):
+    fetch, calls = _counting_fetch()
+    catalog = _catalog(fetch)
+
+    assert catalog.names() == ["a"]
+    clock.now += 5
+    assert catalog.names() == ["a"]
+    assert calls == [1]
+
+
+def test_stale_catalog_is_served_while_refreshing_in_background(clock, monkeypatch):
+    fetch, calls = _counting_fetch()
+    catalog = _catalog(fetch)
+    catalog.names()
+    started = []
+    monkeypatch.setattr(
+        catalog,
+        "_refresh_in_background",
+        lambda: started.append(1),
+    )
+
+    clock.now += 50
+    assert catalog.names() == ["a"]
+    assert calls == [1]
+    assert started == [1]
+
+
+def test_background_refresh_runs_once(clock):
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait()
+        return [ModelInfo(name="a")]
+
+    catalog = _catalog(fetch)
+    catalog.names()
+    clock.now += 50
+    for _ in range(3):
+        catalog.names()
+    release.set()
+    while catalog.stats()["refreshing"]:
+        threading.Event().wait(0.001)
+
+    assert len(calls) == 1 + 1
+
+
+def test_expired_catalog_is_refreshed_synchronously(clock):
+    names = iter([["a"], ["a", "b"]])
+    catalog = _catalog(lambda: [ModelInfo(name=n) for n in next(names)])
+    catalog.names()
+
+    clock.now += 500
+    assert catalog.names() == ["a", "b"]
+
+
+def test_failed_refresh_keeps_last_catalog_and_backs_off(clock):
+    responses = [[ModelInfo(name="a")]]
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if not responses:
+            raise ConnectionError("down")
+        return responses.pop()
+
+    catalog = _catalog(fetch)
+    catalog.names()
+    clock.now += 500
+
+    assert catalog.names() == ["a"]
+    assert catalog.names() == ["a"]
+    assert len(calls) == 1 + 1
+    assert catalog.stats()["last_error"] == "down"
+
+
+def test_invalidate_forces_reload(clock):
+    fetch, calls = _counting_fetch()
+    catalog = _catalog(fetch)
+    catalog.names()
+
+    catalog.invalidate()
+    assert catalog.info("a") == ModelInfo(name="a")
+    assert calls == [1, 1]
@@ -0,0 +1,118 @@
+import asyncio
+import gc
+import os
+import threading
+import weakref
+
+import pytest
+from api import llm_clients
+from api.llm_clients import ClientRegistry, LoopClientRegistry
+
+pytestmark = pytest.mark.unit
+
+
+def test_registry_reuses_client_per_key():
+    registry = ClientRegistry(object)
+
+    first = registry.get("a")
+    assert registry.get("a") is first
+    assert registry.get("b") is not first
+
+
+def test_registry_builds_once_under_concurrency():
+    built = []
+
+    def factory():
+        built.append(1)
+        return object()
+
+    registry = ClientRegistry(factory)
+    threads = [threading.Thread(target=registry.get, args=("k",)) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(built) == 1
+
+
+def test_registry_drops_clients_after_fork(monkeypatch):
+    registry = ClientRegistry(object)
+    parent_client = registry.get("k")
+
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+
+    assert registry.get("k") is not parent_client
+
+
+def test_ollama_client_is_shared():
+    llm_clients.reset_clients()
+    client = llm_clients.get_ollama_client("http://ollama.test:11434")
+
+    assert llm_clients.get_ollama_client("http://ollama.test:11434") is client
+
+
+async def _close(client):
+    client.closed = True
+
+
+class _Client:
+    closed = False
+
+
+def test_loop_registry_shares_clients_per_loop():
+    registry = LoopClientRegistry(object, _close)
+
+    async def get_twice():
+        return registry.get("k"), registry.get("k")
+
+    first, again = asyncio.run(get_twice())
+    assert first is again
+    assert asyncio.run(get_twice())[0] is not first
+
+
+def test_loop_registry_does_not_keep_closed_loops_alive():
+    # Клиент держит ссылку на свой loop, как пул соединений httpx
+    registry = LoopClientRegistry(asyncio.get_running_loop, _close)
+
+    async def get():
+        return registry.get("k")
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(get())
+    loop.close()
+    loop_ref = weakref.ref(loop)
+    del loop
+
+    asyncio.run(get())
+    gc.collect()
+
+    assert loop_ref() is None
+
+
+def test_loop_registry_closes_clients_of_the_running_loop():
+    registry = LoopClientRegistry(_Client, _close)
+
+    async def use_and_close():
+        client = registry.get("k")
+        await registry.aclose_loop()
+        return client, registry.get("k")
+
+    closed, fresh = asyncio.run(use_and_close())
+
+    assert closed.closed
+    assert fresh is not closed
+    assert not fresh.closed
+
+
+def test_async_ollama_client_pool_is_closed():
+    llm_clients.reset_clients()
+
+    async def use_and_close():
+        client = llm_clients.get_async_ollama_client("http://ollama.test:11434")
+        await llm_clients.aclose_loop_clients()
+        return client
+
+    client = asyncio.run(use_and_close())
+
+    assert client._client.is_closed  # noqa: SLF001
@@ -0,0 +1,90 @@
+import pytest
+from api import llm_prompts, llm_service
+from api.llm_prompts import PromptCache
+from api.llm_service import (
+    build_filters_prompt,
+    filters_messages,
+    intent_key,
+    navigation_messages,
+)
+
+pytestmark = pytest.mark.unit
+
+
+def test_prompt_is_built_once_per_category_set():
+    cache = PromptCache()
+    built = []
+
+    def build(categories):
+        built.append(categories)
+        return build_filters_prompt(categories)
+
+    first = cache.get("filters", build, ["Книги"])
+    again = cache.get("filters", build, ["Книги"])
+    other = cache.get("filters", build, ["Книги", "Одежда"])
+
+    assert again is first
+    assert built == [["Книги"], ["Книги", "Одежда"]]
+    assert other.version != first.version
+    assert first.version == cache.version(first.text)
+
+
+def test_categories_are_loaded_until_invalidated():
+    cache = PromptCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return ["Книги"]
+
+    assert cache.categories(load) == ["Книги"]
+    assert cache.categories(load) == ["Книги"]
+    cache.invalidate()
+    cache.categories(load)
+
+    assert loads == [1, 1]
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_load_racing_invalidation_is_not_kept():
+    cache = PromptCache()
+
+    def load():
+        # Категорию изменили, пока шёл запрос к БД
+        cache.invalidate()
+        return ["старый список"]
+
+    assert cache.categories(load) == ["старый список"]
+    assert cache.cached_categories() is None
+
+
+def test_categories_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_prompts.time, "monotonic", lambda: now[0])
+    cache = PromptCache(ttl=5)
+    cache.categories(lambda: ["Книги"])
+
+    now[0] += 6
+
+    assert cache.cached_categories() is None
+
+
+def test_messages_reuse_the_same_system_prompt(monkeypatch):
+    monkeypatch.setattr(llm_service, "prompt_cache", PromptCache())
+
+    first = navigation_messages("каталог", ["Книги"])[0]["content"]
+    second = navigation_messages("погода", ["Книги"])[0]["content"]
+
+    # Тот же объект — неизменный префикс для кэша промпта модели
+    assert second is first
+
+
+def test_intent_key_follows_prompt_version(monkeypatch):
+    monkeypatch.setattr(llm_service, "prompt_cache", PromptCache())
+
+    def key(categories):
+        messages = filters_messages("дешёвые книги", categories)
+        return intent_key("filters", "local", "m", messages, "дешёвые книги")
+
+    assert key(["Книги"]) == key(["Книги"])
+    assert key(["Книги", "Одежда"]) != key(["Книги"])
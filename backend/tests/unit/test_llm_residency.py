@@ -0,0 +1,130 @@
+from datetime import UTC, datetime
+
+import pytest
+from api import llm_residency, llm_service
+from api.llm_residency import residency_status, warm_model, warmup_prompts
+from api.llm_service import OllamaService, keep_alive_for
+from django.core.management import CommandError, call_command
+
+pytestmark = pytest.mark.unit
+
+
+class RecordingClient:
+    def __init__(self, *, ps_models=(), fail_on=None):
+        self.calls = []
+        self.ps_models = list(ps_models)
+        self.fail_on = fail_on
+
+    def generate(self, **kwargs):
+        self.calls.append(("generate", kwargs))
+        if self.fail_on == "generate":
+            raise ConnectionError("ollama down")
+        return {"response": ""}
+
+    def chat(self, **kwargs):
+        self.calls.append(("chat", kwargs))
+        return {"message": {"content": "0"}}
+
+    def ps(self):
+        return {"models": self.ps_models}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    recording = RecordingClient(
+        ps_models=[
+            {
+                "model": "alibayram/smollm3",
+                "size": 2_000,
+                "size_vram": 1_500,
+                "expires_at": datetime(2030, 1, 1, tzinfo=UTC),
+            },
+            {"model": "qwen3:8b", "size": 9_000, "size_vram": 0},
+        ],
+    )
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(lambda: recording))
+    return recording
+
+
+def test_keep_alive_overrides_per_model(monkeypatch):
+    monkeypatch.setattr(llm_service, "LLM_KEEP_ALIVE", "30m")
+    monkeypatch.setattr(llm_service, "LLM_MODEL_KEEP_ALIVE", {"big": "-1"})
+
+    assert keep_alive_for("small") == "30m"
+    assert keep_alive_for("big") == -1
+
+
+def test_every_chat_call_sends_keep_alive(client):
+    OllamaService.generate_response("привет", model="m")
+
+    _, kwargs = client.calls[-1]
+    assert kwargs["keep_alive"] == keep_alive_for("m")
+
+
+def test_warm_model_loads_then_primes_navigation_last(client, monkeypatch):
+    monkeypatch.setattr(llm_residency, "NAVIGATION_STRATEGY", "combined")
+    result = warm_model("m", categories=["Книги"])
+
+    kinds = [kind for kind, _ in client.calls]
+    assert kinds[0] == "generate"
+    assert kinds[1:] == ["chat"] * len(result["primed"])
+    assert result["primed"][-1] == "navigation"
+    assert result["error"] is None
+    assert all(kwargs["options"]["num_predict"] == 1 for _, kwargs in client.calls[1:])
+    # Системный промпт прогрева совпадает с промптом реального запроса
+    last_messages = client.calls[-1][1]["messages"]
+    assert "Книги" in last_messages[0]["content"]
+
+
+def test_two_step_strategy_primes_action_code_last(monkeypatch):
+    monkeypatch.setattr(llm_residency, "NAVIGATION_STRATEGY", "two_step")
+    assert warmup_prompts(None)[-1][0] == "action_code"
+
+
+def test_warm_model_reports_errors(monkeypatch):
+    failing = RecordingClient(fail_on="generate")
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(lambda: failing))
+
+    result = warm_model("m")
+
+    assert result["error"] == "ollama down"
+    assert result["primed"] == []
+
+
+def test_residency_status_merges_configured_and_loaded(client):
+    status = residency_status(["alibayram/smollm3", "missing"])
+
+    assert [item["model"] for item in status] == [
+        "alibayram/smollm3",
+        "missing",
+        "qwen3:8b",
+    ]
+    assert status[0]["loaded"]
+    assert status[0]["size_vram"] == 1_500  # noqa: PLR2004
+    assert status[0]["expires_at"].startswith("2030-01-01")
+    assert not status[1]["loaded"]
+
+
+def test_warmup_command_prints_status(client, capsys):
+    call_command("warmup_llm", "--status", "--model", "alibayram/smollm3")
+
+    out = capsys.readouterr().out
+    assert "alibayram/smollm3: loaded" in out
+    assert not [kind for kind, _ in client.calls]
+
+
+def test_warmup_command_fails_when_model_cannot_load(monkeypatch):
+    monkeypatch.setattr(
+        llm_residency,
+        "warm_model",
+        lambda model, categories=None: {
+            "model": model,
+            "load_ms": None,
+            "primed": [],
+            "error": "boom",
+        },
+    )
+    monkeypatch.setattr(llm_residency, "_category_names", lambda: None)
+
+    with pytest.raises(CommandError):
+        call_command("warmup_llm", "--model", "m")
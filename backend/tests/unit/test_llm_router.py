@@ -0,0 +1,323 @@
+import asyncio
+import threading
+
+import pytest
+from api import llm_router
+from api.llm_admission import AdmissionController
+from api.llm_breaker import CircuitBreaker, breaker
+from api.llm_router import (
+    KIND_CHAT,
+    KIND_NAVIGATION,
+    LLMRouter,
+    Route,
+    RoutedService,
+)
+from api.llm_service import OllamaService
+
+pytestmark = pytest.mark.unit
+
+
+def _router(**kwargs):
+    options = {
+        "window": 50,
+        "prior_latency": 1.0,
+        "tail_weight": 0.0,
+        "costs": {},
+        "hedging": True,
+        "hedge_percentile": 90.0,
+        "hedge_min_samples": 3,
+        "hedge_min_delay": 0.01,
+        "controller": AdmissionController(
+            local_limit=1,
+            external_limit=1,
+            max_queue=4,
+            timeout=5.0,
+        ),
+        "circuit_breaker": CircuitBreaker(
+            window=4,
+            min_calls=1,
+            failure_rate=0.5,
+            slow_call=60.0,
+            slow_rate=1.0,
+            open_seconds=60.0,
+        ),
+        "workers": 4,
+    }
+    options.update(kwargs)
+    return LLMRouter(**options)
+
+
+def _observe(router, provider, seconds, times=5, kind=KIND_NAVIGATION):
+    for _ in range(times):
+        router.record(provider, kind, seconds, ok=True)
+
+
+LOCAL = Route("local", "m", None)
+EXTERNAL = Route("external", "x", None)
+
+
+def _providers(routes):
+    return [route.provider for route in routes]
+
+
+def test_unobserved_providers_use_prior_and_keep_order():
+    router = _router()
+
+    assert _providers(router.rank(KIND_NAVIGATION, [LOCAL, EXTERNAL])) == [
+        "local",
+        "external",
+    ]
+
+
+def test_lower_latency_wins_per_kind():
+    router = _router()
+    _observe(router, "local", 2.0)
+    _observe(router, "external", 0.5)
+
+    assert _providers(router.rank(KIND_NAVIGATION, [LOCAL, EXTERNAL]))[0] == "external"
+    # Для чата наблюдений нет — остаётся исходный порядок
+    assert _providers(router.rank(KIND_CHAT, [LOCAL, EXTERNAL]))[0] == "local"
+
+
+def test_errors_load_and_cost_are_penalised():
+    router = _router()
+    _observe(router, "local", 0.5)
+    _observe(router, "external", 0.6)
+    assert _providers(router.rank(KIND_NAVIGATION, [LOCAL, EXTERNAL]))[0] == "local"
+
+    with router.controller.slot("local", "m", "user"):
+        # Единственный слот занят — ожидание удваивает оценку
+        assert (
+            _providers(router.rank(KIND_NAVIGATION, [LOCAL, EXTERNAL]))[0] == "external"
+        )
+
+    for _ in range(5):
+        router.record("local", KIND_NAVIGATION, 0.0, ok=False)
+    assert _providers(router.rank(KIND_NAVIGATION, [LOCAL, EXTERNAL]))[0] == "external"
+
+    expensive = _router(costs={"external": 10.0})
+    _observe(expensive, "local", 2.0)
+    _observe(expensive, "external", 0.5)
+    assert _providers(expensive.rank(KIND_NAVIGATION, [LOCAL, EXTERNAL]))[0] == "local"
+
+
+def test_open_circuit_is_skipped():
+    router = _router()
+    _observe(router, "local", 0.1)
+    with (
+        pytest.raises(ConnectionError),
+        router.breaker.guard("local", "m"),
+    ):
+        raise ConnectionError("down")
+
+    assert _providers(router.rank(KIND_NAVIGATION, [LOCAL, EXTERNAL])) == ["external"]
+    # Если недоступны все, порядок не меняется — view ответит 503
+    assert _providers(router.rank(KIND_NAVIGATION, [LOCAL])) == ["local"]
+
+
+def test_hedge_delay_needs_samples_and_has_a_floor():
+    router = _router()
+    assert router.hedge_delay("local", KIND_NAVIGATION) is None
+
+    _observe(router, "local", 0.001, times=3)
+    assert router.hedge_delay("local", KIND_NAVIGATION) == pytest.approx(0.01)
+
+    _observe(router, "local", 0.5, times=30)
+    assert router.hedge_delay("local", KIND_NAVIGATION) == pytest.approx(0.5)
+    assert _router(hedging=False).hedge_delay("local", KIND_NAVIGATION) is None
+
+
+class _Service:
+    def __init__(self, answer, gate=None):
+        self.answer = answer
+        self.gate = gate
+        self.calls = []
+
+    def get_action_code(self, question, model):
+        self.calls.append(model)
+        if self.gate is not None:
+            self.gate.wait(5)
+        return self.answer
+
+
+def _routed(router, primary, secondary):
+    return RoutedService(
+        router,
+        [Route("local", "m", primary), Route("external", "x", secondary)],
+    )
+
+
+def test_fast_primary_is_not_hedged():
+    router = _router()
+    _observe(router, "local", 1.0)
+    primary, secondary = _Service("001"), _Service("002")
+
+    svc = _routed(router, primary, secondary)
+
+    assert svc.get_action_code("q") == "001"
+    assert secondary.calls == []
+    assert svc.routing() == {
+        "requested": "auto",
+        "hedged": False,
+        "answered_by": "local",
+    }
+
+
+def test_slow_primary_is_hedged_and_secondary_wins():
+    router = _router()
+    _observe(router, "local", 0.01)
+    gate = threading.Event()
+    primary, secondary = _Service("001", gate), _Service("002")
+
+    svc = _routed(router, primary, secondary)
+    try:
+        assert svc.get_action_code("q") == "002"
+    finally:
+        gate.set()
+
+    assert secondary.calls == ["x"]
+    assert svc.routing()["answered_by"] == "external"
+    stats = router.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_no_hedge_without_a_free_secondary_slot():
+    router = _router()
+    _observe(router, "local", 0.01)
+    gate = threading.Event()
+    primary, secondary = _Service("001", gate), _Service("002")
+    threading.Timer(0.1, gate.set).start()
+
+    with router.controller.slot("external", "x", "user"):
+        assert _routed(router, primary, secondary).get_action_code("q") == "001"
+
+    assert secondary.calls == []
+    assert router.stats()["hedges"] == 0
+
+
+def test_service_routes_to_external_only_with_api_key(monkeypatch):
+    router = _router()
+
+    monkeypatch.setattr(llm_router, "SBER_API_KEY", "")
+    assert [route.provider for route in router.service(KIND_CHAT, "m").routes] == [
+        "local",
+    ]
+
+    monkeypatch.setattr(llm_router, "SBER_API_KEY", "key")
+    svc = router.service(KIND_CHAT, "m")
+    assert [route.provider for route in svc.routes] == ["local", "external"]
+    assert router.stats()["routed"] == {"local": 2}
+
+
+class _DownClient:
+    def chat(self, **_kwargs):
+        raise ConnectionError("Ollama is down")
+
+
+def test_fallback_answers_are_recorded_as_errors(monkeypatch):
+    router = _router(hedging=False)
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(_DownClient))
+    svc = RoutedService(router, [Route("local", "m", OllamaService)])
+
+    assert svc.get_action_code("где мои заказы") == "000"
+    assert svc.generate_response("привет").startswith("Ошибка")
+    with pytest.raises(ConnectionError):
+        list(svc.stream_response("привет"))
+
+    latency = router.stats()["latency"]
+    assert latency["local:navigation"]["error_rate"] == 1.0
+    assert latency["local:chat"]["error_rate"] == 1.0
+    assert latency["local:chat"]["samples"] == 0
+
+
+def test_failed_primary_is_hedged_at_once(monkeypatch):
+    router = _router()
+    _observe(router, "local", 5.0)
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(_DownClient))
+    secondary = _Service("002")
+
+    svc = _routed(router, OllamaService, secondary)
+
+    # Запасной "000" упавшего провайдера не ответ — не ждём 5 с до хеджа
+    assert svc.get_action_code("где мои заказы") == "002"
+    assert svc.routing() == {
+        "requested": "auto",
+        "hedged": True,
+        "answered_by": "external",
+    }
+    assert router.stats()["hedge_wins"] == 1
+
+
+def test_fallback_is_returned_when_both_calls_fail(monkeypatch):
+    router = _router()
+    _observe(router, "local", 5.0)
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(_DownClient))
+    secondary = _Service(None)
+    secondary.get_action_code = lambda question, model: 1 / 0
+
+    svc = _routed(router, OllamaService, secondary)
+
+    assert svc.get_action_code("где мои заказы") == "000"
+    assert svc.routing()["answered_by"] == "local"
+    assert router.stats()["hedge_wins"] == 0
+
+
+class _AsyncService:
+    def __init__(self, answer, delay=0.0):
+        self.answer = answer
+        self.delay = delay
+        self.cancelled = False
+
+    async def get_action_code(self, question, model):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.answer
+
+
+@pytest.mark.asyncio
+async def test_async_hedge_cancels_the_loser():
+    router = _router()
+    _observe(router, "local", 0.01)
+    primary, secondary = _AsyncService("001", delay=5), _AsyncService("002")
+
+    svc = llm_router.AsyncRoutedService(
+        router,
+        [Route("local", "m", primary), Route("external", "x", secondary)],
+    )
+
+    assert await svc.get_action_code("q") == "002"
+    await asyncio.sleep(0)
+    assert primary.cancelled
+    assert svc.routing()["hedged"]
+    assert router.controller.stats()["models"]["external:x"]["active"] == 0
+
+
+class _AsyncDownService:
+    async def get_action_code(self, question, model):
+        try:
+            with breaker.guard("local", model):
+                raise ConnectionError("Ollama is down")
+        except ConnectionError:
+            return "000"
+
+
+@pytest.mark.asyncio
+async def test_async_failed_primary_is_hedged_at_once():
+    router = _router()
+    _observe(router, "local", 5.0)
+
+    svc = llm_router.AsyncRoutedService(
+        router,
+        [
+            Route("local", "m", _AsyncDownService()),
+            Route("external", "x", _AsyncService("002")),
+        ],
+    )
+
+    assert await svc.get_action_code("q") == "002"
+    assert svc.routing()["answered_by"] == "external"
+    assert router.stats()["hedge_wins"] == 1
@@ -0,0 +1,66 @@
+import pytest
+from api import llm_rules
+from api.llm_rules import TRIGGER_RULES, RuleMatch, match_intent
+from api.llm_service import ACTIONS_MAP
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.mark.parametrize(
+    ("question", "code"),
+    [
+        ("Главная", "001"),
+        ("перейди в личный кабинет", "002"),
+        ("о нас", "003"),
+        ("открой каталог", "004"),
+        ("добавить товар", "005"),
+        ("админка", "006"),
+        ("Какая погода сегодня?", "007"),
+        ("Включи тёмную тему", "100"),
+        ("светлый режим, пожалуйста", "101"),
+        ("сверни ассистента", "200"),
+        ("Очистить чат!", "201"),
+    ],
+)
+def test_obvious_commands_are_matched(question, code):
+    assert match_intent(question) == RuleMatch(code=code)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Привет",
+        "что такое темная тема",
+        "товары до 1000",
+        "удали товар",
+        "расскажи анекдот про каталог",
+    ],
+)
+def test_uncertain_questions_fall_back_to_llm(question):
+    assert match_intent(question) is None
+
+
+@pytest.mark.parametrize(
+    "question",
+    ["покажи новые товары", "новые объявления", "новые продукты"],
+)
+def test_browsing_new_products_is_not_creation(question):
+    match = match_intent(question)
+    assert match is None or match.code != "005"
+
+
+def test_weather_keeps_city_words():
+    match = match_intent("погода в Казани")
+
+    assert match.code == "007"
+    assert match.needs_city
+    assert match.city_words == ("казани",)
+
+
+def test_rules_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(llm_rules, "LLM_RULES_ENABLED", False)
+    assert match_intent("открой каталог") is None
+
+
+def test_every_rule_targets_known_action():
+    assert set(TRIGGER_RULES) <= set(ACTIONS_MAP) - {"000"}
@@ -0,0 +1,265 @@
+import time
+
+import numpy as np
+import pytest
+from api import llm_service
+from api.llm_semantic_cache import (
+    HashingEmbedder,
+    OllamaEmbedder,
+    SemanticCache,
+    VectorIndex,
+)
+from api.llm_service import OllamaService
+
+pytestmark = pytest.mark.unit
+
+
+class _Embedder:
+    """Фиксированные векторы по тексту вопроса."""
+
+    name = "stub:3"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        return np.asarray([self.vectors[text] for text in texts], dtype=np.float32)
+
+    async def aembed(self, texts):
+        return self.embed(texts)
+
+
+VECTORS = {
+    "как добавить товар": [1.0, 0.0, 0.0],
+    "как мне добавить товар?": [0.99, 0.1, 0.0],
+    "какая погода": [0.0, 1.0, 0.0],
+    "где корзина": [0.0, 0.0, 1.0],
+}
+
+
+def _cache(**kwargs):
+    options = {
+        "embedder": _Embedder(VECTORS),
+        "threshold": 0.9,
+        "capacity": 8,
+        "ttl": 60,
+        "top_k": 2,
+    }
+    options.update(kwargs)
+    return SemanticCache(**options)
+
+
+def test_similar_question_hits_and_different_misses():
+    cache = _cache()
+    cache.lookup("local", "m", "как добавить товар").store("Через кабинет")
+
+    assert cache.lookup("local", "m", "как мне добавить товар?").answer == (
+        "Через кабинет"
+    )
+    assert cache.lookup("local", "m", "какая погода").answer is None
+    stats = cache.stats()["namespaces"]["local:m"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2  # noqa: PLR2004
+
+
+def test_namespaces_are_per_provider_and_model():
+    cache = _cache()
+    cache.lookup("local", "m", "как добавить товар").store("local answer")
+
+    assert cache.lookup("local", "other", "как добавить товар").answer is None
+    assert cache.lookup("external", "m", "как добавить товар").answer is None
+
+
+def test_prompt_change_starts_a_new_namespace():
+    assert _cache(prompt="a").namespace("local", "m") != _cache(
+        prompt="b",
+    ).namespace("local", "m")
+
+
+def test_expired_entries_are_ignored(monkeypatch):
+    cache = _cache(ttl=10)
+    cache.lookup("local", "m", "как добавить товар").store("answer")
+
+    later = time.time() + 11
+    monkeypatch.setattr(time, "time", lambda: later)
+
+    assert cache.lookup("local", "m", "как добавить товар").answer is None
+    assert cache.stats()["namespaces"]["local:m"]["size"] == 0
+
+
+def test_full_index_evicts_least_recently_used():
+    cache = _cache(capacity=2)
+    cache.lookup("local", "m", "как добавить товар").store("goods")
+    cache.lookup("local", "m", "какая погода").store("weather")
+    # Обращение к «товару» делает «погоду» самой старой
+    assert cache.lookup("local", "m", "как добавить товар").answer == "goods"
+
+    cache.lookup("local", "m", "где корзина").store("cart")
+
+    assert cache.lookup("local", "m", "какая погода").answer is None
+    assert cache.lookup("local", "m", "как добавить товар").answer == "goods"
+    assert cache.lookup("local", "m", "где корзина").answer == "cart"
+
+
+def test_same_question_overwrites_its_slot():
+    cache = _cache()
+    cache.lookup("local", "m", "как добавить товар").store("old")
+    cache.lookup("local", "m", "как добавить товар").store("new")
+
+    assert cache.lookup("local", "m", "как добавить товар").answer == "new"
+    assert cache.stats()["namespaces"]["local:m"]["size"] == 1
+
+
+def test_batched_search_returns_top_k_in_order():
+    index = VectorIndex("local:m:x", 3, 4)
+    for text, answer in [("как добавить товар", "a"), ("какая погода", "b")]:
+        vector = np.asarray(VECTORS[text], dtype=np.float32)
+        index.put(vector, text, answer, ttl=60)
+
+    slots, scores = index.search(np.eye(3, dtype=np.float32), k=2)
+
+    assert slots.shape == (3, 2)
+    assert [index.answers[slot] for slot in slots[:2, 0]] == ["a", "b"]
+    assert scores[2, 0] == 0.0
+    assert np.isneginf(scores[:, 1]).sum() == 0
+
+
+def test_index_is_reloaded_from_disk(tmp_path):
+    cache = _cache(directory=tmp_path)
+    cache.lookup("local", "m", "как добавить товар").store("Через кабинет")
+
+    reloaded = _cache(directory=tmp_path)
+
+    assert reloaded.lookup("local", "m", "как мне добавить товар?").answer == (
+        "Через кабинет"
+    )
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+
+
+def test_log_is_compacted(tmp_path):
+    cache = _cache(directory=tmp_path, capacity=1)
+    for answer in range(6):
+        cache.lookup("local", "m", "как добавить товар").store(str(answer))
+
+    log_file = next(tmp_path.glob("*.jsonl"))
+    assert len(log_file.read_text(encoding="utf-8").splitlines()) <= 5  # noqa: PLR2004
+    reloaded = _cache(directory=tmp_path, capacity=1)
+    assert reloaded.lookup("local", "m", "как добавить товар").answer == "5"
+
+
+def test_purge_by_model_removes_files(tmp_path):
+    cache = _cache(directory=tmp_path)
+    cache.lookup("local", "m", "как добавить товар").store("m answer")
+    cache.lookup("local", "other", "как добавить товар").store("other answer")
+
+    # Пространство имён только на диске — новый процесс его ещё не загрузил
+    fresh = _cache(directory=tmp_path)
+    assert fresh.purge("m") == 1
+
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+    assert cache.purge("m") == 1
+    assert cache.lookup("local", "m", "как добавить товар").answer is None
+    assert cache.lookup("local", "other", "как добавить товар").answer == "other answer"
+    # Поиск после очистки заново создал пространство имён «m»
+    assert cache.purge() == 2  # noqa: PLR2004
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_embedding_failure_is_a_miss():
+    class _Down:
+        name = "down"
+
+        def embed(self, texts):
+            raise ConnectionError("no embedding model")
+
+    cache = _cache(embedder=_Down())
+    lookup = cache.lookup("local", "m", "вопрос")
+    lookup.store("answer")
+
+    assert lookup.answer is None
+    assert cache.stats()["errors"] == 1
+    assert cache.stats()["namespaces"] == {}
+
+
+def test_disabled_cache_does_not_embed():
+    embedder = _Embedder(VECTORS)
+    cache = _cache(embedder=embedder, enabled=False)
+
+    cache.lookup("local", "m", "как добавить товар").store("answer")
+
+    assert embedder.calls == 0
+
+
+def test_hashing_embedder_matches_reworded_questions():
+    vectors = HashingEmbedder().embed(
+        ["Как добавить товар?", "как добавить  товар", "какая погода в Москве"],
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    assert vectors[0] @ vectors[1] == pytest.approx(1.0)
+    assert vectors[0] @ vectors[2] < 0.5  # noqa: PLR2004
+
+
+def test_ollama_embedder_uses_embed_endpoint():
+    calls = []
+
+    class _Client:
+        def embed(self, model, input):  # noqa: A002
+            calls.append((model, input))
+            return {"embeddings": [[0.5, 0.5]]}
+
+    embedder = OllamaEmbedder("nomic-embed-text", _Client, _Client)
+
+    assert embedder.embed(["q"]).shape == (1, 2)
+    assert calls == [("nomic-embed-text", ["q"])]
+    assert embedder.name == "ollama:nomic-embed-text"
+
+
+def test_generate_response_uses_cached_answer(monkeypatch):
+    cache = _cache()
+    monkeypatch.setattr(llm_service, "semantic_cache", cache)
+    calls = []
+
+    def fake_chat(model, messages, options=None, **_kwargs):
+        calls.append(model)
+        return "Через кабинет"
+
+    monkeypatch.setattr(OllamaService, "_chat", staticmethod(fake_chat))
+
+    assert OllamaService.generate_response("как добавить товар", "m") == (
+        "Через кабинет"
+    )
+    assert OllamaService.generate_response("как мне добавить товар?", "m") == (
+        "Через кабинет"
+    )
+    assert calls == ["m"]
+
+
+def test_stream_is_stored_only_when_complete(monkeypatch):
+    cache = _cache()
+    monkeypatch.setattr(llm_service, "semantic_cache", cache)
+
+    class _Client:
+        def chat(self, **kwargs):
+            return iter(
+                [
+                    {"message": {"content": "Через "}},
+                    {"message": {"content": "кабинет"}},
+                ]
+            )
+
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(_Client))
+
+    stream = OllamaService.stream_response("как добавить товар", "m")
+    next(stream)
+    stream.close()
+    assert cache.lookup("local", "m", "как добавить товар").answer is None
+
+    assert "".join(OllamaService.stream_response("как добавить товар", "m")) == (
+        "Через кабинет"
+    )
+    assert list(OllamaService.stream_response("как добавить товар", "m")) == [
+        "Через кабинет",
+    ]
@@ -1,9 +1,34 @@
 import pytest
-from api.llm_service import OllamaService
+from api import llm_service
+from api.llm_service import (
+    ACTIONS_MAP,
+    FILTER_FIELD_TYPES,
+    ExternalLLMService,
+    ExternalLLMServiceError,
+    OllamaService,
+    ThinkTagFilter,
+    action_code_ready,
+    build_completion_kwargs,
+    extract_json_object,
+    filter_think_stream,
+    json_object_ready,
+    navigation_schema,
+    parse_product_filters,
+    product_filters_schema,
+    read_until,
+    validate_navigation_result,
+)
+from api.models import Product
 
 pytestmark = pytest.mark.unit
 
 
+def _reply(content, kwargs):
+    """Ответ DummyClient.chat; при stream=True — поток из одного чанка."""
+    response = {"message": {"content": content}}
+    return iter([response]) if kwargs.get("stream") else response
+
+
 def test_clean_response_strips_think_block():
     text = "Hello <think>secret</think> world"
     assert OllamaService.clean_response(text) == "Hello  world".strip()
@@ -11,8 +36,8 @@ def test_clean_response_strips_think_block():
 
 def test_get_action_code_extracts_first_3_digits(monkeypatch):
     class DummyClient:
-        def chat(self, **_kwargs):
-            return {"message": {"content": "Some text 004 and more"}}
+        def chat(self, **kwargs):
+            return _reply("Some text 004 and more", kwargs)
 
     def _client_factory():
         return DummyClient()
@@ -28,8 +53,8 @@ def test_get_action_code_extracts_first_3_digits(monkeypatch):
 
 def test_get_action_code_falls_back_on_unknown_code(monkeypatch):
     class DummyClient:
-        def chat(self, **_kwargs):
-            return {"message": {"content": "999"}}
+        def chat(self, **kwargs):
+            return _reply("999", kwargs)
 
     def _client_factory():
         return DummyClient()
@@ -45,13 +70,11 @@ def test_get_action_code_falls_back_on_unknown_code(monkeypatch):
 
 def test_get_product_filters_parses_json_from_response(monkeypatch):
     class DummyClient:
-        def chat(self, **_kwargs):
-            return {
-                "message": {
-                    "content": "<think>..</think>"
-                    ' {"max_price": 1000, "in_stock": true}',
-                },
-            }
+        def chat(self, **kwargs):
+            return _reply(
+                '<think>..</think> {"max_price": 1000, "in_stock": true}',
+                kwargs,
+            )
 
     def _client_factory():
         return DummyClient()
@@ -70,8 +93,8 @@ def test_get_product_filters_parses_json_from_response(monkeypatch):
 
 def test_get_product_filters_returns_empty_on_invalid_json(monkeypatch):
     class DummyClient:
-        def chat(self, **_kwargs):
-            return {"message": {"content": "{invalid json"}}
+        def chat(self, **kwargs):
+            return _reply("{invalid json", kwargs)
 
     def _client_factory():
         return DummyClient()
@@ -87,8 +110,8 @@ def test_get_product_filters_returns_empty_on_invalid_json(monkeypatch):
 
 def test_get_weather_city_defaults_to_moscow_when_no_json(monkeypatch):
     class DummyClient:
-        def chat(self, **_kwargs):
-            return {"message": {"content": "город не указан"}}
+        def chat(self, **kwargs):
+            return _reply("город не указан", kwargs)
 
     def _client_factory():
         return DummyClient()
@@ -104,8 +127,8 @@ def test_get_weather_city_defaults_to_moscow_when_no_json(monkeypatch):
 
 def test_get_weather_city_parses_city_from_json(monkeypatch):
     class DummyClient:
-        def chat(self, **_kwargs):
-            return {"message": {"content": '{"city": "Казань"}'}}
+        def chat(self, **kwargs):
+            return _reply('{"city": "Казань"}', kwargs)
 
     def _client_factory():
         return DummyClient()
@@ -117,3 +140,286 @@ def test_get_weather_city_parses_city_from_json(monkeypatch):
     )
 
     assert OllamaService.get_weather_city("погода в казани") == "Казань"
+
+
+def test_think_filter_strips_tags_split_across_chunks():
+    chunks = ["  <thi", "nk>hidden", " stuff</th", "ink>\nHel", "lo <", "b>world"]
+    assert "".join(filter_think_stream(iter(chunks))) == "Hello <b>world"
+
+
+def test_think_filter_drops_unterminated_think_block():
+    think_filter = ThinkTagFilter()
+    assert think_filter.feed("Answer <think>never closed") == "Answer "
+    assert think_filter.flush() == ""
+
+
+def test_stream_response_yields_cleaned_tokens(monkeypatch):
+    class DummyClient:
+        def chat(self, **kwargs):
+            assert kwargs["stream"] is True
+            for part in ("<think>plan</think>", "При", "вет", "!"):
+                yield {"message": {"content": part}}
+
+    monkeypatch.setattr(
+        OllamaService,
+        "get_client",
+        staticmethod(DummyClient),
+    )
+
+    assert list(OllamaService.stream_response("hi")) == ["При", "вет", "!"]
+
+
+def test_external_stream_response_wraps_errors(monkeypatch):
+    def _broken_client():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(llm_service, "_get_sber_client", _broken_client)
+
+    with pytest.raises(ExternalLLMServiceError, match="boom"):
+        list(ExternalLLMService.stream_response("hi"))
+
+
+def test_extract_json_object_handles_nested_objects():
+    raw = 'Ответ: {"code": "004", "filters": {"max_price": 500}, "city": null} ok'
+    assert extract_json_object(raw) == {
+        "code": "004",
+        "filters": {"max_price": 500},
+        "city": None,
+    }
+    assert extract_json_object("{broken {also} no json") is None
+
+
+def test_validate_navigation_result_sanitizes_filters():
+    result = validate_navigation_result(
+        {
+            "code": "004",
+            "filters": {"max_price": 1000, "in_stock": "yes", "color": "red"},
+            "city": "Казань",
+        },
+    )
+    assert result == {"code": "004", "filters": {"max_price": 1000}, "city": None}
+
+
+def test_validate_navigation_result_rejects_unknown_code():
+    assert validate_navigation_result({"code": "999"}) is None
+    assert validate_navigation_result({"code": 7})["city"] == "Москва"
+
+
+def test_get_navigation_single_call(monkeypatch):
+    calls = []
+
+    class DummyClient:
+        def chat(self, **kwargs):
+            calls.append(kwargs)
+            return _reply('{"code": "007", "city": "Казань"}', kwargs)
+
+    monkeypatch.setattr(
+        OllamaService,
+        "get_client",
+        staticmethod(DummyClient),
+    )
+
+    assert OllamaService.get_navigation("погода в казани") == {
+        "code": "007",
+        "filters": {},
+        "city": "Казань",
+    }
+    assert len(calls) == 1
+
+
+def test_action_code_uses_schema_and_short_output(monkeypatch):
+    calls = []
+
+    class DummyClient:
+        def chat(self, **kwargs):
+            calls.append(kwargs)
+            return _reply('{"code": "004"}', kwargs)
+
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(DummyClient))
+
+    assert OllamaService.get_action_code("каталог") == "004"
+    schema = calls[0]["format"]
+    assert schema["properties"]["code"]["enum"] == list(ACTIONS_MAP)
+    assert (
+        calls[0]["options"]["num_predict"] == llm_service.LLM_MAX_TOKENS["action_code"]
+    )
+
+
+def test_structured_output_can_be_disabled(monkeypatch):
+    calls = []
+
+    class DummyClient:
+        def chat(self, **kwargs):
+            calls.append(kwargs)
+            return _reply("<think>хм</think> 101", kwargs)
+
+    monkeypatch.setattr(llm_service, "LLM_STRUCTURED_OUTPUT", False)
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(DummyClient))
+
+    assert OllamaService.get_action_code("светлая тема") == "101"
+    assert calls[0]["format"] is None
+    # Без грамматики ответ не обрезается — модель может начать с <think>
+    assert "num_predict" not in calls[0]["options"]
+
+
+def test_filters_schema_follows_product_filter():
+    schema = product_filters_schema(["Книги", "Игры"])
+
+    assert set(schema["properties"]) == set(FILTER_FIELD_TYPES)
+    assert set(schema["properties"]["status"]["enum"]) == {
+        value for value, _ in Product.STATUS_CHOICES
+    }
+    assert schema["properties"]["min_price"] == {"type": "number"}
+    assert schema["properties"]["in_stock"] == {"type": "boolean"}
+    assert schema["properties"]["category_name"]["enum"] == ["Книги", "Игры"]
+    assert navigation_schema()["properties"]["filters"]["properties"][
+        "category_name"
+    ] == {"type": "string"}
+
+
+def test_parse_product_filters_drops_invalid_fields():
+    raw = '{"max_price": "дёшево", "min_price": 10, "status": "sold", "x": 1}'
+    assert parse_product_filters(raw) == {"min_price": 10}
+
+
+def test_external_completion_kwargs_use_response_format():
+    schema = {"type": "object"}
+
+    kwargs = build_completion_kwargs(
+        "m",
+        [],
+        {"temperature": 0.1, "num_predict": 16},
+        schema,
+    )
+
+    assert kwargs["max_tokens"] == 16  # noqa: PLR2004
+    assert kwargs["response_format"] == {
+        "type": "json_schema",
+        "json_schema": {"name": "response", "schema": schema},
+    }
+    assert "response_format" not in build_completion_kwargs("m", [], None)
+
+
+class _Generation:
+    """Поток Ollama: отдаёт чанки и бесконечно продолжает «рассуждать»."""
+
+    def __init__(self, *chunks):
+        self.chunks = chunks
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self.chunks[self.sent] if self.sent < len(self.chunks) else " ещё"
+        self.sent += 1
+        return {"message": {"content": chunk}}
+
+    def close(self):
+        self.closed = True
+
+
+def test_action_code_stops_generation_after_code(monkeypatch):
+    generation = _Generation("<think>код 001?</think>", "Конечно! Код", " 00", "4", ".")
+    calls = []
+
+    class DummyClient:
+        def chat(self, **kwargs):
+            calls.append(kwargs)
+            return generation
+
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(DummyClient))
+
+    assert OllamaService.get_action_code("каталог") == "004"
+    assert calls[0]["stream"] is True
+    assert generation.closed
+    assert generation.sent == 5  # noqa: PLR2004
+
+
+def test_early_exit_can_be_disabled(monkeypatch):
+    calls = []
+
+    class DummyClient:
+        def chat(self, **kwargs):
+            calls.append(kwargs)
+            return _reply("004", kwargs)
+
+    monkeypatch.setattr(llm_service, "LLM_EARLY_EXIT", False)
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(DummyClient))
+
+    assert OllamaService.get_action_code("каталог") == "004"
+    assert calls[0]["stream"] is False
+
+
+def test_action_code_ready_waits_for_complete_number():
+    assert not action_code_ready("Код 00", "00")
+    assert not action_code_ready("Код 004", "4")
+    assert action_code_ready("Код 004.", ".")
+    # 999 и 1004 — не коды ACTIONS_MAP
+    assert not action_code_ready("999 1004 ", " ")
+
+
+def test_json_object_ready_waits_for_outer_object():
+    partial = '{"code": "004", "filters": {"max_price": 500}'
+    assert not json_object_ready(partial, "}")
+    assert not json_object_ready('{"city": "}"', '}"')
+    assert json_object_ready(partial + "}", "}")
+    assert json_object_ready('Ответ: {bad} {"city": "Казань"}', "}")
+
+
+def test_navigation_stops_after_balanced_object(monkeypatch):
+    generation = _Generation('{"code": "007", ', '"filters": {}, ', '"city": "Казань"}')
+
+    class DummyClient:
+        def chat(self, **_kwargs):
+            return generation
+
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(DummyClient))
+
+    assert OllamaService.get_navigation("погода в казани")["city"] == "Казань"
+    assert generation.sent == 3  # noqa: PLR2004
+    assert generation.closed
+
+
+def test_read_until_returns_whole_answer_when_never_ready():
+    generation = iter([{"message": {"content": c}} for c in ("при", "вет")])
+
+    text = read_until(generation, llm_service.ollama_text, action_code_ready)
+
+    assert text == "привет"
+
+
+def test_external_action_code_closes_stream(monkeypatch):
+    class Chunk:
+        def __init__(self, content):
+            delta = type("Delta", (), {"content": content})
+            self.choices = [type("Choice", (), {"delta": delta})]
+
+    chunks = iter(
+        [Chunk("Код: 10"), Chunk("1"), Chunk(" — светлая тема"), Chunk(" Готово!")]
+    )
+
+    class Stream:
+        closed = False
+
+        def __iter__(self):
+            return chunks
+
+        def close(self):
+            Stream.closed = True
+
+    class Completions:
+        @staticmethod
+        def create(**kwargs):
+            assert kwargs["stream"] is True
+            return Stream()
+
+    client = type(
+        "Client", (), {"chat": type("Chat", (), {"completions": Completions})}
+    )
+    monkeypatch.setattr(llm_service, "_get_sber_client", lambda: client)
+
+    assert ExternalLLMService.get_action_code("светлая тема") == "101"
+    assert Stream.closed
+    assert next(chunks).choices[0].delta.content == " Готово!"
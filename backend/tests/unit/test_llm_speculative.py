@@ -0,0 +1,191 @@
+import asyncio
+import threading
+
+import pytest
+from api.llm_admission import AdmissionController
+from api.llm_speculative import NO_SPECULATION, Speculator
+
+pytestmark = pytest.mark.unit
+
+
+def _speculator(policy="always", **kwargs):
+    controller = AdmissionController(
+        local_limit=2,
+        external_limit=2,
+        max_queue=4,
+        timeout=5.0,
+    )
+    options = {"min_words": 4, "max_load": 0.5, "workers": 2}
+    options.update(kwargs)
+    return Speculator(policy=policy, controller=controller, **options)
+
+
+class _StreamingService:
+    """Отдаёт фрагменты ответа; после первого ждёт разрешения продолжить."""
+
+    def __init__(self, chunks=("При", "вет")):
+        self.chunks = chunks
+        self.proceed = threading.Event()
+        self.first_sent = threading.Event()
+        self.closed = threading.Event()
+
+    def stream_response(self, question, model):
+        try:
+            for index, chunk in enumerate(self.chunks):
+                if index:
+                    self.proceed.wait(5)
+                yield chunk
+                self.first_sent.set()
+        finally:
+            self.closed.set()
+
+
+def _active(speculator, key="local:m"):
+    return speculator.controller.stats()["models"][key]["active"]
+
+
+def _wait_released(speculator):
+    while _active(speculator):
+        threading.Event().wait(0.001)
+
+
+def test_off_policy_never_speculates():
+    speculator = _speculator("off")
+
+    assert speculator.start(_StreamingService(), "q", "m", "local") is NO_SPECULATION
+    assert speculator.stats()["declined"] == 0
+
+
+def test_unknown_policy_falls_back_to_off():
+    assert _speculator("sometimes").policy == "off"
+
+
+def test_long_policy_skips_short_questions():
+    speculator = _speculator("long")
+    svc = _StreamingService()
+    svc.proceed.set()
+
+    assert speculator.start(svc, "тёмная тема", "m", "local") is NO_SPECULATION
+    with speculator.start(svc, "расскажи мне что-нибудь интересное", "m", "local") as s:
+        assert s.started
+        s.result()
+
+    stats = speculator.stats()
+    assert stats["declined"] == 1
+    assert stats["started"] == 1
+
+
+def test_low_load_policy_checks_admission_load():
+    speculator = _speculator("low_load")
+    svc = _StreamingService()
+    svc.proceed.set()
+
+    with speculator.controller.slot("local", "m", "user"):
+        # 1 из 2 слотов занят — нагрузка 0.5, спекуляция разрешена
+        speculation = speculator.start(svc, "q", "m", "local")
+        assert speculation.started
+        speculation.result()
+        with speculator.controller.slot("local", "m", "user"):
+            assert speculator.start(svc, "q", "m", "local") is NO_SPECULATION
+
+    assert speculator.stats()["declined"] == 1
+
+
+def test_speculation_never_queues_for_a_slot():
+    speculator = _speculator()
+
+    with (
+        speculator.controller.slot("local", "m", "user"),
+        speculator.controller.slot("local", "m", "user"),
+    ):
+        assert (
+            speculator.start(_StreamingService(), "q", "m", "local") is NO_SPECULATION
+        )
+
+    assert speculator.stats()["no_slot"] == 1
+
+
+def test_used_speculation_returns_answer_and_frees_slot():
+    speculator = _speculator()
+    svc = _StreamingService()
+    svc.proceed.set()
+
+    with speculator.start(svc, "q", "m", "local") as speculation:
+        answer = speculation.result()
+
+    assert answer == "Привет"
+    assert _active(speculator) == 0
+    stats = speculator.stats()
+    assert stats["used"] == 1
+    assert stats["cancelled"] == 0
+    assert stats["saved_ms"] >= 0
+
+
+def test_leaving_without_result_cancels_and_closes_stream():
+    speculator = _speculator()
+    svc = _StreamingService()
+
+    with speculator.start(svc, "q", "m", "local"):
+        assert svc.first_sent.wait(5)
+    svc.proceed.set()
+
+    assert svc.closed.wait(5)
+    _wait_released(speculator)
+    stats = speculator.stats()
+    assert stats["cancelled"] == 1
+    assert stats["used"] == 0
+    # Прерванная генерация не искажает оценку времени обслуживания
+    assert speculator.controller.stats()["models"]["local:m"]["service_avg_ms"] == 0
+
+
+def test_failed_speculation_returns_none():
+    class BrokenService:
+        @staticmethod
+        def stream_response(question, model):
+            raise ConnectionError("ollama is down")
+
+    speculator = _speculator()
+
+    with speculator.start(BrokenService(), "q", "m", "local") as speculation:
+        assert speculation.result() is None
+
+    assert speculator.stats()["failed"] == 1
+    assert _active(speculator) == 0
+
+
+class _AsyncService:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    async def generate_response(self, question, model, *, coalesce=True):
+        self.calls.append(coalesce)
+        await asyncio.sleep(self.delay)
+        return f"ответ на {question}"
+
+
+@pytest.mark.asyncio
+async def test_async_speculation_is_not_coalesced():
+    speculator = _speculator()
+    svc = _AsyncService()
+
+    with speculator.astart(svc, "q", "m", "local") as speculation:
+        answer = await speculation.aresult()
+
+    assert answer == "ответ на q"
+    assert svc.calls == [False]
+    assert speculator.stats()["used"] == 1
+    assert _active(speculator) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_speculation_is_cancelled_on_exit():
+    speculator = _speculator()
+    svc = _AsyncService(delay=5)
+
+    with speculator.astart(svc, "q", "m", "local"):
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+
+    assert speculator.stats()["cancelled"] == 1
+    assert _active(speculator) == 0
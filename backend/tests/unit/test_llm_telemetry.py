@@ -0,0 +1,165 @@
+from types import SimpleNamespace
+
+import pytest
+from api import llm_service
+from api.llm_service import ExternalLLMService, OllamaService
+from api.llm_telemetry import (
+    SECONDS_BUCKETS,
+    Histogram,
+    Telemetry,
+    ollama_usage,
+    openai_usage,
+)
+
+pytestmark = pytest.mark.unit
+
+OLLAMA_RESPONSE = {
+    "message": {"content": "004"},
+    "load_duration": 500_000_000,
+    "prompt_eval_count": 120,
+    "prompt_eval_duration": 200_000_000,
+    "eval_count": 40,
+    "eval_duration": 800_000_000,
+}
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(SECONDS_BUCKETS)
+    for value in [0.2] * 90 + [3.0] * 10:
+        histogram.observe(value)
+
+    stats = histogram.stats()
+
+    assert stats["count"] == 100  # noqa: PLR2004
+    assert stats["buckets"]["0.25"] == 90  # noqa: PLR2004
+    assert stats["buckets"]["+Inf"] == 100  # noqa: PLR2004
+    assert 0.1 < stats["p50"] <= 0.25  # noqa: PLR2004
+    assert 2.5 < stats["p95"] <= 3.0  # noqa: PLR2004
+    assert stats["avg"] == pytest.approx(0.48)
+
+
+def test_histogram_overflow_bucket_reports_max():
+    histogram = Histogram((1.0,))
+    histogram.observe(7.0)
+
+    assert histogram.quantile(0.99) == 7.0  # noqa: PLR2004
+
+
+def test_ollama_usage_converts_nanoseconds():
+    usage = ollama_usage(OLLAMA_RESPONSE)
+
+    assert usage == {
+        "load": pytest.approx(0.5),
+        "prompt_tokens": 120,
+        "prompt_eval": pytest.approx(0.2),
+        "completion_tokens": 40,
+        "eval": pytest.approx(0.8),
+    }
+    assert ollama_usage({"message": {"content": "x"}}) == {}
+
+
+def test_openai_usage_reads_token_counts():
+    response = SimpleNamespace(
+        usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3),
+    )
+
+    assert openai_usage(response) == {"prompt_tokens": 12, "completion_tokens": 3}
+    assert openai_usage(SimpleNamespace(usage=None)) == {}
+
+
+def test_call_is_aggregated_per_mode_provider_and_model():
+    telemetry = Telemetry()
+
+    with telemetry.call("action_code", "local", "m") as call:
+        call.set_usage(ollama_usage(OLLAMA_RESPONSE))
+    with pytest.raises(ConnectionError), telemetry.call("action_code", "local", "m"):
+        raise ConnectionError("down")
+
+    stats = telemetry.stats()["calls"]["action_code"]["local:m"]
+    assert stats["calls"] == 2  # noqa: PLR2004
+    assert stats["errors"] == 1
+    assert stats["load_seconds"]["sum"] == pytest.approx(0.5)
+    assert stats["completion_tokens"]["sum"] == 40  # noqa: PLR2004
+    # eval_count / eval_duration
+    assert stats["tokens_per_second"]["sum"] == pytest.approx(50.0)
+
+
+def test_interrupted_stream_is_not_recorded():
+    telemetry = Telemetry()
+
+    with pytest.raises(GeneratorExit), telemetry.call("chat", "local", "m"):
+        raise GeneratorExit
+
+    assert telemetry.stats()["calls"] == {}
+
+
+def test_streamed_chunks_stand_in_for_token_counts():
+    telemetry = Telemetry()
+
+    with telemetry.call("chat", "external", "x") as call:
+        read = call.reader(lambda chunk: chunk, lambda _chunk: {})
+        assert [read(chunk) for chunk in ["", "a", "b"]] == ["", "a", "b"]
+
+    stats = telemetry.stats()["calls"]["chat"]["external:x"]
+    assert stats["completion_tokens"]["sum"] == 2  # noqa: PLR2004
+    assert stats["first_chunk_seconds"]["count"] == 1
+
+
+def test_collect_only_in_debug_mode():
+    quiet = Telemetry()
+    with quiet.collect() as calls, quiet.call("chat", "local", "m"):
+        pass
+    assert calls is None
+
+    debug = Telemetry(debug=True)
+    with debug.collect() as calls:
+        debug.record_wait("local", "m", 0.25)
+        with debug.call("chat", "local", "m") as call:
+            call.set_usage({"prompt_tokens": 5})
+    with debug.call("chat", "local", "m"):
+        pass
+
+    assert [entry["mode"] for entry in calls] == ["queue", "chat"]
+    assert calls[0]["wait_ms"] == 250.0  # noqa: PLR2004
+    assert calls[1]["prompt_tokens"] == 5  # noqa: PLR2004
+    assert "wall_ms" in calls[1]
+    assert debug.stats()["queue_wait_seconds"]["local:m"]["count"] == 1
+
+
+def test_ollama_chat_records_provider_breakdown(monkeypatch):
+    telemetry = Telemetry()
+    monkeypatch.setattr(llm_service, "telemetry", telemetry)
+
+    class _Client:
+        def chat(self, **kwargs):
+            # Последний чанк потока Ollama несёт ту же разбивку, что и ответ
+            response = {**OLLAMA_RESPONSE, "message": {"content": '{"city": "Moscow"}'}}
+            return iter([response]) if kwargs["stream"] else response
+
+    monkeypatch.setattr(OllamaService, "get_client", staticmethod(_Client))
+
+    assert OllamaService.get_weather_city("погода в Москве", "m") == "Moscow"
+
+    stats = telemetry.stats()["calls"]["weather_city"]["local:m"]
+    assert stats["prompt_eval_seconds"]["sum"] == pytest.approx(0.2)
+    assert stats["prompt_tokens"]["sum"] == 120  # noqa: PLR2004
+
+
+def test_external_chat_records_usage(monkeypatch):
+    telemetry = Telemetry()
+    monkeypatch.setattr(llm_service, "telemetry", telemetry)
+    monkeypatch.setattr(llm_service, "SBER_API_KEY", "key")
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Привет"))],
+        usage=SimpleNamespace(prompt_tokens=30, completion_tokens=2),
+    )
+    completions = SimpleNamespace(create=lambda **_kwargs: response)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(llm_service, "_get_sber_client", lambda: client)
+
+    assert ExternalLLMService.generate_response("привет", "x") == "Привет"
+
+    stats = telemetry.stats()["calls"]["chat"]["external:x"]
+    assert stats["prompt_tokens"]["sum"] == 30  # noqa: PLR2004
+    assert stats["completion_tokens"]["sum"] == 2  # noqa: PLR2004
+    assert stats["load_seconds"]["count"] == 0
@@ -0,0 +1,95 @@
+import datetime as dt
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from api.s3_presign import Presigner
+from botocore import auth
+from botocore.client import Config
+
+pytestmark = pytest.mark.unit
+
+NOW = dt.datetime(2026, 3, 14, 23, 59, 58, tzinfo=dt.UTC)
+
+KEYS = [
+    "products/3f2a.png",
+    "products/фото товара №1.jpg",
+    "avatars/a+b=c&d?e#f%g.png",
+    "products/~tilde/!*'()[]$,;:@.webp",
+    "products//double/../dots/./x.png",
+]
+
+ENDPOINTS = [
+    ("http://localhost:9000", ""),
+    ("http://minio:9000/", "ru-central-1"),
+    ("https://S3.Example.com:443", "eu-central-1"),
+    ("https://cdn.example.com/storage", "us-west-2"),
+    ("http://[::1]:9000", ""),
+]
+
+
+@pytest.fixture
+def frozen_boto(monkeypatch):
+    """botocore подписывает с datetime.utcnow() — фиксируем время."""
+
+    class _Frozen(dt.datetime):
+        @classmethod
+        def utcnow(cls):
+            return NOW.replace(tzinfo=None)
+
+    monkeypatch.setattr(auth, "datetime", SimpleNamespace(datetime=_Frozen))
+
+
+def _boto_urls(endpoint, region, bucket, keys, expires_in):
+    client = boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id="AKIA/TEST+KEY",
+        aws_secret_access_key="secret/key+with=chars",
+        region_name=region or None,
+        config=Config(signature_version="s3v4"),
+    )
+    return [
+        client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket, "Key": key},
+            ExpiresIn=expires_in,
+        )
+        for key in keys
+    ]
+
+
+@pytest.mark.parametrize(("endpoint", "region"), ENDPOINTS)
+@pytest.mark.parametrize("expires_in", [60, 3600, 604800])
+def test_urls_match_boto3_byte_for_byte(frozen_boto, endpoint, region, expires_in):
+    presigner = Presigner(
+        endpoint,
+        "product-images",
+        "AKIA/TEST+KEY",
+        "secret/key+with=chars",
+        region or None,
+    )
+
+    ours = presigner.presign_get_many(KEYS, expires_in, now=NOW)
+
+    assert ours == _boto_urls(endpoint, region, "product-images", KEYS, expires_in)
+
+
+def test_single_url_matches_batch():
+    presigner = Presigner("http://localhost:9000", "b", "k", "s")
+
+    batch = presigner.presign_get_many(["x.png"], now=NOW)
+
+    assert presigner.presign_get("x.png", now=NOW) == batch[0]
+
+
+def test_signing_key_is_derived_once_per_day(monkeypatch):
+    presigner = Presigner("http://localhost:9000", "b", "k", "s")
+    presigner.presign_get("x.png", now=NOW)
+    day_key = presigner._day_key  # noqa: SLF001
+
+    presigner.presign_get("y.png", now=NOW + dt.timedelta(seconds=1))
+    assert presigner._day_key is day_key  # noqa: SLF001
+
+    presigner.presign_get("y.png", now=NOW + dt.timedelta(seconds=2))
+    assert presigner._day_key[0] == "20260315"  # noqa: SLF001
@@ -1,7 +1,11 @@
+import base64
 import io
+import json
+from types import SimpleNamespace
 
 import api.s3_service as s3
 import pytest
+from django.core.exceptions import ImproperlyConfigured
 
 pytestmark = pytest.mark.unit
 
@@ -75,18 +79,13 @@ def test_generate_presigned_url_uses_public_endpoint(monkeypatch, settings):
     settings.AWS_SECRET_ACCESS_KEY = "s"
     settings.AWS_S3_REGION_NAME = ""
 
-    created = []
+    def unexpected_client(*_args, **_kwargs):
+        raise AssertionError("URLs are signed without boto3")
 
-    def fake_boto3_client(service, **kwargs):
-        assert service == "s3"
-        created.append(kwargs.get("endpoint_url"))
-        return _DummyClient()
-
-    monkeypatch.setattr(s3.boto3, "client", fake_boto3_client)
+    monkeypatch.setattr(s3.boto3, "client", unexpected_client)
 
     url = s3.generate_presigned_url("products/x.png")
-    assert url.startswith("https://")
-    assert created[-1] == "http://public"
+    assert url.startswith("http://public/bucket/products/x.png?X-Amz-Algorithm=")
 
 
 def test_delete_file_calls_delete_object(monkeypatch, settings):
@@ -101,3 +100,268 @@ def test_delete_file_calls_delete_object(monkeypatch, settings):
 
     s3.delete_file("products/a.bin")
     assert any(c[0] == "delete_object" for c in client.calls)
+
+
+def _presign_settings(settings, window=300):
+    settings.AWS_STORAGE_BUCKET_NAME = "bucket"
+    settings.AWS_S3_ENDPOINT_URL = "http://internal"
+    settings.AWS_S3_PUBLIC_URL = "http://public"
+    settings.AWS_ACCESS_KEY_ID = "k"
+    settings.AWS_SECRET_ACCESS_KEY = "s"
+    settings.AWS_S3_REGION_NAME = ""
+    settings.AWS_S3_PRESIGNED_URL_CACHE_SECONDS = window
+
+
+@pytest.fixture
+def presigner(monkeypatch):
+    """Считает созданные подписчики и пакеты подписанных ключей."""
+    counts = SimpleNamespace(created=0, signed=[])
+
+    class _Counting(s3.Presigner):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            counts.created += 1
+
+        def presign_get_many(self, keys, expires_in=3600, now=None):
+            counts.signed.append(list(keys))
+            return super().presign_get_many(keys, expires_in, now)
+
+    monkeypatch.setattr(s3, "Presigner", _Counting)
+    return counts
+
+
+def test_presigner_is_created_once(settings, presigner):
+    _presign_settings(settings, window=0)
+
+    for index in range(5):
+        s3.generate_presigned_url(f"products/{index}.png")
+
+    assert presigner.created == 1
+
+
+def test_presigned_url_is_reused_within_window(monkeypatch, settings, presigner):
+    _presign_settings(settings)
+    now = [1_000_000.0]
+    monkeypatch.setattr(s3.time, "time", lambda: now[0])
+
+    first = s3.generate_presigned_url("products/x.png")
+    assert s3.generate_presigned_url("products/x.png") == first
+    s3.generate_presigned_url("products/y.png")
+    assert len(presigner.signed) == 2  # noqa: PLR2004
+
+    # Новое окно — подпись заново, чтобы срок действия URL не истёк
+    now[0] += 300
+    s3.generate_presigned_url("products/x.png")
+    assert len(presigner.signed) == 3  # noqa: PLR2004
+    assert s3.presigned_urls.stats()["hits"] == 1
+
+
+def test_batch_signs_only_missing_keys(settings, presigner):
+    _presign_settings(settings)
+    s3.generate_presigned_url("products/a.png")
+
+    urls = s3.generate_presigned_urls(
+        ["products/a.png", "products/b.png", "products/c.png", "products/b.png"],
+    )
+
+    assert list(urls) == ["products/a.png", "products/b.png", "products/c.png"]
+    assert presigner.signed == [
+        ["products/a.png"],
+        ["products/b.png", "products/c.png"],
+    ]
+
+
+def test_cache_window_stays_under_expiry(settings):
+    settings.AWS_S3_PRESIGNED_URL_CACHE_SECONDS = 300
+
+    assert s3.PresignedURLCache.window_for(3600) == 300  # noqa: PLR2004
+    assert s3.PresignedURLCache.window_for(60) == 30  # noqa: PLR2004
+
+
+def test_immutable_urls_are_stable_within_period(monkeypatch, settings, presigner):
+    _presign_settings(settings)
+    settings.AWS_S3_IMMUTABLE_URL_PERIOD = 86400
+    settings.AWS_S3_IMMUTABLE_URL_EXPIRES = 7 * 86400
+    now = [86400.0 * 20_000 + 10]
+    monkeypatch.setattr(s3.time, "time", lambda: now[0])
+
+    first = s3.generate_immutable_urls(["products/x.png"])["products/x.png"]
+    s3.clear_caches()  # другой процесс подпишет так же
+    now[0] += 3600
+    again = s3.generate_immutable_urls(["products/x.png"])["products/x.png"]
+    now[0] += 86400
+    next_day = s3.generate_immutable_urls(["products/x.png"])["products/x.png"]
+
+    assert again == first
+    assert "X-Amz-Date=20241004T000000Z" in first
+    assert "X-Amz-Expires=604800" in first
+    assert next_day != first
+
+
+def test_object_urls_follow_strategy(settings, presigner):
+    _presign_settings(settings)
+    settings.AWS_S3_URL_STRATEGY = {"product_image": "public", "avatar": "presigned"}
+
+    public = s3.object_urls(["products/a b.png"], s3.PRODUCT_IMAGE)
+    signed = s3.object_url("avatars/a.png", s3.AVATAR)
+
+    assert public == {"products/a b.png": "http://public/bucket/products/a%20b.png"}
+    assert "X-Amz-Signature=" in signed
+    assert presigner.signed == [["avatars/a.png"]]
+    assert s3.url_lifetime(s3.PRODUCT_IMAGE) is None
+
+
+def test_url_lifetime_accounts_for_reuse(settings):
+    _presign_settings(settings, window=300)
+    settings.AWS_S3_URL_STRATEGY = {"product_image": "presigned", "avatar": "immutable"}
+    settings.AWS_S3_IMMUTABLE_URL_EXPIRES = 7 * 86400
+    settings.AWS_S3_IMMUTABLE_URL_PERIOD = 86400
+
+    # Ссылку из кэша могли подписать до 300 с назад
+    assert s3.url_lifetime(s3.PRODUCT_IMAGE) == s3.PRESIGNED_URL_EXPIRES - 300
+    assert s3.url_lifetime(s3.AVATAR) == 6 * 86400
+
+    settings.AWS_S3_PRESIGNED_URL_CACHE_SECONDS = 0
+    assert s3.url_lifetime(s3.PRODUCT_IMAGE) == s3.PRESIGNED_URL_EXPIRES
+
+
+def test_unknown_url_strategy_is_rejected(settings):
+    settings.AWS_S3_URL_STRATEGY = {"product_image": "cdn"}
+
+    with pytest.raises(ImproperlyConfigured):
+        s3.object_url("products/x.png", s3.PRODUCT_IMAGE)
+
+
+def test_immutable_upload_uses_content_addressed_key(monkeypatch, settings):
+    settings.AWS_STORAGE_BUCKET_NAME = "bucket"
+    settings.AWS_S3_URL_STRATEGY = {"avatar": "immutable"}
+    client = _DummyClient()
+    monkeypatch.setattr(s3, "_get_client", lambda: client)
+    monkeypatch.setattr(s3, "ensure_bucket_exists", lambda *a, **k: None)
+
+    first = s3.upload_file(io.BytesIO(b"data"), "image/png", "a.png", kind=s3.AVATAR)
+    again = s3.upload_file(io.BytesIO(b"data"), "image/png", "b.png", kind=s3.AVATAR)
+
+    assert first == again
+    assert first.startswith("avatars/3a6eb0790f39ac87")
+    _, args, kwargs = client.calls[0]
+    assert args[0].read() == b"data"  # хэш не съел содержимое
+    assert kwargs["ExtraArgs"]["CacheControl"] == s3.IMMUTABLE_CACHE_CONTROL
+
+
+def test_client_registry_reuses_clients_until_fork(monkeypatch, settings):
+    _presign_settings(settings)
+    registry = s3.S3ClientRegistry()
+    pid = [100]
+    monkeypatch.setattr(s3.os, "getpid", lambda: pid[0])
+    registry.clear()
+
+    first = registry.get("http://minio", "k", "s", None)
+    assert registry.get("http://minio", "k", "s", None) is first
+    assert registry.get("http://other", "k", "s", None) is not first
+    assert (
+        first.meta.config.max_pool_connections == settings.AWS_S3_MAX_POOL_CONNECTIONS
+    )
+
+    pid[0] = 101  # дочерний процесс после fork
+    assert registry.get("http://minio", "k", "s", None) is not first
+
+
+def test_bucket_existence_is_remembered(monkeypatch, settings):
+    settings.AWS_STORAGE_BUCKET_NAME = "bucket"
+    client = _DummyClient()
+    monkeypatch.setattr(s3, "_get_client", lambda: client)
+
+    s3.ensure_bucket_exists()
+    s3.ensure_bucket_exists()
+    assert [c[0] for c in client.calls] == ["head_bucket"]
+
+    s3.forget_bucket()
+    s3.ensure_bucket_exists()
+    assert [c[0] for c in client.calls] == ["head_bucket", "head_bucket"]
+
+
+def test_upload_recreates_missing_bucket_once(monkeypatch, settings):
+    settings.AWS_STORAGE_BUCKET_NAME = "bucket"
+    client = _DummyClient()
+    uploads = []
+
+    def upload_fileobj(file_obj, *args, **kwargs):
+        uploads.append(file_obj.read())
+        if len(uploads) == 1:
+            raise s3.ClientError({"Error": {"Code": "NoSuchBucket"}}, "PutObject")
+
+    client.upload_fileobj = upload_fileobj
+    monkeypatch.setattr(s3, "_get_client", lambda: client)
+
+    s3.upload_file(io.BytesIO(b"data"), "image/png", "a.png")
+
+    assert uploads == [b"data", b"data"]
+    assert [c[0] for c in client.calls] == ["head_bucket", "head_bucket"]
+
+
+def _direct_upload(monkeypatch, settings, scope="product_image:1:1"):
+    _presign_settings(settings)
+    monkeypatch.setattr(s3, "ensure_bucket_exists", lambda *a, **k: None)
+    return s3.create_direct_upload(
+        s3.PRODUCT_IMAGE,
+        "photo.png",
+        "image/png",
+        1024,
+        scope,
+    )
+
+
+def test_direct_upload_policy_pins_key_type_and_size(monkeypatch, settings):
+    upload = _direct_upload(monkeypatch, settings)
+
+    assert upload["url"] == "http://public/bucket"
+    assert upload["key"].startswith("products/")
+    assert upload["key"].endswith(".png")
+    assert upload["fields"]["key"] == upload["key"]
+    assert upload["fields"]["Content-Type"] == "image/png"
+    policy = json.loads(base64.b64decode(upload["fields"]["policy"]))
+    assert ["content-length-range", 1, 1024] in policy["conditions"]
+    assert {"Content-Type": "image/png"} in policy["conditions"]
+
+
+def test_confirm_direct_upload_checks_the_object(monkeypatch, settings):
+    upload = _direct_upload(monkeypatch, settings)
+    client = _DummyClient()
+    heads = {"ContentLength": 1024, "ContentType": "image/png"}
+    client.head_object = lambda **kwargs: heads
+    monkeypatch.setattr(s3, "_get_client", lambda: client)
+
+    confirmed = s3.confirm_direct_upload(upload["upload_token"], "product_image:1:1")
+
+    assert confirmed == {
+        "key": upload["key"],
+        "filename": "photo.png",
+        "content_type": "image/png",
+        "size": 1024,
+    }
+    with pytest.raises(s3.UploadVerificationError):
+        s3.confirm_direct_upload(upload["upload_token"], "product_image:2:1")
+
+    heads["ContentLength"] = 512  # меньше заявленного размера
+    with pytest.raises(s3.UploadVerificationError):
+        s3.confirm_direct_upload(upload["upload_token"], "product_image:1:1")
+    assert ("delete_object", {"Bucket": "bucket", "Key": upload["key"]}) in (
+        client.calls
+    )
+
+
+def test_confirm_direct_upload_requires_the_object(monkeypatch, settings):
+    upload = _direct_upload(monkeypatch, settings)
+    client = _DummyClient()
+
+    def head_object(**kwargs):
+        raise s3.ClientError({"Error": {"Code": "404"}}, "HeadObject")
+
+    client.head_object = head_object
+    monkeypatch.setattr(s3, "_get_client", lambda: client)
+
+    with pytest.raises(s3.UploadVerificationError):
+        s3.confirm_direct_upload(upload["upload_token"], "product_image:1:1")
+    with pytest.raises(s3.UploadVerificationError):
+        s3.confirm_direct_upload("forged", "product_image:1:1")
@@ -64,11 +64,11 @@ class UserProfile(models.Model):
         # Regular users with limit
         return self.daily_requests_used < self.daily_requests_limit
 
-    def increment_requests(self):
+    def increment_requests(self, count=1):
         """Increment request counter"""
         self.reset_daily_requests()
         if self.role == "user":
-            self.daily_requests_used += 1
+            self.daily_requests_used += count
             self.save()
 
     def get_available_models(self):
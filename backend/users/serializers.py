@@ -1,4 +1,4 @@
-from api.s3_service import generate_presigned_url
+from api.s3_service import AVATAR, object_url
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
@@ -49,7 +49,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         if not obj.avatar_s3_key:
             return None
         try:
-            return generate_presigned_url(obj.avatar_s3_key, expires_in=3600)
+            return object_url(obj.avatar_s3_key, AVATAR)
         except Exception:
             return None
 
@@ -11,6 +11,16 @@ urlpatterns = [
     path("logout/", views.LogoutView.as_view(), name="logout"),
     path("me/", views.UserDetailView.as_view(), name="user_detail"),
     path("me/avatar/", views.AvatarUploadView.as_view(), name="user_avatar"),
+    path(
+        "me/avatar/direct/",
+        views.AvatarDirectUploadView.as_view(),
+        name="user_avatar_direct_upload",
+    ),
+    path(
+        "me/avatar/direct/confirm/",
+        views.AvatarDirectUploadConfirmView.as_view(),
+        name="user_avatar_direct_upload_confirm",
+    ),
     # JWT token endpoints
     path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("token/refresh/", views.TokenRefreshView.as_view(), name="token_refresh"),
@@ -2,21 +2,29 @@ import contextlib
 import logging
 import uuid
 
-from api.s3_service import delete_file, upload_file
+from api.s3_service import (
+    AVATAR,
+    UploadVerificationError,
+    confirm_direct_upload,
+    create_direct_upload,
+    delete_file,
+    upload_file,
+)
+from api.serializers import DirectUploadSerializer
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.mail import send_mail
 from django.http import HttpResponseRedirect
 from rest_framework import status
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import PasswordResetToken
+from .models import PasswordResetToken, UserProfile
 from .permissions import IsAdminUser
 from .serializers import (
     LoginSerializer,
@@ -30,6 +38,15 @@ from .serializers import (
 logger = logging.getLogger(__name__)
 
 
+def _avatar_key_shared(profile) -> bool:
+    """Тот же объект S3 — аватар другого профиля (ключи по хэшу содержимого)."""
+    return (
+        UserProfile.objects.filter(avatar_s3_key=profile.avatar_s3_key)
+        .exclude(pk=profile.pk)
+        .exists()
+    )
+
+
 class RegisterView(APIView):
     permission_classes = (AllowAny,)
 
@@ -165,12 +182,12 @@ class AvatarUploadView(APIView):
 
         profile = request.user.profile
 
-        if profile.avatar_s3_key:
+        if profile.avatar_s3_key and not _avatar_key_shared(profile):
             with contextlib.suppress(Exception):
                 delete_file(profile.avatar_s3_key)
 
         try:
-            s3_key = upload_file(file, file.content_type, file.name)
+            s3_key = upload_file(file, file.content_type, file.name, kind=AVATAR)
         except Exception as exc:
             logger.exception("Avatar upload failed: %s", exc)
             return Response(
@@ -185,14 +202,87 @@ class AvatarUploadView(APIView):
     def delete(self, request):
         profile = request.user.profile
         if profile.avatar_s3_key:
-            with contextlib.suppress(Exception):
-                delete_file(profile.avatar_s3_key)
+            if not _avatar_key_shared(profile):
+                with contextlib.suppress(Exception):
+                    delete_file(profile.avatar_s3_key)
             profile.avatar_s3_key = ""
             profile.save(update_fields=["avatar_s3_key"])
 
         return Response(UserSerializer(request.user).data, status=status.HTTP_200_OK)
 
 
+class AvatarDirectUploadView(APIView):
+    """
+    POST /users/me/avatar/direct/ - presigned POST policy for a new avatar
+
+    The browser sends the file straight to storage (see
+    api.views.ProductImageDirectUploadView) and then calls
+    AvatarDirectUploadConfirmView with the upload_token.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    parser_classes = (JSONParser,)
+
+    def post(self, request):
+        serializer = DirectUploadSerializer(
+            data=request.data,
+            context={
+                "allowed_types": AvatarUploadView.ALLOWED_TYPES,
+                "max_size": AvatarUploadView.MAX_SIZE,
+            },
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = create_direct_upload(
+                AVATAR,
+                serializer.validated_data["filename"],
+                serializer.validated_data["content_type"],
+                serializer.validated_data["size"],
+                f"avatar:{request.user.pk}",
+            )
+        except Exception as exc:
+            logger.exception("Failed to create avatar direct upload: %s", exc)
+            return Response(
+                {"detail": "Ошибка хранилища."},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+        return Response(upload, status=status.HTTP_200_OK)
+
+
+class AvatarDirectUploadConfirmView(AvatarDirectUploadView):
+    """
+    POST /users/me/avatar/direct/confirm/ - check the upload and set the avatar
+    """
+
+    def post(self, request):
+        token = request.data.get("upload_token")
+        if not token:
+            return Response(
+                {"detail": "Не передан upload_token."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            upload = confirm_direct_upload(token, f"avatar:{request.user.pk}")
+        except UploadVerificationError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as exc:
+            logger.exception("Failed to confirm avatar direct upload: %s", exc)
+            return Response(
+                {"detail": "Ошибка хранилища."},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+
+        profile = request.user.profile
+        if profile.avatar_s3_key != upload["key"]:
+            if profile.avatar_s3_key and not _avatar_key_shared(profile):
+                with contextlib.suppress(Exception):
+                    delete_file(profile.avatar_s3_key)
+            profile.avatar_s3_key = upload["key"]
+            profile.save(update_fields=["avatar_s3_key"])
+        return Response(UserSerializer(request.user).data, status=status.HTTP_200_OK)
+
+
 class LogoutView(APIView):
     permission_classes = (IsAuthenticated,)
 
@@ -0,0 +1,29 @@
+import axios from 'axios';
+import api from './axios';
+
+export interface DirectUpload {
+  url: string;
+  fields: Record<string, string>;
+  key: string;
+  upload_token: string;
+  expires_in: number;
+}
+
+// Загрузка в два этапа: бэкенд подписывает политику presigned POST, файл уходит
+// прямо в хранилище, затем бэкенд проверяет объект (`${endpoint}confirm/`)
+export async function uploadDirect<T>(endpoint: string, file: File): Promise<T> {
+  const { data: upload } = await api.post<DirectUpload>(endpoint, {
+    filename: file.name,
+    content_type: file.type,
+    size: file.size,
+  });
+
+  const form = new FormData();
+  Object.entries(upload.fields).forEach(([name, value]) => form.append(name, value));
+  form.append('file', file); // поле file должно быть последним
+  // Обычный axios: токен и куки бэкенда хранилищу не нужны
+  await axios.post(upload.url, form);
+
+  const r = await api.post<T>(`${endpoint}confirm/`, { upload_token: upload.upload_token });
+  return r.data;
+}
@@ -6,6 +6,7 @@ import type {
   ProductImage,
 } from '../types/product';
 import api from './axios';
+import { uploadDirect } from './directUpload';
 
 export const productApi = {
   // ── Products ──────────────────────────────────────────────────────────────
@@ -60,12 +61,8 @@ export const productApi = {
   },
 
   async uploadImage(slug: string, file: File): Promise<ProductImage> {
-    const form = new FormData();
-    form.append('file', file);
-    const r = await api.post<ProductImage>(`/products/${slug}/images/`, form, {
-      headers: { 'Content-Type': 'multipart/form-data' },
-    });
-    return r.data;
+    // Файл идёт прямо в хранилище, бэкенд только подписывает и проверяет
+    return uploadDirect<ProductImage>(`/products/${slug}/images/direct/`, file);
   },
 
   async deleteImage(slug: string, imageId: number): Promise<void> {
@@ -2,6 +2,7 @@ import { isAxiosError } from 'axios';
 import { create } from 'zustand';
 import { persist } from 'zustand/middleware';
 import api from '../api/axios';
+import { uploadDirect } from '../api/directUpload';
 
 interface UserProfile {
   role: 'user' | 'premium' | 'admin';
@@ -178,12 +179,8 @@ export const useAuthStore = create<AuthStore>()(
       },
 
       uploadAvatar: async (file) => {
-        const formData = new FormData();
-        formData.append('file', file);
-        const response = await api.post<User>('/users/me/avatar/', formData, {
-          headers: { 'Content-Type': 'multipart/form-data' },
-        });
-        set({ user: response.data });
+        const user = await uploadDirect<User>('/users/me/avatar/direct/', file);
+        set({ user });
       },
 
       deleteAvatar: async () => {